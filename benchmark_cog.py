@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# Comparação dos perfis de gravação de perfil_raster.py para um raster do
+# projeto (ou um NDVI sintético do tamanho de um recorte): tamanho em disco,
+# latência de leitura de janelas aleatórias 256x256 (como o QGIS faz ao
+# navegar no mapa) e tempo de leitura da visão geral (mapa inteiro a 1/16).
+#
+# Exemplos:
+#   python benchmark_cog.py
+#   python benchmark_cog.py --raster "G:\...\PA458_Leste_2024_NDVI.tif" --json resultado.json
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+from osgeo import gdal
+
+import perfil_raster
+from perfil_raster import criar_raster, finalizar_raster
+from vetorizacao_paralela import banda_ndvi
+
+# --- CONFIGURAÇÕES ---
+PERFIS = ["original", "gtiff", "cog"]
+TAMANHO_SINTETICO = (6000, 4000)  # colunas, linhas (~ um lado do corredor a 10 m)
+N_LEITURAS = 200
+TAMANHO_JANELA = 256
+FATOR_VISAO_GERAL = 16
+SEMENTE = 458
+
+gdal.UseExceptions()
+
+
+def ndvi_sintetico(xsize, ysize, semente=SEMENTE):
+    """NDVI float32 com manchas suaves, ruído e uma faixa de nodata (estrada)."""
+    rng = np.random.RandomState(semente)
+    y, x = np.mgrid[0:ysize, 0:xsize].astype(np.float32)
+    ndvi = 0.45 + 0.25 * np.sin(x / 180.0) * np.cos(y / 240.0) + rng.normal(0, 0.05, (ysize, xsize))
+    ndvi = np.clip(ndvi, -1, 1).astype(np.float32)
+    meio = xsize // 2
+    ndvi[:, meio - 3:meio + 3] = -9999
+    return ndvi
+
+
+def _gravar_origem(caminho, dados):
+    ds = gdal.GetDriverByName('GTiff').Create(caminho, dados.shape[1], dados.shape[0], 1, gdal.GDT_Float32)
+    ds.SetGeoTransform((300000.0, 10.0, 0.0, 9880000.0, 0.0, -10.0))
+    b = ds.GetRasterBand(1)
+    b.SetNoDataValue(-9999)
+    b.WriteArray(dados)
+    ds = None
+
+
+def gravar_no_perfil(caminho_origem, caminho_saida, perfil):
+    """Copia a banda NDVI do raster de origem usando o mesmo caminho de escrita dos recortes."""
+    origem = gdal.Open(caminho_origem)
+    b_in = origem.GetRasterBand(banda_ndvi(origem))
+    saida = criar_raster(caminho_saida, origem.RasterXSize, origem.RasterYSize, 1, b_in.DataType, perfil)
+    saida.SetGeoTransform(origem.GetGeoTransform())
+    saida.SetProjection(origem.GetProjection())
+    b_out = saida.GetRasterBand(1)
+    if b_in.GetNoDataValue() is not None:
+        b_out.SetNoDataValue(b_in.GetNoDataValue())
+    for y0 in range(0, origem.RasterYSize, 512):
+        nlin = min(512, origem.RasterYSize - y0)
+        b_out.WriteArray(b_in.ReadAsArray(0, y0, origem.RasterXSize, nlin), 0, y0)
+    saida = origem = None
+    return finalizar_raster(caminho_saida, perfil)
+
+
+def medir_leituras(caminho, n_leituras=N_LEITURAS, janela=TAMANHO_JANELA, semente=SEMENTE):
+    """Latências (ms) de janelas aleatórias, abrindo o arquivo a cada leitura (sem cache de blocos)."""
+    ds = gdal.Open(caminho)
+    xsize, ysize = ds.RasterXSize, ds.RasterYSize
+    ds = None
+    rng = np.random.RandomState(semente)
+    tempos = []
+    gdal.SetCacheMax(0)
+    for _ in range(n_leituras):
+        xoff = rng.randint(0, max(1, xsize - janela))
+        yoff = rng.randint(0, max(1, ysize - janela))
+        inicio = time.perf_counter()
+        ds = gdal.Open(caminho)
+        ds.GetRasterBand(1).ReadAsArray(xoff, yoff, min(janela, xsize), min(janela, ysize))
+        ds = None
+        tempos.append((time.perf_counter() - inicio) * 1000.0)
+    return np.array(tempos)
+
+
+def medir_visao_geral(caminho, fator=FATOR_VISAO_GERAL):
+    """Tempo (ms) para ler o raster inteiro reduzido (usa as overviews, se houver)."""
+    inicio = time.perf_counter()
+    ds = gdal.Open(caminho)
+    b = ds.GetRasterBand(1)
+    b.ReadAsArray(0, 0, ds.RasterXSize, ds.RasterYSize,
+                  buf_xsize=max(1, ds.RasterXSize // fator), buf_ysize=max(1, ds.RasterYSize // fator))
+    n_overviews = b.GetOverviewCount()
+    ds = None
+    return (time.perf_counter() - inicio) * 1000.0, n_overviews
+
+
+def _tamanho_mb(caminho):
+    """Tamanho do .tif mais um eventual .ovr externo."""
+    total = os.path.getsize(caminho)
+    if os.path.exists(caminho + ".ovr"):
+        total += os.path.getsize(caminho + ".ovr")
+    return total / (1024.0 * 1024.0)
+
+
+def executar_benchmark(caminho_raster=None, perfis=PERFIS, n_leituras=N_LEITURAS, pasta_trabalho=None):
+    pasta = pasta_trabalho or tempfile.mkdtemp(prefix="bench_cog_")
+    if caminho_raster is None:
+        caminho_raster = os.path.join(pasta, "ndvi_sintetico.tif")
+        _gravar_origem(caminho_raster, ndvi_sintetico(*TAMANHO_SINTETICO))
+
+    resultados = {'raster': caminho_raster, 'compressao': perfil_raster.COMPRESSAO,
+                  'janela': TAMANHO_JANELA, 'n_leituras': n_leituras, 'perfis': {}}
+    try:
+        for perfil in perfis:
+            caminho = os.path.join(pasta, "perfil_{}.tif".format(perfil))
+            inicio = time.perf_counter()
+            gravar_no_perfil(caminho_raster, caminho, perfil)
+            segundos_escrita = time.perf_counter() - inicio
+
+            tempos = medir_leituras(caminho, n_leituras)
+            ms_visao, n_overviews = medir_visao_geral(caminho)
+            resultados['perfis'][perfil] = {
+                'tamanho_mb': round(_tamanho_mb(caminho), 3),
+                'escrita_s': round(segundos_escrita, 3),
+                'janela_mediana_ms': round(float(np.median(tempos)), 3),
+                'janela_p95_ms': round(float(np.percentile(tempos, 95)), 3),
+                'visao_geral_ms': round(ms_visao, 3),
+                'n_overviews': n_overviews,
+            }
+    finally:
+        if pasta_trabalho is None:
+            shutil.rmtree(pasta, ignore_errors=True)
+    return resultados
+
+
+def imprimir(resultados):
+    print(u"--- Perfis de gravação ({}, compressão {}) ---".format(
+        os.path.basename(resultados['raster']), resultados['compressao']))
+    print(u"{:<10}{:>12}{:>12}{:>14}{:>12}{:>14}{:>6}".format(
+        "perfil", "MB", "escrita s", "janela med", "janela p95", "visao geral", "ovr"))
+    for perfil, r in resultados['perfis'].items():
+        print(u"{:<10}{:>12.2f}{:>12.2f}{:>12.2f}ms{:>10.2f}ms{:>12.1f}ms{:>6}".format(
+            perfil, r['tamanho_mb'], r['escrita_s'], r['janela_mediana_ms'], r['janela_p95_ms'],
+            r['visao_geral_ms'], r['n_overviews']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=u"Tamanho e latência de leitura por perfil de gravação.")
+    parser.add_argument("--raster", default=None, help=u"Raster NDVI (padrão: sintético)")
+    parser.add_argument("--perfis", default=",".join(PERFIS), help=u"Perfis separados por vírgula")
+    parser.add_argument("--leituras", type=int, default=N_LEITURAS, help=u"Número de janelas aleatórias")
+    parser.add_argument("--compressao", default=None, help=u"DEFLATE ou ZSTD (padrão: perfil_raster.COMPRESSAO)")
+    parser.add_argument("--json", default=None, help=u"Grava o resultado neste arquivo JSON")
+    args = parser.parse_args()
+
+    if args.compressao:
+        perfil_raster.COMPRESSAO = args.compressao.upper()
+    res = executar_benchmark(args.raster, [p.strip() for p in args.perfis.split(",") if p.strip()], args.leituras)
+    imprimir(res)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(res, f, indent=1)
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+# Benchmark das etapas do processamento sobre um corredor sintético (sem os
+# caminhos G:\ / H:\ dos scripts): rasters NDVI de N anos e o polígono do
+# buffer de um lado da estrada, em tamanho, número de anos e fragmentação
+# das classes configuráveis. Cada etapa roda num processo novo e mede:
+#   - tempo de parede (s);
+#   - pico de memória residente (MB) do maior processo da etapa (o próprio
+#     ou um filho do pool), via resource no Linux/macOS ou psutil no Windows;
+#   - tamanho das saídas em disco (MB).
+#
+# Etapas: recorte, estatisticas, reclassificacao (só a tabela de classes,
+# gravando o raster de classes), vetorizacao (reclassificação +
+# poligonização, como no processamento), dissolve (com área), transicao
+# (tabela do Sankey) e quebras (bfast_lote em séries mensais sintéticas).
+#
+# Exemplos:
+#   python benchmark_pipeline.py
+#   python benchmark_pipeline.py --tamanhos 1000x800,2000x1600,4000x3200 --anos 6 --json bench.json
+#   python benchmark_pipeline.py --json novo.json --comparar bench.json   # regressões
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+# --- CONFIGURAÇÕES ---
+TAMANHOS = [(2000, 1500)]       # colunas x linhas (10 m)
+N_ANOS = 6
+ANO_INICIAL = 2019
+FRAGMENTACAO = 0.5              # 0 = manchas grandes, 1 = classes muito picotadas
+N_SERIES_QUEBRAS = 500          # séries mensais na etapa de quebras
+N_PROCESSOS = None              # pool da vetorização (None = todos os núcleos)
+SEMENTE = 458
+TOLERANCIA_REGRESSAO = 1.25     # --comparar: acusa etapa mais lenta que isto x a referência
+
+ETAPAS = ['recorte', 'estatisticas', 'reclassificacao', 'vetorizacao', 'dissolve', 'transicao', 'quebras']
+MARCADOR = "@@resultado "
+EXTENSOES_SHAPEFILE = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+
+# --- Medidas ---
+def pico_memoria_mb():
+    """Maior RSS entre este processo e os filhos já encerrados (None se não houver como medir)."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1048576.0
+        except (ImportError, AttributeError):
+            return None
+    pico = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return pico / 1048576.0 if sys.platform == 'darwin' else pico / 1024.0   # bytes no macOS, kB no Linux
+
+
+def tamanho_saidas_mb(caminhos):
+    total = 0
+    for caminho in caminhos:
+        base, ext = os.path.splitext(caminho)
+        arquivos = [base + e for e in EXTENSOES_SHAPEFILE] if ext.lower() == ".shp" else [caminho, caminho + ".ovr"]
+        total += sum(os.path.getsize(a) for a in arquivos if os.path.isfile(a))
+    return total / 1048576.0
+
+
+# --- Corredor sintético ---
+def _eixo(y, xsize, ysize):
+    """Coluna do eixo da estrada em cada linha (um S suave pelo meio da cena)."""
+    return xsize * (0.5 + 0.15 * np.sin(np.pi * y / float(ysize)))
+
+
+def gerar_corredor(pasta, xsize, ysize, n_anos=N_ANOS, fragmentacao=FRAGMENTACAO, semente=SEMENTE):
+    """
+    Um NDVI float32 por ano (PA458_Leste_<AAAA>_NDVI_SINTETICO.tif, nodata
+    -9999) e o polígono do buffer do lado Leste (do eixo até 40% da largura).
+    Manchas de senoides com comprimento de onda que cai com a fragmentação,
+    ruído por pixel e uma área que degrada ano a ano.
+    """
+    rng = np.random.RandomState(semente)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32723)
+    x0, y0 = 300000.0, 9880000.0
+    gt = (x0, 10.0, 0.0, y0, 0.0, -10.0)
+
+    comprimento = 8.0 + 400.0 * (1.0 - fragmentacao)   # pixels
+    ondas = [(rng.uniform(0, 2 * np.pi), 2 * np.pi / (comprimento * rng.uniform(0.5, 2.0)), rng.uniform(0, 2 * np.pi))
+             for _ in range(6)]
+    ruido = 0.03 + 0.12 * fragmentacao
+    y = np.arange(ysize, dtype=np.float32)[:, None]
+    x = np.arange(xsize, dtype=np.float32)[None, :]
+    base = np.full((ysize, xsize), 0.45, dtype=np.float32)
+    for angulo, k, fase in ondas:
+        base += np.float32(0.08) * np.sin(k * (np.cos(angulo) * x + np.sin(angulo) * y) + fase).astype(np.float32)
+    estrada = np.abs(x - _eixo(y, xsize, ysize)) < 4
+    degradando = ((x - xsize * 0.7) ** 2 + (y - ysize * 0.5) ** 2) < (min(xsize, ysize) * 0.15) ** 2
+
+    rasters = {}
+    for i in range(n_anos):
+        ano = ANO_INICIAL + i
+        ndvi = base + rng.normal(0, ruido, (ysize, xsize)).astype(np.float32)
+        ndvi[degradando] -= np.float32(0.05 * i)
+        ndvi = np.clip(ndvi, -1, 1)
+        ndvi[estrada] = -9999
+        caminho = os.path.join(pasta, "PA458_Leste_{}_NDVI_SINTETICO.tif".format(ano))
+        ds = gdal.GetDriverByName('GTiff').Create(caminho, xsize, ysize, 1, gdal.GDT_Float32,
+                                                  options=["TILED=YES", "COMPRESS=DEFLATE"])
+        ds.SetGeoTransform(gt)
+        ds.SetProjection(srs.ExportToWkt())
+        b = ds.GetRasterBand(1)
+        b.SetNoDataValue(-9999)
+        b.WriteArray(ndvi)
+        ds = None
+        rasters[ano] = caminho
+
+    # buffer Leste: do eixo (+ meia pista) até 0,4 da largura, seguindo o S da estrada
+    linhas = np.linspace(0, ysize, 60)
+    borda_estrada = [(x0 + (_eixo(l, xsize, ysize) + 4) * 10.0, y0 - l * 10.0) for l in linhas]
+    borda_externa = [(x0 + min(_eixo(l, xsize, ysize) + 0.4 * xsize, xsize) * 10.0, y0 - l * 10.0)
+                     for l in linhas[::-1]]
+    anel = ogr.Geometry(ogr.wkbLinearRing)
+    for px, py in borda_estrada + borda_externa + borda_estrada[:1]:
+        anel.AddPoint_2D(float(px), float(py))
+    poligono = ogr.Geometry(ogr.wkbPolygon)
+    poligono.AddGeometry(anel)
+    caminho_mascara = os.path.join(pasta, "PA458_Leste_buffer.gpkg")
+    vds = ogr.GetDriverByName('GPKG').CreateDataSource(caminho_mascara)
+    lyr = vds.CreateLayer("buffer", srs=srs, geom_type=ogr.wkbPolygon)
+    feat = ogr.Feature(lyr.GetLayerDefn())
+    feat.SetGeometry(poligono)
+    lyr.CreateFeature(feat)
+    feat = lyr = vds = None
+    return rasters, caminho_mascara
+
+
+# --- Etapas (rodam no processo filho) ---
+def _etapa_recorte(rasters, mascara, pasta):
+    import etapas
+    saidas = []
+    for ano, caminho in sorted(rasters.items()):
+        saida = os.path.join(pasta, "PA458_Leste_{}_NDVI_recorte.tif".format(ano))
+        etapas.recortar_por_mascara(caminho, mascara, saida)
+        saidas.append(saida)
+    return saidas
+
+
+def _etapa_estatisticas(recortes, pasta):
+    from estatisticas_cache import calcular_estatisticas
+    saida = os.path.join(pasta, "estatisticas.json")
+    stats = dict((c, calcular_estatisticas(c)) for c in recortes)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(stats, f)
+    return [saida]
+
+
+def _etapa_reclassificacao(recortes, pasta, estatisticas):
+    from perfil_raster import criar_raster, finalizar_raster
+    from vetorizacao_paralela import limites_intervalo_igual, classificar_intervalos, NODATA
+    with open(estatisticas, 'r', encoding='utf-8') as f:
+        stats = json.load(f)
+    saidas = []
+    for caminho in recortes:
+        limites = limites_intervalo_igual(stats[caminho]['min'], stats[caminho]['max'])
+        ds = gdal.Open(caminho)
+        b = ds.GetRasterBand(1)
+        saida = os.path.join(pasta, os.path.basename(caminho).replace(".tif", "_reclass.tif"))
+        out = criar_raster(saida, ds.RasterXSize, ds.RasterYSize, 1, gdal.GDT_Int16)
+        out.SetGeoTransform(ds.GetGeoTransform())
+        out.SetProjection(ds.GetProjection())
+        ob = out.GetRasterBand(1)
+        ob.SetNoDataValue(NODATA)
+        for y0 in range(0, ds.RasterYSize, 512):
+            nlin = min(512, ds.RasterYSize - y0)
+            ob.WriteArray(classificar_intervalos(b.ReadAsArray(0, y0, ds.RasterXSize, nlin), limites,
+                                                 b.GetNoDataValue()), 0, y0)
+        out = ob = None
+        finalizar_raster(saida)
+        saidas.append(saida)
+    return saidas
+
+
+def _etapa_vetorizacao(recortes, pasta, n_processos):
+    from vetorizacao_paralela import vetorizar_lote
+    vetores = vetorizar_lote(recortes, pasta, n_processos=n_processos)
+    return list(vetores.values()) + [v.replace("_vetor.gpkg", "_classes.tif") for v in vetores.values()]
+
+
+def _etapa_dissolve(vetores, pasta):
+    import etapas
+    saidas = []
+    for vetor in vetores:
+        saida = vetor.replace("_vetor.gpkg", "_dissolvido.gpkg")
+        etapas.dissolver_com_area(vetor, saida, vetor.replace("_vetor.gpkg", "_classes.tif"))
+        saidas.append(saida)
+    return saidas
+
+
+def _etapa_transicao(classes_por_ano, pasta):
+    import etapas
+    saida = os.path.join(pasta, "transicao_completa_Leste.csv")
+    etapas.tabela_transicao(dict((int(a), c) for a, c in classes_por_ano.items()), saida)
+    return [saida]
+
+
+def _etapa_quebras(n_series, n_anos, pasta, semente):
+    from bfast_numpy import bfast_lote
+    from series_mensais import FREQUENCIA, calendario_mensal, tempo_decimal
+    rng = np.random.RandomState(semente)
+    datas = calendario_mensal((ANO_INICIAL, 1), (ANO_INICIAL + n_anos - 1, 12))
+    n = len(datas)
+    t = np.arange(n)
+    Y = (0.6 + 0.08 * np.sin(2 * np.pi * t / FREQUENCIA)[None, :]
+         + rng.normal(0, 0.03, (n_series, n)))
+    quebra = rng.randint(n // 4, 3 * n // 4, n_series)
+    Y[t[None, :] >= quebra[:, None]] -= 0.15
+    resultado = bfast_lote(Y, tempo_decimal(datas))
+    saida = os.path.join(pasta, "quebras_sinteticas.csv")
+    with open(saida, 'w', encoding='utf-8') as f:
+        f.write("serie,quebras_tendencia\n")
+        for s, q in enumerate(resultado['quebras_tendencia']):
+            f.write("{},{}\n".format(s, " ".join(str(i) for i in q)))
+    return [saida]
+
+
+FUNCOES = {
+    'recorte': _etapa_recorte, 'estatisticas': _etapa_estatisticas, 'reclassificacao': _etapa_reclassificacao,
+    'vetorizacao': _etapa_vetorizacao, 'dissolve': _etapa_dissolve, 'transicao': _etapa_transicao,
+    'quebras': _etapa_quebras, 'geracao': None,
+}
+
+
+def _executar_no_filho(nome, argumentos):
+    """Corpo do processo filho: roda a etapa e imprime o resultado em JSON."""
+    inicial = pico_memoria_mb()
+    inicio = time.perf_counter()
+    if nome == 'geracao':
+        rasters, mascara = gerar_corredor(**argumentos)
+        saidas = list(rasters.values()) + [mascara]
+        extra = {'rasters': rasters, 'mascara': mascara}
+    else:
+        saidas = FUNCOES[nome](**argumentos)
+        extra = {}
+    resultado = {'tempo_s': time.perf_counter() - inicio, 'pico_rss_mb': pico_memoria_mb(),
+                 'rss_inicial_mb': inicial, 'saidas': saidas}
+    resultado.update(extra)
+    print(MARCADOR + json.dumps(resultado))
+
+
+def rodar_etapa(nome, argumentos):
+    """Roda a etapa num processo Python novo (pico de memória isolado)."""
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--etapa", nome,
+                           "--argumentos", json.dumps(argumentos)],
+                          cwd=os.path.dirname(os.path.abspath(__file__)),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    for linha in reversed(proc.stdout.splitlines()):
+        if linha.startswith(MARCADOR):
+            resultado = json.loads(linha[len(MARCADOR):])
+            resultado['saida_mb'] = tamanho_saidas_mb(resultado['saidas'])
+            return resultado
+    raise RuntimeError(u"Etapa {} falhou:\n{}".format(nome, proc.stderr[-2000:]))
+
+
+# --- Execução ---
+def benchmark_tamanho(xsize, ysize, n_anos=N_ANOS, fragmentacao=FRAGMENTACAO, etapas=ETAPAS,
+                      n_series=N_SERIES_QUEBRAS, n_processos=N_PROCESSOS, pasta_trabalho=None):
+    """Todas as etapas para um tamanho de cena; {etapa: medidas}."""
+    pasta = pasta_trabalho or tempfile.mkdtemp(prefix="bench_pipeline_")
+    medidas = {}
+    try:
+        ger = rodar_etapa('geracao', {'pasta': pasta, 'xsize': xsize, 'ysize': ysize,
+                                      'n_anos': n_anos, 'fragmentacao': fragmentacao})
+        rasters = dict((int(a), c) for a, c in ger['rasters'].items())
+        recortes = [os.path.join(pasta, "PA458_Leste_{}_NDVI_recorte.tif".format(a)) for a in sorted(rasters)]
+        vetores = [r.replace(".tif", "_vetor.gpkg") for r in recortes]
+        argumentos = {
+            'recorte': {'rasters': rasters, 'mascara': ger['mascara'], 'pasta': pasta},
+            'estatisticas': {'recortes': recortes, 'pasta': pasta},
+            'reclassificacao': {'recortes': recortes, 'pasta': pasta,
+                                'estatisticas': os.path.join(pasta, "estatisticas.json")},
+            'vetorizacao': {'recortes': recortes, 'pasta': pasta, 'n_processos': n_processos},
+            'dissolve': {'vetores': vetores, 'pasta': pasta},
+            'transicao': {'classes_por_ano': dict((a, r.replace(".tif", "_classes.tif"))
+                                                  for a, r in zip(sorted(rasters), recortes)), 'pasta': pasta},
+            'quebras': {'n_series': n_series, 'n_anos': n_anos, 'pasta': pasta, 'semente': SEMENTE},
+        }
+        # cada etapa depende das saídas das anteriores (ETAPAS está em ordem)
+        for nome in [e for e in ETAPAS if e in etapas]:
+            r = rodar_etapa(nome, argumentos[nome])
+            medidas[nome] = {'tempo_s': round(r['tempo_s'], 3),
+                             'pico_rss_mb': None if r['pico_rss_mb'] is None else round(r['pico_rss_mb'], 1),
+                             'saida_mb': round(r['saida_mb'], 3), 'n_saidas': len(r['saidas'])}
+            print(u"  {:<16}{:>9.2f} s{:>10} MB RSS{:>10.2f} MB em disco".format(
+                nome, r['tempo_s'], "-" if r['pico_rss_mb'] is None else "{:.0f}".format(r['pico_rss_mb']),
+                r['saida_mb']))
+    finally:
+        if pasta_trabalho is None:
+            shutil.rmtree(pasta, ignore_errors=True)
+    return medidas
+
+
+def executar_benchmark(tamanhos=TAMANHOS, n_anos=N_ANOS, fragmentacao=FRAGMENTACAO, etapas=ETAPAS,
+                       n_series=N_SERIES_QUEBRAS, n_processos=N_PROCESSOS):
+    resultados = {'parametros': {'n_anos': n_anos, 'fragmentacao': fragmentacao, 'n_series': n_series,
+                                 'n_processos': n_processos, 'gdal': gdal.__version__,
+                                 'python': sys.version.split()[0]},
+                  'execucoes': []}
+    for xsize, ysize in tamanhos:
+        print(u"--- Corredor sintético {}x{} px, {} anos, fragmentação {} ---".format(
+            xsize, ysize, n_anos, fragmentacao))
+        resultados['execucoes'].append({'tamanho': [xsize, ysize], 'etapas': benchmark_tamanho(
+            xsize, ysize, n_anos, fragmentacao, etapas, n_series, n_processos)})
+    return resultados
+
+
+def comparar(resultados, referencia, tolerancia=TOLERANCIA_REGRESSAO):
+    """Etapas (por tamanho) com tempo acima de `tolerancia` x o da referência."""
+    ref = dict((tuple(e['tamanho']), e['etapas']) for e in referencia['execucoes'])
+    regressoes = []
+    for execucao in resultados['execucoes']:
+        base = ref.get(tuple(execucao['tamanho']))
+        if not base:
+            continue
+        for nome, m in execucao['etapas'].items():
+            if nome in base and base[nome]['tempo_s'] > 0:
+                razao = m['tempo_s'] / base[nome]['tempo_s']
+                if razao > tolerancia:
+                    regressoes.append((tuple(execucao['tamanho']), nome, razao))
+    return regressoes
+
+
+def _ler_tamanhos(texto):
+    return [tuple(int(v) for v in t.lower().split("x")) for t in texto.split(",") if t.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=u"Tempo, memória e saída de cada etapa num corredor sintético.")
+    parser.add_argument("--tamanhos", default=",".join("{}x{}".format(*t) for t in TAMANHOS),
+                        help=u"Cenas LARGURAxALTURA separadas por vírgula (ex.: 1000x800,2000x1600)")
+    parser.add_argument("--anos", type=int, default=N_ANOS, help=u"Número de anos (rasters) por cena")
+    parser.add_argument("--fragmentacao", type=float, default=FRAGMENTACAO, help=u"0 (manchas grandes) a 1")
+    parser.add_argument("--etapas", default=",".join(ETAPAS), help=u"Etapas separadas por vírgula")
+    parser.add_argument("--series", type=int, default=N_SERIES_QUEBRAS, help=u"Séries na etapa de quebras")
+    parser.add_argument("--processos", type=int, default=N_PROCESSOS, help=u"Processos da vetorização")
+    parser.add_argument("--json", default=None, help=u"Grava o resultado neste arquivo JSON")
+    parser.add_argument("--comparar", default=None, help=u"JSON de uma execução anterior (acusa regressões)")
+    parser.add_argument("--etapa", default=None, help=argparse.SUPPRESS)        # uso interno (processo filho)
+    parser.add_argument("--argumentos", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.etapa:
+        _executar_no_filho(args.etapa, json.loads(args.argumentos))
+        sys.exit(0)
+
+    res = executar_benchmark(_ler_tamanhos(args.tamanhos), args.anos, args.fragmentacao,
+                             [e.strip() for e in args.etapas.split(",") if e.strip()], args.series, args.processos)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(res, f, indent=1)
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            regressoes = comparar(res, json.load(f))
+        for tamanho, nome, razao in regressoes:
+            print(u"  [REGRESSÃO] {}x{} {}: {:.2f}x o tempo da referência".format(tamanho[0], tamanho[1], nome, razao))
+        if regressoes:
+            sys.exit(1)
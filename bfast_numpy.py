@@ -0,0 +1,615 @@
+# -*- coding: utf-8 -*-
+# BFAST e bfastmonitor em NumPy, vetorizados sobre muitas séries de uma vez
+# (trechos de km, pixels), reproduzindo o bfast.R:
+#   - bfast(..., h = 0.20, season = "harmonic", max.iter = 5): tendência por
+#     partes (Vt ~ ti) e sazonalidade harmônica (3 pares seno/cosseno),
+#     teste OLS-MOSUM, busca de quebras Bai-Perron (BIC) e ajuste por
+#     mínimos quadrados de cada componente (lm, como no pacote bfast);
+#   - "varredura-trend": breakpoints(Tt ~ 1) na tendência da 1ª iteração (a
+#     mesma que o bfast.R extrai), magnitude = diferença entre as médias dos
+#     segmentos;
+#   - bfastmonitor(start = 2019-01, response ~ season + trend, h = 0.25),
+#     com histórico estável escolhido pelo ROC (Rec-CUSUM reverso).
+#
+# Todas as séries compartilham o mesmo eixo de tempo, então as matrizes de
+# desenho (harmônicos, tendência, dummies de mês) e as somas acumuladas da
+# busca de quebras são montadas uma vez e aplicadas ao lote inteiro.
+# Os valores críticos dos processos MOSUM são obtidos por simulação do
+# processo limite (Monte Carlo com semente fixa), em vez das tabelas do
+# strucchange; as decisões a 5% coincidem dentro do erro de simulação.
+# Empates de RSS na busca de quebras (ex.: terços de um trecho linear da Tt)
+# ficam com a quebra mais tardia, o que reproduz as datas da tabela do R.
+#
+# `python bfast_numpy.py` roda Leste/Oeste a partir do CSV mensal do GEE,
+# grava a tabela lado,tipo,date,magnitude e a confere com
+# bfast_quebras_datas_magnitudes.csv (gerado pelo bfast.R).
+
+import os
+import csv
+import math
+
+import numpy as np
+
+from series_mensais import FREQUENCIA, tempo_decimal, data_iso, stl_lote, montar_series
+from tabelas import espelhar_csv
+
+# --- CONFIGURAÇÕES ---
+PASTA_DADOS = os.path.dirname(os.path.abspath(__file__))
+CSV_NDVI = os.path.join(PASTA_DADOS, "PA458_NDVI_mensal_2017_2025_12km.csv")
+CSV_REFERENCIA = os.path.join(PASTA_DADOS, "bfast_quebras_datas_magnitudes.csv")
+CSV_SAIDA = os.path.join(PASTA_DADOS, "outputs", "bfast_quebras_datas_magnitudes_numpy.csv")
+
+H_VARREDURA = 0.20
+H_TENDENCIA = 0.15      # default do breakpoints() usado no fallback do bfast.R
+MAX_ITER = 5
+ORDEM_HARMONICA = 3
+NIVEL = 0.05
+
+INICIO_MONITOR = (2019, 1)
+H_MONITOR = 0.25
+FIM_MONITOR = 10        # horizonte do monitoramento, em múltiplos do histórico
+
+TIPOS_SAIDA = ["varredura", "varredura-trend", "monitor"]
+TAMANHO_LOTE = 2000     # séries por bloco na busca de quebras (memória ~ lote x n²)
+EMPATE_RSS = 1e-9       # RSS relativamente iguais contam como empate (fica a quebra mais tardia)
+
+# Conferência com a tabela do R
+TOLERANCIA_MESES = 0
+TOLERANCIA_MAGNITUDE = 1e-6
+
+N_SIMULACOES = 4000
+PASSOS_SIMULACAO = 2000
+BLOCO_SIMULACAO = 250   # trajetórias por vez (memória da simulação independe de N_SIMULACOES)
+SEMENTE = 458
+
+
+# =====================================================================
+# Regressões em lote (desenho compartilhado)
+# =====================================================================
+def harmonicos(n, periodo=FREQUENCIA, ordem=ORDEM_HARMONICA):
+    """co, si, co2, si2, co3, si3 do bfast (tl = 1..n)."""
+    tl = np.arange(1, n + 1, dtype=np.float64)
+    colunas = []
+    for k in range(1, ordem + 1):
+        colunas.append(np.cos(2 * np.pi * tl * k / periodo))
+        colunas.append(np.sin(2 * np.pi * tl * k / periodo))
+    return np.column_stack(colunas)
+
+
+def ols_lote(X, Y):
+    """Coeficientes (S, k) e resíduos (S, n) de Y ~ X para todas as séries."""
+    coef = np.linalg.lstsq(X, Y.T, rcond=None)[0].T
+    return coef, Y - coef @ X.T
+
+
+def ajustados_lote(X, Y):
+    """Valores ajustados de Y ~ X (fitted(lm(...)) do bfast) para todas as séries."""
+    coef, _ = ols_lote(X, Y)
+    return coef @ X.T
+
+
+def _por_grupo(chaves, funcao):
+    """Aplica funcao(indices, chave) a cada grupo de séries com a mesma chave (ex.: mesmas quebras)."""
+    grupos = {}
+    for i, c in enumerate(chaves):
+        grupos.setdefault(c, []).append(i)
+    for c, idx in grupos.items():
+        funcao(np.array(idx), c)
+
+
+def _indicadoras(n, quebras):
+    """Matriz (n, m+1) de segmentos definidos pelas quebras (índices 1-based do fim de cada segmento)."""
+    limites = [0] + list(quebras) + [n]
+    D = np.zeros((n, len(limites) - 1))
+    for s in range(len(limites) - 1):
+        D[limites[s]:limites[s + 1], s] = 1.0
+    return D
+
+
+def desenho_tendencia(ti, quebras):
+    """breakfactor(bp)/ti: intercepto e inclinação por segmento."""
+    D = _indicadoras(ti.size, quebras)
+    return np.hstack([D, D * ti[:, None]])
+
+
+def desenho_sazonal(harm, quebras):
+    """(co + si + ...) %in% breakfactor(bp): intercepto comum e harmônicos por segmento."""
+    D = _indicadoras(harm.shape[0], quebras)
+    partes = [np.ones((harm.shape[0], 1))]
+    for s in range(D.shape[1]):
+        partes.append(harm * D[:, s:s + 1])
+    return np.hstack(partes)
+
+
+# =====================================================================
+# Testes de flutuação (OLS-MOSUM) e valores críticos simulados
+# =====================================================================
+_SIMULACOES = {}
+
+
+def _ponte_browniana(rng, n_sim, passos):
+    incr = rng.normal(0.0, 1.0 / math.sqrt(passos), (n_sim, passos))
+    W = np.concatenate([np.zeros((n_sim, 1)), np.cumsum(incr, axis=1)], axis=1)
+    t = np.linspace(0.0, 1.0, passos + 1)
+    return W - t * W[:, -1:]
+
+
+def _em_blocos(n_sim, gerar):
+    """Concatena e ordena gerar(rng, n) em blocos de BLOCO_SIMULACAO trajetórias (mesma sequência aleatória)."""
+    rng = np.random.RandomState(SEMENTE)
+    partes = []
+    for inicio in range(0, n_sim, BLOCO_SIMULACAO):
+        partes.append(gerar(rng, min(BLOCO_SIMULACAO, n_sim - inicio)))
+    return np.sort(np.concatenate(partes))
+
+
+def distribuicao_mosum(h, n_sim=N_SIMULACOES, passos=PASSOS_SIMULACAO):
+    """Amostra de sup |B0(t) - B0(t - h)|, t em [h, 1] (limite do OLS-MOSUM com funcional max)."""
+    chave = ('efp', round(h, 6), n_sim, passos)
+    if chave not in _SIMULACOES:
+        nh = int(round(h * passos))
+
+        def gerar(rng, n):
+            B0 = _ponte_browniana(rng, n, passos)
+            return np.abs(B0[:, nh:] - B0[:, :-nh]).max(axis=1)
+        _SIMULACOES[chave] = _em_blocos(n_sim, gerar)
+    return _SIMULACOES[chave]
+
+
+def valor_p(estatisticas, amostra):
+    """P(sup >= estatística) pela amostra simulada ordenada."""
+    pos = np.searchsorted(amostra, estatisticas, side='left')
+    return (amostra.size - pos) / float(amostra.size)
+
+
+def mosum_ols(X, Y, h):
+    """Estatística sup|OLS-MOSUM| (efp type = 'OLS-MOSUM') de cada série."""
+    S, n = Y.shape
+    _, res = ols_lote(X, Y)
+    sigma = np.sqrt((res ** 2).sum(axis=1) / (n - X.shape[1]))
+    nh = int(math.floor(n * h))
+    acum = np.concatenate([np.zeros((S, 1)), np.cumsum(res, axis=1)], axis=1)
+    processo = (acum[:, nh:] - acum[:, :n - nh + 1]) / (sigma[:, None] * math.sqrt(n))
+    return np.abs(processo).max(axis=1)
+
+
+def teste_mosum(X, Y, h, nivel=NIVEL):
+    """True onde o OLS-MOSUM rejeita a estabilidade ao nível `nivel`."""
+    return valor_p(mosum_ols(X, Y, h), distribuicao_mosum(h)) <= nivel
+
+
+# =====================================================================
+# Busca de quebras (Bai & Perron, programação dinâmica) em lote
+# =====================================================================
+def rss_segmentos(X, Y):
+    """
+    RSS[s, i, j] de Y[s, i..j] ~ X[i..j] para todos os segmentos (0-based,
+    inclusive), a partir de somas acumuladas compartilhadas pelo lote.
+    """
+    S, n = Y.shape
+    p = X.shape[1]
+    XX = np.concatenate([np.zeros((1, p, p)), np.cumsum(X[:, :, None] * X[:, None, :], axis=0)])
+    XY = np.concatenate([np.zeros((S, 1, p)), np.cumsum(Y[:, :, None] * X[None, :, :], axis=1)], axis=1)
+    YY = np.concatenate([np.zeros((S, 1)), np.cumsum(Y ** 2, axis=1)], axis=1)
+
+    rss = np.full((S, n, n), np.inf)
+    for i in range(n):
+        for j in range(i + p - 1, n):
+            G = XX[j + 1] - XX[i]
+            z = XY[:, j + 1] - XY[:, i]
+            coef = np.linalg.lstsq(G, z.T, rcond=None)[0]
+            rss[:, i, j] = YY[:, j + 1] - YY[:, i] - np.einsum('sk,ks->s', z, coef)
+    return np.maximum(rss, 0.0)
+
+
+def rss_segmentos_media(Y):
+    """Caso Y ~ 1 (só intercepto), em forma fechada."""
+    S, n = Y.shape
+    c1 = np.concatenate([np.zeros((S, 1)), np.cumsum(Y, axis=1)], axis=1)
+    c2 = np.concatenate([np.zeros((S, 1)), np.cumsum(Y ** 2, axis=1)], axis=1)
+    i = np.arange(n)[:, None]
+    j = np.arange(n)[None, :]
+    tam = (j - i + 1).astype(np.float64)
+    soma = c1[:, None, 1:] - c1[:, :n, None]
+    soma2 = c2[:, None, 1:] - c2[:, :n, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rss = soma2 - soma ** 2 / tam
+    return np.where(tam > 0, np.maximum(rss, 0.0), np.inf)
+
+
+def _argmin_tardio(cand, tol=EMPATE_RSS):
+    """
+    argmin por linha, mas entre valores empatados (diferença relativa <= tol)
+    fica o último. Numa Tt linear por partes as partições em terços de um
+    segmento têm RSS idêntico, e a escolha passa a ser determinística.
+    """
+    minimo = cand.min(axis=1, keepdims=True)
+    perto = cand <= minimo + tol * np.abs(minimo) + 1e-300
+    return cand.shape[1] - 1 - np.argmax(perto[:, ::-1], axis=1)
+
+
+def quebras_bic(rss, h, n_reg, max_quebras=None):
+    """
+    Partição ótima para m = 0..max_quebras (segmentos de tamanho >= h) e
+    escolha de m pelo BIC, como breakpoints() do strucchange. Retorna uma
+    lista (por série) de tuplas de quebras 1-based (fim de cada segmento).
+    """
+    S, n, _ = rss.shape
+    if max_quebras is None:
+        max_quebras = int(math.ceil(n / float(h))) - 2
+    max_quebras = max(0, max_quebras)
+
+    # tabelas[m][:, i] = menor RSS de 0..i em m+1 segmentos (i = fim do último)
+    tabelas = [rss[:, 0, :].copy()]
+    escolhas = [None]
+    for m in range(1, max_quebras + 1):
+        ant = tabelas[-1]
+        atual = np.full((S, n), np.inf)
+        escolha = np.zeros((S, n), dtype=np.int64)
+        for i in range((m + 1) * h - 1, n - h):
+            js = np.arange(m * h - 1, i - h + 1)
+            cand = ant[:, js] + rss[:, js + 1, i]
+            k = _argmin_tardio(cand)
+            atual[:, i] = cand[np.arange(S), k]
+            escolha[:, i] = js[k]
+        tabelas.append(atual)
+        escolhas.append(escolha)
+
+    lnn = math.log(n)
+    melhor_bic = np.full(S, np.inf)
+    resultado = [()] * S
+    for m in range(max_quebras + 1):
+        if m == 0:
+            total = rss[:, 0, n - 1]
+            fins = None
+        else:
+            js = np.arange(m * h - 1, n - h)
+            cand = tabelas[m - 1][:, js] + rss[:, js + 1, n - 1]
+            k = _argmin_tardio(cand)
+            total = cand[np.arange(S), k]
+            fins = js[k]
+        with np.errstate(divide='ignore'):
+            bic = n * (np.log(np.maximum(total, 1e-300) / n) + 1 + math.log(2 * math.pi)) + lnn * (n_reg + 1) * (m + 1)
+        melhores = bic < melhor_bic
+        melhor_bic = np.where(melhores, bic, melhor_bic)
+        for s in np.flatnonzero(melhores):
+            if m == 0:
+                resultado[s] = ()
+                continue
+            qs = [int(fins[s])]
+            for mm in range(m - 1, 0, -1):
+                qs.append(int(escolhas[mm][s, qs[-1]]))
+            resultado[s] = tuple(sorted(q + 1 for q in qs))
+    return resultado
+
+
+def buscar_quebras(X, Y, h_frac, n_reg=None, tamanho_lote=TAMANHO_LOTE):
+    """Quebras BIC-ótimas de Y ~ X (X None = só intercepto) por série, em blocos."""
+    S, n = Y.shape
+    h = int(math.floor(h_frac * n))
+    resultado = []
+    for a in range(0, S, tamanho_lote):
+        bloco = Y[a:a + tamanho_lote]
+        if X is None:
+            rss, k = rss_segmentos_media(bloco), 1
+        else:
+            rss, k = rss_segmentos(X, bloco), X.shape[1]
+        resultado.extend(quebras_bic(rss, h, n_reg or k))
+    return resultado
+
+
+def medias_segmentos(Y, quebras):
+    """Médias de cada segmento por série (lista de arrays)."""
+    saida = []
+    for y, qs in zip(Y, quebras):
+        limites = [0] + list(qs) + [y.size]
+        saida.append(np.array([y[limites[s]:limites[s + 1]].mean() for s in range(len(limites) - 1)]))
+    return saida
+
+
+# =====================================================================
+# BFAST
+# =====================================================================
+def bfast_lote(Y, ti, h=H_VARREDURA, max_iter=MAX_ITER, nivel=NIVEL, periodo=FREQUENCIA,
+               ordem=ORDEM_HARMONICA):
+    """
+    bfast(season = "harmonic") para todas as linhas de Y (S, n). Retorna dict
+    com Tt, St (S, n), Tt_inicial (tendência da 1ª iteração, output[[1]] no R),
+    quebras_tendencia e quebras_sazonal (listas de tuplas 1-based) e n_iter.
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    S, n = Y.shape
+    X_t = np.column_stack([np.ones(n), ti])
+    harm = harmonicos(n, periodo, ordem)
+    X_s = np.column_stack([np.ones(n), harm])
+
+    St, _ = stl_lote(Y, periodo, "periodic")
+    Tt = np.zeros_like(Y)
+    Tt_inicial = None
+    bp_t = [()] * S
+    bp_s = [()] * S
+    ativo = np.ones(S, dtype=bool)
+    n_iter = np.zeros(S, dtype=np.int64)
+
+    for _ in range(max_iter):
+        idx = np.flatnonzero(ativo)
+        if idx.size == 0:
+            break
+        ant_t = [bp_t[i] for i in idx]
+        ant_s = [bp_s[i] for i in idx]
+
+        # Tendência
+        Vt = Y[idx] - St[idx]
+        novos_t = [()] * idx.size
+        instavel = np.flatnonzero(teste_mosum(X_t, Vt, h, nivel))
+        if instavel.size:
+            for k, q in zip(instavel, buscar_quebras(X_t, Vt[instavel], h)):
+                novos_t[k] = q
+        Tt_novo = np.empty_like(Vt)
+
+        def ajustar_t(sel, quebras):
+            Tt_novo[sel] = ajustados_lote(desenho_tendencia(ti, quebras), Vt[sel])
+        _por_grupo(novos_t, ajustar_t)
+
+        # Sazonalidade
+        Wt = Y[idx] - Tt_novo
+        novos_s = [()] * idx.size
+        instavel = np.flatnonzero(teste_mosum(X_s, Wt, h, nivel))
+        if instavel.size:
+            for k, q in zip(instavel, buscar_quebras(X_s, Wt[instavel], h)):
+                novos_s[k] = q
+        St_novo = np.empty_like(Wt)
+
+        def ajustar_s(sel, quebras):
+            St_novo[sel] = ajustados_lote(desenho_sazonal(harm, quebras), Wt[sel])
+        _por_grupo(novos_s, ajustar_s)
+
+        Tt[idx] = Tt_novo
+        St[idx] = St_novo
+        if Tt_inicial is None:
+            Tt_inicial = Tt.copy()
+        n_iter[idx] += 1
+        for k, i in enumerate(idx):
+            bp_t[i] = novos_t[k]
+            bp_s[i] = novos_s[k]
+            if novos_t[k] == ant_t[k] and novos_s[k] == ant_s[k]:
+                ativo[i] = False
+
+    return {'Tt': Tt, 'St': St, 'Tt_inicial': Tt_inicial, 'quebras_tendencia': bp_t,
+            'quebras_sazonal': bp_s, 'n_iter': n_iter}
+
+
+def quebras_varredura(resultado):
+    """'varredura': quebras da tendência do bfast, magnitude = salto da Tt na quebra."""
+    saida = []
+    for Tt, qs in zip(resultado['Tt'], resultado['quebras_tendencia']):
+        saida.append([(q - 1, float(Tt[q] - Tt[q - 1])) for q in qs if q < Tt.size])
+    return saida
+
+
+def quebras_varredura_trend(Tt, h=H_TENDENCIA):
+    """'varredura-trend': breakpoints(Tt ~ 1) e diferença das médias dos segmentos."""
+    quebras = buscar_quebras(None, Tt, h)
+    saida = []
+    for qs, medias in zip(quebras, medias_segmentos(Tt, quebras)):
+        saida.append([(q - 1, float(d)) for q, d in zip(qs, np.diff(medias))])
+    return saida
+
+
+# =====================================================================
+# bfastmonitor
+# =====================================================================
+def _lambda_rec_cusum(nivel):
+    """Valor crítico do Rec-CUSUM (fronteira λ(1 + 2t)) para o nível dado."""
+    def p(x):
+        phi = lambda v: 0.5 * (1 + math.erf(v / math.sqrt(2)))
+        return 2 * (1 - phi(3 * x) + math.exp(-4 * x * x) * phi(x))
+    a, b = 0.1, 5.0
+    for _ in range(100):
+        m = 0.5 * (a + b)
+        a, b = (m, b) if p(m) > nivel else (a, m)
+    return 0.5 * (a + b)
+
+
+def residuos_recursivos(X, Y):
+    """Resíduos recursivos (S, n - k) de Y ~ X com desenho compartilhado."""
+    n, k = X.shape
+    saida = np.empty((Y.shape[0], n - k))
+    for r in range(k, n):
+        Xr = X[:r]
+        inv = np.linalg.pinv(Xr.T @ Xr)
+        b = (inv @ Xr.T @ Y[:, :r].T).T
+        x = X[r]
+        saida[:, r - k] = (Y[:, r] - b @ x) / math.sqrt(1 + x @ inv @ x)
+    return saida
+
+
+def inicio_historico_roc(X, Y, nivel=NIVEL):
+    """Índice (0-based) do início do histórico estável pelo Rec-CUSUM reverso (history = "ROC")."""
+    n, k = X.shape
+    w = residuos_recursivos(X[::-1], Y[:, ::-1])
+    nw = w.shape[1]
+    sigma = w.std(axis=1, ddof=1)
+    processo = np.concatenate([np.zeros((Y.shape[0], 1)), np.cumsum(w, axis=1)], axis=1)
+    processo /= (sigma[:, None] * math.sqrt(nw))
+    t = np.arange(nw + 1) / float(nw)
+    lam = _lambda_rec_cusum(nivel)
+    cruza = np.abs(processo[:, 1:]) > lam * (1 + 2 * t[1:])
+    inicio = np.zeros(Y.shape[0], dtype=np.int64)
+    for s in np.flatnonzero(cruza.any(axis=1)):
+        j = int(np.argmax(cruza[s])) + 1          # 1-based em process[-1]
+        inicio[s] = (nw + 1) - j                   # y_start - 1
+    return inicio
+
+
+def distribuicao_monitor(h, fim, n_sim=N_SIMULACOES, passos=400):
+    """Amostra de sup |W(t) - W(t-h) - h W(1)| / sqrt(2 log+ t), t em (1, fim]."""
+    chave = ('mon', round(h, 6), fim, n_sim, passos)
+    if chave not in _SIMULACOES:
+        total = int(passos * fim)
+        nh = int(round(h * passos))
+        t = np.arange(passos, total + 1) / float(passos)
+        fronteira = np.sqrt(2 * np.maximum(1.0, np.log(t)))
+
+        def gerar(rng, n):
+            incr = rng.normal(0.0, 1.0 / math.sqrt(passos), (n, total))
+            W = np.concatenate([np.zeros((n, 1)), np.cumsum(incr, axis=1)], axis=1)
+            M = W[:, passos:] - W[:, passos - nh:total + 1 - nh] - h * W[:, passos:passos + 1]
+            return (np.abs(M) / fronteira).max(axis=1)
+        _SIMULACOES[chave] = _em_blocos(n_sim, gerar)
+    return _SIMULACOES[chave]
+
+
+def desenho_monitor(datas, periodo=FREQUENCIA, tendencia=True, t0=0):
+    """Desenho de response ~ season (+ trend): intercepto, dummies de mês e t = t0+1, t0+2, ..."""
+    n = len(datas)
+    mes = np.array([m - 1 for _, m in datas]) % periodo  # cycle() da série
+    colunas = [np.ones(n)]
+    for c in range(1, periodo):
+        colunas.append((mes == c).astype(np.float64))
+    if tendencia:
+        colunas.append(np.arange(t0 + 1, t0 + n + 1, dtype=np.float64))
+    return np.column_stack(colunas)
+
+
+def bfastmonitor_lote(Y, datas, inicio=INICIO_MONITOR, h=H_MONITOR, fim=FIM_MONITOR,
+                      nivel=NIVEL, periodo=FREQUENCIA, tendencia=True, validos=None):
+    """
+    bfastmonitor(response ~ season + trend, history = "ROC", type = "OLS-MOSUM")
+    em lote; tendencia=False usa response ~ season. `validos` (S, n) marca as
+    observações reais de séries preenchidas: o sigma do histórico sai só
+    delas, já que valores interpolados subestimam o ruído. Retorna listas
+    (por série) de (indice_quebra ou None, magnitude).
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    S, n = Y.shape
+    n_mon = datas.index(tuple(inicio))
+    X = desenho_monitor(datas, periodo, tendencia)
+
+    inicio_hist = inicio_historico_roc(X[:n_mon], Y[:, :n_mon], nivel)
+    lam = np.quantile(distribuicao_monitor(h, fim), 1 - nivel)
+    resultado = [None] * S
+
+    def monitorar(sel, ini):
+        Xh, Yh = X[ini:n_mon], Y[sel, ini:n_mon]
+        nh_hist = n_mon - ini
+        coef, res_h = ols_lote(Xh, Yh)
+        if validos is None:
+            sigma = np.sqrt((res_h ** 2).sum(axis=1) / (nh_hist - X.shape[1]))
+        else:
+            v = validos[sel, ini:n_mon]
+            gl = np.maximum(1, v.sum(axis=1) - X.shape[1])
+            sigma = np.sqrt((res_h ** 2 * v).sum(axis=1) / gl)
+        pred = coef @ X[ini:].T
+        res = Y[sel, ini:] - pred
+        janela = max(1, int(math.floor(h * nh_hist)))
+        acum = np.concatenate([np.zeros((sel.size, 1)), np.cumsum(res, axis=1)], axis=1)
+        tempos = np.arange(nh_hist + 1, n - ini + 1)          # 1-based a partir do início do histórico
+        mosum = (acum[:, tempos] - acum[:, tempos - janela]) / (sigma[:, None] * math.sqrt(nh_hist))
+        fronteira = lam * np.sqrt(2 * np.maximum(1.0, np.log(tempos / float(nh_hist))))
+        cruza = np.abs(mosum) > fronteira
+        magnitude = np.median(res[:, nh_hist:], axis=1)
+        for k, s in enumerate(sel):
+            q = int(ini + tempos[np.argmax(cruza[k])] - 1) if cruza[k].any() else None
+            resultado[s] = (q, float(magnitude[k]))
+
+    _por_grupo(inicio_hist.tolist(), monitorar)
+    return resultado
+
+
+# =====================================================================
+# Tabela de quebras
+# =====================================================================
+def tabela_quebras(series, datas, tipos=TIPOS_SAIDA):
+    """
+    Roda bfast/bfastmonitor para {rótulo: série sem falhas} e devolve as
+    linhas (lado, tipo, date, magnitude) ordenadas como no bfast.R.
+    """
+    rotulos = list(series)
+    Y = np.array([series[r] for r in rotulos], dtype=np.float64)
+    ti = tempo_decimal(datas)
+    res = bfast_lote(Y, ti)
+
+    por_tipo = {}
+    if "varredura" in tipos:
+        por_tipo["varredura"] = quebras_varredura(res)
+    if "varredura-trend" in tipos:
+        # o bfast.R pega a primeira Tt válida de res$output, i.e. a da 1ª iteração
+        por_tipo["varredura-trend"] = quebras_varredura_trend(res['Tt_inicial'])
+    if "monitor" in tipos:
+        por_tipo["monitor"] = [[] if q is None else [(q, m)] for q, m in bfastmonitor_lote(Y, datas)]
+
+    linhas = set()
+    for tipo, por_serie in por_tipo.items():
+        for rotulo, quebras in zip(rotulos, por_serie):
+            for indice, magnitude in quebras:
+                linhas.add((rotulo, tipo, data_iso(datas, indice), magnitude))
+    return sorted(linhas, key=lambda l: (l[0], l[1], l[2]))
+
+
+def escrever_quebras_csv(caminho, linhas):
+    pasta = os.path.dirname(caminho)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    with open(caminho, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['lado', 'tipo', 'date', 'magnitude'])
+        for lado, tipo, data, magnitude in linhas:
+            writer.writerow([lado, tipo, data, repr(float(magnitude))])
+    espelhar_csv(caminho, [{'lado': lado, 'ano': int(data[:4]), 'tipo': tipo, 'date': data,
+                            'magnitude': float(magnitude)} for lado, tipo, data, magnitude in linhas])
+
+
+def ler_quebras_csv(caminho):
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return [(l['lado'], l['tipo'], l['date'], float(l['magnitude'])) for l in csv.DictReader(f)]
+
+
+def _meses(data):
+    ano, mes = int(data[:4]), int(data[5:7])
+    return ano * 12 + mes
+
+
+def conferir_com_referencia(linhas, caminho_referencia=CSV_REFERENCIA,
+                            tol_meses=TOLERANCIA_MESES, tol_magnitude=TOLERANCIA_MAGNITUDE):
+    """
+    Compara com a tabela do bfast.R, só nos tipos presentes nela. Retorna a
+    lista de divergências (vazia = confere).
+    """
+    referencia = ler_quebras_csv(caminho_referencia)
+    tipos = set(r[1] for r in referencia)
+    obtidas = [l for l in linhas if l[1] in tipos]
+    erros = []
+    for chave in sorted(set((r[0], r[1]) for r in referencia) | set((o[0], o[1]) for o in obtidas)):
+        ref = [r for r in referencia if (r[0], r[1]) == chave]
+        obt = [o for o in obtidas if (o[0], o[1]) == chave]
+        if len(ref) != len(obt):
+            erros.append(u"{} {}: {} quebra(s), referência tem {}".format(chave[0], chave[1], len(obt), len(ref)))
+            continue
+        for r, o in zip(ref, obt):
+            if abs(_meses(r[2]) - _meses(o[2])) > tol_meses:
+                erros.append(u"{} {}: data {} (referência {})".format(chave[0], chave[1], o[2], r[2]))
+            elif abs(r[3] - o[3]) > tol_magnitude:
+                erros.append(u"{} {} {}: magnitude {:.4f} (referência {:.4f})".format(
+                    chave[0], chave[1], o[2], o[3], r[3]))
+    return erros
+
+
+if __name__ == "__main__":
+    montadas = montar_series(CSV_NDVI)
+    datas = montadas['datas']
+    series = dict(zip(montadas['rotulos'], montadas['valores']))
+    print(u"--- BFAST (NumPy): {} séries de {} meses ({} a {}) ---".format(
+        len(series), len(datas), data_iso(datas, 0)[:7], data_iso(datas, -1)[:7]))
+
+    linhas = tabela_quebras(series, datas)
+    for l in linhas:
+        print(u"  {:<6} {:<16} {}  {: .4f}".format(*l))
+    escrever_quebras_csv(CSV_SAIDA, linhas)
+    print(u"--- Salvo: {} ---".format(CSV_SAIDA))
+
+    erros = conferir_com_referencia(linhas)
+    for e in erros:
+        print(u"  [DIVERGE] {}".format(e))
+    print(u"--- Conferência com {}: {} ---".format(
+        os.path.basename(CSV_REFERENCIA), "OK" if not erros else "{} divergência(s)".format(len(erros))))
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+# bfastmonitor por pixel sobre o cubo mensal de NDVI (tempo x linha x coluna),
+# em vez da série média por lado que o monthly_series do notebook exporta.
+# Mostra onde, ao longo da PA-458, aconteceu a queda de 2021-2022.
+#
+#   1) montar_cubo: empilha os compósitos mensais PA458_<Lado>_<AAAA>-<MM>*.tif
+#      num .npy mapeado em memória (np.lib.format.open_memmap), completando
+#      o calendário mensal com NaN; cada compósito é lido em faixas de
+#      linhas, então a memória não depende de quantos anos são empilhados;
+#   2) monitorar_cubo: blocos de linhas do cubo vão para um pool de
+#      processos; cada processo abre o .npy em modo leitura, preenche as
+#      falhas de cada pixel (preencher_falhas_lote, o na.interp em lote
+#      de series_mensais.py) e roda o bfastmonitor_lote (bfast_numpy.py)
+#      com os parâmetros do bfast.R (start 2019-01, h 0,25, ROC), mas por
+#      padrão sem o termo de tendência (ver TENDENCIA);
+#   3) saída: dois rasters Float32 na grade do cubo, data da quebra (ano
+#      decimal, como o breakpoint do bfastmonitor) e magnitude (mediana dos
+#      resíduos do período monitorado), nodata -9999.
+#
+# Ao lado do cubo fica um .json com as datas, a grade e a projeção.
+# `python bfast_pixel.py --autoteste` roda o fluxo sobre compósitos sintéticos
+# com uma queda conhecida numa faixa da imagem.
+
+import os
+import re
+import sys
+import json
+import shutil
+import tempfile
+from concurrent.futures import as_completed
+
+import numpy as np
+from osgeo import gdal, osr
+
+from bfast_numpy import bfastmonitor_lote, INICIO_MONITOR, H_MONITOR
+from series_mensais import FREQUENCIA, calendario_mensal, preencher_falhas_lote
+from paralelo import criar_pool, n_processos_padrao
+from perfil_raster import criar_raster, finalizar_raster
+
+# --- CONFIGURAÇÕES ---
+PASTA_MENSAL = r"G:\Meu Drive\PA458_NDVI_Mensal"
+PASTA_SAIDA = r"G:\Meu Drive\PA458_BFAST_Pixel"
+LADOS = ['Leste', 'Oeste']
+PADRAO_MENSAL = re.compile(r"PA458_([A-Za-z]+)_(\d{4})[-_](\d{2})")  # PA458_<Lado>_<AAAA>-<MM>
+
+NODATA = -9999
+# Por processo. Uma fração (FRACAO_BLOCO) vai para o bloco de linhas do cubo
+# (float32 + máscara de válidos); o resto para o sublote de pixels que passa
+# pelo preenchimento e pelo bfastmonitor_lote de cada vez.
+LIMITE_MEMORIA_MB = 256
+FRACAO_BLOCO = 0.25
+# Pico medido por pixel x mês num sublote (float64 e temporários): ~280 B no
+# preencher_falhas_lote (Fourier + STL robusto) e 60-190 B no bfastmonitor_lote
+BYTES_SUBLOTE = 480
+N_PROCESSOS = None        # None = todos os núcleos
+
+INICIO = INICIO_MONITOR     # (2019, 1), como no bfast.R
+# response ~ season + trend (True, como no bfast.R) ou response ~ season.
+# Com histórico curto a tendência extrapolada domina os resíduos: em séries
+# sintéticas sem quebra (24-48 meses de histórico) o teste alarma em 45-70%
+# dos pixels com tendência, contra 4-17% sem ela.
+TENDENCIA = False
+
+# Pixels sem dados suficientes ficam como nodata
+MIN_VALIDOS_HISTORICO = 12   # meses válidos antes do início do monitoramento
+MIN_VALIDOS_MONITOR = 6      # meses válidos no período monitorado
+
+gdal.UseExceptions()
+
+
+# --- Compósitos mensais ---
+def listar_mensais(pasta, lado):
+    """{(ano, mes): caminho} dos compósitos mensais de um lado."""
+    mensais = {}
+    for nome in sorted(os.listdir(pasta)):
+        if not nome.lower().endswith(".tif"):
+            continue
+        m = PADRAO_MENSAL.search(nome)
+        if m and m.group(1).lower() == lado.lower():
+            mensais[(int(m.group(2)), int(m.group(3)))] = os.path.join(pasta, nome)
+    return mensais
+
+
+def _banda_ndvi(ds):
+    """Compósito de 3 bandas (B4, B8, NDVI) ou só NDVI."""
+    return 3 if ds.RasterCount >= 3 else 1
+
+
+def _abrir_na_grade(caminho, grade):
+    """Abre o compósito; se a grade for outra, lê por um VRT reprojetado (vizinho mais próximo)."""
+    ds = gdal.Open(caminho)
+    gt, wkt, xsize, ysize = grade['geotransform'], grade['projecao'], grade['xsize'], grade['ysize']
+    if ds.GetGeoTransform() == tuple(gt) and (ds.RasterXSize, ds.RasterYSize) == (xsize, ysize):
+        return ds
+    limites = (gt[0], gt[3] + ysize * gt[5], gt[0] + xsize * gt[1], gt[3])
+    return gdal.Warp('', ds, format='VRT', dstSRS=wkt, outputBounds=limites,
+                     width=xsize, height=ysize, resampleAlg='near')
+
+
+def _linhas_por_bloco(n_meses, xsize, limite_mb=LIMITE_MEMORIA_MB):
+    """Linhas por bloco: o bloco do cubo (float32) e a máscara de válidos cabem em FRACAO_BLOCO do limite."""
+    bytes_por_linha = max(1, n_meses) * xsize * (4 + 1)
+    return max(1, int(limite_mb * FRACAO_BLOCO * 1024 * 1024 // bytes_por_linha))
+
+
+def _pixels_por_sublote(n_meses, limite_mb=LIMITE_MEMORIA_MB):
+    """Pixels preenchidos e monitorados de cada vez, no restante do limite."""
+    return max(1, int(limite_mb * (1 - FRACAO_BLOCO) * 1024 * 1024 // (max(1, n_meses) * BYTES_SUBLOTE)))
+
+
+def caminho_metadados(caminho_cubo):
+    return os.path.splitext(caminho_cubo)[0] + ".json"
+
+
+def montar_cubo(mensais, caminho_cubo, limite_mb=LIMITE_MEMORIA_MB):
+    """
+    Empilha {(ano, mes): caminho} em `caminho_cubo` (.npy float32, tempo x
+    linha x coluna), NaN nos meses sem compósito e nos pixels sem dado.
+    A grade é a do primeiro compósito. Retorna o dict de metadados.
+    """
+    if not mensais:
+        raise RuntimeError(u"Nenhum compósito mensal para {}".format(os.path.basename(caminho_cubo)))
+    datas = calendario_mensal(min(mensais), max(mensais))
+    ds0 = gdal.Open(mensais[min(mensais)])
+    grade = {'geotransform': list(ds0.GetGeoTransform()), 'projecao': ds0.GetProjection(),
+             'xsize': ds0.RasterXSize, 'ysize': ds0.RasterYSize}
+    ds0 = None
+
+    xsize, ysize = grade['xsize'], grade['ysize']
+    cubo = np.lib.format.open_memmap(caminho_cubo, mode='w+', dtype=np.float32,
+                                     shape=(len(datas), ysize, xsize))
+    nlin = max(1, int(limite_mb * 1024 * 1024 // (xsize * 8)))
+    for t, data in enumerate(datas):
+        if data not in mensais:
+            for y0 in range(0, ysize, nlin):
+                cubo[t, y0:y0 + nlin] = np.nan
+            continue
+        ds = _abrir_na_grade(mensais[data], grade)
+        b = ds.GetRasterBand(_banda_ndvi(ds))
+        nodata = b.GetNoDataValue()
+        for y0 in range(0, ysize, nlin):
+            dados = b.ReadAsArray(0, y0, xsize, min(nlin, ysize - y0)).astype(np.float32)
+            if nodata is not None:
+                dados[dados == nodata] = np.nan
+            cubo[t, y0:y0 + dados.shape[0]] = dados
+        ds = None
+    cubo.flush()
+    del cubo
+
+    meta = dict(grade, datas=["{:04d}-{:02d}".format(a, m) for a, m in datas])
+    with open(caminho_metadados(caminho_cubo), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=1)
+    return meta
+
+
+def ler_metadados(caminho_cubo):
+    with open(caminho_metadados(caminho_cubo), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    meta['datas'] = [tuple(int(p) for p in d.split('-')) for d in meta['datas']]
+    return meta
+
+
+# --- Monitoramento por pixel ---
+def tempo_decimal_quebra(datas, indice):
+    ano, mes = datas[indice]
+    return ano + (mes - 1) / float(FREQUENCIA)
+
+
+def monitorar_bloco(caminho_cubo, datas, y0, nlin, inicio=INICIO, h=H_MONITOR, tendencia=TENDENCIA,
+                    limite_mb=LIMITE_MEMORIA_MB):
+    """
+    Trabalho de um processo: linhas [y0, y0+nlin) do cubo, preenchidas e
+    monitoradas em sublotes de pixels. Devolve (y0, data_quebra, magnitude)
+    como float32 (nlin x colunas), NODATA onde não há quebra / dados suficientes.
+    """
+    cubo = np.load(caminho_cubo, mmap_mode='r')
+    bloco = np.asarray(cubo[:, y0:y0 + nlin, :])
+    n, _, xsize = bloco.shape
+    Y = bloco.reshape(n, -1).T
+    del cubo, bloco
+
+    n_hist = datas.index(tuple(inicio))
+    validos = ~np.isnan(Y)
+    ok = (validos[:, :n_hist].sum(axis=1) >= MIN_VALIDOS_HISTORICO) & \
+         (validos[:, n_hist:].sum(axis=1) >= MIN_VALIDOS_MONITOR)
+
+    data_quebra = np.full(Y.shape[0], NODATA, dtype=np.float32)
+    magnitude = np.full(Y.shape[0], NODATA, dtype=np.float32)
+    idx_ok = np.flatnonzero(ok)
+    passo = _pixels_por_sublote(n, limite_mb)
+    for i in range(0, idx_ok.size, passo):
+        idx = idx_ok[i:i + passo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            resultado = bfastmonitor_lote(preencher_falhas_lote(Y[idx]), datas, inicio=inicio, h=h,
+                                          tendencia=tendencia, validos=validos[idx])
+        for p, (q, mag) in zip(idx, resultado):
+            magnitude[p] = mag
+            if q is not None:
+                data_quebra[p] = tempo_decimal_quebra(datas, q)
+    forma = (nlin, xsize)
+    return y0, data_quebra.reshape(forma), magnitude.reshape(forma)
+
+
+def _criar_saida(caminho, meta, descricao):
+    ds = criar_raster(caminho, meta['xsize'], meta['ysize'], 1, gdal.GDT_Float32)
+    ds.SetGeoTransform(meta['geotransform'])
+    ds.SetProjection(meta['projecao'])
+    b = ds.GetRasterBand(1)
+    b.SetDescription(descricao)
+    b.SetNoDataValue(NODATA)
+    return ds
+
+
+def monitorar_cubo(caminho_cubo, prefixo_saida, inicio=INICIO, tendencia=TENDENCIA,
+                   n_processos=N_PROCESSOS, limite_mb=LIMITE_MEMORIA_MB):
+    """
+    bfastmonitor de todos os pixels do cubo. Grava <prefixo>_quebra_data.tif
+    e <prefixo>_quebra_magnitude.tif e retorna os dois caminhos.
+    """
+    meta = ler_metadados(caminho_cubo)
+    datas, xsize, ysize = meta['datas'], meta['xsize'], meta['ysize']
+    if tuple(inicio) not in datas or datas.index(tuple(inicio)) < MIN_VALIDOS_HISTORICO:
+        raise RuntimeError(u"{}: o cubo ({} a {}) precisa de {:04d}-{:02d} e de ao menos {} meses "
+                           u"de histórico antes dele".format(
+                               os.path.basename(caminho_cubo), "{:04d}-{:02d}".format(*datas[0]),
+                               "{:04d}-{:02d}".format(*datas[-1]), inicio[0], inicio[1],
+                               MIN_VALIDOS_HISTORICO))
+    caminho_data = prefixo_saida + "_quebra_data.tif"
+    caminho_mag = prefixo_saida + "_quebra_magnitude.tif"
+    ds_data = _criar_saida(caminho_data, meta, "data da quebra (ano decimal)")
+    ds_mag = _criar_saida(caminho_mag, meta, "magnitude")
+
+    nlin = min(ysize, _linhas_por_bloco(len(datas), xsize, limite_mb))
+    with criar_pool(min(n_processos_padrao(n_processos), -(-ysize // nlin))) as pool:
+        futuros = [pool.submit(monitorar_bloco, caminho_cubo, datas, y0, min(nlin, ysize - y0),
+                               inicio, H_MONITOR, tendencia, limite_mb)
+                   for y0 in range(0, ysize, nlin)]
+        for fut in as_completed(futuros):
+            y0, data_quebra, magnitude = fut.result()
+            ds_data.GetRasterBand(1).WriteArray(data_quebra, 0, y0)
+            ds_mag.GetRasterBand(1).WriteArray(magnitude, 0, y0)
+
+    ds_data = ds_mag = None
+    return finalizar_raster(caminho_data), finalizar_raster(caminho_mag)
+
+
+def processar_lados(pasta_mensal=PASTA_MENSAL, pasta_saida=PASTA_SAIDA, lados=LADOS):
+    if not os.path.exists(pasta_saida):
+        os.makedirs(pasta_saida)
+    saidas = []
+    for lado in lados:
+        mensais = listar_mensais(pasta_mensal, lado)
+        print(u"--- {}: {} compósito(s) mensal(is) ---".format(lado, len(mensais)))
+        try:
+            caminho_cubo = os.path.join(pasta_saida, "PA458_{}_NDVI_cubo.npy".format(lado))
+            meta = montar_cubo(mensais, caminho_cubo)
+            print(u"  > cubo {} meses x {} x {}".format(len(meta['datas']), meta['ysize'], meta['xsize']))
+            saidas.extend(monitorar_cubo(caminho_cubo, os.path.join(pasta_saida, "PA458_{}_bfastmonitor".format(lado))))
+            print(u"  > {}".format(", ".join(os.path.basename(s) for s in saidas[-2:])))
+        except Exception as e:
+            print(u"  > Erro em {}: {}".format(lado, e))
+    return saidas
+
+
+# --- Compósitos sintéticos (autoteste) ---
+def gerar_mensais_sinteticos(pasta, anos=(2015, 2024), xsize=40, ysize=30, semente=458):
+    """
+    NDVI mensal sazonal com ruído e meses sem dado; nas colunas da metade
+    esquerda o NDVI cai 0,25 a partir de jan/2020. Retorna a data (ano, mes)
+    da queda e a máscara das colunas afetadas.
+    """
+    rng = np.random.RandomState(semente)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32723)
+    gt = (300000.0, 10.0, 0.0, 9880000.0, 0.0, -10.0)
+    queda = (2020, 1)
+    afetados = np.zeros((ysize, xsize), dtype=bool)
+    afetados[:, :xsize // 2] = True
+
+    for ano, mes in calendario_mensal((anos[0], 1), (anos[1], 12)):
+        if rng.rand() < 0.1:
+            continue  # mês sem compósito
+        ndvi = 0.7 + 0.08 * np.sin(2 * np.pi * (mes - 1) / 12.0) + rng.normal(0, 0.02, (ysize, xsize))
+        if (ano, mes) >= queda:
+            ndvi[afetados] -= 0.25
+        ndvi[rng.rand(ysize, xsize) < 0.1] = NODATA  # nuvens
+        caminho = os.path.join(pasta, "PA458_Teste_{:04d}-{:02d}_NDVI.tif".format(ano, mes))
+        ds = gdal.GetDriverByName('GTiff').Create(caminho, xsize, ysize, 1, gdal.GDT_Float32)
+        ds.SetGeoTransform(gt)
+        ds.SetProjection(srs.ExportToWkt())
+        b = ds.GetRasterBand(1)
+        b.SetNoDataValue(NODATA)
+        b.WriteArray(ndvi.astype(np.float32))
+        ds = None
+    return queda, afetados
+
+
+def autoteste(n_processos=2):
+    """Cubo sintético: quebra em 2020 só na metade afetada, magnitude perto de -0,25."""
+    pasta = tempfile.mkdtemp(prefix="bfast_pixel_")
+    erros = []
+    try:
+        queda, afetados = gerar_mensais_sinteticos(pasta)
+        caminho_cubo = os.path.join(pasta, "cubo.npy")
+        montar_cubo(listar_mensais(pasta, "Teste"), caminho_cubo, limite_mb=0.01)
+        # blocos pequenos para exercitar a divisão entre processos
+        caminho_data, caminho_mag = monitorar_cubo(caminho_cubo, os.path.join(pasta, "teste"),
+                                                   n_processos=n_processos, limite_mb=0.05)
+        datas = gdal.Open(caminho_data).GetRasterBand(1).ReadAsArray()
+        mags = gdal.Open(caminho_mag).GetRasterBand(1).ReadAsArray()
+
+        ano_queda = queda[0] + (queda[1] - 1) / 12.0
+        # o MOSUM cruza a fronteira alguns meses depois da queda
+        detectados = (datas != NODATA) & (datas >= ano_queda) & (datas <= ano_queda + 0.5)
+        taxa = detectados[afetados].mean()
+        falsos = (datas[~afetados] != NODATA).mean()
+        if taxa < 0.9:
+            erros.append(u"quebra de {} detectada em {:.0%} dos pixels afetados".format(queda, taxa))
+        if falsos > 0.1:
+            erros.append(u"{:.0%} de quebras na metade estável".format(falsos))
+        mediana = np.median(mags[afetados & detectados]) if detectados.any() else np.nan
+        if not abs(mediana + 0.25) < 0.05:
+            erros.append(u"magnitude mediana {:.3f} (esperado ~ -0.25)".format(mediana))
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    for e in erros:
+        print(u"  [FALHA] {}".format(e))
+    print(u"--- Autoteste: {} ---".format("OK" if not erros else "FALHOU"))
+    return not erros
+
+
+if __name__ == "__main__":
+    if "--autoteste" in sys.argv:
+        sys.exit(0 if autoteste() else 1)
+    processar_lados()
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Cache em disco (SQLite) dos resultados de requisições ao Earth Engine.
+# As células do notebook recalculam as mesmas reduções (NDVI set-nov por
+# ano e lado, CHIRPS mensal) a cada execução; aqui o getInfo só vai ao
+# servidor se a expressão ainda não foi avaliada.
+#
+#   - chave: sha256 do grafo da expressão serializado (objeto.serialize(),
+#     reescrito em JSON canônico) + parâmetros extras, em JSON canônico;
+#   - validade (TTL) por item e limite de tamanho do banco: ao passar do
+#     limite, saem os itens acessados há mais tempo;
+#   - contadores de acertos/faltas por sessão (contadores(cache)).
+#
+# Qualquer objeto com serialize() e getInfo() serve (ee.ComputedObject ou o
+# cliente falso de objeto_falso), então o autoteste roda sem o serviço.
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import shutil
+import tempfile
+import types
+
+# --- CONFIGURAÇÕES ---
+ARQUIVO_CACHE = os.path.join(os.path.expanduser("~"), ".pa458_cache", "ee_resultados.sqlite")
+VALIDADE_S = 30 * 24 * 3600     # resultados mais velhos que isso são refeitos
+TAMANHO_MAXIMO_MB = 200
+
+_CACHE_PADRAO = None
+
+
+# --- Chave ---
+def _json_canonico(valor):
+    return json.dumps(valor, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=repr)
+
+
+def serializar(objeto):
+    """Grafo da expressão como estrutura JSON (objetos EE) ou o próprio valor."""
+    if hasattr(objeto, 'serialize'):
+        return json.loads(objeto.serialize())
+    return objeto
+
+
+def chave_expressao(objeto, parametros=None):
+    texto = _json_canonico(serializar(objeto)) + "|" + _json_canonico(parametros)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+# --- Banco ---
+def abrir_cache(arquivo=ARQUIVO_CACHE, validade_s=VALIDADE_S, tamanho_maximo_mb=TAMANHO_MAXIMO_MB,
+                relogio=time.time):
+    """Estado do cache: conexão, limites e contadores da sessão."""
+    pasta = os.path.dirname(arquivo)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    conexao = sqlite3.connect(arquivo, timeout=30)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute("CREATE TABLE IF NOT EXISTS resultados ("
+                    "chave TEXT PRIMARY KEY, valor TEXT NOT NULL, "
+                    "criado REAL NOT NULL, acessado REAL NOT NULL, tamanho INTEGER NOT NULL)")
+    conexao.execute("CREATE INDEX IF NOT EXISTS resultados_acessado ON resultados (acessado)")
+    conexao.commit()
+    return {
+        'conexao': conexao,
+        'validade_s': validade_s,
+        'tamanho_maximo': int(tamanho_maximo_mb * 1024 * 1024),
+        'relogio': relogio,
+        'contadores': {'acertos': 0, 'faltas': 0, 'expirados': 0, 'despejados': 0},
+    }
+
+
+def fechar_cache(cache):
+    cache['conexao'].close()
+
+
+def cache_padrao():
+    """Cache compartilhado da sessão (ARQUIVO_CACHE), aberto na primeira chamada."""
+    global _CACHE_PADRAO
+    if _CACHE_PADRAO is None:
+        _CACHE_PADRAO = abrir_cache()
+    return _CACHE_PADRAO
+
+
+def contadores(cache=None):
+    return dict((cache or cache_padrao())['contadores'])
+
+
+def consultar(cache, chave):
+    """(True, valor) se a chave está no cache e dentro da validade; (False, None) se não."""
+    agora = cache['relogio']()
+    con = cache['conexao']
+    linha = con.execute("SELECT valor, criado FROM resultados WHERE chave = ?", (chave,)).fetchone()
+    if linha is not None and cache['validade_s'] is not None and agora - linha[1] > cache['validade_s']:
+        con.execute("DELETE FROM resultados WHERE chave = ?", (chave,))
+        con.commit()
+        cache['contadores']['expirados'] += 1
+        linha = None
+    if linha is None:
+        cache['contadores']['faltas'] += 1
+        return False, None
+    con.execute("UPDATE resultados SET acessado = ? WHERE chave = ?", (agora, chave))
+    con.commit()
+    cache['contadores']['acertos'] += 1
+    return True, json.loads(linha[0])
+
+
+def _despejar(cache):
+    """Remove os itens acessados há mais tempo até o banco caber no limite."""
+    con = cache['conexao']
+    total = con.execute("SELECT COALESCE(SUM(tamanho), 0) FROM resultados").fetchone()[0]
+    if total <= cache['tamanho_maximo']:
+        return
+    remover = []
+    for chave, tamanho in con.execute("SELECT chave, tamanho FROM resultados ORDER BY acessado"):
+        if total <= cache['tamanho_maximo']:
+            break
+        remover.append((chave,))
+        total -= tamanho
+    con.executemany("DELETE FROM resultados WHERE chave = ?", remover)
+    con.commit()
+    cache['contadores']['despejados'] += len(remover)
+
+
+def gravar(cache, chave, valor):
+    texto = json.dumps(valor, ensure_ascii=False)
+    agora = cache['relogio']()
+    cache['conexao'].execute("INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?)",
+                             (chave, texto, agora, agora, len(texto.encode('utf-8'))))
+    cache['conexao'].commit()
+    _despejar(cache)
+
+
+def limpar(cache=None):
+    con = (cache or cache_padrao())['conexao']
+    con.execute("DELETE FROM resultados")
+    con.commit()
+
+
+# --- Uso ---
+def get_info(objeto, cache=None, parametros=None):
+    """objeto.getInfo() passando pelo cache (o padrão se `cache` for None)."""
+    return obter(objeto, objeto.getInfo, cache, parametros)
+
+
+def obter(objeto, calcular, cache=None, parametros=None):
+    """
+    Resultado de `calcular()` para a expressão `objeto` + `parametros`: do
+    cache se já avaliado e válido, senão calcula e grava. O valor precisa ser
+    serializável em JSON (o que o getInfo devolve é).
+    """
+    cache = cache or cache_padrao()
+    chave = chave_expressao(objeto, parametros)
+    achou, valor = consultar(cache, chave)
+    if not achou:
+        valor = calcular()
+        gravar(cache, chave, valor)
+    return valor
+
+
+# --- Cliente falso ---
+def objeto_falso(grafo, resultado, chamadas=None):
+    """
+    Objeto com serialize()/getInfo() no lugar de um ee.ComputedObject. Cada
+    getInfo que chega ao "servidor" é anotado em `chamadas` (lista).
+    """
+    def get_info_falso():
+        if chamadas is not None:
+            chamadas.append(grafo)
+        return resultado
+    return types.SimpleNamespace(serialize=lambda: json.dumps(grafo), getInfo=get_info_falso)
+
+
+def autoteste():
+    """Cliente falso: acerto com grafo reordenado, chave com parâmetros, TTL e despejo por tamanho."""
+    pasta = tempfile.mkdtemp(prefix="cache_ee_")
+    erros = []
+    agora = [1000.0]
+    chamadas = []
+    cache = abrir_cache(os.path.join(pasta, "teste.sqlite"), validade_s=60, tamanho_maximo_mb=0.001,
+                        relogio=lambda: agora[0])
+    try:
+        grafo = {'result': '0', 'values': {'0': {'functionInvocationValue': {
+            'functionName': 'Image.reduceRegion', 'arguments': {'scale': {'constantValue': 10}}}}}}
+        # a mesma expressão com as chaves em outra ordem cai na mesma chave
+        reordenado = {'values': grafo['values'], 'result': '0'}
+        a = get_info(objeto_falso(grafo, {'NDVI': 0.71}, chamadas), cache)
+        b = get_info(objeto_falso(reordenado, {'NDVI': 0.71}, chamadas), cache)
+        if a != {'NDVI': 0.71} or b != a:
+            erros.append(u"valores devolvidos {} / {}".format(a, b))
+        if len(chamadas) != 1 or contadores(cache)['acertos'] != 1:
+            erros.append(u"{} chamadas ao servidor para a mesma expressão".format(len(chamadas)))
+
+        get_info(objeto_falso(grafo, {'NDVI': 0.71}, chamadas), cache, parametros={'ano': 2020})
+        if len(chamadas) != 2:
+            erros.append(u"parâmetros diferentes não mudaram a chave")
+
+        agora[0] += 61
+        get_info(objeto_falso(grafo, {'NDVI': 0.72}, chamadas), cache)
+        if len(chamadas) != 3 or contadores(cache)['expirados'] != 1:
+            erros.append(u"item vencido não foi refeito")
+
+        # limite de ~1 kB: saem os acessados há mais tempo, o último fica
+        for i in range(20):
+            agora[0] += 1
+            get_info(objeto_falso({'i': i}, {'valores': list(range(20))}, chamadas), cache)
+        n_itens = cache['conexao'].execute("SELECT COUNT(*) FROM resultados").fetchone()[0]
+        if not contadores(cache)['despejados'] or not 0 < n_itens < 20:
+            erros.append(u"despejo por tamanho: {} itens no banco".format(n_itens))
+        n_chamadas = len(chamadas)
+        get_info(objeto_falso({'i': 19}, None, chamadas), cache)
+        if len(chamadas) != n_chamadas:
+            erros.append(u"item mais recente foi despejado")
+    finally:
+        fechar_cache(cache)
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    for e in erros:
+        print(u"  [FALHA] {}".format(e))
+    print(u"--- Autoteste: {} ---".format("OK" if not erros else "FALHOU"))
+    return not erros
+
+
+if __name__ == "__main__":
+    if "--autoteste" in sys.argv:
+        sys.exit(0 if autoteste() else 1)
+    if "--limpar" in sys.argv:
+        limpar()
+    c = cache_padrao()
+    n, total = c['conexao'].execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM resultados").fetchone()
+    print(u"--- {}: {} resultados, {:.1f} MB ---".format(ARQUIVO_CACHE, n, total / 1024.0 / 1024.0))
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+# Precipitação mensal (CHIRPS) calculada localmente, no lugar do
+# get_monthly_precipitation do notebook (um getInfo por ano no Earth Engine):
+#   - entrada: CHIRPS diário em GeoTIFF (chirps-v2.0.AAAA.MM.DD.tif, já
+#     descompactado) ou NetCDF anual (chirps-v2.0.AAAA.days_p05.nc);
+#   - GeoTIFF sem compressão é lido por np.memmap direto do arquivo: só as
+#     linhas da janela da AOI saem do disco. Os demais passam pelo GDAL,
+#     também só na janela;
+#   - pesos da AOI: fração de cada pixel CHIRPS (0,05°) coberta pelo
+#     polígono (rasterização superamostrada), calculados uma vez por grade e
+#     guardados em ~/.pa458_cache/chirps; a média espacial é ponderada, como
+#     o reduceRegion(mean) do EE;
+#   - média diária da AOI gravada em cache por arquivo (validada por mtime e
+#     tamanho): ao chegar um mês novo, só os arquivos novos são lidos;
+#   - total mensal (mm) de todos os anos num único bincount sobre os dias.
+#
+# A tabela sai como region,date (AAAA-MM),precip_mm,n_dias, o mesmo formato
+# de mês do CSV mensal de NDVI; covariavel() alinha a chuva com as datas de
+# series_mensais para uso nas análises de quebra.
+#
+# `python chirps_local.py` grava outputs/precipitacao_mensal_chirps.csv.
+
+import os
+import re
+import csv
+import sys
+import glob
+import shutil
+import hashlib
+import datetime
+import tempfile
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from tabelas import espelhar_csv
+from recorte_paralelo import chave_grade, janela_da_mascara, _separar_fonte
+from zonal_lote import MASCARAS_LADO
+
+# --- CONFIGURAÇÕES ---
+PASTA_CHIRPS = r"G:\Meu Drive\CHIRPS\diario"
+PADROES = ("chirps-v2.0.*.tif", "chirps-v2.0.*.nc")
+# mesmo polígono do asset projects/ee-samuelsantosambientalcourse/assets/PA-458
+# usado pelo notebook (não o buffer_total.gpkg do recorte)
+CAMINHO_PA458 = r"G:\Meu Drive\PA458_ByPolygons\PA-458.gpkg"
+REGIOES = dict(MASCARAS_LADO, **{'PA-458': CAMINHO_PA458})
+PASTA_CACHE = os.path.join(os.path.expanduser("~"), ".pa458_cache", "chirps")
+SUPERAMOSTRAGEM = 10       # subpixels por lado na fração de cobertura
+CSV_SAIDA = os.path.join("outputs", "precipitacao_mensal_chirps.csv")
+COLUNAS = ['region', 'date', 'precip_mm', 'n_dias']
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+
+# --- Arquivos e datas ---
+def _datas_netcdf(ds, ano):
+    """Dia de cada banda pelo NETCDF_DIM_time (unidade 'days since ...'); sem ele, 1º de jan em diante."""
+    unidade = ds.GetMetadataItem('time#units') or ""
+    m = re.match(r"days since (\d{4})-(\d{1,2})-(\d{1,2})", unidade)
+    datas = []
+    for i in range(ds.RasterCount):
+        valor = ds.GetRasterBand(i + 1).GetMetadataItem('NETCDF_DIM_time')
+        if m and valor is not None:
+            d = datetime.date(int(m.group(1)), int(m.group(2)), int(m.group(3))) + datetime.timedelta(days=float(valor))
+        else:
+            d = datetime.date(ano, 1, 1) + datetime.timedelta(days=i)
+        datas.append(d.year * 10000 + d.month * 100 + d.day)
+    return datas
+
+
+def listar_arquivos(pasta=PASTA_CHIRPS, padroes=PADROES):
+    """[(caminho, [AAAAMMDD por banda])] dos arquivos diários (tif) e anuais (nc) da pasta."""
+    arquivos = []
+    for padrao in padroes:
+        for caminho in sorted(glob.glob(os.path.join(pasta, padrao))):
+            nome = os.path.basename(caminho)
+            diario = re.search(r"(\d{4})\.(\d{2})\.(\d{2})\.tif$", nome)
+            if diario:
+                arquivos.append((caminho, [int("".join(diario.groups()))]))
+                continue
+            anual = re.search(r"(\d{4})\.days", nome)
+            if anual and nome.endswith(".nc"):
+                arquivos.append((caminho, _datas_netcdf(gdal.Open(caminho), int(anual.group(1)))))
+    return arquivos
+
+
+# --- Pesos da AOI ---
+def _camada(caminho_poligono):
+    arquivo, camada = _separar_fonte(caminho_poligono)
+    vds = ogr.Open(arquivo)
+    return vds, vds.GetLayerByName(camada) if camada else vds.GetLayer(0)
+
+
+def _rasterizar(lyr, gt, xsize, ysize, wkt, opcoes=None):
+    mem = gdal.GetDriverByName('MEM').Create('', xsize, ysize, 1, gdal.GDT_Byte)
+    mem.SetGeoTransform(gt)
+    mem.SetProjection(wkt)
+    gdal.RasterizeLayer(mem, [1], lyr, burn_values=[1], options=opcoes or [])
+    return mem.GetRasterBand(1).ReadAsArray()
+
+
+def calcular_pesos(ds, caminho_poligono, superamostragem=SUPERAMOSTRAGEM):
+    """
+    (janela, pesos): janela (xoff, yoff, largura, altura) dos pixels tocados
+    pelo polígono e a fração de cada um coberta por ele. AOI sem área (linha)
+    cai nos pixels tocados com peso 1.
+    """
+    vds, lyr = _camada(caminho_poligono)
+    gt, wkt = ds.GetGeoTransform(), ds.GetProjection()
+    tocados = _rasterizar(lyr, gt, ds.RasterXSize, ds.RasterYSize, wkt, ['ALL_TOUCHED=TRUE']).astype(bool)
+    janela = janela_da_mascara(tocados)
+    if janela is None:
+        raise ValueError(u"{} não toca a grade do CHIRPS".format(caminho_poligono))
+    xoff, yoff, largura, altura = janela
+    s = superamostragem
+    gt_fino = (gt[0] + xoff * gt[1] + yoff * gt[2], gt[1] / s, gt[2] / s,
+               gt[3] + xoff * gt[4] + yoff * gt[5], gt[4] / s, gt[5] / s)
+    fino = _rasterizar(lyr, gt_fino, largura * s, altura * s, wkt)
+    pesos = fino.reshape(altura, s, largura, s).mean(axis=(1, 3))
+    if not pesos.any():
+        pesos = tocados[yoff:yoff + altura, xoff:xoff + largura].astype(np.float64)
+    return janela, pesos
+
+
+def pesos_da_grade(ds, caminho_poligono, pasta_cache=PASTA_CACHE):
+    """calcular_pesos com cache em disco por (polígono, grade)."""
+    chave = chave_grade(ds, caminho_poligono)
+    caminho = os.path.join(pasta_cache, "pesos_{}.npz".format(chave))
+    if os.path.exists(caminho):
+        with np.load(caminho) as z:
+            return tuple(int(v) for v in z['janela']), z['pesos'], chave
+    janela, pesos = calcular_pesos(ds, caminho_poligono)
+    if not os.path.exists(pasta_cache):
+        os.makedirs(pasta_cache)
+    tmp = "{}.{}.tmp.npz".format(caminho, os.getpid())
+    np.savez(tmp, janela=np.array(janela), pesos=pesos)
+    os.replace(tmp, caminho)
+    return janela, pesos, chave
+
+
+# --- Leitura ---
+def memmap_gtiff(ds, caminho):
+    """
+    Banda de um GeoTIFF Float32 sem compressão, em faixas de linhas inteiras
+    e contíguas, como np.memmap (linhas x colunas); None se o layout não permitir.
+    """
+    if ds.GetDriver().ShortName != 'GTiff' or ds.RasterCount != 1:
+        return None
+    if ds.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE'):
+        return None
+    b = ds.GetRasterBand(1)
+    if b.DataType != gdal.GDT_Float32 or b.GetBlockSize()[0] != ds.RasterXSize:
+        return None
+    linhas_faixa = b.GetBlockSize()[1]
+    n_faixas = -(-ds.RasterYSize // linhas_faixa)
+    inicio = b.GetMetadataItem('BLOCK_OFFSET_0_0', 'TIFF')
+    ultimo = b.GetMetadataItem('BLOCK_OFFSET_0_{}'.format(n_faixas - 1), 'TIFF')
+    if inicio is None or ultimo is None:
+        return None
+    if int(ultimo) - int(inicio) != (n_faixas - 1) * linhas_faixa * ds.RasterXSize * 4:
+        return None
+    with open(caminho, 'rb') as f:
+        ordem = '<' if f.read(2) == b'II' else '>'
+    return np.memmap(caminho, dtype=ordem + 'f4', mode='r', offset=int(inicio),
+                     shape=(ds.RasterYSize, ds.RasterXSize))
+
+
+def ler_janela(caminho, janela):
+    """Valores (bandas, altura, largura) float64 da janela, NaN em nodata e negativos."""
+    ds = gdal.Open(caminho)
+    xoff, yoff, largura, altura = janela
+    mapa = memmap_gtiff(ds, caminho)
+    if mapa is not None:
+        v = np.array(mapa[yoff:yoff + altura, xoff:xoff + largura], dtype=np.float64)[None]
+    else:
+        v = ds.ReadAsArray(xoff, yoff, largura, altura).astype(np.float64).reshape(-1, altura, largura)
+    nodata = ds.GetRasterBand(1).GetNoDataValue()
+    invalido = ~np.isfinite(v) | (v < 0)
+    if nodata is not None:
+        invalido |= v == nodata
+    v[invalido] = np.nan
+    return v
+
+
+def medias_ponderadas(valores, pesos):
+    """Média ponderada de cada banda, renormalizando pelos pixels válidos (NaN se nenhum)."""
+    validos = np.isfinite(valores)
+    num = np.where(validos, valores, 0.0).reshape(valores.shape[0], -1) @ pesos.ravel()
+    den = validos.reshape(valores.shape[0], -1) @ pesos.ravel()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def _assinatura(caminho):
+    st = os.stat(caminho)
+    return np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+
+
+def medias_diarias(arquivos, caminho_poligono, pasta_cache=PASTA_CACHE):
+    """(dias AAAAMMDD, média diária da AOI em mm) de todos os arquivos, lendo só os que mudaram."""
+    dias, valores = [], []
+    for caminho, datas in arquivos:
+        ds = gdal.Open(caminho)
+        janela, pesos, chave = pesos_da_grade(ds, caminho_poligono, pasta_cache)
+        pasta = os.path.join(pasta_cache, chave)
+        item = os.path.join(pasta, hashlib.sha1(os.path.abspath(caminho).encode('utf-8')).hexdigest() + ".npz")
+        assinatura = _assinatura(caminho)
+        if os.path.exists(item):
+            with np.load(item) as z:
+                if np.array_equal(z['assinatura'], assinatura):
+                    dias.append(z['dias'])
+                    valores.append(z['valores'])
+                    continue
+        medias = medias_ponderadas(ler_janela(caminho, janela), pesos)
+        if not os.path.exists(pasta):
+            os.makedirs(pasta)
+        tmp = "{}.{}.tmp.npz".format(item, os.getpid())
+        np.savez(tmp, assinatura=assinatura, dias=np.array(datas, dtype=np.int64), valores=medias)
+        os.replace(tmp, item)
+        dias.append(np.array(datas, dtype=np.int64))
+        valores.append(medias)
+    if not dias:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    dias, valores = np.concatenate(dias), np.concatenate(valores)
+    dias, primeiro = np.unique(dias, return_index=True)        # mesmo dia em tif e nc: vale o primeiro
+    return dias, valores[primeiro]
+
+
+def totais_mensais(dias, valores):
+    """
+    Soma das médias diárias por mês, todos os anos num único bincount.
+    Retorna {'datas': [(ano, mes)], 'precip_mm', 'n_dias'}; mês sem dia válido = NaN.
+    """
+    if dias.size == 0:
+        return {'datas': [], 'precip_mm': np.zeros(0), 'n_dias': np.zeros(0, dtype=np.int64)}
+    ano, mes = dias // 10000, dias // 100 % 100
+    ano0 = int(ano.min())
+    indice = (ano - ano0) * 12 + mes - 1
+    validos = np.isfinite(valores)
+    n_meses = int(indice.max()) + 1
+    total = np.bincount(indice[validos], weights=valores[validos], minlength=n_meses)
+    n_dias = np.bincount(indice[validos], minlength=n_meses)
+    primeiro = int(indice.min())
+    datas = [(ano0 + i // 12, i % 12 + 1) for i in range(primeiro, n_meses)]
+    total = np.where(n_dias > 0, total, np.nan)[primeiro:]
+    return {'datas': datas, 'precip_mm': total, 'n_dias': n_dias[primeiro:]}
+
+
+def precipitacao_mensal(pasta=PASTA_CHIRPS, caminho_poligono=REGIOES['PA-458'], pasta_cache=PASTA_CACHE):
+    return totais_mensais(*medias_diarias(listar_arquivos(pasta), caminho_poligono, pasta_cache))
+
+
+# --- Uso ---
+def covariavel(mensal, datas):
+    """Precipitação alinhada às datas [(ano, mes)] de series_mensais (NaN onde não houver)."""
+    por_data = dict(zip(mensal['datas'], mensal['precip_mm'].tolist()))
+    return np.array([por_data.get(tuple(d), np.nan) for d in datas], dtype=np.float64)
+
+
+def por_ano(mensal, anos):
+    """{ano: [jan..dez]} no formato do get_monthly_precipitation do notebook."""
+    return dict((a, covariavel(mensal, [(a, m) for m in range(1, 13)]).tolist()) for a in anos)
+
+
+def escrever_csv(caminho, por_regiao):
+    pasta = os.path.dirname(caminho)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    linhas = []
+    for regiao in sorted(por_regiao):
+        m = por_regiao[regiao]
+        for (ano, mes), p, n in zip(m['datas'], m['precip_mm'].tolist(), m['n_dias'].tolist()):
+            linhas.append({'region': regiao, 'date': "{:04d}-{:02d}".format(ano, mes), 'ano': ano, 'mes': mes,
+                           'precip_mm': None if np.isnan(p) else round(p, 3), 'n_dias': int(n)})
+    with open(caminho, 'w', encoding='utf-8', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(COLUNAS)
+        for l in linhas:
+            w.writerow([l['region'], l['date'], "" if l['precip_mm'] is None else l['precip_mm'], l['n_dias']])
+    if linhas:
+        espelhar_csv(caminho, linhas, particoes=('region', 'ano'))
+    return caminho
+
+
+# --- Autoteste ---
+def _gravar_dia(caminho, dados, gt, srs, comprimir=False):
+    opcoes = ['COMPRESS=DEFLATE', 'TILED=YES'] if comprimir else []
+    ds = gdal.GetDriverByName('GTiff').Create(caminho, dados.shape[1], dados.shape[0], 1, gdal.GDT_Float32, opcoes)
+    ds.SetGeoTransform(gt)
+    ds.SetProjection(srs.ExportToWkt())
+    ds.GetRasterBand(1).SetNoDataValue(-9999)
+    ds.GetRasterBand(1).WriteArray(dados)
+    ds = None
+
+
+def autoteste():
+    """Grade 0,05° sintética: memmap = GDAL, pesos de cobertura, totais mensais e cache por arquivo."""
+    pasta = tempfile.mkdtemp(prefix="chirps_")
+    erros = []
+    try:
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(4326)
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        gt = (-48.0, 0.05, 0.0, -0.5, 0.0, -0.05)
+        # polígono cobrindo exatamente as colunas 2-5 e metade das linhas 3 e 6 (linhas 4-5 inteiras)
+        x0, x1 = gt[0] + 2 * 0.05, gt[0] + 6 * 0.05
+        y0, y1 = gt[3] - 3.5 * 0.05, gt[3] - 6.5 * 0.05
+        caminho_aoi = os.path.join(pasta, "aoi.gpkg")
+        vds = ogr.GetDriverByName('GPKG').CreateDataSource(caminho_aoi)
+        lyr = vds.CreateLayer("aoi", srs=srs, geom_type=ogr.wkbPolygon)
+        feat = ogr.Feature(lyr.GetLayerDefn())
+        feat.SetGeometry(ogr.CreateGeometryFromWkt("POLYGON(({0} {2},{1} {2},{1} {3},{0} {3},{0} {2}))"
+                                                   .format(x0, x1, y0, y1)))
+        lyr.CreateFeature(feat)
+        feat = lyr = vds = None
+
+        rng = np.random.RandomState(458)
+        esperado = {}
+        peso = np.zeros((12, 10))
+        peso[3:7, 2:6] = [[0.5], [1.0], [1.0], [0.5]]
+        data = datetime.date(2020, 1, 25)
+        for i in range(40):                         # 25/jan a 04/mar
+            dados = rng.gamma(1.0, 8.0, (12, 10)).astype(np.float32)
+            dados[0, 0] = -9999
+            _gravar_dia(os.path.join(pasta, "chirps-v2.0.{:%Y.%m.%d}.tif".format(data)), dados, gt, srs,
+                        comprimir=(i % 2 == 1))
+            chave = (data.year, data.month)
+            esperado[chave] = esperado.get(chave, 0.0) + float((dados * peso).sum() / peso.sum())
+            data += datetime.timedelta(days=1)
+
+        arquivos = listar_arquivos(pasta)
+        ds = gdal.Open(arquivos[0][0])
+        mapa = memmap_gtiff(ds, arquivos[0][0])
+        if mapa is None or not np.array_equal(np.asarray(mapa), ds.ReadAsArray()):
+            erros.append(u"memmap do GeoTIFF sem compressão difere do GDAL")
+        if memmap_gtiff(gdal.Open(arquivos[1][0]), arquivos[1][0]) is not None:
+            erros.append(u"memmap aceitou GeoTIFF comprimido")
+
+        janela, pesos = calcular_pesos(ds, caminho_aoi)
+        if janela != (2, 3, 4, 4) or not np.allclose(pesos[pesos > 0].sum(), peso.sum(), atol=0.05):
+            erros.append(u"pesos da AOI: janela {}, soma {:.3f}".format(janela, pesos.sum()))
+
+        cache = os.path.join(pasta, "cache")
+        mensal = totais_mensais(*medias_diarias(arquivos, caminho_aoi, cache))
+        if mensal['datas'] != [(2020, 1), (2020, 2), (2020, 3)] or mensal['n_dias'].tolist() != [7, 29, 4]:
+            erros.append(u"meses {} com {} dias".format(mensal['datas'], mensal['n_dias'].tolist()))
+        else:
+            obtido = dict(zip(mensal['datas'], mensal['precip_mm'].tolist()))
+            for chave, valor in esperado.items():
+                if abs(obtido[chave] - valor) > 1e-3 * max(1.0, valor):
+                    erros.append(u"{}: {:.3f} mm (esperado {:.3f})".format(chave, obtido[chave], valor))
+
+        # cache: sem mudança nos arquivos, nenhum item é regravado
+        itens = glob.glob(os.path.join(cache, "*", "*.npz"))
+        antes = dict((c, os.stat(c).st_mtime_ns) for c in itens)
+        dias, valores = medias_diarias(arquivos, caminho_aoi, cache)
+        if len(itens) != len(arquivos) or any(os.stat(c).st_mtime_ns != t for c, t in antes.items()):
+            erros.append(u"cache por arquivo: {} itens para {} arquivos, ou regravados".format(
+                len(itens), len(arquivos)))
+        if not np.allclose(totais_mensais(dias, valores)['precip_mm'], mensal['precip_mm']):
+            erros.append(u"totais com o cache diferem da primeira leitura")
+
+        if not np.isnan(por_ano(mensal, [2020])[2020][3]):
+            erros.append(u"mês sem dados deveria ser NaN")
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    for e in erros:
+        print(u"  [FALHA] {}".format(e))
+    print(u"--- Autoteste: {} ---".format("OK" if not erros else "FALHOU"))
+    return not erros
+
+
+if __name__ == "__main__":
+    if "--autoteste" in sys.argv:
+        sys.exit(0 if autoteste() else 1)
+    arquivos = listar_arquivos()
+    print(u"--- CHIRPS: {} arquivo(s) em {} ---".format(len(arquivos), PASTA_CHIRPS))
+    por_regiao = {}
+    for regiao, caminho_poligono in sorted(REGIOES.items()):
+        por_regiao[regiao] = totais_mensais(*medias_diarias(arquivos, caminho_poligono))
+        m = por_regiao[regiao]
+        if m['datas']:
+            print(u"  {:<7} {} meses ({:04d}-{:02d} a {:04d}-{:02d}), média {:.1f} mm/mês".format(
+                regiao, len(m['datas']), m['datas'][0][0], m['datas'][0][1], m['datas'][-1][0],
+                m['datas'][-1][1], float(np.nanmean(m['precip_mm']))))
+    print(u"--- Salvo: {} ---".format(escrever_csv(CSV_SAIDA, por_regiao)))
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+# Limites de classe únicos para todos os anos e lados. Os scripts calculam o
+# Intervalo Igual com o min/max de cada raster, então a classe 3 de 2019 e a
+# de 2024 cobrem faixas de NDVI diferentes e o Sankey mistura mudança real
+# com deslocamento dos limites. Aqui:
+#   - histograma_global: soma os histogramas de faixa fixa (-1..1, 200 bins)
+#     do estatisticas_cache.py, uma leitura por raster no máximo (rasters
+#     inalterados não são relidos), mais o min/max global;
+#   - limites_globais: os limites saem só do histograma somado, por qualquer
+#     método, sem voltar aos pixels:
+#       "intervalo" -> Intervalo Igual entre o min e o max globais;
+#       "quantil"   -> classes com a mesma quantidade de pixels;
+#       "jenks"     -> quebras naturais (Fisher-Jenks sobre os bins);
+#       "fixo"      -> LIMIARES_FIXOS;
+#   - reclassificar_lote: reaplica os limites a todos os rasters em blocos
+#     (<nome>_classes.tif, entrada do modo "raster" da transição); para os
+#     vetores, vetorizacao_paralela.vetorizar_lote(..., limites=...).
+#
+# A precisão de "quantil" e "jenks" é a largura do bin (0,01 de NDVI).
+#
+# `python classes_globais.py [metodo] [--reclassificar | --vetorizar]`
+# mostra os limites de todos os métodos e a fração de pixels por classe.
+
+import os
+import sys
+import json
+
+import numpy as np
+from osgeo import gdal
+
+from paralelo import criar_pool
+from perfil_raster import criar_raster, finalizar_raster
+from estatisticas_cache import registrar_estatisticas
+from vetorizacao_paralela import (N_CLASSES, NODATA, PASTA_SAIDA, banda_ndvi, classificar_intervalos,
+                                  limites_intervalo_igual, listar_rasters_ndvi, nome_seguro,
+                                  vetorizar_lote, _ler_estatisticas)
+
+# --- CONFIGURAÇÕES ---
+METODO = "intervalo"
+METODOS = ("intervalo", "quantil", "jenks", "fixo")
+# Cortes entre as 5 classes do ROTULOS_MAPA (Não-Vegetação/Água ... Saudável e Vigoroso)
+LIMIARES_FIXOS = (0.2, 0.4, 0.6, 0.8)
+MARGEM = 0.0001          # o min global também precisa cair na 1ª classe (min < valor <= max)
+LINHAS_POR_BLOCO = 512
+ARQUIVO_LIMITES = os.path.join(PASTA_SAIDA, "limites_classes.json")
+
+gdal.UseExceptions()
+
+
+# --- Histograma ---
+def histograma_global(caminhos, n_processos=None):
+    """
+    Soma dos histogramas de faixa fixa dos rasters (banda NDVI de cada um).
+    Retorna {'histograma', 'bordas', 'min', 'max', 'n'}.
+    """
+    total = bordas = None
+    vmin, vmax = np.inf, -np.inf
+    with criar_pool(n_processos) as pool:
+        for caminho, (banda, stats, novo) in zip(caminhos, pool.map(_ler_estatisticas, caminhos)):
+            if novo:
+                registrar_estatisticas(caminho, banda, stats)
+            if not stats['n_validos']:
+                continue
+            hist = np.array(stats['histograma'], dtype=np.int64)
+            if total is None:
+                total = hist
+                bordas = np.linspace(stats['faixa'][0], stats['faixa'][1], hist.size + 1)
+            elif hist.size != total.size or not np.allclose(stats['faixa'], [bordas[0], bordas[-1]]):
+                raise ValueError(u"Histograma de {} com faixa/bins diferentes; limpe o cache de estatísticas."
+                                 .format(caminho))
+            else:
+                total += hist
+            vmin = min(vmin, stats['min'])
+            vmax = max(vmax, stats['max'])
+    if total is None:
+        raise ValueError(u"Nenhum pixel válido nos rasters informados")
+    return {'histograma': total, 'bordas': bordas, 'min': vmin, 'max': vmax, 'n': int(total.sum())}
+
+
+# --- Métodos ---
+def _fechar(limites, vmin, vmax):
+    """Estende o primeiro e o último limite até o min/max globais (com MARGEM)."""
+    limites = np.array(limites, dtype=np.float64)
+    limites[0] = min(limites[0], vmin) - MARGEM
+    limites[-1] = max(limites[-1], vmax) + MARGEM
+    return limites
+
+
+def limites_quantis(hist, bordas, n_classes=N_CLASSES):
+    """Limites com n_classes frações iguais de pixels (interpolação linear dentro do bin)."""
+    acum = np.concatenate([[0], np.cumsum(hist)]).astype(np.float64)
+    alvos = acum[-1] * np.arange(1, n_classes) / float(n_classes)
+    ocupados = np.flatnonzero(hist)
+    limites = [bordas[ocupados[0]]]
+    for alvo in alvos:
+        i = min(max(int(np.searchsorted(acum, alvo, side='left')), 1), hist.size)
+        dentro = (alvo - acum[i - 1]) / hist[i - 1] if hist[i - 1] else 1.0
+        limites.append(bordas[i - 1] + dentro * (bordas[i] - bordas[i - 1]))
+    limites.append(bordas[ocupados[-1] + 1])
+    return np.array(limites)
+
+
+def limites_jenks(hist, bordas, n_classes=N_CLASSES):
+    """
+    Fisher-Jenks sobre os centros dos bins ocupados, ponderados pela contagem:
+    minimiza a soma dos desvios quadráticos dentro das classes (programação
+    dinâmica, O(n_classes x bins²)). Os limites ficam na borda superior do
+    último bin de cada classe.
+    """
+    ocupados = np.flatnonzero(hist)
+    if ocupados.size < n_classes:
+        raise ValueError(u"Só {} bins ocupados para {} classes".format(ocupados.size, n_classes))
+    w = hist[ocupados].astype(np.float64)
+    c = 0.5 * (bordas[ocupados] + bordas[ocupados + 1])
+    W = np.concatenate([[0], np.cumsum(w)])
+    S1 = np.concatenate([[0], np.cumsum(w * c)])
+    S2 = np.concatenate([[0], np.cumsum(w * c * c)])
+    m = ocupados.size
+
+    def ssd(i, j):
+        """Desvio quadrático dos bins ocupados i..j-1 (vetorizado em i)."""
+        return S2[j] - S2[i] - (S1[j] - S1[i]) ** 2 / (W[j] - W[i])
+
+    custo = np.full((n_classes + 1, m + 1), np.inf)
+    origem = np.zeros((n_classes + 1, m + 1), dtype=np.int64)
+    custo[0, 0] = 0.0
+    for k in range(1, n_classes + 1):
+        for j in range(k, m + 1):
+            i = np.arange(k - 1, j)
+            cand = custo[k - 1, i] + ssd(i, j)
+            melhor = int(np.argmin(cand))
+            custo[k, j] = cand[melhor]
+            origem[k, j] = i[melhor]
+    cortes = []
+    j = m
+    for k in range(n_classes, 0, -1):
+        cortes.append(j)
+        j = origem[k, j]
+    cortes = sorted(cortes)
+    return np.array([bordas[ocupados[0]]] + [bordas[ocupados[j - 1] + 1] for j in cortes])
+
+
+def limites_fixos(vmin, vmax, limiares=LIMIARES_FIXOS):
+    return np.array([min(vmin, limiares[0])] + list(limiares) + [max(vmax, limiares[-1])], dtype=np.float64)
+
+
+def limites_metodo(estat, metodo=METODO, n_classes=N_CLASSES):
+    """Limites (n_classes + 1, crescentes) do método a partir do histograma global."""
+    hist, bordas, vmin, vmax = estat['histograma'], estat['bordas'], estat['min'], estat['max']
+    if metodo == "intervalo":
+        limites = limites_intervalo_igual(vmin, vmax, n_classes)
+    elif metodo == "quantil":
+        limites = limites_quantis(hist, bordas, n_classes)
+    elif metodo == "jenks":
+        limites = limites_jenks(hist, bordas, n_classes)
+    elif metodo == "fixo":
+        limites = limites_fixos(vmin, vmax)
+    else:
+        raise ValueError(u"Método de limites desconhecido: {} (use {})".format(metodo, ", ".join(METODOS)))
+    return _fechar(limites, vmin, vmax)
+
+
+def limites_globais(caminhos, metodo=METODO, n_classes=N_CLASSES, n_processos=None):
+    return limites_metodo(histograma_global(caminhos, n_processos), metodo, n_classes)
+
+
+def fracoes_classes(estat, limites):
+    """Fração dos pixels em cada classe, estimada pelo histograma (centro dos bins)."""
+    centros = 0.5 * (estat['bordas'][:-1] + estat['bordas'][1:])
+    classe = np.clip(np.digitize(centros, limites, right=True), 1, len(limites) - 1)
+    return np.bincount(classe - 1, weights=estat['histograma'], minlength=len(limites) - 1) / float(estat['n'])
+
+
+def tabela_reclassificacao(limites):
+    """Tabela do native:reclassifybytable (min, max, classe) com os limites dados."""
+    tabela = []
+    for i in range(len(limites) - 1):
+        tabela.extend([float(limites[i]), float(limites[i + 1]), i + 1])
+    return tabela
+
+
+def salvar_limites(limites, metodo, caminho=ARQUIVO_LIMITES):
+    pasta = os.path.dirname(caminho)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump({'metodo': metodo, 'limites': [float(v) for v in limites]}, f, indent=2)
+    return caminho
+
+
+# --- Reclassificação ---
+def _reclassificar_um(caminho, limites, pasta_saida, linhas_por_bloco=LINHAS_POR_BLOCO):
+    ds = gdal.Open(caminho)
+    b = ds.GetRasterBand(banda_ndvi(ds))
+    nodata = b.GetNoDataValue()
+    caminho_classes = os.path.join(pasta_saida, "{}_classes.tif".format(nome_seguro(caminho)))
+    saida = criar_raster(caminho_classes, ds.RasterXSize, ds.RasterYSize, 1, gdal.GDT_Int16)
+    saida.SetGeoTransform(ds.GetGeoTransform())
+    saida.SetProjection(ds.GetProjection())
+    sb = saida.GetRasterBand(1)
+    sb.SetNoDataValue(NODATA)
+    for y0 in range(0, ds.RasterYSize, linhas_por_bloco):
+        nlin = min(linhas_por_bloco, ds.RasterYSize - y0)
+        sb.WriteArray(classificar_intervalos(b.ReadAsArray(0, y0, ds.RasterXSize, nlin), limites, nodata), 0, y0)
+    sb = saida = None
+    finalizar_raster(caminho_classes)
+    return caminho_classes
+
+
+def reclassificar_lote(caminhos, limites, pasta_saida=PASTA_SAIDA, n_processos=None):
+    """<nome>_classes.tif de cada raster com os mesmos limites, um raster por processo."""
+    if not os.path.exists(pasta_saida):
+        os.makedirs(pasta_saida)
+    with criar_pool(n_processos) as pool:
+        saidas = list(pool.map(_reclassificar_um, caminhos, [limites] * len(caminhos),
+                               [pasta_saida] * len(caminhos)))
+    return dict(zip(caminhos, saidas))
+
+
+if __name__ == "__main__":
+    metodo = next((a for a in sys.argv[1:] if a in METODOS), METODO)
+    rasters = listar_rasters_ndvi()
+    estat = histograma_global(rasters)
+    print(u"--- {} rasters, {} pixels, NDVI de {:.4f} a {:.4f} ---".format(
+        len(rasters), estat['n'], estat['min'], estat['max']))
+    for m in METODOS:
+        limites = limites_metodo(estat, m)
+        print(u"  {}{:<10} {}  pixels: {}".format(
+            "*" if m == metodo else " ", m, " ".join("{: .4f}".format(v) for v in limites),
+            " ".join("{:5.1%}".format(f) for f in fracoes_classes(estat, limites))))
+
+    limites = limites_metodo(estat, metodo)
+    print(u"--- Limites salvos em {} ---".format(salvar_limites(limites, metodo)))
+    if "--vetorizar" in sys.argv:
+        vetorizar_lote(rasters, limites=limites)
+    elif "--reclassificar" in sys.argv:
+        for caminho, saida in reclassificar_lote(rasters, limites).items():
+            print(u"  > {}".format(saida))
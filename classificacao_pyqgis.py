@@ -2,30 +2,26 @@
 # QGIS 3.x — Aplica Singleband Pseudocolor (DISCRETE) na Banda 3 (NDVI)
 # a todas as camadas raster do projeto, com 5 classes por Intervalo Igual.
 
+import os
+import sys
 from qgis.PyQt.QtGui import QColor
 from qgis.core import (
-    QgsProject, QgsMapLayerType, QgsRasterLayer, QgsRasterBandStats,
+    QgsProject, QgsMapLayerType, QgsRasterLayer,
     QgsColorRampShader, QgsRasterShader, QgsSingleBandPseudoColorRenderer
 )
 
 # --- Configurações ---
 BANDA_NDVI = 3  # usar a banda 3 de cada raster (1-based)
-ROTULOS = [
-    u"Não-Vegetação/Água",
-    u"Estresse Severo/Degradação",
-    u"Estresse Moderado/Baixa Biomassa",
-    u"Saúde Razoável",
-    u"Saudável e Vigoroso"
-]
-
-# Paleta Vermelho (baixo) -> Verde escuro (alto)
-CORES = [
-    QColor(215,  25,  28),  # vermelho
-    QColor(253, 174,  97),  # laranja
-    QColor(255, 255, 191),  # amarelo claro
-    QColor(171, 221, 164),  # verde claro
-    QColor("#1a9641")       # verde escuro (saudável e vigoroso)
-]
+
+# Pasta destes scripts (para importar os módulos auxiliares no console do QGIS)
+PASTA_SCRIPTS = os.path.dirname(os.path.abspath(__file__)) if "__file__" in globals() else os.getcwd()
+if PASTA_SCRIPTS not in sys.path:
+    sys.path.insert(0, PASTA_SCRIPTS)
+
+from estatisticas_cache import min_max_camada
+from paleta import ROTULOS, CORES_HEX
+
+CORES = [QColor(c) for c in CORES_HEX]  # Vermelho (baixo) -> Verde escuro (alto)
 
 def aplica_pseudocolor_ndvi_discreto(layer, banda=BANDA_NDVI):
     """Aplica simbologia Singleband Pseudocolor (DISCRETE) na banda NDVI indicada."""
@@ -39,13 +35,8 @@ def aplica_pseudocolor_ndvi_discreto(layer, banda=BANDA_NDVI):
         raise RuntimeError(u"Camada '{}' tem apenas {} banda(s); precisa da banda {}."
                            .format(layer.name(), prov.bandCount(), banda))
 
-    # Estatísticas min/max da banda (QGIS 3)
-    stats = prov.bandStatistics(
-        banda,
-        QgsRasterBandStats.Min | QgsRasterBandStats.Max
-    )
-    vmin = stats.minimumValue
-    vmax = stats.maximumValue
+    # Estatísticas min/max da banda (cache persistente; só lê o raster se ele mudou)
+    vmin, vmax = min_max_camada(layer, banda)
 
     if vmin is None or vmax is None:
         raise RuntimeError(u"Falha ao obter min/max da banda {} em '{}'.".format(banda, layer.name()))
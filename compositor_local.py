@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+# Compósito Sentinel-2 local (sem GEE): reproduz o composite_b4b8_ndvi_f32
+# do notebook a partir de cenas L2A baixadas para uma pasta.
+#   - filtro por data (1/set a 30/nov, fim exclusivo como o filterDate do EE)
+#     e por CLOUDY_PIXEL_PERCENTAGE < 20 (lido do MTD_*.xml, se houver);
+#   - máscara SCL 3, 6, 8, 9, 10, 11 (sombra, água, nuvens, cirrus, neve);
+#   - B4/B8 em reflectância 0-1 e NDVI por cena; mediana de cada banda ao
+#     longo do tempo ignorando os pixels mascarados (np.nanmedian);
+#   - saída Float32 com 3 bandas B4, B8, NDVI (a ordem que BANDA_NDVI = 3
+#     espera), recortada ao polígono do lado, nodata -9999.
+#
+# As cenas são lidas por janelas de linhas, reprojetadas na grade de saída
+# (10 m) por VRTs; as janelas são distribuídas num pool de processos e o
+# número de linhas por janela é limitado pela memória de cada processo.
+#
+# Estrutura esperada: uma subpasta por cena (ex.: S2A_MSIL2A_20230915T133231_...)
+# contendo, em qualquer nível, os arquivos *_B04*.jp2|tif, *_B08*.jp2|tif e
+# *_SCL*.jp2|tif. O SCL de 20 m é lido por vizinho mais próximo.
+#
+# `python compositor_local.py --autoteste` roda o compósito sobre cenas
+# sintéticas (gerar_cenas_sinteticas) e confere com a mediana esperada.
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+import warnings
+from datetime import date, timedelta
+from concurrent.futures import as_completed
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from paralelo import criar_pool, n_processos_padrao
+from perfil_raster import criar_raster, finalizar_raster
+from recorte_paralelo import rasterizar_mascara
+
+# --- CONFIGURAÇÕES ---
+PASTA_CENAS = r"G:\Meu Drive\PA458_S2_L2A"
+PASTA_SAIDA = r"G:\Meu Drive\PA458_ByPolygons"
+MASCARAS_LADO = {
+    'Leste': r"G:\Meu Drive\PA458_ByPolygons\PA458_Leste.gpkg",
+    'Oeste': r"G:\Meu Drive\PA458_ByPolygons\PA458_Oeste.gpkg",
+}
+ANOS = list(range(2019, 2025))
+MES_INI, DIA_INI = 9, 1     # 1/set
+MES_FIM, DIA_FIM = 11, 30   # 30/nov (exclusivo, como no filterDate)
+
+CLOUD_PCT = 20
+CLASSES_SCL_MASCARA = (3, 6, 8, 9, 10, 11)
+ESCALA_REFLECTANCIA = 0.0001
+RESOLUCAO = 10
+EPSG_SAIDA = None  # None = CRS da primeira cena (UTM nativo)
+
+NODATA = -9999
+LIMITE_MEMORIA_MB = 512  # por processo: cenas x linhas x colunas x 3 bandas
+N_PROCESSOS = None       # None = todos os núcleos
+
+PADROES_BANDAS = {
+    'B4': re.compile(r"_B04(_10m)?\.(jp2|tif)$", re.I),
+    'B8': re.compile(r"_B08(_10m)?\.(jp2|tif)$", re.I),
+    'SCL': re.compile(r"_SCL(_20m)?\.(jp2|tif)$", re.I),
+}
+PADRAO_DATA = re.compile(r"(\d{8})T\d{6}")
+# em ordem de preferência: o CLOUDY_PIXEL_PERCENTAGE é a métrica filtrada no notebook (EE)
+PADROES_NUVENS = (re.compile(r"<CLOUDY_PIXEL_PERCENTAGE>([\d.]+)<"),
+                  re.compile(r"<Cloud_Coverage_Assessment>([\d.]+)<"))
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+
+# --- Cenas ---
+def ler_cena(pasta_cena):
+    """{'data', 'nuvens', 'B4', 'B8', 'SCL'} de uma pasta de cena, ou None se incompleta."""
+    m = PADRAO_DATA.search(os.path.basename(pasta_cena.rstrip("\\/")))
+    if not m:
+        return None
+    s = m.group(1)
+    cena = {'pasta': pasta_cena, 'data': date(int(s[:4]), int(s[4:6]), int(s[6:8])), 'nuvens': None}
+    prioridade_nuvens = len(PADROES_NUVENS)
+
+    for raiz, _, arquivos in os.walk(pasta_cena):
+        for arq in arquivos:
+            caminho = os.path.join(raiz, arq)
+            for banda, padrao in PADROES_BANDAS.items():
+                if banda not in cena and padrao.search(arq):
+                    cena[banda] = caminho
+            if arq.upper().startswith("MTD_") and arq.lower().endswith(".xml") and prioridade_nuvens > 0:
+                with open(caminho, 'r', encoding='utf-8', errors='ignore') as f:
+                    texto = f.read()
+                # Cloud_Coverage_Assessment só vale se nenhum MTD trouxer o CLOUDY_PIXEL_PERCENTAGE
+                for i, padrao in enumerate(PADROES_NUVENS[:prioridade_nuvens]):
+                    n = padrao.search(texto)
+                    if n:
+                        cena['nuvens'], prioridade_nuvens = float(n.group(1)), i
+                        break
+
+    if not all(b in cena for b in PADROES_BANDAS):
+        return None
+    return cena
+
+
+def selecionar_cenas(pasta_cenas, ano, cloud_pct=CLOUD_PCT):
+    """Cenas do período set-nov do ano, com cobertura de nuvens abaixo do limite."""
+    inicio = date(ano, MES_INI, DIA_INI)
+    fim = date(ano, MES_FIM, DIA_FIM)
+    cenas = []
+    for nome in sorted(os.listdir(pasta_cenas)):
+        caminho = os.path.join(pasta_cenas, nome)
+        if not os.path.isdir(caminho):
+            continue
+        cena = ler_cena(caminho)
+        if cena is None or not (inicio <= cena['data'] < fim):
+            continue
+        if cena['nuvens'] is not None and cena['nuvens'] >= cloud_pct:
+            continue
+        cenas.append(cena)
+    return cenas
+
+
+# --- Grade de saída ---
+def grade_do_poligono(caminho_mascara, srs_saida, resolucao=RESOLUCAO):
+    """(geotransform, xsize, ysize) cobrindo o polígono, alinhada à resolução."""
+    ds = ogr.Open(caminho_mascara)
+    lyr = ds.GetLayer(0)
+    xmin, xmax, ymin, ymax = lyr.GetExtent()
+
+    srs_mascara = lyr.GetSpatialRef()
+    if srs_mascara is not None and not srs_mascara.IsSame(srs_saida):
+        srs_mascara.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        srs_saida.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        anel = ogr.Geometry(ogr.wkbLinearRing)
+        for x, y in ((xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax), (xmin, ymin)):
+            anel.AddPoint_2D(x, y)
+        caixa = ogr.Geometry(ogr.wkbPolygon)
+        caixa.AddGeometry(anel)
+        caixa.Segmentize(max(xmax - xmin, ymax - ymin) / 50.0)
+        caixa.Transform(osr.CoordinateTransformation(srs_mascara, srs_saida))
+        xmin, xmax, ymin, ymax = caixa.GetEnvelope()
+
+    xmin = np.floor(xmin / resolucao) * resolucao
+    ymax = np.ceil(ymax / resolucao) * resolucao
+    xsize = int(np.ceil((xmax - xmin) / resolucao))
+    ysize = int(np.ceil((ymax - ymin) / resolucao))
+    return (float(xmin), float(resolucao), 0.0, float(ymax), 0.0, -float(resolucao)), xsize, ysize
+
+
+def _vrt_na_grade(caminho, wkt, gt, xsize, ysize):
+    """XML de um VRT que lê `caminho` já reprojetado (vizinho mais próximo) na grade de saída."""
+    limites = (gt[0], gt[3] + ysize * gt[5], gt[0] + xsize * gt[1], gt[3])
+    vrt = gdal.Warp('', caminho, format='VRT', dstSRS=wkt, outputBounds=limites,
+                    width=xsize, height=ysize, resampleAlg='near', dstNodata=0)
+    xml = vrt.GetMetadata('xml:VRT')[0]
+    vrt = None
+    return xml
+
+
+# --- Compósito ---
+def mediana_temporal(pilha):
+    """Mediana ao longo do eixo 0 ignorando NaN; pixels sem nenhuma cena válida ficam NaN."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # "All-NaN slice"
+        return np.nanmedian(pilha, axis=0)
+
+
+def compor_janela(vrts, y0, nlin, classes_mascara=CLASSES_SCL_MASCARA, escala=ESCALA_REFLECTANCIA):
+    """
+    Trabalho de um processo: lê as linhas [y0, y0+nlin) de todas as cenas e
+    devolve as medianas (B4, B8, NDVI) como float32, NaN onde não há dado.
+    """
+    n = len(vrts)
+    b4 = b8 = None
+    for i, (x_b4, x_b8, x_scl) in enumerate(vrts):
+        ds4, ds8, dss = gdal.Open(x_b4), gdal.Open(x_b8), gdal.Open(x_scl)
+        xsize = ds4.RasterXSize
+        if b4 is None:
+            b4 = np.full((n, nlin, xsize), np.nan, dtype=np.float32)
+            b8 = np.full((n, nlin, xsize), np.nan, dtype=np.float32)
+        r4 = ds4.GetRasterBand(1).ReadAsArray(0, y0, xsize, nlin)
+        r8 = ds8.GetRasterBand(1).ReadAsArray(0, y0, xsize, nlin)
+        scl = dss.GetRasterBand(1).ReadAsArray(0, y0, xsize, nlin)
+
+        # SCL 0 = sem dado; B4/B8 = 0 é o nodata do L2A (e fora da cena)
+        ok = (scl > 0) & ~np.isin(scl, classes_mascara) & (r4 > 0) & (r8 > 0)
+        b4[i][ok] = r4[ok] * escala
+        b8[i][ok] = r8[ok] * escala
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ndvi = (b8 - b4) / (b8 + b4)
+    return y0, mediana_temporal(b4), mediana_temporal(b8), mediana_temporal(ndvi).astype(np.float32)
+
+
+def _linhas_por_janela(n_cenas, xsize, limite_mb=LIMITE_MEMORIA_MB):
+    """Linhas por janela para que as pilhas (B4, B8, NDVI) caibam no limite de memória."""
+    bytes_por_linha = max(1, n_cenas) * xsize * 4 * 3
+    return max(1, min(2048, int(limite_mb * 1024 * 1024 // bytes_por_linha)))
+
+
+def compor_lado_ano(cenas, caminho_mascara, caminho_saida, epsg_saida=EPSG_SAIDA,
+                    n_processos=N_PROCESSOS, limite_mb=LIMITE_MEMORIA_MB):
+    """Mediana set-nov das cenas, recortada ao polígono, gravada como B4/B8/NDVI Float32."""
+    if not cenas:
+        raise RuntimeError(u"Nenhuma cena para {}".format(os.path.basename(caminho_saida)))
+
+    srs = osr.SpatialReference()
+    if epsg_saida:
+        srs.ImportFromEPSG(int(epsg_saida))
+    else:
+        srs.ImportFromWkt(gdal.Open(cenas[0]['B4']).GetProjection())
+    wkt = srs.ExportToWkt()
+    gt, xsize, ysize = grade_do_poligono(caminho_mascara, srs)
+
+    vrts = [tuple(_vrt_na_grade(c[b], wkt, gt, xsize, ysize) for b in ('B4', 'B8', 'SCL')) for c in cenas]
+
+    saida = criar_raster(caminho_saida, xsize, ysize, 3, gdal.GDT_Float32)
+    saida.SetGeoTransform(gt)
+    saida.SetProjection(wkt)
+    for i, nome in enumerate(['B4', 'B8', 'NDVI']):
+        b = saida.GetRasterBand(i + 1)
+        b.SetDescription(nome)
+        b.SetNoDataValue(NODATA)
+    dentro = rasterizar_mascara(saida, caminho_mascara)
+
+    nlin = _linhas_por_janela(len(cenas), xsize, limite_mb)
+    with criar_pool(min(n_processos_padrao(n_processos), -(-ysize // nlin))) as pool:
+        futuros = [pool.submit(compor_janela, vrts, y0, min(nlin, ysize - y0))
+                   for y0 in range(0, ysize, nlin)]
+        for fut in as_completed(futuros):
+            y0, *bandas = fut.result()
+            m = dentro[y0:y0 + bandas[0].shape[0]]
+            for i, dados in enumerate(bandas):
+                dados = np.where(m & ~np.isnan(dados), dados, NODATA).astype(np.float32)
+                saida.GetRasterBand(i + 1).WriteArray(dados, 0, y0)
+
+    saida = None
+    return finalizar_raster(caminho_saida)
+
+
+def nome_saida(lado, ano):
+    """Mesmo nome do export do notebook (casa com PADRAO_ENTRADA dos scripts)."""
+    return "PA458_{}_{}_B4_B8_NDVI_f32_10m_POLIGONO.tif".format(lado, ano)
+
+
+def compor_todos(pasta_cenas=PASTA_CENAS, mascaras=MASCARAS_LADO, anos=ANOS, pasta_saida=PASTA_SAIDA):
+    if not os.path.exists(pasta_saida):
+        os.makedirs(pasta_saida)
+    saidas = []
+    for ano in anos:
+        cenas = selecionar_cenas(pasta_cenas, ano)
+        print(u"--- {}: {} cena(s) set-nov com nuvens < {}% ---".format(ano, len(cenas), CLOUD_PCT))
+        for lado, caminho_mascara in mascaras.items():
+            caminho_saida = os.path.join(pasta_saida, nome_saida(lado, ano))
+            try:
+                saidas.append(compor_lado_ano(cenas, caminho_mascara, caminho_saida))
+                print(u"  > {}".format(os.path.basename(caminho_saida)))
+            except Exception as e:
+                print(u"  > Erro em {} {}: {}".format(lado, ano, e))
+    return saidas
+
+
+# --- Cenas sintéticas (autoteste) ---
+def _gravar_banda(caminho, dados, gt, wkt, tipo=gdal.GDT_UInt16):
+    ds = gdal.GetDriverByName('GTiff').Create(caminho, dados.shape[1], dados.shape[0], 1, tipo)
+    ds.SetGeoTransform(gt)
+    ds.SetProjection(wkt)
+    ds.GetRasterBand(1).WriteArray(dados)
+    ds = None
+
+
+def gerar_cenas_sinteticas(pasta, ano=2023, n_cenas=7, xsize=64, ysize=48, semente=458):
+    """
+    Cria `n_cenas` cenas L2A sintéticas (B04/B08 a 10 m, SCL a 20 m, MTD com
+    nuvens) e o polígono da máscara; inclui uma cena fora do período e uma
+    acima do limite de nuvens, que devem ser ignoradas.
+    Retorna (caminho_mascara, esperado) com esperado = (b4, b8, ndvi) float32
+    calculados direto em NumPy (NaN onde não há cena válida).
+    """
+    rng = np.random.RandomState(semente)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32723)
+    wkt = srs.ExportToWkt()
+    x0, y0 = 300000.0, 9880000.0
+    gt10 = (x0, 10.0, 0.0, y0, 0.0, -10.0)
+    gt20 = (x0, 20.0, 0.0, y0, 0.0, -20.0)
+
+    datas = [date(ano, 9, 3) + timedelta(days=10 * i) for i in range(n_cenas)]
+    extras = [(date(ano, 8, 20), 5.0), (date(ano, 10, 1), 60.0)]  # n_cenas <= 8  # fora do período / nublada
+    b4_validos, b8_validos = [], []
+
+    for i, (data, nuvens) in enumerate([(d, 10.0) for d in datas] + extras):
+        nome = "S2A_MSIL2A_{:%Y%m%d}T133231_N0509_R081_T23MLU_SINTETICA".format(data)
+        pasta_cena = os.path.join(pasta, "cenas", nome, "IMG_DATA")
+        os.makedirs(pasta_cena)
+        b4 = rng.randint(200, 1500, (ysize, xsize)).astype(np.uint16)
+        b8 = rng.randint(1500, 5000, (ysize, xsize)).astype(np.uint16)
+        scl = rng.choice([4, 4, 4, 5, 3, 8, 9, 6], size=(ysize // 2, xsize // 2)).astype(np.uint8)
+        b4[:3, :5] = 0  # borda sem dado
+        prefixo = os.path.join(pasta_cena, "T23MLU_{:%Y%m%d}T133231".format(data))
+        _gravar_banda(prefixo + "_B04_10m.tif", b4, gt10, wkt)
+        _gravar_banda(prefixo + "_B08_10m.tif", b8, gt10, wkt)
+        _gravar_banda(prefixo + "_SCL_20m.tif", scl, gt20, wkt, gdal.GDT_Byte)
+        with open(os.path.join(pasta, "cenas", nome, "MTD_MSIL2A.xml"), 'w') as f:
+            f.write("<x><Cloud_Coverage_Assessment>{}</Cloud_Coverage_Assessment></x>".format(nuvens))
+
+        if i < n_cenas:
+            scl10 = np.repeat(np.repeat(scl, 2, axis=0), 2, axis=1)
+            ok = ~np.isin(scl10, CLASSES_SCL_MASCARA) & (b4 > 0) & (b8 > 0)
+            b4_validos.append(np.where(ok, b4 * ESCALA_REFLECTANCIA, np.nan).astype(np.float32))
+            b8_validos.append(np.where(ok, b8 * ESCALA_REFLECTANCIA, np.nan).astype(np.float32))
+
+    # Máscara: a cena inteira menos um canto
+    caminho_mascara = os.path.join(pasta, "mascara.gpkg")
+    vds = ogr.GetDriverByName('GPKG').CreateDataSource(caminho_mascara)
+    lyr = vds.CreateLayer("mascara", srs=srs, geom_type=ogr.wkbPolygon)
+    xmax, ymin = x0 + xsize * 10.0, y0 - ysize * 10.0
+    anel = ogr.Geometry(ogr.wkbLinearRing)
+    for x, y in ((x0, y0), (xmax, y0), (xmax, ymin + 100.0), (xmax - 100.0, ymin), (x0, ymin), (x0, y0)):
+        anel.AddPoint_2D(x, y)
+    poligono = ogr.Geometry(ogr.wkbPolygon)
+    poligono.AddGeometry(anel)
+    feat = ogr.Feature(lyr.GetLayerDefn())
+    feat.SetGeometry(poligono)
+    lyr.CreateFeature(feat)
+    feat = lyr = vds = None
+
+    b4s, b8s = np.array(b4_validos), np.array(b8_validos)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ndvis = (b8s - b4s) / (b8s + b4s)
+    esperado = (mediana_temporal(b4s), mediana_temporal(b8s), mediana_temporal(ndvis))
+    return caminho_mascara, esperado
+
+
+def autoteste(n_processos=2):
+    """Compósito das cenas sintéticas comparado à mediana calculada direto em NumPy."""
+    pasta = tempfile.mkdtemp(prefix="compositor_")
+    try:
+        ano = 2023
+        caminho_mascara, esperado = gerar_cenas_sinteticas(pasta, ano)
+        cenas = selecionar_cenas(os.path.join(pasta, "cenas"), ano)
+        caminho_saida = os.path.join(pasta, nome_saida("Teste", ano))
+        # janelas pequenas para exercitar a divisão em blocos
+        compor_lado_ano(cenas, caminho_mascara, caminho_saida, n_processos=n_processos, limite_mb=0.05)
+
+        ds = gdal.Open(caminho_saida)
+        dentro = rasterizar_mascara(ds, caminho_mascara)
+        erros = []
+        if len(cenas) != 7:
+            erros.append(u"{} cenas selecionadas (esperado 7)".format(len(cenas)))
+        for i, nome in enumerate(['B4', 'B8', 'NDVI']):
+            b = ds.GetRasterBand(i + 1)
+            obtido = b.ReadAsArray()
+            ref = np.where(dentro & ~np.isnan(esperado[i]), esperado[i], NODATA)
+            if b.GetDescription() != nome:
+                erros.append(u"banda {} com descrição '{}'".format(i + 1, b.GetDescription()))
+            if not np.allclose(obtido, ref, atol=1e-6):
+                erros.append(u"{}: {} pixel(s) diferentes".format(nome, int((~np.isclose(obtido, ref, atol=1e-6)).sum())))
+        ds = None
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    for e in erros:
+        print(u"  [FALHA] {}".format(e))
+    print(u"--- Autoteste: {} ---".format("OK" if not erros else "FALHOU"))
+    return not erros
+
+
+if __name__ == "__main__":
+    if "--autoteste" in sys.argv:
+        raise SystemExit(0 if autoteste() else 1)
+    feitos = compor_todos()
+    print(u"--- Concluído! {} compósito(s) em: {} ---".format(len(feitos), PASTA_SAIDA))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Dissolve por classe (DN) com Rotulo e Area_Ha gravados numa única escrita
+# transacional do GeoPackage, sem reabrir a camada nem sessão de edição
+# feição a feição (startEditing/updateFeature/commitChanges).
+#
+# A união e as áreas usam o shapely 2 (operações vetorizadas sobre o array
+# de geometrias) quando instalado; sem ele, o OGR (UnionCascaded/GetArea).
+# Opcionalmente a área de cada classe vem direto da contagem de pixels do
+# raster de classes (<nome>_classes.tif) -- a mesma grade que gerou os
+# polígonos, então o valor coincide com a área dos polígonos da classe.
+
+import os
+import numpy as np
+from osgeo import ogr
+
+from paleta import ROTULOS_MAPA
+from transicao_raster import contar_historicos
+
+try:
+    import shapely
+    SHAPELY_2 = hasattr(shapely, "union_all")
+except ImportError:
+    shapely = None
+    SHAPELY_2 = False
+
+# --- CONFIGURAÇÕES ---
+CAMPO_CLASSE = 'DN'
+
+ogr.UseExceptions()
+
+
+def ler_geometrias_por_classe(caminho_vetor, camada=None, campo=CAMPO_CLASSE):
+    """Lê a camada de uma vez: {dn: [wkb, ...]} e a referência espacial."""
+    ds = ogr.Open(caminho_vetor)
+    lyr = ds.GetLayerByName(camada) if camada else ds.GetLayer(0)
+    grupos = {}
+    for feat in lyr:
+        geom = feat.GetGeometryRef()
+        if geom is None or geom.IsEmpty():
+            continue
+        grupos.setdefault(feat.GetField(campo), []).append(geom.ExportToWkb())
+    srs = lyr.GetSpatialRef()
+    return grupos, (srs.Clone() if srs is not None else None)
+
+
+def _dissolver_shapely(grupos):
+    dns = sorted(grupos)
+    geoms = [shapely.union_all(shapely.from_wkb(np.array(grupos[dn], dtype=object))) for dn in dns]
+    areas = shapely.area(np.array(geoms, dtype=object))  # m², todas as classes numa chamada
+    return dns, [shapely.to_wkb(g) for g in geoms], areas
+
+
+def _dissolver_ogr(grupos):
+    dns = sorted(grupos)
+    wkbs, areas = [], []
+    for dn in dns:
+        multi = ogr.Geometry(ogr.wkbMultiPolygon)
+        for wkb in grupos[dn]:
+            geom = ogr.CreateGeometryFromWkb(wkb)
+            if ogr.GT_Flatten(geom.GetGeometryType()) == ogr.wkbPolygon:
+                multi.AddGeometry(geom)
+            else:
+                for i in range(geom.GetGeometryCount()):
+                    multi.AddGeometry(geom.GetGeometryRef(i))
+        uniao = multi.UnionCascaded()
+        wkbs.append(uniao.ExportToWkb())
+        areas.append(uniao.GetArea())
+    return dns, wkbs, np.array(areas, dtype=np.float64)
+
+
+def dissolver_geometrias(grupos):
+    """União por classe; retorna (dns, wkbs, areas_m2) em ordem de DN."""
+    if SHAPELY_2:
+        return _dissolver_shapely(grupos)
+    return _dissolver_ogr(grupos)
+
+
+def areas_por_pixels(caminho_classes, banda=1):
+    """{classe: área em m²} pela contagem de pixels do raster de classes."""
+    codigos, contagens, area_pixel = contar_historicos([caminho_classes], banda)
+    return dict(zip(codigos.tolist(), (contagens * area_pixel).tolist()))
+
+
+def gravar_dissolvido(caminho_saida, srs, dns, wkbs, areas_m2, rotulos=ROTULOS_MAPA):
+    """Cria o GeoPackage (DN, Rotulo, Area_Ha) e grava todas as feições numa transação."""
+    drv = ogr.GetDriverByName('GPKG')
+    if os.path.exists(caminho_saida):
+        drv.DeleteDataSource(caminho_saida)
+    saida = drv.CreateDataSource(caminho_saida)
+    nome_camada = os.path.splitext(os.path.basename(caminho_saida))[0]
+    out = saida.CreateLayer(nome_camada, srs=srs, geom_type=ogr.wkbMultiPolygon)
+    out.CreateField(ogr.FieldDefn('DN', ogr.OFTInteger))
+    campo_rotulo = ogr.FieldDefn('Rotulo', ogr.OFTString)
+    campo_rotulo.SetWidth(100)
+    out.CreateField(campo_rotulo)
+    out.CreateField(ogr.FieldDefn('Area_Ha', ogr.OFTReal))
+
+    hectares = np.round(np.asarray(areas_m2, dtype=np.float64) / 10000.0, 4)
+    defn = out.GetLayerDefn()
+    out.StartTransaction()
+    for dn, wkb, ha in zip(dns, wkbs, hectares.tolist()):
+        feat = ogr.Feature(defn)
+        feat.SetField('DN', int(dn))
+        feat.SetField('Rotulo', rotulos.get(dn, "Indefinido"))
+        feat.SetField('Area_Ha', ha)
+        feat.SetGeometry(ogr.ForceToMultiPolygon(ogr.CreateGeometryFromWkb(wkb)))
+        out.CreateFeature(feat)
+    out.CommitTransaction()
+    out = saida = None
+    return caminho_saida
+
+
+def dissolver_com_area(caminho_vetor, caminho_saida, caminho_classes=None, camada=None):
+    """
+    Dissolve por DN e grava Rotulo e Area_Ha (ha, 4 casas) na mesma escrita.
+    Com `caminho_classes`, a área vem da contagem de pixels do raster de classes.
+    """
+    grupos, srs = ler_geometrias_por_classe(caminho_vetor, camada)
+    dns, wkbs, areas = dissolver_geometrias(grupos)
+    if caminho_classes:
+        por_pixel = areas_por_pixels(caminho_classes)
+        areas = np.array([por_pixel.get(dn, 0.0) for dn in dns], dtype=np.float64)
+    return gravar_dissolvido(caminho_saida, srs, dns, wkbs, areas)
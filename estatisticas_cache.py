@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Cache persistente de estatísticas por banda raster (min, max, contagens e
+# histograma de faixa fixa), preenchido por uma única leitura em blocos.
+# A chave é o caminho do arquivo + banda, validada por mtime e tamanho:
+# rodar de novo os scripts sobre rasters inalterados não relê nenhum pixel.
+
+import os
+import json
+import numpy as np
+from osgeo import gdal
+
+from instrumentacao import trecho
+
+# --- CONFIGURAÇÕES ---
+ARQUIVO_CACHE = os.path.join(os.path.expanduser("~"), ".pa458_cache", "estatisticas_raster.json")
+LINHAS_POR_BLOCO = 512
+
+# Histograma de faixa fixa (NDVI): bins iguais para todos os rasters, o que
+# permite somar histogramas de anos/lados diferentes
+FAIXA_HISTOGRAMA = (-1.0, 1.0)
+N_BINS = 200
+
+gdal.UseExceptions()
+
+
+def _id_arquivo(caminho):
+    return os.path.normcase(os.path.abspath(caminho))
+
+
+def _assinatura(caminho):
+    st = os.stat(caminho)
+    return st.st_mtime_ns, st.st_size
+
+
+def carregar_cache(arquivo_cache=ARQUIVO_CACHE):
+    if not os.path.exists(arquivo_cache):
+        return {}
+    try:
+        with open(arquivo_cache, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _salvar_cache(cache, arquivo_cache=ARQUIVO_CACHE):
+    pasta = os.path.dirname(arquivo_cache)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    tmp = "{}.{}.tmp".format(arquivo_cache, os.getpid())
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(tmp, arquivo_cache)
+
+
+def calcular_estatisticas(caminho, banda=1, faixa=FAIXA_HISTOGRAMA, n_bins=N_BINS,
+                          linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Uma passada em blocos de linhas: min, max, soma, soma², contagens e histograma."""
+    ds = gdal.Open(caminho)
+    b = ds.GetRasterBand(banda)
+    nodata = b.GetNoDataValue()
+    xsize, ysize = ds.RasterXSize, ds.RasterYSize
+
+    lo, hi = faixa
+    escala = n_bins / float(hi - lo)
+    hist = np.zeros(n_bins, dtype=np.int64)
+    vmin, vmax = np.inf, -np.inf
+    n_validos = n_nodata = n_abaixo = n_acima = 0
+    soma = soma2 = 0.0
+
+    for y0 in range(0, ysize, linhas_por_bloco):
+        nlin = min(linhas_por_bloco, ysize - y0)
+        dados = b.ReadAsArray(0, y0, xsize, nlin).astype(np.float64, copy=False)
+
+        valido = np.isfinite(dados)
+        if nodata is not None:
+            valido &= dados != nodata
+        v = dados[valido]
+        n_nodata += dados.size - v.size
+        if v.size == 0:
+            continue
+
+        n_validos += v.size
+        vmin = min(vmin, float(v.min()))
+        vmax = max(vmax, float(v.max()))
+        soma += float(v.sum())
+        soma2 += float(np.dot(v, v))
+        n_abaixo += int(np.count_nonzero(v < lo))
+        n_acima += int(np.count_nonzero(v > hi))
+
+        idx = np.clip(((v - lo) * escala).astype(np.int64), 0, n_bins - 1)
+        hist += np.bincount(idx, minlength=n_bins)
+
+    return {
+        'min': vmin if n_validos else None,
+        'max': vmax if n_validos else None,
+        'n_validos': n_validos,
+        'n_nodata': n_nodata,
+        'soma': soma,
+        'soma_quadrados': soma2,
+        'faixa': [lo, hi],
+        'histograma': hist.tolist(),
+        'n_abaixo': n_abaixo,
+        'n_acima': n_acima,
+    }
+
+
+def consultar_cache(caminho, banda=1, arquivo_cache=ARQUIVO_CACHE, cache=None):
+    """Estatísticas em cache ainda válidas para o arquivo (ou None)."""
+    if cache is None:
+        cache = carregar_cache(arquivo_cache)
+    item = cache.get("{}::{}".format(_id_arquivo(caminho), banda))
+    if item is None:
+        return None
+    mtime, tamanho = _assinatura(caminho)
+    if item['mtime_ns'] != mtime or item['tamanho'] != tamanho:
+        return None
+    return item['estatisticas']
+
+
+def registrar_estatisticas(caminho, banda, estatisticas, arquivo_cache=ARQUIVO_CACHE):
+    """Grava (substituindo versões antigas do mesmo arquivo/banda) no cache."""
+    mtime, tamanho = _assinatura(caminho)
+    cache = carregar_cache(arquivo_cache)
+    cache["{}::{}".format(_id_arquivo(caminho), banda)] = {
+        'mtime_ns': mtime,
+        'tamanho': tamanho,
+        'estatisticas': estatisticas,
+    }
+    _salvar_cache(cache, arquivo_cache)
+
+
+def obter_estatisticas(caminho, banda=1, arquivo_cache=ARQUIVO_CACHE):
+    """Estatísticas da banda: do cache se o arquivo não mudou, senão uma passada e grava."""
+    with trecho("estatisticas", camada=os.path.basename(caminho), banda=banda) as t:
+        stats = consultar_cache(caminho, banda, arquivo_cache)
+        t['cache'] = stats is not None
+        if stats is None:
+            stats = calcular_estatisticas(caminho, banda)
+            registrar_estatisticas(caminho, banda, stats, arquivo_cache)
+            t['pixels'] = stats['n_validos'] + stats['n_nodata']
+    return stats
+
+
+def min_max(caminho, banda=1, arquivo_cache=ARQUIVO_CACHE):
+    stats = obter_estatisticas(caminho, banda, arquivo_cache)
+    return stats['min'], stats['max']
+
+
+def min_max_camada(layer, banda=1):
+    """
+    Min/max de uma QgsRasterLayer. Arquivos locais passam pelo cache; outras
+    fontes (memória, WMS...) caem no bandStatistics do provedor, como antes.
+    """
+    fonte = layer.source()
+    if os.path.isfile(fonte):
+        return min_max(fonte, banda)
+
+    from qgis.core import QgsRasterBandStats
+    stats = layer.dataProvider().bandStatistics(banda, QgsRasterBandStats.Min | QgsRasterBandStats.Max)
+    return stats.minimumValue, stats.maximumValue
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Etapas do processamento (recorte -> vetorização -> dissolve -> Sankey)
+# operando sobre caminhos de arquivo, sem projeto nem árvore de camadas.
+# Reproduzem o que os scripts PyQGIS fazem com as camadas carregadas.
+
+from osgeo import gdal, ogr
+
+import dissolve_vetorial
+from recorte_paralelo import recortar_raster
+from transicao_raster import tabela_transicao_raster
+from vetorizacao_paralela import vetorizar_lote
+
+# --- CONFIGURAÇÕES ---
+NODATA = -9999
+
+# A transição é calculada sobre os rasters de classes de cada ano
+ENTRADA_SANKEY = "classes"
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+
+def recortar_por_mascara(caminho_raster, caminho_mascara, caminho_saida, nodata=NODATA):
+    """Recorte pela máscara (nodata -9999), com o bitmap da máscara em cache por grade."""
+    return recortar_raster(caminho_raster, caminho_mascara, caminho_saida, nodata)
+
+
+def vetorizar(caminho_raster, pasta_saida, n_processos=None):
+    """Reclassificação em 5 classes + poligonização (<nome>_vetor.gpkg e <nome>_classes.tif)."""
+    return vetorizar_lote([caminho_raster], pasta_saida, n_processos=n_processos)[caminho_raster]
+
+
+def dissolver_com_area(caminho_vetor, caminho_saida, caminho_classes=None):
+    """
+    Dissolve por DN e grava Rotulo e Area_Ha (ha, 4 casas) na mesma escrita.
+    Com `caminho_classes`, a área vem da contagem de pixels do raster de classes.
+    """
+    return dissolve_vetorial.dissolver_com_area(caminho_vetor, caminho_saida, caminho_classes)
+
+
+def tabela_transicao(entradas_por_ano, caminho_csv):
+    """Tabela de transição (ClassAAAA..., area_ha) direto dos rasters de classes."""
+    tabela_transicao_raster(entradas_por_ano, caminho_csv)
+    return caminho_csv
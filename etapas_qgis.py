@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# As mesmas etapas de etapas.py, mas pelos algoritmos do QGIS Processing
+# (exatamente os usados nos scripts), num QgsApplication sem interface:
+# nada de árvore de camadas, renderer ou repaint. Serve para rodar em
+# servidor (QT_QPA_PLATFORM=offscreen) com resultado idêntico ao do projeto.
+
+import os
+
+from dissolve_vetorial import areas_por_pixels
+from estatisticas_cache import min_max
+from instrumentacao import rodar, contador, contar, encerrar_contador
+from paleta import ROTULOS_MAPA
+from perfil_raster import opcoes_texto, concluir_saida_gdal, aplicar_perfil
+from transicao_raster import escrever_csv_transicao
+from vetorizacao_paralela import banda_ndvi, limites_intervalo_igual, nome_seguro
+
+# --- CONFIGURAÇÕES ---
+NODATA = -9999
+N_CLASSES = 5
+
+# O Sankey no QGIS cruza as camadas dissolvidas (e não os rasters de classes)
+ENTRADA_SANKEY = "dissolvido"
+
+_APP = None
+
+
+def iniciar_qgis():
+    """Inicializa (uma vez) o QGIS sem display e registra os provedores do Processing."""
+    global _APP
+    if _APP is not None:
+        return _APP
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from qgis.core import QgsApplication
+    from qgis.analysis import QgsNativeAlgorithms
+
+    prefixo = os.environ.get("QGIS_PREFIX_PATH")
+    if prefixo:
+        QgsApplication.setPrefixPath(prefixo, True)
+    _APP = QgsApplication([], False)
+    _APP.initQgis()
+
+    from processing.core.Processing import Processing
+    Processing.initialize()
+    QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
+    return _APP
+
+
+def _run(algoritmo, parametros):
+    iniciar_qgis()
+    return rodar(algoritmo, parametros)
+
+
+def recortar_por_mascara(caminho_raster, caminho_mascara, caminho_saida, nodata=NODATA):
+    """gdal:cliprasterbymasklayer com os parâmetros de script_ndvi_pyqgis_final.py."""
+    _run("gdal:cliprasterbymasklayer", {
+        'INPUT': caminho_raster,
+        'MASK': caminho_mascara,
+        'KEEP_RESOLUTION': True,
+        'NODATA': nodata,
+        'ALPHA_BAND': False,
+        'OPTIONS': opcoes_texto(),
+        'DATA_TYPE': 0,
+        'OUTPUT': caminho_saida
+    })
+    return concluir_saida_gdal(caminho_saida)
+
+
+def vetorizar(caminho_raster, pasta_saida, n_processos=None):
+    """native:reclassifybytable + gdal:polygonize, como em script_vetorizacao.py."""
+    from osgeo import gdal
+    banda = banda_ndvi(gdal.Open(caminho_raster))
+    vmin, vmax = min_max(caminho_raster, banda)
+    if vmin is None or vmax is None or vmin == vmax:
+        raise RuntimeError(u"Camada vazia ou constante: {}".format(caminho_raster))
+
+    limites = limites_intervalo_igual(vmin, vmax, N_CLASSES)
+    reclass_table = []
+    for i in range(N_CLASSES):
+        reclass_table.extend([float(limites[i]), float(limites[i + 1]), i + 1])
+
+    nome = nome_seguro(caminho_raster)
+    caminho_classes = os.path.join(pasta_saida, "{}_classes.tif".format(nome))
+    caminho_final = os.path.join(pasta_saida, "{}_vetor.gpkg".format(nome))
+
+    _run("native:reclassifybytable", {
+        'INPUT_RASTER': caminho_raster,
+        'RASTER_BAND': banda,
+        'TABLE': reclass_table,
+        'NO_DATA': NODATA,
+        'RANGE_BOUNDARIES': 0,
+        'NODATA_FOR_MISSING': True,
+        'DATA_TYPE': 5, # Int16
+        'OUTPUT': caminho_classes
+    })
+    aplicar_perfil(caminho_classes)
+    _run("gdal:polygonize", {
+        'INPUT': caminho_classes,
+        'BAND': 1,
+        'FIELD': 'DN',
+        'EIGHT_CONNECTEDNESS': False,
+        'OUTPUT': caminho_final
+    })
+    return caminho_final
+
+
+def dissolver_com_area(caminho_vetor, caminho_saida, caminho_classes=None):
+    """native:dissolve por DN e preenchimento de Rotulo/Area_Ha (script_dissolve_final.py)."""
+    from qgis.core import QgsVectorLayer, QgsField
+    from qgis.PyQt.QtCore import QVariant
+
+    _run("native:dissolve", {'INPUT': caminho_vetor, 'FIELD': ['DN'], 'OUTPUT': caminho_saida})
+
+    vlayer = QgsVectorLayer(caminho_saida, os.path.basename(caminho_saida), "ogr")
+    if not vlayer.isValid():
+        raise RuntimeError(u"Erro ao carregar camada gerada: {}".format(caminho_saida))
+
+    vlayer.startEditing()
+    vlayer.dataProvider().addAttributes([
+        QgsField("Rotulo", QVariant.String, len=100),
+        QgsField("Area_Ha", QVariant.Double)
+    ])
+    vlayer.updateFields()
+    por_pixel = areas_por_pixels(caminho_classes) if caminho_classes else None
+    feicoes = contador("dissolve.feicoes", camada=os.path.basename(caminho_saida))
+    for feat in vlayer.getFeatures():
+        feat['Rotulo'] = ROTULOS_MAPA.get(feat['DN'], "Indefinido")
+        area_m2 = por_pixel.get(feat['DN'], 0.0) if por_pixel is not None else feat.geometry().area()
+        feat['Area_Ha'] = round(area_m2 / 10000.0, 4)
+        vlayer.updateFeature(feat)
+        contar(feicoes)
+    encerrar_contador(feicoes)
+    vlayer.commitChanges()
+    return caminho_saida
+
+
+def _renomear_campo_dn(caminho_ou_camada, ano):
+    from qgis.core import QgsVectorLayer
+    layer = caminho_ou_camada
+    if isinstance(layer, str):
+        layer = QgsVectorLayer(layer, os.path.basename(layer), "ogr")
+
+    fields_mapping = []
+    for field in layer.fields():
+        if field.name() == 'DN':
+            fields_mapping.append({
+                'expression': '"DN"',
+                'length': field.length(),
+                'name': "Class{}".format(ano),
+                'precision': field.precision(),
+                'type': field.type()
+            })
+    return _run("native:refactorfields", {
+        'INPUT': layer,
+        'FIELDS_MAPPING': fields_mapping,
+        'OUTPUT': 'TEMPORARY_OUTPUT'
+    })['OUTPUT']
+
+
+def tabela_transicao(entradas_por_ano, caminho_csv):
+    """
+    Interseção sequencial das camadas dissolvidas ({ano: gpkg}), como em
+    script_pre_processamento_sankey.py; grava o SHP de auditoria e o CSV.
+    """
+    anos = sorted(entradas_por_ano)
+    acumulado = _renomear_campo_dn(entradas_por_ano[anos[0]], anos[0])
+    for ano in anos[1:]:
+        prox = _renomear_campo_dn(entradas_por_ano[ano], ano)
+        acumulado = _run("native:intersection", {
+            'INPUT': acumulado,
+            'OVERLAY': prox,
+            'OUTPUT': 'TEMPORARY_OUTPUT'
+        })['OUTPUT']
+
+    caminho_shp = os.path.splitext(caminho_csv)[0] + ".shp"
+    _run("native:savefeatures", {'INPUT': acumulado, 'OUTPUT': caminho_shp})
+
+    campos_classe = sorted(f.name() for f in acumulado.fields() if f.name().startswith("Class"))
+    dados_agrupados = {}
+    feicoes = contador("transicao.feicoes", camada=os.path.basename(caminho_csv))
+    for feat in acumulado.getFeatures():
+        historico = tuple(feat[c] for c in campos_classe)
+        dados_agrupados[historico] = dados_agrupados.get(historico, 0.0) + feat.geometry().area() / 10000.0
+        contar(feicoes)
+    encerrar_contador(feicoes)
+
+    escrever_csv_transicao(caminho_csv, campos_classe, dados_agrupados)
+    return caminho_csv
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+# Agendador das exportações do GEE (uma por ano x lado). Na célula de export
+# do notebook cada Export.image.toDrive era iniciado e esquecido; aqui:
+#   - fila com no máximo MAX_SIMULTANEAS tarefas enviadas ao mesmo tempo;
+#   - tarefa que falha (no envio ou no servidor) volta para a fila com
+#     espera exponencial, até MAX_TENTATIVAS; tarefa cancelada pelo usuário
+#     (no Code Editor ou pela API) termina como CANCELADA, sem repetição;
+#   - estado do servidor desconhecido (UNKNOWN ou fora de ESTADOS_EE) por
+#     mais de LIMITE_DESCONHECIDO_S conta como falha;
+#   - estado de cada tarefa (id remoto, tentativas, tempos) gravado em JSON a
+#     cada mudança: rodar de novo depois de uma interrupção retoma de onde
+#     parou, sem reenviar o que já está no servidor ou concluído;
+#   - tempo de fila e de execução de cada tarefa no log.
+#
+# O backend é um dict de funções {'iniciar': tarefa -> id_remoto,
+# 'consultar': id_remoto -> (estado, erro)}: backend_ee para o serviço,
+# backend_falso (fila e falhas simuladas, relógio virtual) para o autoteste.
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+# --- CONFIGURAÇÕES ---
+ARQUIVO_ESTADO = os.path.join("outputs", "exportacoes_pa458.json")
+MAX_SIMULTANEAS = 4
+MAX_TENTATIVAS = 4
+ESPERA_BASE_S = 60.0       # 1ª repetição após 1 min, depois 2, 4... (limitado a ESPERA_MAXIMA_S)
+ESPERA_MAXIMA_S = 1800.0
+INTERVALO_CONSULTA_S = 30.0
+LIMITE_DESCONHECIDO_S = 600.0
+
+# Estados locais
+PENDENTE = 'PENDENTE'      # na fila (ou aguardando a espera da próxima tentativa)
+ENVIADA = 'ENVIADA'        # no servidor (READY/RUNNING)
+CONCLUIDA = 'CONCLUIDA'
+FALHOU = 'FALHOU'          # esgotou as tentativas
+CANCELADA = 'CANCELADA'    # cancelada no servidor; não é repetida
+
+# Estados do servidor -> estado local (os demais, como UNKNOWN, são desconhecidos)
+ESTADOS_EE = {
+    'UNSUBMITTED': ENVIADA, 'READY': ENVIADA, 'RUNNING': ENVIADA,
+    'CANCEL_REQUESTED': CANCELADA, 'CANCELLED': CANCELADA,
+    'COMPLETED': CONCLUIDA, 'SUCCEEDED': CONCLUIDA, 'FAILED': FALHOU,
+}
+
+
+def tarefas_lado_ano(anos, lados, modelo_nome):
+    """Uma tarefa por ano x lado; `modelo_nome` com {lado} e {ano} (vira a descrição do export)."""
+    return [{'nome': modelo_nome.format(lado=lado, ano=ano), 'lado': lado, 'ano': ano}
+            for ano in anos for lado in lados]
+
+
+# --- Estado persistente ---
+def carregar_estado(arquivo_estado):
+    if not os.path.exists(arquivo_estado):
+        return {}
+    try:
+        with open(arquivo_estado, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def salvar_estado(estado, arquivo_estado):
+    pasta = os.path.dirname(arquivo_estado)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    tmp = "{}.{}.tmp".format(arquivo_estado, os.getpid())
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, arquivo_estado)
+
+
+def _novo_item(tarefa):
+    return {'tarefa': tarefa, 'estado': PENDENTE, 'id_remoto': None, 'tentativas': 0,
+            'proxima_tentativa': 0.0, 'enviada_em': None, 'executando_em': None,
+            'concluida_em': None, 'desconhecido_desde': None, 'erro': None}
+
+
+def espera_retentativa(tentativas, base=ESPERA_BASE_S, maxima=ESPERA_MAXIMA_S):
+    return min(base * 2 ** (tentativas - 1), maxima)
+
+
+# --- Agendador ---
+def executar_exportacoes(tarefas, backend, arquivo_estado=ARQUIVO_ESTADO, max_simultaneas=MAX_SIMULTANEAS,
+                         max_tentativas=MAX_TENTATIVAS, espera_base_s=ESPERA_BASE_S,
+                         espera_maxima_s=ESPERA_MAXIMA_S, intervalo_s=INTERVALO_CONSULTA_S,
+                         limite_desconhecido_s=LIMITE_DESCONHECIDO_S, relogio=time.time, dormir=time.sleep, log=print):
+    """
+    Roda a fila até todas as tarefas terminarem (CONCLUIDA, CANCELADA ou FALHOU) e
+    devolve o estado {nome: item}. Tarefas já presentes no arquivo de estado
+    seguem de onde estavam; as que FALHARAM de vez podem ser reabertas
+    apagando o item (ou o arquivo).
+    """
+    estado = carregar_estado(arquivo_estado)
+    for tarefa in tarefas:
+        if tarefa['nome'] not in estado:
+            estado[tarefa['nome']] = _novo_item(tarefa)
+    nomes = [t['nome'] for t in tarefas]
+    salvar_estado(estado, arquivo_estado)
+
+    def falhar(item, erro, agora):
+        item['tentativas'] += 1
+        item['erro'] = erro
+        item['id_remoto'] = None
+        if item['tentativas'] >= max_tentativas:
+            item['estado'] = FALHOU
+            log(u"  [FALHOU] {} após {} tentativas: {}".format(item['tarefa']['nome'], item['tentativas'], erro))
+        else:
+            espera = espera_retentativa(item['tentativas'], espera_base_s, espera_maxima_s)
+            item['estado'] = PENDENTE
+            item['proxima_tentativa'] = agora + espera
+            log(u"  [repetir em {:.0f} s] {} (tentativa {}): {}".format(
+                espera, item['tarefa']['nome'], item['tentativas'], erro))
+
+    while True:
+        agora = relogio()
+        mudou = False
+
+        # 1) acompanha as enviadas
+        for nome in nomes:
+            item = estado[nome]
+            if item['estado'] != ENVIADA:
+                continue
+            situacao, erro = backend['consultar'](item['id_remoto'])
+            if situacao == 'RUNNING' and item['executando_em'] is None:
+                item['executando_em'] = agora
+                mudou = True
+            local = ESTADOS_EE.get(situacao)
+            if local is None:
+                if item.get('desconhecido_desde') is None:
+                    item['desconhecido_desde'] = agora
+                    mudou = True
+                elif agora - item['desconhecido_desde'] >= limite_desconhecido_s:
+                    item['desconhecido_desde'] = None
+                    falhar(item, u"estado {} por {:.0f} s".format(situacao, limite_desconhecido_s), agora)
+                    mudou = True
+                continue
+            if item.get('desconhecido_desde') is not None:
+                item['desconhecido_desde'] = None
+                mudou = True
+            if local == CONCLUIDA:
+                item['estado'] = CONCLUIDA
+                item['concluida_em'] = agora
+                item['erro'] = None
+                inicio = item['executando_em'] or item['enviada_em']
+                log(u"  [ok] {}: {:.0f} s na fila, {:.0f} s executando".format(
+                    nome, inicio - item['enviada_em'], agora - inicio))
+                mudou = True
+            elif local == CANCELADA:
+                item['estado'] = CANCELADA
+                item['erro'] = erro or situacao
+                log(u"  [cancelada] {}: não será repetida".format(nome))
+                mudou = True
+            elif local == FALHOU:
+                falhar(item, erro or situacao, agora)
+                mudou = True
+
+        # 2) envia as pendentes enquanto houver vaga
+        ativas = sum(1 for n in nomes if estado[n]['estado'] == ENVIADA)
+        for nome in nomes:
+            if ativas >= max_simultaneas:
+                break
+            item = estado[nome]
+            if item['estado'] != PENDENTE or item['proxima_tentativa'] > agora:
+                continue
+            try:
+                item['id_remoto'] = backend['iniciar'](item['tarefa'])
+            except Exception as e:
+                falhar(item, u"envio: {}".format(e), agora)
+                mudou = True
+                continue
+            item['estado'] = ENVIADA
+            item['enviada_em'] = agora
+            item['executando_em'] = None
+            ativas += 1
+            mudou = True
+            log(u"  [enviada] {} ({})".format(nome, item['id_remoto']))
+
+        if mudou:
+            salvar_estado(estado, arquivo_estado)
+
+        restantes = [n for n in nomes if estado[n]['estado'] in (PENDENTE, ENVIADA)]
+        if not restantes:
+            break
+        dormir(intervalo_s)
+
+    return dict((n, estado[n]) for n in nomes)
+
+
+def resumo(estado):
+    contagem = {}
+    for item in estado.values():
+        contagem[item['estado']] = contagem.get(item['estado'], 0) + 1
+    return contagem
+
+
+# --- Backends ---
+def backend_ee(criar_tarefa):
+    """
+    criar_tarefa(tarefa) -> ee.batch.Task ainda não iniciada (ex.: o
+    Export.image.toDrive da célula de export, sem o .start()).
+    """
+    import ee
+
+    def iniciar(tarefa):
+        task = criar_tarefa(tarefa)
+        task.start()
+        return task.id
+
+    def consultar(id_remoto):
+        status = ee.data.getTaskStatus([id_remoto])[0]
+        return status.get('state', 'UNKNOWN'), status.get('error_message')
+
+    return {'iniciar': iniciar, 'consultar': consultar}
+
+
+def relogio_virtual(inicio=0.0):
+    """(relogio, dormir) que só avançam o tempo simulado."""
+    agora = [inicio]
+
+    def dormir(segundos):
+        agora[0] += segundos
+    return (lambda: agora[0]), dormir
+
+
+def backend_falso(relogio, espera_fila=45.0, duracao=300.0, falhas_envio=None, falhas_servidor=None,
+                  estados_fixos=None):
+    """
+    Servidor simulado: cada tarefa fica `espera_fila` s em READY e `duracao` s
+    em RUNNING. falhas_envio/falhas_servidor: {nome: n} = as n primeiras
+    tentativas daquela tarefa falham no envio / no fim da execução.
+    estados_fixos: {nome: estado} devolvido sempre (ex.: 'CANCELLED', 'UNKNOWN').
+    """
+    servidor = {'tarefas': {}, 'envios': [], 'pico_ativas': 0}
+    falhas_envio = dict(falhas_envio or {})
+    falhas_servidor = dict(falhas_servidor or {})
+    estados_fixos = dict(estados_fixos or {})
+
+    def ativas():
+        agora = relogio()
+        return sum(1 for t in servidor['tarefas'].values() if t['fim'] > agora)
+
+    def iniciar(tarefa):
+        nome = tarefa['nome']
+        servidor['envios'].append(nome)
+        if falhas_envio.get(nome, 0) > 0:
+            falhas_envio[nome] -= 1
+            raise RuntimeError(u"Too many tasks already in the queue (simulado)")
+        falha = falhas_servidor.get(nome, 0) > 0
+        if falha:
+            falhas_servidor[nome] -= 1
+        id_remoto = "FALSO{:04d}".format(len(servidor['envios']))
+        agora = relogio()
+        servidor['tarefas'][id_remoto] = {'nome': nome, 'executa': agora + espera_fila,
+                                          'fim': agora + espera_fila + duracao, 'falha': falha}
+        servidor['pico_ativas'] = max(servidor['pico_ativas'], ativas())
+        return id_remoto
+
+    def consultar(id_remoto):
+        t = servidor['tarefas'][id_remoto]
+        if t['nome'] in estados_fixos:
+            return estados_fixos[t['nome']], None
+        agora = relogio()
+        if agora < t['executa']:
+            return 'READY', None
+        if agora < t['fim']:
+            return 'RUNNING', None
+        return ('FAILED', u"Erro interno simulado") if t['falha'] else ('COMPLETED', None)
+
+    return {'iniciar': iniciar, 'consultar': consultar, 'servidor': servidor}
+
+
+def autoteste():
+    """
+    12 exports (6 anos x 2 lados) no backend falso: limite de simultâneas,
+    repetições e retomada; depois, tarefa cancelada e estado desconhecido.
+    """
+    pasta = tempfile.mkdtemp(prefix="exportacao_ee_")
+    erros = []
+    try:
+        arquivo = os.path.join(pasta, "estado.json")
+        tarefas = tarefas_lado_ano(range(2019, 2025), ['Oeste', 'Leste'], "PA458_{lado}_{ano}_TESTE")
+        relogio, dormir = relogio_virtual()
+        backend = backend_falso(relogio,
+                                falhas_envio={'PA458_Leste_2020_TESTE': 1},
+                                falhas_servidor={'PA458_Oeste_2021_TESTE': 2, 'PA458_Leste_2023_TESTE': 9})
+        silencioso = lambda *a: None
+
+        # sessão interrompida no meio (o "dormir" estoura depois de algumas consultas)
+        chamadas = [0]
+
+        def dormir_interrompido(segundos):
+            chamadas[0] += 1
+            if chamadas[0] > 15:
+                raise KeyboardInterrupt
+            dormir(segundos)
+        try:
+            executar_exportacoes(tarefas, backend, arquivo, max_simultaneas=3, max_tentativas=3,
+                                 relogio=relogio, dormir=dormir_interrompido, log=silencioso)
+            erros.append(u"a primeira sessão deveria ter sido interrompida")
+        except KeyboardInterrupt:
+            pass
+        enviadas_antes = len(backend['servidor']['envios'])
+        concluidas_antes = [n for n, i in carregar_estado(arquivo).items() if i['estado'] == CONCLUIDA]
+
+        estado = executar_exportacoes(tarefas, backend, arquivo, max_simultaneas=3, max_tentativas=3,
+                                      relogio=relogio, dormir=dormir, log=silencioso)
+        contagem = resumo(estado)
+        if contagem.get(CONCLUIDA) != 11 or contagem.get(FALHOU) != 1:
+            erros.append(u"estados finais {}".format(contagem))
+        if estado['PA458_Leste_2023_TESTE']['estado'] != FALHOU:
+            erros.append(u"tarefa que sempre falha não terminou em FALHOU")
+        if backend['servidor']['pico_ativas'] > 3:
+            erros.append(u"{} tarefas simultâneas no servidor (máximo 3)".format(backend['servidor']['pico_ativas']))
+        # 12 + 1 falha de envio + 2 repetições (Oeste 2021) + 2 repetições (Leste 2023)
+        envios = backend['servidor']['envios']
+        if len(envios) != 17:
+            erros.append(u"{} envios (esperado 17)".format(len(envios)))
+        if not concluidas_antes or any(envios[enviadas_antes:].count(n) for n in concluidas_antes):
+            erros.append(u"a retomada reenviou tarefas já concluídas")
+        repetidas = [i for i in estado.values() if i['tarefa']['nome'] == 'PA458_Oeste_2021_TESTE']
+        if repetidas[0]['tentativas'] != 2 or repetidas[0]['estado'] != CONCLUIDA:
+            erros.append(u"Oeste 2021: {}".format(repetidas[0]))
+
+        # cancelada: termina sem repetir; UNKNOWN: falha depois do limite e é repetida
+        tarefas = tarefas_lado_ano([2024], ['Oeste', 'Leste'], "PA458_{lado}_{ano}_ESTADOS")
+        relogio, dormir = relogio_virtual()
+        backend = backend_falso(relogio, estados_fixos={'PA458_Oeste_2024_ESTADOS': 'CANCELLED',
+                                                        'PA458_Leste_2024_ESTADOS': 'UNKNOWN'})
+        estado = executar_exportacoes(tarefas, backend, os.path.join(pasta, "estados.json"), max_tentativas=2,
+                                      espera_base_s=10, limite_desconhecido_s=120, relogio=relogio,
+                                      dormir=dormir, log=silencioso)
+        envios = backend['servidor']['envios']
+        cancelada, desconhecida = estado['PA458_Oeste_2024_ESTADOS'], estado['PA458_Leste_2024_ESTADOS']
+        if cancelada['estado'] != CANCELADA or envios.count('PA458_Oeste_2024_ESTADOS') != 1:
+            erros.append(u"cancelada: {} com {} envio(s)".format(
+                cancelada['estado'], envios.count('PA458_Oeste_2024_ESTADOS')))
+        if desconhecida['estado'] != FALHOU or envios.count('PA458_Leste_2024_ESTADOS') != 2:
+            erros.append(u"UNKNOWN: {} com {} envio(s)".format(
+                desconhecida['estado'], envios.count('PA458_Leste_2024_ESTADOS')))
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    for e in erros:
+        print(u"  [FALHA] {}".format(e))
+    print(u"--- Autoteste: {} ---".format("OK" if not erros else "FALHOU"))
+    return not erros
+
+
+if __name__ == "__main__":
+    if "--autoteste" in sys.argv:
+        sys.exit(0 if autoteste() else 1)
+    estado = carregar_estado(ARQUIVO_ESTADO)
+    print(u"--- {}: {} ---".format(ARQUIVO_ESTADO, resumo(estado) if estado else u"sem exportações registradas"))
+    for nome, item in sorted(estado.items()):
+        print(u"  {:<50} {:<10} tentativas={} {}".format(nome, item['estado'], item['tentativas'], item['erro'] or ""))
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+# Figuras do relatório em lote, sem reabrir o notebook:
+#   - painel_<Lado>_<AAAA>.png: mapa de classes de um compósito (ano x lado);
+#   - NDVI_mapa_anual.png: todos os anos x lados numa grade, com legenda;
+#   - NDVI_tabela_anual.png: tabela Ano | Leste | Oeste | Δ | Média | Σ;
+#   - NDVI_medio_por_lado.png: NDVI médio por ano e lado.
+#
+# Os mapas leem a banda NDVI da overview mais próxima da largura final em
+# pixels (polegadas x DPI), e não a resolução cheia; sem overviews, o próprio
+# GDAL reduz na leitura. Cada figura é renderizada num processo do pool.
+#
+# Uma figura só é refeita quando muda a chave dela: assinatura das entradas
+# (caminho, mtime, tamanho), limites de classe, DPI e paleta. As chaves das
+# figuras prontas ficam em <pasta>/figuras.json.
+#
+# Limites das classes: os compartilhados do classes_globais.py
+# (limites_classes.json), se existirem; senão Intervalo Igual de cada raster.
+# Cores e rótulos: paleta.py.
+#
+# `python figuras.py [--forcar] [--autoteste]`
+
+import os
+import sys
+import csv
+import json
+import shutil
+import hashlib
+import tempfile
+from concurrent.futures import as_completed
+
+import numpy as np
+from osgeo import gdal
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap, BoundaryNorm
+    from matplotlib.patches import Patch
+except ImportError:
+    plt = None
+
+from paleta import ROTULOS, CORES_HEX
+from paralelo import criar_pool
+from instrumentacao import trecho
+from estatisticas_cache import min_max
+from classes_globais import ARQUIVO_LIMITES
+from vetorizacao_paralela import NODATA, banda_ndvi, classificar_intervalos, limites_intervalo_igual
+from zonal_lote import CSV_SAIDA as CSV_ZONAL, pares_locais
+
+# --- CONFIGURAÇÕES ---
+PASTA_FIGURAS = os.path.join("outputs", "figuras")
+DPI = 200
+LARGURA_PAINEL = 4.0      # polegadas
+LARGURA_MOSAICO = 8.0     # polegadas, todos os lados lado a lado
+N_PROCESSOS = None        # None = todos os núcleos
+VERSAO = 1                # mude para refazer todas as figuras após alterar o desenho
+CORES_LADO = {'Leste': 'orange', 'Oeste': 'green'}
+
+gdal.UseExceptions()
+
+
+def _exigir_matplotlib():
+    if plt is None:
+        raise RuntimeError(u"matplotlib não está instalado (pip install matplotlib): figuras indisponíveis")
+
+
+# --- Leitura reduzida ---
+def escolher_overview(banda, largura_alvo):
+    """A menor overview com pelo menos largura_alvo colunas (a própria banda se nenhuma servir)."""
+    escolhida = banda
+    for i in range(banda.GetOverviewCount()):
+        ov = banda.GetOverview(i)
+        if largura_alvo <= ov.XSize < escolhida.XSize:
+            escolhida = ov
+    return escolhida
+
+
+def ler_reduzido(caminho, largura_alvo, banda=None):
+    """
+    (valores float64 com NaN no nodata, extensão (x0, x1, y0, y1)) da banda
+    NDVI com no máximo ~largura_alvo colunas, lida da overview adequada.
+    """
+    ds = gdal.Open(caminho)
+    b = ds.GetRasterBand(banda or banda_ndvi(ds))
+    nodata = b.GetNoDataValue()
+    fonte = escolher_overview(b, largura_alvo)
+    fator = max(1, fonte.XSize // max(1, largura_alvo))
+    dados = fonte.ReadAsArray(buf_xsize=max(1, fonte.XSize // fator),
+                              buf_ysize=max(1, fonte.YSize // fator)).astype(np.float64)
+    if nodata is not None:
+        dados[dados == nodata] = np.nan
+    gt = ds.GetGeoTransform()
+    extensao = (gt[0], gt[0] + ds.RasterXSize * gt[1], gt[3] + ds.RasterYSize * gt[5], gt[3])
+    return dados, extensao
+
+
+def proporcao(caminho):
+    """Altura / largura do raster."""
+    ds = gdal.Open(caminho)
+    return ds.RasterYSize / float(ds.RasterXSize)
+
+
+# --- Desenho ---
+def _mapa(ax, caminho, limites, largura_px, titulo):
+    dados, extensao = ler_reduzido(caminho, largura_px)
+    classes = classificar_intervalos(dados, np.asarray(limites, dtype=np.float64))
+    ax.imshow(np.ma.masked_equal(classes, NODATA), extent=extensao, interpolation='nearest',
+              cmap=ListedColormap(CORES_HEX), norm=BoundaryNorm(np.arange(0.5, len(CORES_HEX) + 1), len(CORES_HEX)))
+    ax.set_title(titulo, fontsize=10)
+    ax.set_axis_off()
+
+
+def _legenda(fig):
+    fig.legend(handles=[Patch(facecolor=c, edgecolor='none', label=r) for c, r in zip(CORES_HEX, ROTULOS)],
+               loc='lower center', ncol=3, fontsize=8, frameon=False)
+
+
+def desenhar_painel(p):
+    largura = p['largura']
+    fig = plt.figure(figsize=(largura, largura * proporcao(p['raster']) + 0.3), dpi=p['dpi'])
+    ax = fig.add_axes([0, 0, 1, 1 - 0.3 / fig.get_figheight()])
+    _mapa(ax, p['raster'], p['limites'], int(largura * p['dpi']), u"{} {}".format(p['lado'], p['ano']))
+    return fig
+
+
+def desenhar_mosaico(p):
+    anos, lados = p['anos'], p['lados']
+    largura_celula = p['largura'] / float(len(lados))
+    altura_celula = largura_celula * max(proporcao(m['raster']) for m in p['mapas']) + 0.3
+    fig, eixos = plt.subplots(len(anos), len(lados), squeeze=False, dpi=p['dpi'],
+                              figsize=(p['largura'], len(anos) * altura_celula + 0.8))
+    for ax in eixos.ravel():
+        ax.set_axis_off()
+    for m in p['mapas']:
+        ax = eixos[anos.index(m['ano']), lados.index(m['lado'])]
+        _mapa(ax, m['raster'], m['limites'], int(largura_celula * p['dpi']), u"{} {}".format(m['lado'], m['ano']))
+    _legenda(fig)
+    fig.subplots_adjust(left=0.02, right=0.98, top=0.98, bottom=0.8 / fig.get_figheight(), hspace=0.25, wspace=0.05)
+    return fig
+
+
+def medias_zonais(caminho_csv):
+    """{(ano, lado): NDVI médio} da tabela do zonal_lote.py."""
+    medias = {}
+    with open(caminho_csv, encoding='utf-8', newline='') as f:
+        for l in csv.DictReader(f):
+            if l.get('mean') not in (None, ''):
+                medias[(int(l['ano']), l['lado'])] = float(l['mean'])
+    return medias
+
+
+def linhas_tabela(medias):
+    """Linhas Ano, Leste, Oeste, Δ (Leste−Oeste), Média e a linha Σ (média do período)."""
+    linhas = []
+    for ano in sorted(set(a for a, _ in medias)):
+        leste, oeste = medias.get((ano, 'Leste')), medias.get((ano, 'Oeste'))
+        presentes = [v for v in (leste, oeste) if v is not None]
+        linhas.append([ano, leste, oeste, None if len(presentes) < 2 else leste - oeste,
+                       float(np.mean(presentes)) if presentes else None])
+    soma = [u"Σ"]
+    for c in range(1, 5):
+        valores = [l[c] for l in linhas if l[c] is not None]
+        soma.append(float(np.mean(valores)) if valores else None)
+    return linhas + [soma]
+
+
+def desenhar_tabela(p):
+    colunas = [u"Ano", u"NDVI Leste", u"NDVI Oeste", u"Δ (Leste−Oeste)", u"Média (Leste, Oeste)"]
+    linhas = linhas_tabela(medias_zonais(p['csv']))
+    texto = [[str(l[0])] + [u"–" if v is None else u"{:.3f}".format(v) for v in l[1:]] for l in linhas]
+    with plt.rc_context({"font.family": "serif", "font.serif": ["Times New Roman", "DejaVu Serif", "Times"],
+                         "font.size": 10}):
+        fig, ax = plt.subplots(figsize=(7.3, 0.5 + 0.33 * len(texto)), dpi=p['dpi'])
+        ax.axis('off')
+        tabela = ax.table(cellText=texto, colLabels=colunas, cellLoc='right', colLoc='center',
+                          loc='upper left', bbox=[0.0, 0.0, 1.0, 1.0])
+        for (r, c), celula in tabela.get_celld().items():
+            celula.set_edgecolor((1, 1, 1, 0))
+            celula.set_linewidth(0.0)
+            if r == 0 or r == len(texto):
+                celula.set_text_props(weight='bold')
+        # regras "booktabs": topo, sob o cabeçalho e base
+        for y, lw in ((1.0, 1.2), (1.0 - 1.0 / (len(texto) + 1), 0.8), (0.0, 1.2)):
+            ax.plot([0, 1], [y, y], transform=ax.transAxes, lw=lw, color='black', solid_capstyle='butt')
+        for c in range(len(colunas)):
+            tabela.auto_set_column_width(col=c)
+    return fig
+
+
+def desenhar_medias(p):
+    medias = medias_zonais(p['csv'])
+    anos = sorted(set(a for a, _ in medias))
+    fig, ax = plt.subplots(figsize=(9, 5), dpi=p['dpi'])
+    for lado in sorted(set(l for _, l in medias), reverse=True):
+        ax.plot(anos, [medias.get((a, lado), np.nan) for a in anos], 'o--', label=lado, color=CORES_LADO.get(lado))
+    ax.grid(True)
+    ax.set_xlabel("Ano")
+    ax.set_ylabel(u"NDVI médio")
+    ax.set_title(u"NDVI médio por lado (setembro a novembro)")
+    ax.set_xticks(anos)
+    ax.set_ylim(0, 1)
+    ax.legend()
+    fig.tight_layout()
+    return fig
+
+
+DESENHOS = {'painel': desenhar_painel, 'mosaico': desenhar_mosaico,
+            'tabela': desenhar_tabela, 'medias': desenhar_medias}
+
+
+def renderizar(tarefa):
+    """Desenha a figura da tarefa e grava o PNG (temporário + os.replace). Roda nos processos do pool."""
+    _exigir_matplotlib()
+    fig = DESENHOS[tarefa['tipo']](tarefa['parametros'])
+    tmp = "{}.{}.tmp".format(tarefa['saida'], os.getpid())
+    try:
+        fig.savefig(tmp, format='png', dpi=tarefa['parametros']['dpi'], bbox_inches='tight')
+    finally:
+        plt.close(fig)
+    os.replace(tmp, tarefa['saida'])
+    return tarefa['saida']
+
+
+# --- Tarefas ---
+def _limites_compartilhados(caminho=ARQUIVO_LIMITES):
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as f:
+        return [float(v) for v in json.load(f)['limites']]
+
+
+def _limites_raster(caminho):
+    ds = gdal.Open(caminho)
+    vmin, vmax = min_max(caminho, banda_ndvi(ds))
+    return [float(v) for v in limites_intervalo_igual(vmin, vmax)]
+
+
+def listar_tarefas(pares=None, csv_zonal=CSV_ZONAL, limites=None, dpi=DPI):
+    """
+    Tarefas de todas as figuras: {'nome', 'tipo', 'entradas', 'parametros'}.
+    pares: [{'ano', 'lado', 'raster'}] (padrão: zonal_lote.pares_locais());
+    limites: None = compartilhados se houver, senão por raster.
+    """
+    pares = sorted(pares_locais() if pares is None else pares, key=lambda p: (p['ano'], p['lado']))
+    if limites is None:
+        limites = _limites_compartilhados()
+    mapas = [{'ano': p['ano'], 'lado': p['lado'], 'raster': p['raster'],
+              'limites': [float(v) for v in limites] if limites is not None else _limites_raster(p['raster'])}
+             for p in pares]
+    tarefas = []
+    for m in mapas:
+        tarefas.append({'nome': "painel_{}_{}.png".format(m['lado'], m['ano']), 'tipo': 'painel',
+                        'entradas': [m['raster']], 'parametros': dict(m, dpi=dpi, largura=LARGURA_PAINEL)})
+    if mapas:
+        tarefas.append({'nome': "NDVI_mapa_anual.png", 'tipo': 'mosaico', 'entradas': [m['raster'] for m in mapas],
+                        'parametros': {'mapas': mapas, 'anos': sorted(set(m['ano'] for m in mapas)),
+                                       'lados': sorted(set(m['lado'] for m in mapas)),
+                                       'dpi': dpi, 'largura': LARGURA_MOSAICO}})
+    if csv_zonal and os.path.exists(csv_zonal):
+        tarefas.append({'nome': "NDVI_tabela_anual.png", 'tipo': 'tabela', 'entradas': [csv_zonal],
+                        'parametros': {'csv': csv_zonal, 'dpi': dpi}})
+        tarefas.append({'nome': "NDVI_medio_por_lado.png", 'tipo': 'medias', 'entradas': [csv_zonal],
+                        'parametros': {'csv': csv_zonal, 'dpi': dpi}})
+    return tarefas
+
+
+def _assinatura(caminho):
+    st = os.stat(caminho)
+    return [os.path.normcase(os.path.abspath(caminho)), st.st_mtime_ns, st.st_size]
+
+
+def chave_tarefa(tarefa):
+    """Hash das entradas (assinaturas), parâmetros, paleta e VERSAO."""
+    texto = json.dumps([VERSAO, tarefa['tipo'], tarefa['parametros'], CORES_HEX, ROTULOS,
+                        [_assinatura(c) for c in tarefa['entradas']]], sort_keys=True, ensure_ascii=True)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def _manifesto(pasta):
+    return os.path.join(pasta, "figuras.json")
+
+
+def carregar_manifesto(pasta):
+    try:
+        with open(_manifesto(pasta), encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _salvar_manifesto(pasta, manifesto):
+    tmp = "{}.{}.tmp".format(_manifesto(pasta), os.getpid())
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, indent=2, sort_keys=True)
+    os.replace(tmp, _manifesto(pasta))
+
+
+def construir(tarefas, pasta=PASTA_FIGURAS, n_processos=N_PROCESSOS, forcar=False):
+    """
+    Renderiza em paralelo as figuras cuja chave mudou (ou todas, com forcar).
+    Retorna {'feitas': [caminhos], 'puladas': [caminhos]}.
+    """
+    _exigir_matplotlib()
+    if not os.path.exists(pasta):
+        os.makedirs(pasta)
+    manifesto = carregar_manifesto(pasta)
+    pendentes, puladas = [], []
+    for t in tarefas:
+        t = dict(t, chave=chave_tarefa(t), saida=os.path.join(pasta, t['nome']))
+        if not forcar and manifesto.get(t['nome']) == t['chave'] and os.path.exists(t['saida']):
+            puladas.append(t['saida'])
+        else:
+            pendentes.append(t)
+    feitas = []
+    with trecho("figuras", figuras=len(tarefas), pendentes=len(pendentes)):
+        try:
+            if pendentes:
+                with criar_pool(n_processos) as pool:
+                    futuros = dict((pool.submit(renderizar, t), t) for t in pendentes)
+                    for f in as_completed(futuros):
+                        t = futuros[f]
+                        feitas.append(f.result())
+                        manifesto[t['nome']] = t['chave']
+                        print(u"  > {}".format(t['saida']))
+        finally:
+            _salvar_manifesto(pasta, manifesto)
+    return {'feitas': feitas, 'puladas': puladas}
+
+
+# --- Autoteste ---
+def autoteste():
+    """Raster sintético com overviews: leitura reduzida, renderização e pulo por chave."""
+    pasta = tempfile.mkdtemp(prefix="figuras_")
+    erros = []
+    try:
+        rng = np.random.RandomState(458)
+        pares = []
+        for ano in (2019, 2020):
+            for lado in ("Leste", "Oeste"):
+                caminho = os.path.join(pasta, "PA458_{}_{}_NDVI.tif".format(lado, ano))
+                ds = gdal.GetDriverByName('GTiff').Create(caminho, 800, 400, 1, gdal.GDT_Float32)
+                ds.SetGeoTransform((300000, 10, 0, 9900000, 0, -10))
+                dados = rng.uniform(-0.2, 0.9, (400, 800)).astype(np.float32)
+                dados[:50, :50] = NODATA
+                ds.GetRasterBand(1).SetNoDataValue(NODATA)
+                ds.GetRasterBand(1).WriteArray(dados)
+                ds.BuildOverviews("AVERAGE", [2, 4, 8])
+                ds = None
+                pares.append({'ano': ano, 'lado': lado, 'raster': caminho})
+
+        b = gdal.Open(pares[0]['raster']).GetRasterBand(1)
+        if escolher_overview(b, 150).XSize != 200 or escolher_overview(b, 1000).XSize != 800:
+            erros.append(u"overview escolhida errada")
+        dados, extensao = ler_reduzido(pares[0]['raster'], 150)
+        if dados.shape[1] > 200 or extensao != (300000, 308000, 9896000, 9900000):
+            erros.append(u"leitura reduzida: {} {}".format(dados.shape, extensao))
+
+        csv_zonal = os.path.join(pasta, "zonal.csv")
+        with open(csv_zonal, 'w', encoding='utf-8', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(['ano', 'lado', 'mean'])
+            for p in pares:
+                w.writerow([p['ano'], p['lado'], rng.uniform(0.4, 0.8)])
+        linhas = linhas_tabela(medias_zonais(csv_zonal))
+        if len(linhas) != 3 or abs(linhas[0][3] - (linhas[0][1] - linhas[0][2])) > 1e-12:
+            erros.append(u"linhas da tabela: {}".format(linhas))
+
+        limites = [-0.2, 0.0, 0.2, 0.4, 0.6, 0.9]
+        saida = os.path.join(pasta, "figuras")
+        tarefas = listar_tarefas(pares, csv_zonal, limites=limites, dpi=50)
+        r1 = construir(tarefas, saida, n_processos=2)
+        r2 = construir(listar_tarefas(pares, csv_zonal, limites=limites, dpi=50), saida, n_processos=2)
+        if len(r1['feitas']) != len(tarefas) or r2['feitas'] or len(r2['puladas']) != len(tarefas):
+            erros.append(u"1ª: {} feitas; 2ª: {} feitas, {} puladas (de {})".format(
+                len(r1['feitas']), len(r2['feitas']), len(r2['puladas']), len(tarefas)))
+
+        # limites novos: só os mapas são refeitos
+        r3 = construir(listar_tarefas(pares, csv_zonal, limites=[v + 0.01 for v in limites], dpi=50), saida)
+        if len(r3['feitas']) != len(pares) + 1:
+            erros.append(u"com limites novos, {} figuras refeitas (esperado {})".format(
+                len(r3['feitas']), len(pares) + 1))
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    for e in erros:
+        print(u"  [FALHA] {}".format(e))
+    print(u"--- Autoteste: {} ---".format("OK" if not erros else "FALHOU"))
+    return not erros
+
+
+if __name__ == "__main__":
+    if "--autoteste" in sys.argv:
+        sys.exit(0 if autoteste() else 1)
+    tarefas = listar_tarefas()
+    print(u"--- {} figuras em {} ---".format(len(tarefas), PASTA_FIGURAS))
+    r = construir(tarefas, forcar="--forcar" in sys.argv)
+    print(u"--- {} renderizadas, {} sem mudança ---".format(len(r['feitas']), len(r['puladas'])))
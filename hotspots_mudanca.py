@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+# Manchas de perda e ganho de NDVI entre compósitos set-nov consecutivos
+# (os rasters de 3 bandas exportados pelo notebook, banda NDVI):
+#   - ΔNDVI = NDVI(ano) - NDVI(ano anterior), lido em blocos de linhas nos
+#     pixels válidos nos dois anos; opcionalmente gravado como raster;
+#   - perda: Δ <= -LIMIAR_DELTA; ganho: Δ >= LIMIAR_DELTA;
+#   - componentes conexas (8-vizinhança por padrão) rotuladas em corridas
+#     (run-length) em vez de pixel a pixel: cada bloco vira uma lista de
+#     corridas (linha, início, fim) com soma de Δ e de coordenadas; as
+#     corridas de linhas vizinhas que se tocam são ligadas por busca binária
+#     e unidas por union-find vetorizado. A ligação é feita em coordenadas
+#     globais de linha, então a última linha de um bloco encontra a primeira
+#     do seguinte (a sobreposição de uma linha) e as manchas que atravessam
+#     blocos saem inteiras;
+#   - tabela de manchas: área (ha), ΔNDVI médio, centroide, km da PA-458 e
+#     distância ao eixo (segmentos_km.py).
+#
+# `python hotspots_mudanca.py` processa os pares de anos de cada lado;
+# `--autoteste` confere a rotulação com um flood fill em máscaras sintéticas.
+
+import os
+import csv
+import sys
+import time
+
+import numpy as np
+from osgeo import gdal
+
+from perfil_raster import criar_raster, finalizar_raster
+from tabelas import espelhar_csv
+from transicao_raster import _conferir_grade
+from vetorizacao_paralela import banda_ndvi
+from zonal_lote import pares_locais
+
+# --- CONFIGURAÇÕES ---
+LIMIAR_DELTA = 0.15        # |ΔNDVI| mínimo para perda/ganho
+MIN_PIXELS = 5             # manchas menores são descartadas (5 px = 0,05 ha a 10 m)
+CONECTIVIDADE = 8          # 4 ou 8
+LINHAS_POR_BLOCO = 512
+NODATA = -9999
+SALVAR_DIFERENCA = False   # grava <pasta>/dNDVI_<Lado>_<ano0>_<ano1>.tif
+PASTA_SAIDA = "outputs"
+CSV_SAIDA = os.path.join(PASTA_SAIDA, "hotspots_mudanca.csv")
+CAMPOS = ['lado', 'ano_inicial', 'ano', 'tipo', 'mancha', 'n_pixels', 'area_ha', 'delta_medio',
+          'x', 'y', 'km', 'dist_eixo_m']
+
+gdal.UseExceptions()
+
+
+# --- Corridas e componentes ---
+def corridas(mascara, linha0=0):
+    """Corridas de True de uma máscara 2D: (linha, início, fim) com fim exclusivo, em ordem de linha."""
+    borda = np.zeros((mascara.shape[0], 1), dtype=np.int8)
+    d = np.diff(np.hstack([borda, mascara.astype(np.int8), borda]), axis=1)
+    li, ini = np.nonzero(d == 1)
+    _, fim = np.nonzero(d == -1)
+    return li + linha0, ini, fim
+
+
+def ligacoes(linha, ini, fim, largura, conectividade=CONECTIVIDADE):
+    """
+    Pares (a, b) de corridas de linhas consecutivas que se tocam. Corridas de
+    uma linha são disjuntas e ordenadas, então as vizinhas de cada corrida na
+    linha de cima formam um intervalo contíguo, achado por busca binária.
+    """
+    c = 1 if conectividade == 8 else 0
+    passo = largura + 3
+    chave_ini = linha * passo + ini + 1
+    chave_fim = linha * passo + fim + 1
+    acima = linha - 1
+    primeiro = np.searchsorted(chave_fim, acima * passo + (ini - c) + 1, side='right')
+    ultimo = np.searchsorted(chave_ini, acima * passo + (fim + c) + 1, side='left') - 1
+    n = np.maximum(0, ultimo - primeiro + 1)
+    b = np.repeat(np.arange(linha.size), n)
+    deslocamento = np.arange(b.size) - np.repeat(np.cumsum(n) - n, n)
+    return np.repeat(primeiro, n) + deslocamento, b
+
+
+def componentes(n, a, b):
+    """Rótulo (raiz de menor índice) de cada nó do grafo com arestas (a, b): union-find vetorizado."""
+    rotulo = np.arange(n)
+    while a.size:
+        ra, rb = rotulo[a], rotulo[b]
+        diferentes = ra != rb
+        if not diferentes.any():
+            break
+        ra, rb = ra[diferentes], rb[diferentes]
+        menor = np.minimum(ra, rb)
+        np.minimum.at(rotulo, ra, menor)
+        np.minimum.at(rotulo, rb, menor)
+        while True:                                   # compressão de caminhos até as raízes
+            prox = rotulo[rotulo]
+            if np.array_equal(prox, rotulo):
+                break
+            rotulo = prox
+    return rotulo
+
+
+def _nova_lista():
+    return {'linha': [], 'ini': [], 'fim': [], 'soma': []}
+
+
+def _acumular(lista, mascara, delta, y0):
+    li, ini, fim = corridas(mascara, y0)
+    if li.size == 0:
+        return
+    valores = delta[mascara]                          # mesma ordem (linha a linha) das corridas
+    inicios = np.concatenate([[0], np.cumsum(fim - ini)[:-1]])
+    lista['linha'].append(li)
+    lista['ini'].append(ini)
+    lista['fim'].append(fim)
+    lista['soma'].append(np.add.reduceat(valores.astype(np.float64), inicios))
+
+
+def manchas(lista, largura, conectividade=CONECTIVIDADE, min_pixels=MIN_PIXELS):
+    """Corridas acumuladas -> {'n', 'soma', 'col', 'lin'} por mancha (centroide em pixels)."""
+    if not lista['linha']:
+        vazio = np.zeros(0)
+        return {'n': vazio, 'soma': vazio, 'col': vazio, 'lin': vazio}
+    linha, ini, fim, soma = (np.concatenate(lista[c]) for c in ('linha', 'ini', 'fim', 'soma'))
+    a, b = ligacoes(linha, ini, fim, largura, conectividade)
+    raiz = componentes(linha.size, a, b)
+    _, rotulo = np.unique(raiz, return_inverse=True)
+    comp = (fim - ini).astype(np.float64)
+    n = np.bincount(rotulo, weights=comp)
+    soma_col = np.bincount(rotulo, weights=(ini + fim - 1) * comp / 2.0)
+    soma_lin = np.bincount(rotulo, weights=linha * comp)
+    s = np.bincount(rotulo, weights=soma)
+    ok = n >= min_pixels
+    return {'n': n[ok], 'soma': s[ok], 'col': soma_col[ok] / n[ok], 'lin': soma_lin[ok] / n[ok]}
+
+
+def detectar_manchas(ler_delta, largura, altura, limiar=LIMIAR_DELTA, linhas_por_bloco=LINHAS_POR_BLOCO,
+                     conectividade=CONECTIVIDADE, min_pixels=MIN_PIXELS, gravar=None):
+    """
+    ler_delta(y0, nlin) -> ΔNDVI do bloco (NaN fora dos pixels válidos).
+    gravar(delta, y0), se dado, recebe cada bloco (raster de diferença).
+    Retorna {'perda': manchas, 'ganho': manchas}.
+    """
+    listas = {'perda': _nova_lista(), 'ganho': _nova_lista()}
+    for y0 in range(0, altura, linhas_por_bloco):
+        nlin = min(linhas_por_bloco, altura - y0)
+        delta = ler_delta(y0, nlin)
+        if gravar is not None:
+            gravar(delta, y0)
+        with np.errstate(invalid='ignore'):
+            _acumular(listas['perda'], delta <= -limiar, delta, y0)
+            _acumular(listas['ganho'], delta >= limiar, delta, y0)
+    return dict((tipo, manchas(lista, largura, conectividade, min_pixels)) for tipo, lista in listas.items())
+
+
+# --- Rasters ---
+def _leitor_delta(ds0, ds1):
+    b0 = ds0.GetRasterBand(banda_ndvi(ds0))
+    b1 = ds1.GetRasterBand(banda_ndvi(ds1))
+    nd0, nd1 = b0.GetNoDataValue(), b1.GetNoDataValue()
+
+    def ler(y0, nlin):
+        v0 = b0.ReadAsArray(0, y0, ds0.RasterXSize, nlin).astype(np.float32)
+        v1 = b1.ReadAsArray(0, y0, ds1.RasterXSize, nlin).astype(np.float32)
+        if nd0 is not None:
+            v0[v0 == nd0] = np.nan
+        if nd1 is not None:
+            v1[v1 == nd1] = np.nan
+        return v1 - v0
+    return ler
+
+
+def _gravador_delta(caminho, ds):
+    saida = criar_raster(caminho, ds.RasterXSize, ds.RasterYSize, 1, gdal.GDT_Float32)
+    saida.SetGeoTransform(ds.GetGeoTransform())
+    saida.SetProjection(ds.GetProjection())
+    saida.GetRasterBand(1).SetNoDataValue(NODATA)
+
+    def gravar(delta, y0):
+        saida.GetRasterBand(1).WriteArray(np.where(np.isnan(delta), NODATA, delta).astype(np.float32), 0, y0)
+    return saida, gravar
+
+
+def eixo_da_grade(wkt):
+    """Vértices do eixo da PA-458 no CRS dos rasters, ou None se o arquivo do eixo não existir."""
+    from segmentos_km import CAMINHO_EIXO, INICIO_EIXO, ler_eixo
+    if not os.path.exists(CAMINHO_EIXO):
+        return None
+    return ler_eixo(CAMINHO_EIXO, wkt, INICIO_EIXO)
+
+
+def manchas_par(caminho0, caminho1, lado, ano0, ano1, pasta_saida=PASTA_SAIDA, eixo=None):
+    """Linhas da tabela de manchas de um par de anos (mesma grade)."""
+    ds0, ds1 = gdal.Open(caminho0), gdal.Open(caminho1)
+    _conferir_grade([ds0, ds1])
+    gt = ds0.GetGeoTransform()
+    saida = gravar = None
+    if SALVAR_DIFERENCA:
+        caminho_delta = os.path.join(pasta_saida, "dNDVI_{}_{}_{}.tif".format(lado, ano0, ano1))
+        saida, gravar = _gravador_delta(caminho_delta, ds0)
+    resultado = detectar_manchas(_leitor_delta(ds0, ds1), ds0.RasterXSize, ds0.RasterYSize, gravar=gravar)
+    if saida is not None:
+        saida = None
+        finalizar_raster(caminho_delta)
+
+    area_pixel_ha = abs(gt[1] * gt[5] - gt[2] * gt[4]) / 10000.0
+    linhas = []
+    for tipo in ('perda', 'ganho'):
+        m = resultado[tipo]
+        col, lin = m['col'] + 0.5, m['lin'] + 0.5
+        x = gt[0] + col * gt[1] + lin * gt[2]
+        y = gt[3] + col * gt[4] + lin * gt[5]
+        km = dist = [None] * x.size
+        if eixo is not None and x.size:
+            from segmentos_km import estaqueamento
+            cadeia, distancia = estaqueamento(x, y, eixo)
+            km, dist = (cadeia / 1000.0).tolist(), distancia.tolist()
+        ordem = np.argsort(m['soma'] if tipo == 'perda' else -m['soma'], kind='stable')   # maior mudança primeiro
+        for i, k in enumerate(ordem.tolist()):
+            linhas.append({'lado': lado, 'ano_inicial': ano0, 'ano': ano1, 'tipo': tipo, 'mancha': i + 1,
+                           'n_pixels': int(m['n'][k]), 'area_ha': round(m['n'][k] * area_pixel_ha, 4),
+                           'delta_medio': round(m['soma'][k] / m['n'][k], 4),
+                           'x': round(float(x[k]), 2), 'y': round(float(y[k]), 2),
+                           'km': round(km[k], 3) if km[k] is not None else None,
+                           'dist_eixo_m': round(dist[k], 1) if dist[k] is not None else None})
+    return linhas
+
+
+def pares_consecutivos(pares):
+    """[(lado, ano0, raster0, ano1, raster1)] dos anos consecutivos disponíveis de cada lado."""
+    por_lado = {}
+    for p in pares:
+        por_lado.setdefault(p['lado'], {})[p['ano']] = p['raster']
+    saida = []
+    for lado in sorted(por_lado):
+        anos = sorted(por_lado[lado])
+        for a0, a1 in zip(anos[:-1], anos[1:]):
+            saida.append((lado, a0, por_lado[lado][a0], a1, por_lado[lado][a1]))
+    return saida
+
+
+def escrever_csv(caminho, linhas):
+    pasta = os.path.dirname(caminho)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    with open(caminho, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CAMPOS)
+        writer.writeheader()
+        writer.writerows(linhas)
+    if linhas:
+        espelhar_csv(caminho, linhas)
+    return caminho
+
+
+# --- Autoteste ---
+def _rotular_flood(mascara, conectividade):
+    """Referência lenta: flood fill pixel a pixel."""
+    rot = np.zeros(mascara.shape, dtype=np.int64)
+    vizinhos = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+    if conectividade == 8:
+        vizinhos += [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+    n = 0
+    for i, j in zip(*np.nonzero(mascara)):
+        if rot[i, j]:
+            continue
+        n += 1
+        pilha = [(i, j)]
+        rot[i, j] = n
+        while pilha:
+            a, b = pilha.pop()
+            for da, db in vizinhos:
+                p, q = a + da, b + db
+                if 0 <= p < mascara.shape[0] and 0 <= q < mascara.shape[1] and mascara[p, q] and not rot[p, q]:
+                    rot[p, q] = n
+                    pilha.append((p, q))
+    return rot, n
+
+
+def autoteste():
+    """Rotulação em blocos pequenos (manchas atravessando blocos) = flood fill, em 4 e 8 vizinhanças."""
+    erros = []
+    rng = np.random.RandomState(458)
+    for conectividade in (4, 8):
+        for densidade in (0.3, 0.55):
+            delta = rng.normal(0, 0.1, (97, 61))
+            delta[rng.rand(*delta.shape) > densidade] = 0.0
+            delta[5:9, :] = np.nan                                     # faixa sem dados
+            ref, n_ref = _rotular_flood(delta <= -0.05, conectividade)
+            res = detectar_manchas(lambda y0, n: delta[y0:y0 + n], delta.shape[1], delta.shape[0],
+                                   limiar=0.05, linhas_por_bloco=7, conectividade=conectividade, min_pixels=1)
+            m = res['perda']
+            tamanhos_ref = np.sort(np.bincount(ref.ravel())[1:])
+            if n_ref != m['n'].size or not np.array_equal(tamanhos_ref, np.sort(m['n']).astype(np.int64)):
+                erros.append(u"{}-vizinhança, densidade {}: {} manchas (flood fill: {})".format(
+                    conectividade, densidade, m['n'].size, n_ref))
+                continue
+            soma_ref = np.sort(np.bincount(ref.ravel(), weights=np.nan_to_num(delta).ravel())[1:])
+            if not np.allclose(np.sort(m['soma']), soma_ref):
+                erros.append(u"{}-vizinhança: somas de Δ diferentes".format(conectividade))
+
+    # mancha em U: os dois braços só se juntam na última linha, três blocos abaixo
+    u = np.zeros((30, 10))
+    u[:, 1] = u[:, 8] = -1.0
+    u[29, 1:9] = -1.0
+    m = detectar_manchas(lambda y0, n: u[y0:y0 + n], 10, 30, linhas_por_bloco=8, min_pixels=1)['perda']
+    if m['n'].tolist() != [66.0]:
+        erros.append(u"mancha em U dividida: {}".format(m['n'].tolist()))
+
+    for e in erros:
+        print(u"  [FALHA] {}".format(e))
+    print(u"--- Autoteste: {} ---".format("OK" if not erros else "FALHOU"))
+    return not erros
+
+
+if __name__ == "__main__":
+    if "--autoteste" in sys.argv:
+        sys.exit(0 if autoteste() else 1)
+    pares = pares_consecutivos(pares_locais())
+    print(u"--- Manchas de mudança: {} pares de anos ---".format(len(pares)))
+    linhas = []
+    eixo = None
+    for lado, a0, r0, a1, r1 in pares:
+        t0 = time.time()
+        if eixo is None:
+            eixo = eixo_da_grade(gdal.Open(r0).GetProjection())
+        novas = manchas_par(r0, r1, lado, a0, a1, eixo=eixo)
+        for tipo in ('perda', 'ganho'):
+            sel = [l for l in novas if l['tipo'] == tipo]
+            print(u"  {} {}->{} {:<5}: {:5d} manchas, {:10.2f} ha".format(
+                lado, a0, a1, tipo, len(sel), sum(l['area_ha'] for l in sel)))
+        print(u"    ({:.1f} s)".format(time.time() - t0))
+        linhas.extend(novas)
+    print(u"--- Salvo: {} ---".format(escrever_csv(CSV_SAIDA, linhas)))
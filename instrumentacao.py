@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+# Registro estruturado das execuções: trechos cronometrados em volta das
+# chamadas ao processing.run, das passadas de estatística e das gravações
+# de arquivo, e contadores amostrados nos laços por feição.
+#
+#   - trecho(nome, **atributos): context manager; grava no fim uma linha JSON
+#     com início, duração, RSS e os atributos (camada, pixels, feições,
+#     bytes...), que o próprio bloco pode completar;
+#   - rodar(algoritmo, parametros): processing.run dentro de um trecho, com o
+#     nome da camada de entrada, pixels/feições e bytes das saídas em disco;
+#   - contador(nome) / contar(c): um evento a cada AMOSTRAGEM incrementos,
+#     não um por feição;
+#   - exportar_chrome: JSON-lines -> trace events (chrome://tracing, Perfetto).
+#
+# As linhas vão para ARQUIVO_LOG (variável de ambiente PA458_LOG; vazia ou
+# "0" desliga) e são descarregadas no disco ao fim de cada trecho de topo.
+# Processos filhos (pools de recorte, vetorização...) herdam o log e o id da
+# execução pelas variáveis PA458_LOG/PA458_EXECUCAO e descarregam ao fim de
+# cada trecho, já que os workers do pool saem sem passar pelo atexit.
+#
+# `python instrumentacao.py` resume a última execução do log;
+# `--chrome saida.json` exporta o trace; `--autoteste` confere tudo num log temporário.
+
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# --- CONFIGURAÇÕES ---
+ARQUIVO_LOG = os.environ.get("PA458_LOG", os.path.join(os.path.expanduser("~"), ".pa458_cache", "execucoes.jsonl"))
+AMOSTRAGEM = 1000           # contadores: um evento a cada N incrementos
+MEDIR_MEMORIA = True
+BUFFER_BYTES = 64 * 1024
+
+EXTENSOES_SHAPEFILE = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+
+def _nova_execucao():
+    return "{}-{}".format(time.strftime("%Y%m%dT%H%M%S"), os.getpid())
+
+
+_ESTADO = {
+    'arquivo': ARQUIVO_LOG if ARQUIVO_LOG not in ("", "0") else None,
+    'pendentes': [],          # linhas ainda não gravadas
+    'bytes': 0,
+    'execucao': os.environ.get("PA458_EXECUCAO") or _nova_execucao(),
+    # processo que começou a execução (nos filhos, por fork ou spawn, o pai)
+    'pid': int(os.environ.get("PA458_EXECUCAO_PID", os.getpid())) if "PA458_EXECUCAO" in os.environ else os.getpid(),
+    'proximo_id': 0,
+}
+_LOCAL = threading.local()
+_TRAVA = threading.Lock()
+
+
+def _exportar_ambiente():
+    """Log e execução para os processos filhos (spawn reimporta o módulo)."""
+    os.environ["PA458_LOG"] = _ESTADO['arquivo'] or "0"
+    os.environ["PA458_EXECUCAO"] = _ESTADO['execucao']
+    os.environ["PA458_EXECUCAO_PID"] = str(_ESTADO['pid'])
+
+
+def _apos_fork():
+    """No filho: pilha de trechos e linhas pendentes são do pai; descarta sem gravar."""
+    global _LOCAL, _TRAVA
+    _LOCAL = threading.local()
+    _TRAVA = threading.Lock()
+    _ESTADO['pendentes'] = []
+    _ESTADO['bytes'] = 0
+
+
+_exportar_ambiente()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_apos_fork)
+
+
+# --- Destino ---
+def configurar(arquivo=ARQUIVO_LOG, ativo=True):
+    """Troca o arquivo do log (ou desliga, ativo=False); começa uma nova execução."""
+    descarregar()
+    _ESTADO['arquivo'] = arquivo if ativo and arquivo else None
+    _ESTADO['execucao'] = _nova_execucao()
+    _ESTADO['pid'] = os.getpid()
+    _exportar_ambiente()
+    return _ESTADO['arquivo']
+
+
+def ativo():
+    return _ESTADO['arquivo'] is not None
+
+
+def execucao():
+    return _ESTADO['execucao']
+
+
+def registrar(evento):
+    """Acrescenta um evento (dict) ao log desta execução."""
+    if _ESTADO['arquivo'] is None:
+        return
+    evento['execucao'] = _ESTADO['execucao']
+    linha = json.dumps(evento, ensure_ascii=False, default=str) + "\n"
+    with _TRAVA:
+        _ESTADO['pendentes'].append(linha)
+        _ESTADO['bytes'] += len(linha)
+        cheio = _ESTADO['bytes'] >= BUFFER_BYTES
+    if cheio:
+        descarregar()
+
+
+def descarregar():
+    """Grava as linhas pendentes numa única escrita em modo append."""
+    with _TRAVA:
+        linhas, _ESTADO['pendentes'], _ESTADO['bytes'] = _ESTADO['pendentes'], [], 0
+        if not linhas or _ESTADO['arquivo'] is None:
+            return
+        pasta = os.path.dirname(_ESTADO['arquivo'])
+        if pasta and not os.path.exists(pasta):
+            os.makedirs(pasta)
+        with open(_ESTADO['arquivo'], 'a', encoding='utf-8') as f:
+            f.write("".join(linhas))
+
+
+def _em_filho():
+    return os.getpid() != _ESTADO['pid']
+
+
+atexit.register(descarregar)
+
+
+# --- Medidas ---
+def memoria_mb():
+    """RSS atual do processo (pico, onde só ele está disponível); None se não houver como medir."""
+    if not MEDIR_MEMORIA:
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576.0
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1048576.0
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1048576.0 if sys.platform == 'darwin' else pico / 1024.0
+
+
+def tamanho_arquivo(caminho):
+    """Bytes em disco (shapefile: soma dos arquivos auxiliares); None se não for arquivo."""
+    if not isinstance(caminho, str) or not os.path.isfile(caminho):
+        return None
+    base, ext = os.path.splitext(caminho)
+    if ext.lower() == ".shp":
+        return sum(os.path.getsize(base + e) for e in EXTENSOES_SHAPEFILE if os.path.isfile(base + e))
+    return os.path.getsize(caminho)
+
+
+# --- Trechos ---
+def _pilha():
+    if not hasattr(_LOCAL, 'pilha'):
+        _LOCAL.pilha = []
+    return _LOCAL.pilha
+
+
+@contextmanager
+def trecho(nome, **atributos):
+    """
+    Cronometra o bloco. O dict devolvido pode receber mais atributos
+    (pixels, feicoes, bytes...) antes do fim; exceções são anotadas em
+    'erro' e repassadas.
+    """
+    if _ESTADO['arquivo'] is None:
+        yield atributos
+        return
+    pilha = _pilha()
+    with _TRAVA:
+        _ESTADO['proximo_id'] += 1
+        ident = _ESTADO['proximo_id']
+    pai = pilha[-1] if pilha else None
+    pilha.append(ident)
+    rss_inicio = memoria_mb()
+    inicio = time.time()
+    t0 = time.perf_counter()
+    erro = None
+    try:
+        yield atributos
+    except BaseException as e:
+        erro = u"{}: {}".format(type(e).__name__, e)
+        raise
+    finally:
+        dur_ms = (time.perf_counter() - t0) * 1000.0
+        pilha.pop()
+        rss = memoria_mb()
+        evento = {'tipo': 'trecho', 'nome': nome, 'id': ident, 'pai': pai,
+                  'inicio': inicio, 'dur_ms': round(dur_ms, 3),
+                  'pid': os.getpid(), 'tid': threading.get_ident(),
+                  'rss_mb': round(rss, 1) if rss is not None else None,
+                  'delta_rss_mb': round(rss - rss_inicio, 1) if rss is not None and rss_inicio is not None else None,
+                  'atributos': atributos}
+        if erro is not None:
+            evento['erro'] = erro
+        registrar(evento)
+        if not pilha or _em_filho():
+            descarregar()
+
+
+def _nome_camada(valor):
+    if hasattr(valor, 'name') and callable(valor.name):
+        return valor.name()
+    if isinstance(valor, str):
+        return os.path.basename(valor.split("|")[0])
+    return None
+
+
+def _dimensoes(valor, prefixo, atributos):
+    """Pixels (raster) ou feições (vetor) de uma camada do QGIS, sem ler os dados."""
+    if hasattr(valor, 'featureCount'):
+        n = valor.featureCount()
+        if n is not None and n >= 0:
+            atributos[prefixo + 'feicoes'] = int(n)
+    elif hasattr(valor, 'width') and hasattr(valor, 'height'):
+        atributos[prefixo + 'pixels'] = int(valor.width()) * int(valor.height())
+
+
+def rodar(algoritmo, parametros, **atributos):
+    """processing.run(algoritmo, parametros) num trecho com camada, dimensões e bytes gravados."""
+    import processing
+    entrada = None
+    for chave in ('INPUT', 'INPUT_RASTER'):
+        if chave in parametros:
+            entrada = parametros[chave]
+            break
+    atributos.setdefault('camada', _nome_camada(entrada))
+    with trecho(algoritmo, **atributos) as t:
+        if entrada is not None and not isinstance(entrada, str):
+            _dimensoes(entrada, '', t)
+        resultado = processing.run(algoritmo, parametros)
+        saida = resultado.get('OUTPUT') if isinstance(resultado, dict) else None
+        if isinstance(saida, str):
+            n_bytes = tamanho_arquivo(saida.split("|")[0])
+            if n_bytes is not None:
+                t['bytes'] = n_bytes
+        elif saida is not None:
+            _dimensoes(saida, 'saida_', t)
+    return resultado
+
+
+# --- Contadores amostrados ---
+def contador(nome, a_cada=AMOSTRAGEM, **atributos):
+    return {'nome': nome, 'a_cada': a_cada, 'valor': 0, 'proximo': a_cada,
+            'atributos': atributos, 't0': time.perf_counter()}
+
+
+def _emitir_contador(c):
+    decorrido = time.perf_counter() - c['t0']
+    registrar({'tipo': 'contador', 'nome': c['nome'], 't': time.time(),
+               'pid': os.getpid(), 'tid': threading.get_ident(), 'valor': c['valor'],
+               'por_s': round(c['valor'] / decorrido, 1) if decorrido > 0 else None,
+               'atributos': c['atributos']})
+
+
+def contar(c, n=1):
+    """Incrementa; só grava um evento quando o valor passa do próximo múltiplo de a_cada."""
+    c['valor'] += n
+    if c['valor'] >= c['proximo']:
+        c['proximo'] = (c['valor'] // c['a_cada'] + 1) * c['a_cada']
+        if _ESTADO['arquivo'] is not None:
+            _emitir_contador(c)
+
+
+def encerrar_contador(c):
+    """Evento com o valor final (o último incremento raramente cai num múltiplo)."""
+    if _ESTADO['arquivo'] is not None and c['valor']:
+        _emitir_contador(c)
+        if _em_filho():
+            descarregar()
+    return c['valor']
+
+
+# --- Leitura e exportação ---
+def ler_eventos(arquivo=None, execucao_log=None):
+    """Eventos do log; execucao_log='ultima' filtra a execução mais recente."""
+    arquivo = arquivo or _ESTADO['arquivo'] or ARQUIVO_LOG
+    descarregar()
+    eventos = []
+    with open(arquivo, 'r', encoding='utf-8') as f:
+        for linha in f:
+            linha = linha.strip()
+            if linha:
+                try:
+                    eventos.append(json.loads(linha))
+                except ValueError:
+                    continue    # linha truncada (processo interrompido)
+    if execucao_log == 'ultima' and eventos:
+        execucao_log = eventos[-1].get('execucao')
+    if execucao_log:
+        eventos = [e for e in eventos if e.get('execucao') == execucao_log]
+    return eventos
+
+
+def eventos_chrome(eventos):
+    """Trace events: 'X' para trechos (início/duração em µs) e 'C' para contadores."""
+    saida = []
+    for e in eventos:
+        if e.get('tipo') == 'trecho':
+            args = dict(e.get('atributos') or {})
+            for campo in ('rss_mb', 'delta_rss_mb', 'erro'):
+                if e.get(campo) is not None:
+                    args[campo] = e[campo]
+            saida.append({'name': e['nome'], 'cat': e.get('execucao', ''), 'ph': 'X',
+                          'ts': int(e['inicio'] * 1e6), 'dur': int(e['dur_ms'] * 1000),
+                          'pid': e['pid'], 'tid': e['tid'], 'args': args})
+        elif e.get('tipo') == 'contador':
+            saida.append({'name': e['nome'], 'ph': 'C', 'ts': int(e['t'] * 1e6),
+                          'pid': e['pid'], 'tid': e['tid'], 'args': {'valor': e['valor']}})
+    return saida
+
+
+def exportar_chrome(caminho_json, arquivo=None, execucao_log='ultima'):
+    eventos = eventos_chrome(ler_eventos(arquivo, execucao_log))
+    pasta = os.path.dirname(caminho_json)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    with open(caminho_json, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': eventos, 'displayTimeUnit': 'ms'}, f)
+    return caminho_json
+
+
+def resumo(eventos):
+    """Por nome de trecho: chamadas, tempo total/máximo (ms), bytes e pico de RSS."""
+    por_nome = {}
+    for e in eventos:
+        if e.get('tipo') != 'trecho':
+            continue
+        r = por_nome.setdefault(e['nome'], {'n': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'bytes': 0,
+                                            'rss_mb': None, 'erros': 0, 'mais_lento': None})
+        r['n'] += 1
+        r['total_ms'] += e['dur_ms']
+        if e['dur_ms'] >= r['max_ms']:
+            r['max_ms'] = e['dur_ms']
+            r['mais_lento'] = (e.get('atributos') or {}).get('camada')
+        r['bytes'] += (e.get('atributos') or {}).get('bytes') or 0
+        if e.get('rss_mb') is not None:
+            r['rss_mb'] = max(r['rss_mb'] or 0.0, e['rss_mb'])
+        r['erros'] += 1 if 'erro' in e else 0
+    return por_nome
+
+
+def imprimir_resumo(eventos):
+    por_nome = resumo(eventos)
+    if eventos:
+        print(u"--- Execução {} ---".format(eventos[-1].get('execucao')))
+    for nome, r in sorted(por_nome.items(), key=lambda item: -item[1]['total_ms']):
+        print(u"  {:<32} {:>5}x {:>10.1f} ms (máx {:.1f} ms{}) {:>9.1f} MB grav. {}{}".format(
+            nome, r['n'], r['total_ms'], r['max_ms'],
+            u", {}".format(r['mais_lento']) if r['mais_lento'] else u"",
+            r['bytes'] / 1048576.0,
+            u"RSS {:.0f} MB".format(r['rss_mb']) if r['rss_mb'] is not None else u"",
+            u" [{} erro(s)]".format(r['erros']) if r['erros'] else u""))
+
+
+def _trecho_no_filho(i):
+    with trecho("filho", i=i):
+        c = contador("filho_itens", a_cada=1000)
+        contar(c, 10)
+        encerrar_contador(c)
+    return os.getpid()
+
+
+def autoteste():
+    """Trechos aninhados, erro anotado, amostragem dos contadores, trace, pool de processos e modo desligado."""
+    pasta = tempfile.mkdtemp(prefix="instrumentacao_")
+    erros = []
+    anterior = _ESTADO['arquivo']
+    try:
+        log = configurar(os.path.join(pasta, "log.jsonl"))
+        with trecho("externo", camada="Leste_2020") as t:
+            with trecho("interno"):
+                caminho = os.path.join(pasta, "saida.bin")
+                with open(caminho, 'wb') as f:
+                    f.write(b"\0" * 4096)
+            t['bytes'] = tamanho_arquivo(caminho)
+            c = contador("feicoes", a_cada=100)
+            for _ in range(250):
+                contar(c)
+            encerrar_contador(c)
+        try:
+            with trecho("falha"):
+                raise ValueError("teste")
+        except ValueError:
+            pass
+
+        eventos = ler_eventos(log, 'ultima')
+        trechos = dict((e['nome'], e) for e in eventos if e['tipo'] == 'trecho')
+        valores = [e['valor'] for e in eventos if e['tipo'] == 'contador']
+        if sorted(trechos) != ['externo', 'falha', 'interno']:
+            erros.append(u"trechos gravados: {}".format(sorted(trechos)))
+        elif trechos['interno']['pai'] != trechos['externo']['id'] or trechos['externo']['pai'] is not None:
+            erros.append(u"aninhamento perdido")
+        elif trechos['externo']['atributos'] != {'camada': 'Leste_2020', 'bytes': 4096}:
+            erros.append(u"atributos: {}".format(trechos['externo']['atributos']))
+        elif 'ValueError' not in trechos['falha'].get('erro', ''):
+            erros.append(u"erro não anotado")
+        if valores != [100, 200, 250]:
+            erros.append(u"contador amostrado em {}".format(valores))
+
+        trace = os.path.join(pasta, "trace.json")
+        exportar_chrome(trace, log)
+        with open(trace, 'r', encoding='utf-8') as f:
+            fases = sorted(e['ph'] for e in json.load(f)['traceEvents'])
+        if fases != ['C'] * 3 + ['X'] * 3:
+            erros.append(u"trace com fases {}".format(fases))
+
+        # pool de processos criado dentro de um trecho e fora dele, com linhas do pai pendentes
+        from concurrent.futures import ProcessPoolExecutor
+        log_pool = configurar(os.path.join(pasta, "pool.jsonl"))
+        with trecho("pai_pool"):
+            c = contador("pendente_dentro", a_cada=1)
+            contar(c)
+            with ProcessPoolExecutor(2) as pool:
+                list(pool.map(_trecho_no_filho, range(4)))
+        c = contador("pendente_fora", a_cada=1)
+        contar(c)
+        with ProcessPoolExecutor(2) as pool:
+            list(pool.map(_trecho_no_filho, range(4, 8)))
+        descarregar()
+        eventos_pool = ler_eventos(log_pool)
+        nomes = [e['nome'] for e in eventos_pool]
+        filhos = sorted(e['atributos']['i'] for e in eventos_pool if e['nome'] == 'filho')
+        if filhos != list(range(8)):
+            erros.append(u"pool: trechos dos filhos gravados {}".format(filhos))
+        if nomes.count('filho_itens') != 8:
+            erros.append(u"pool: {} contadores dos filhos (esperado 8)".format(nomes.count('filho_itens')))
+        repetidas = [n for n in ('pendente_dentro', 'pendente_fora', 'pai_pool') if nomes.count(n) != 1]
+        if repetidas:
+            erros.append(u"pool: linhas do pai gravadas != 1 vez: {}".format(
+                ", ".join(u"{} ({}x)".format(n, nomes.count(n)) for n in repetidas)))
+        if len(set(e['execucao'] for e in eventos_pool)) != 1:
+            erros.append(u"pool: filhos em outra execução")
+
+        configurar(ativo=False)
+        with trecho("desligado"):
+            contar(contador("nada", a_cada=1))
+        if len(ler_eventos(log)) != len(eventos):
+            erros.append(u"modo desligado gravou eventos")
+    finally:
+        configurar(anterior, ativo=anterior is not None)
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    for e in erros:
+        print(u"  [FALHA] {}".format(e))
+    print(u"--- Autoteste: {} ---".format("OK" if not erros else "FALHOU"))
+    return not erros
+
+
+if __name__ == "__main__":
+    if "--autoteste" in sys.argv:
+        sys.exit(0 if autoteste() else 1)
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if "--chrome" in sys.argv:
+        destino = sys.argv[sys.argv.index("--chrome") + 1]
+        argumentos.remove(destino)
+        origem = argumentos[0] if argumentos else ARQUIVO_LOG
+        print(u"--- Trace: {} ---".format(exportar_chrome(destino, origem, None if "--todas" in sys.argv else 'ultima')))
+    else:
+        imprimir_resumo(ler_eventos(argumentos[0] if argumentos else ARQUIVO_LOG,
+                                    None if "--todas" in sys.argv else 'ultima'))
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# Séries mensais de NDVI de várias regiões (Leste, Oeste, buffers de 12 km,
+# trechos...) numa passada só. O monthly_series do notebook mapeia os ~108
+# meses uma vez por geometria, filtrando e mascarando a coleção S2 inteira
+# de novo para cada lado; aqui cada mês é composto uma vez e reduzido sobre
+# todas as regiões com reduceRegions, então o custo cresce com os meses e
+# não com meses x regiões.
+#
+# Saída: tabela longa region, date (AAAA-MM), ndvi, n_valid_pixels, que
+# substitui o PA458_NDVI_mensal_2017_2025_12km.csv (series_mensais.py lê a
+# coluna region no lugar de lado). Dois backends com a mesma saída:
+#   - colecao_mensal_ee: FeatureCollection no servidor, para exportar
+#     (exportar_ee + exportacao_ee.py) ou trazer pelo cache (tabela_ee);
+#   - series_locais: compósitos mensais em GeoTIFF + polígonos; cada raster
+#     é lido uma vez e os pixels de cada região saem do índice polígono ->
+#     pixels do zonal_lote.py.
+
+import os
+import re
+import sys
+import csv
+import glob
+import shutil
+import tempfile
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from series_mensais import calendario_mensal
+from tabelas import espelhar_csv
+from zonal_lote import indice_poligono
+from vetorizacao_paralela import banda_ndvi
+
+# --- CONFIGURAÇÕES ---
+ASSET_BASE = "projects/ee-samuelsantosambientalcourse/assets/"
+REGIOES_EE = {
+    'Leste': ASSET_BASE + "PA458_Leste",
+    'Oeste': ASSET_BASE + "PA458_Oeste",
+    'Leste_12km': ASSET_BASE + "PA458_Leste_12km",
+    'Oeste_12km': ASSET_BASE + "PA458_Oeste_12km",
+}
+REGIOES_LOCAIS = {
+    'Leste': r"G:\Meu Drive\PA458_ByPolygons\PA458_Leste.gpkg",
+    'Oeste': r"G:\Meu Drive\PA458_ByPolygons\PA458_Oeste.gpkg",
+    'Leste_12km': r"G:\Meu Drive\PA458_ByPolygons\PA458_Leste_12km.gpkg",
+    'Oeste_12km': r"G:\Meu Drive\PA458_ByPolygons\PA458_Oeste_12km.gpkg",
+}
+PASTA_MENSAL = r"G:\Meu Drive\PA458_NDVI_Mensal"
+PADRAO_MENSAL = re.compile(r"PA458_(?:[A-Za-z]+_)?(\d{4})[-_](\d{2})")  # PA458_[<Lado>_]<AAAA>-<MM>*.tif
+CSV_SAIDA = os.path.join("outputs", "PA458_NDVI_mensal_regioes.csv")
+
+INICIO = (2017, 1)
+FIM = (2025, 12)
+CLOUD_PCT = 20
+ESCALA = 10
+CLASSES_SCL_MASCARA = (3, 6, 8, 9, 10, 11)  # sombra, água, nuvens, cirrus, neve
+
+COLUNAS = ['region', 'date', 'ndvi', 'n_valid_pixels']
+
+gdal.UseExceptions()
+
+
+def _data_texto(data):
+    return "{:04d}-{:02d}".format(*data)
+
+
+# --- Backend Earth Engine ---
+def colecao_mensal_ee(regioes=REGIOES_EE, inicio=INICIO, fim=FIM, escala=ESCALA, cloud_pct=CLOUD_PCT):
+    """
+    FeatureCollection (uma feição por região e mês, sem geometria) com as
+    propriedades de COLUNAS. regioes: {nome: asset, ee.Geometry ou
+    ee.FeatureCollection}. Mês sem imagem vira ndvi nulo e n_valid_pixels 0.
+    """
+    import ee
+
+    feicoes = []
+    for nome, regiao in sorted(regioes.items()):
+        if isinstance(regiao, str):
+            regiao = ee.FeatureCollection(regiao)
+        if isinstance(regiao, ee.FeatureCollection):
+            regiao = regiao.union(1).geometry()
+        feicoes.append(ee.Feature(regiao, {'region': nome}))
+    fc_regioes = ee.FeatureCollection(feicoes)
+
+    def mascarar(img):
+        scl = img.select('SCL')
+        ok = scl.neq(CLASSES_SCL_MASCARA[0])
+        for classe in CLASSES_SCL_MASCARA[1:]:
+            ok = ok.And(scl.neq(classe))
+        return img.updateMask(ok).normalizedDifference(['B8', 'B4']).rename('NDVI')
+
+    t0 = ee.Date.fromYMD(inicio[0], inicio[1], 1)
+    t1 = ee.Date.fromYMD(fim[0], fim[1], 1).advance(1, 'month')
+    # filtro, máscara e NDVI uma vez para todas as regiões
+    s2 = (ee.ImageCollection('COPERNICUS/S2_SR')
+          .filterDate(t0, t1)
+          .filterBounds(fc_regioes.geometry())
+          .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', cloud_pct))
+          .map(mascarar))
+    vazio = ee.Image.constant(0).rename('NDVI').updateMask(0)
+    redutor = ee.Reducer.mean().combine(ee.Reducer.count(), sharedInputs=True)
+
+    def mes(m):
+        ini = t0.advance(ee.Number(m), 'month')
+        col = s2.filterDate(ini, ini.advance(1, 'month'))
+        comp = ee.Image(ee.Algorithms.If(col.size().gt(0), col.median(), vazio))
+        data = ini.format('YYYY-MM')
+        reduzidas = comp.reduceRegions(collection=fc_regioes, reducer=redutor, scale=escala, tileScale=4)
+        return reduzidas.map(lambda f: ee.Feature(None, {
+            'region': f.get('region'), 'date': data,
+            'ndvi': f.get('mean'), 'n_valid_pixels': f.get('count')}))
+
+    n_meses = len(calendario_mensal(inicio, fim))
+    return ee.FeatureCollection(ee.List.sequence(0, n_meses - 1).map(mes)).flatten()
+
+
+def exportar_ee(colecao, descricao="PA458_NDVI_mensal_regioes", pasta_drive="PA458_ByPolygons"):
+    """Export.table.toDrive (ainda não iniciado; ver exportacao_ee.py) só com as colunas da tabela."""
+    import ee
+    return ee.batch.Export.table.toDrive(collection=colecao, description=descricao, folder=pasta_drive,
+                                         fileNamePrefix=descricao, fileFormat='CSV', selectors=COLUNAS)
+
+
+def tabela_ee(colecao):
+    """Linhas da tabela via getInfo (passando pelo cache_ee)."""
+    from cache_ee import get_info
+    linhas = [dict((c, f['properties'].get(c)) for c in COLUNAS) for f in get_info(colecao)['features']]
+    return sorted(linhas, key=lambda l: (l['region'], l['date']))
+
+
+# --- Backend local ---
+def listar_mensais(pasta=PASTA_MENSAL, padrao=PADRAO_MENSAL):
+    """{(ano, mes): [caminhos]} dos compósitos mensais da pasta."""
+    mensais = {}
+    for caminho in sorted(glob.glob(os.path.join(pasta, "*.tif"))):
+        m = padrao.search(os.path.basename(caminho))
+        if m:
+            mensais.setdefault((int(m.group(1)), int(m.group(2))), []).append(caminho)
+    return mensais
+
+
+_INDICES_GRADE = {}
+
+
+def indices_na_grade(ds, regioes):
+    """
+    (janela, {nome: posições na janela}) das regiões que caem no raster; a
+    janela envolve todas elas, para uma leitura só. Em memória por grade.
+    """
+    chave = (ds.GetProjection(), ds.GetGeoTransform(), ds.RasterXSize, ds.RasterYSize,
+             tuple(sorted(regioes.items())))
+    if chave not in _INDICES_GRADE:
+        janelas = {}
+        for nome, caminho in regioes.items():
+            janela, posicoes = indice_poligono(ds, caminho)
+            if janela is not None and posicoes.size:
+                janelas[nome] = (janela, posicoes)
+        if not janelas:
+            _INDICES_GRADE[chave] = (None, {})
+        else:
+            x0 = min(j[0] for j, _ in janelas.values())
+            y0 = min(j[1] for j, _ in janelas.values())
+            x1 = max(j[0] + j[2] for j, _ in janelas.values())
+            y1 = max(j[1] + j[3] for j, _ in janelas.values())
+            uniao = (x0, y0, x1 - x0, y1 - y0)
+            indices = {}
+            for nome, ((xoff, yoff, largura, _), posicoes) in janelas.items():
+                lin, col = np.divmod(posicoes, largura)
+                indices[nome] = (lin + yoff - y0) * uniao[2] + (col + xoff - x0)
+            _INDICES_GRADE[chave] = (uniao, indices)
+    return _INDICES_GRADE[chave]
+
+
+def reduzir_raster(caminho, regioes, banda=None):
+    """{nome: (ndvi médio ou None, n válidos)} das regiões cobertas pelo raster."""
+    ds = gdal.Open(caminho)
+    janela, indices = indices_na_grade(ds, regioes)
+    if janela is None:
+        return {}
+    b = ds.GetRasterBand(banda or banda_ndvi(ds))
+    dados = b.ReadAsArray(*janela).ravel()
+    nodata = b.GetNoDataValue()
+    resultado = {}
+    for nome, posicoes in indices.items():
+        v = dados[posicoes].astype(np.float64)
+        v = v[np.isfinite(v) & (v != nodata)] if nodata is not None else v[np.isfinite(v)]
+        resultado[nome] = (float(v.mean()) if v.size else None, int(v.size))
+    return resultado
+
+
+def series_locais(mensais, regioes=REGIOES_LOCAIS, banda=None, inicio=None, fim=None):
+    """
+    mensais: {(ano, mes): [caminhos]} (listar_mensais). Linhas da tabela
+    longa para o calendário completo (inicio/fim: padrão, os meses dos
+    arquivos); região sem raster no mês fica com ndvi None e 0 pixels.
+    Quando há mais de um raster no mês, cada região usa o primeiro que a cobre.
+    """
+    if not mensais:
+        return []
+    datas = calendario_mensal(inicio or min(mensais), fim or max(mensais))
+    linhas = []
+    for data in datas:
+        por_regiao = {}
+        for caminho in mensais.get(data, []):
+            faltam = dict((n, c) for n, c in regioes.items() if n not in por_regiao)
+            if not faltam:
+                break
+            por_regiao.update(reduzir_raster(caminho, faltam, banda))
+        for nome in regioes:
+            ndvi, n = por_regiao.get(nome, (None, 0))
+            linhas.append({'region': nome, 'date': _data_texto(data), 'ndvi': ndvi, 'n_valid_pixels': n})
+    return sorted(linhas, key=lambda l: (l['region'], l['date']))
+
+
+def escrever_csv(caminho, linhas):
+    pasta = os.path.dirname(caminho)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    with open(caminho, 'w', encoding='utf-8', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(COLUNAS)
+        for l in linhas:
+            w.writerow([l['region'], l['date'], "" if l['ndvi'] is None else repr(l['ndvi']), l['n_valid_pixels']])
+    espelhar_csv(caminho, [dict(l, ano=int(l['date'][:4]), mes=int(l['date'][5:7])) for l in linhas],
+                 particoes=('region', 'ano'))
+    return caminho
+
+
+# --- Autoteste ---
+def _gravar_retangulo(caminho, srs, x0, y0, x1, y1):
+    vds = ogr.GetDriverByName('GPKG').CreateDataSource(caminho)
+    lyr = vds.CreateLayer("regiao", srs=srs, geom_type=ogr.wkbPolygon)
+    anel = ogr.Geometry(ogr.wkbLinearRing)
+    for x, y in ((x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)):
+        anel.AddPoint_2D(x, y)
+    poligono = ogr.Geometry(ogr.wkbPolygon)
+    poligono.AddGeometry(anel)
+    feat = ogr.Feature(lyr.GetLayerDefn())
+    feat.SetGeometry(poligono)
+    lyr.CreateFeature(feat)
+    feat = lyr = vds = None
+
+
+def autoteste():
+    """Três regiões (uma dentro da outra) em compósitos sintéticos, com um mês faltando."""
+    pasta = tempfile.mkdtemp(prefix="mensal_regioes_")
+    erros = []
+    try:
+        rng = np.random.RandomState(458)
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(32723)
+        x0, y0, xsize, ysize = 300000.0, 9880000.0, 60, 40
+        regioes = {'A': (0, 0, 30, 40), 'B': (30, 0, 60, 40), 'A_12km': (0, 0, 12, 20)}  # colunas/linhas
+        caminhos = {}
+        for nome, (c0, l0, c1, l1) in regioes.items():
+            caminhos[nome] = os.path.join(pasta, nome + ".gpkg")
+            _gravar_retangulo(caminhos[nome], srs, x0 + c0 * 10, y0 - l1 * 10, x0 + c1 * 10, y0 - l0 * 10)
+
+        esperado = {}
+        for data in [(2020, 1), (2020, 2), (2020, 4)]:   # março sem compósito
+            ndvi = rng.uniform(-0.2, 0.9, (ysize, xsize)).astype(np.float32)
+            ndvi[rng.rand(ysize, xsize) < 0.2] = -9999
+            ds = gdal.GetDriverByName('GTiff').Create(
+                os.path.join(pasta, "PA458_{}.tif".format(_data_texto(data))), xsize, ysize, 1, gdal.GDT_Float32)
+            ds.SetGeoTransform((x0, 10.0, 0.0, y0, 0.0, -10.0))
+            ds.SetProjection(srs.ExportToWkt())
+            ds.GetRasterBand(1).WriteArray(ndvi)
+            ds.GetRasterBand(1).SetNoDataValue(-9999)
+            ds = None
+            for nome, (c0, l0, c1, l1) in regioes.items():
+                v = ndvi[l0:l1, c0:c1]
+                v = v[v != -9999].astype(np.float64)
+                esperado[(nome, _data_texto(data))] = (v.mean(), v.size)
+
+        linhas = series_locais(listar_mensais(pasta), caminhos)
+        if len(linhas) != 4 * len(regioes):
+            erros.append(u"{} linhas (esperado {})".format(len(linhas), 4 * len(regioes)))
+        for l in linhas:
+            ref = esperado.get((l['region'], l['date']))
+            if ref is None:
+                if l['ndvi'] is not None or l['n_valid_pixels'] != 0:
+                    erros.append(u"{} {}: mês sem compósito com valor".format(l['region'], l['date']))
+            elif l['n_valid_pixels'] != ref[1] or abs(l['ndvi'] - ref[0]) > 1e-6:
+                erros.append(u"{} {}: {} / {} (esperado {:.6f} / {})".format(
+                    l['region'], l['date'], l['ndvi'], l['n_valid_pixels'], ref[0], ref[1]))
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    for e in erros:
+        print(u"  [FALHA] {}".format(e))
+    print(u"--- Autoteste: {} ---".format("OK" if not erros else "FALHOU"))
+    return not erros
+
+
+if __name__ == "__main__":
+    if "--autoteste" in sys.argv:
+        sys.exit(0 if autoteste() else 1)
+    mensais = listar_mensais()
+    print(u"--- {} meses x {} regiões ---".format(len(mensais), len(REGIOES_LOCAIS)))
+    escrever_csv(CSV_SAIDA, series_locais(mensais))
+    print(u"--- Salvo: {} ---".format(CSV_SAIDA))
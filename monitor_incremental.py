@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+# bfastmonitor incremental: o histórico estável (2017-2018) é ajustado uma
+# única vez e o estado de cada série fica salvo em disco. A cada mês novo,
+# cada série é atualizada em O(1) sem reajustar nada:
+#   - coeficientes do histórico, sigma e tamanho do histórico (fixos, como no
+#     bfastmonitor, que não reajusta o modelo durante o monitoramento);
+#   - janela do MOSUM: anel com os últimos floor(h * n_hist) resíduos e a
+#     soma corrente (entra o resíduo novo, sai o mais antigo);
+#   - mínimos quadrados recursivos (Sherman-Morrison sobre (X'X)^-1), que
+#     dão o resíduo recursivo padronizado do mês, O(k²) por série;
+#   - primeira quebra e soma dos resíduos do monitoramento.
+# O alerta sai no mês em que |MOSUM| passa da fronteira
+# λ sqrt(2 log+(t / n_hist)), a mesma de bfast_numpy.bfastmonitor_lote;
+# reprocessar o arquivo inteiro mês a mês dá as mesmas datas de quebra.
+#
+# Diferença: a magnitude é a média dos resíduos do monitoramento (a mediana
+# do bfastmonitor exigiria guardar todos). Mês sem observação (NaN) entra
+# com resíduo 0 na janela e não atualiza os mínimos quadrados recursivos.
+#
+# `python monitor_incremental.py` cria o estado a partir do CSV mensal (na
+# primeira vez) ou aplica só os meses posteriores ao último já visto.
+
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+
+from bfast_numpy import (INICIO_MONITOR, H_MONITOR, FIM_MONITOR, NIVEL, desenho_monitor,
+                         inicio_historico_roc, distribuicao_monitor, ols_lote, _por_grupo,
+                         bfastmonitor_lote)
+from series_mensais import CSV_NDVI, FREQUENCIA, calendario_mensal, data_iso, ler_csv_gee, montar_series
+
+# --- CONFIGURAÇÕES ---
+PASTA_DADOS = os.path.dirname(os.path.abspath(__file__))
+ARQUIVO_ESTADO = os.path.join(PASTA_DADOS, "outputs", "monitor_estado.npz")
+
+
+def _proximo_mes(data):
+    ano, mes = data
+    return (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+
+def iniciar_estado(Y, datas, rotulos, inicio=INICIO_MONITOR, h=H_MONITOR, fim=FIM_MONITOR,
+                   nivel=NIVEL, periodo=FREQUENCIA, tendencia=True, validos=None):
+    """
+    Ajusta o histórico (meses antes de `inicio`, ROC como no bfastmonitor) e
+    devolve o estado pronto para o primeiro mês do monitoramento. Meses de Y
+    a partir de `inicio` são aplicados em seguida, um a um (atualizar).
+    Retorna (estado, lista de alertas da reaplicação).
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    S = Y.shape[0]
+    n_mon = datas.index(tuple(inicio))
+    X = desenho_monitor(datas[:n_mon], periodo, tendencia)
+    k = X.shape[1]
+    ini = inicio_historico_roc(X, Y[:, :n_mon], nivel)
+    nh_hist = n_mon - ini
+    janela = np.maximum(1, np.floor(h * nh_hist).astype(np.int64))
+
+    coef = np.empty((S, k))
+    sigma = np.empty(S)
+    P = np.empty((S, k, k))
+    anel = np.zeros((S, int(janela.max())))
+
+    def ajustar(sel, i0):
+        Xh, Yh = X[i0:], Y[sel, i0:n_mon]
+        c, res = ols_lote(Xh, Yh)
+        if validos is None:
+            sigma[sel] = np.sqrt((res ** 2).sum(axis=1) / (n_mon - i0 - k))
+        else:
+            v = validos[sel, i0:n_mon]
+            sigma[sel] = np.sqrt((res ** 2 * v).sum(axis=1) / np.maximum(1, v.sum(axis=1) - k))
+        coef[sel] = c
+        P[sel] = np.linalg.pinv(Xh.T @ Xh)
+        j = int(janela[sel[0]])
+        anel[sel, :j] = res[:, -j:]          # do mais antigo (posição 0) ao mais recente
+
+    _por_grupo(ini.tolist(), ajustar)
+
+    estado = {
+        'rotulos': [str(r) for r in rotulos],
+        'data_inicial': tuple(datas[0]),
+        't': n_mon,                                       # índice (0-based) do próximo mês
+        'proxima_data': tuple(datas[n_mon]),
+        'periodo': periodo, 'tendencia': tendencia, 'h': h, 'fim': fim, 'nivel': nivel,
+        'lam': float(np.quantile(distribuicao_monitor(h, fim), 1 - nivel)),
+        'ini': ini, 'n_hist': nh_hist, 'janela': janela,
+        'coef': coef, 'sigma': sigma,
+        'anel': anel, 'posicao': np.zeros(S, dtype=np.int64), 'soma_janela': anel.sum(axis=1),
+        'P': P, 'coef_recursivo': coef.copy(),
+        'quebra': np.full(S, -1, dtype=np.int64),
+        'soma_monitor': np.zeros(S), 'n_monitor': np.zeros(S, dtype=np.int64),
+    }
+    alertas = []
+    for j in range(n_mon, Y.shape[1]):
+        alertas.extend(atualizar(estado, Y[:, j], datas[j])['alertas'])
+    return estado, alertas
+
+
+def atualizar(estado, valores, data=None):
+    """
+    Aplica um mês (um valor por série, NaN = sem observação). Custo O(1) por
+    série no tamanho do arquivo. Retorna {'data', 'mosum', 'fronteira',
+    'residuo', 'residuo_recursivo', 'alertas'}; alertas são os índices das
+    séries que cruzaram a fronteira pela primeira vez neste mês.
+    """
+    if data is not None and tuple(data) != estado['proxima_data']:
+        raise ValueError(u"Mês {} fora de ordem: o estado espera {}".format(tuple(data), estado['proxima_data']))
+    y = np.asarray(valores, dtype=np.float64)
+    t = estado['t']
+    S = y.size
+    linhas = np.arange(S)
+    x = desenho_monitor([estado['proxima_data']], estado['periodo'], estado['tendencia'], t0=t)[0]
+    observado = np.isfinite(y)
+
+    residuo = np.where(observado, y - estado['coef'] @ x, 0.0)
+    posicao = estado['posicao']
+    estado['soma_janela'] += residuo - estado['anel'][linhas, posicao]
+    estado['anel'][linhas, posicao] = residuo
+    estado['posicao'] = (posicao + 1) % estado['janela']
+
+    # Mínimos quadrados recursivos: resíduo de previsão padronizado e atualização de (X'X)^-1
+    P, b = estado['P'], estado['coef_recursivo']
+    Px = P @ x
+    denominador = 1.0 + Px @ x
+    erro = y - b @ x
+    recursivo = np.where(observado, erro / np.sqrt(denominador), np.nan)
+    obs = np.flatnonzero(observado)
+    if obs.size:
+        ganho = Px[obs] / denominador[obs, None]
+        b[obs] += ganho * erro[obs, None]
+        P[obs] -= ganho[:, :, None] * Px[obs, None, :]
+
+    tempo = t - estado['ini'] + 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mosum = estado['soma_janela'] / (estado['sigma'] * np.sqrt(estado['n_hist']))
+    fronteira = estado['lam'] * np.sqrt(2 * np.maximum(1.0, np.log(tempo / estado['n_hist'].astype(np.float64))))
+    novos = np.flatnonzero((np.abs(mosum) > fronteira) & (estado['quebra'] < 0))
+    estado['quebra'][novos] = t
+    estado['soma_monitor'] += residuo
+    estado['n_monitor'] += observado
+
+    data_atual = estado['proxima_data']
+    estado['t'] = t + 1
+    estado['proxima_data'] = _proximo_mes(data_atual)
+    return {'data': data_atual, 'mosum': mosum, 'fronteira': fronteira, 'residuo': residuo,
+            'residuo_recursivo': recursivo, 'alertas': novos.tolist()}
+
+
+def quebras(estado):
+    """Como bfastmonitor_lote: por série, (índice da quebra ou None, magnitude média)."""
+    with np.errstate(invalid='ignore'):
+        magnitude = estado['soma_monitor'] / estado['n_monitor']
+    return [(int(q) if q >= 0 else None, float(m)) for q, m in zip(estado['quebra'], magnitude)]
+
+
+def datas_estado(estado, n=None):
+    """Calendário do estado, do primeiro mês até o último aplicado (ou n meses)."""
+    ultimo = estado['t'] if n is None else n
+    fim = estado['data_inicial']
+    for _ in range(ultimo - 1):
+        fim = _proximo_mes(fim)
+    return calendario_mensal(estado['data_inicial'], fim)
+
+
+# --- Persistência ---
+_ESCALARES = ('t', 'periodo', 'tendencia', 'h', 'fim', 'nivel', 'lam')
+
+
+def salvar_estado(estado, caminho=ARQUIVO_ESTADO):
+    pasta = os.path.dirname(caminho)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    arrays = dict((c, v) for c, v in estado.items() if isinstance(v, np.ndarray))
+    for c in _ESCALARES:
+        arrays[c] = np.array(estado[c])
+    arrays['rotulos'] = np.array(estado['rotulos'])
+    arrays['data_inicial'] = np.array(estado['data_inicial'], dtype=np.int16)
+    arrays['proxima_data'] = np.array(estado['proxima_data'], dtype=np.int16)
+    tmp = "{}.{}.tmp".format(caminho, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, caminho)
+    return caminho
+
+
+def carregar_estado(caminho=ARQUIVO_ESTADO):
+    with np.load(caminho) as z:
+        estado = dict((c, z[c]) for c in z.files)
+    for c in _ESCALARES:
+        estado[c] = estado[c].item()
+    estado['rotulos'] = [str(r) for r in estado['rotulos']]
+    estado['data_inicial'] = tuple(int(v) for v in estado['data_inicial'])
+    estado['proxima_data'] = tuple(int(v) for v in estado['proxima_data'])
+    return estado
+
+
+# --- Uso com o CSV mensal ---
+def meses_novos(estado, caminho=CSV_NDVI):
+    """[(data, valores alinhados a estado['rotulos'])] dos meses do CSV posteriores ao estado."""
+    datas, rotulos, Y = ler_csv_gee(caminho)
+    linha = dict((r, i) for i, r in enumerate(rotulos))
+    novos = []
+    for j, data in enumerate(datas):
+        if data < estado['proxima_data']:
+            continue
+        novos.append((data, np.array([Y[linha[r], j] if r in linha else np.nan for r in estado['rotulos']])))
+    return novos
+
+
+def monitorar_csv(caminho=CSV_NDVI, arquivo_estado=ARQUIVO_ESTADO, reiniciar=False, log=print):
+    """Cria o estado (histórico + reaplicação) ou aplica os meses novos; salva e devolve o estado."""
+    alertas = []
+    if reiniciar or not os.path.exists(arquivo_estado):
+        montadas = montar_series(caminho)
+        estado, indices = iniciar_estado(montadas['valores'], montadas['datas'], montadas['rotulos'])
+        alertas = [(s, estado['quebra'][s]) for s in indices]
+        log(u"--- Estado criado: {} série(s), monitoradas de {} a {} ---".format(
+            len(estado['rotulos']), "{}-{:02d}".format(*INICIO_MONITOR), data_iso(montadas['datas'], estado['t'] - 1)[:7]))
+    else:
+        estado = carregar_estado(arquivo_estado)
+        novos = meses_novos(estado, caminho)
+        for data, valores in novos:
+            if data != estado['proxima_data']:
+                raise ValueError(u"Falta o mês {} no CSV antes de {}".format(estado['proxima_data'], data))
+            for s in atualizar(estado, valores, data)['alertas']:
+                alertas.append((s, estado['t'] - 1))
+        log(u"--- {} mês(es) novo(s) aplicado(s) ---".format(len(novos)))
+
+    datas = datas_estado(estado)
+    for s, q in alertas:
+        log(u"  [ALERTA] {}: quebra em {}".format(estado['rotulos'][s], data_iso(datas, int(q))[:7]))
+    salvar_estado(estado, arquivo_estado)
+    return estado
+
+
+def autoteste():
+    """Reaplicação mês a mês = bfastmonitor_lote (CSV real e séries sintéticas); estado salvo no meio."""
+    erros = []
+    pasta = tempfile.mkdtemp(prefix="monitor_")
+    try:
+        rng = np.random.RandomState(458)
+        datas = calendario_mensal((2017, 1), (2025, 12))
+        n = len(datas)
+        mes = np.array([m for _, m in datas])
+        Y = 0.6 + 0.05 * np.sin(2 * np.pi * mes / 12.0) + rng.normal(0, 0.02, (300, n))
+        degrau = rng.randint(30, n - 5, 300)
+        for s in range(0, 300, 2):                # metade das séries com queda
+            Y[s, degrau[s]:] -= rng.uniform(0.03, 0.2)
+        casos = [(u"sintéticas", Y, datas, [str(i) for i in range(300)])]
+        if os.path.exists(CSV_NDVI):
+            m = montar_series(CSV_NDVI)
+            casos.append((u"CSV mensal", m['valores'], m['datas'], m['rotulos']))
+
+        for nome, Yc, datas_c, rotulos in casos:
+            esperado = [q for q, _ in bfastmonitor_lote(Yc, datas_c)]
+            n_mon = datas_c.index(INICIO_MONITOR)
+            meio = (n_mon + len(datas_c)) // 2
+            estado, _ = iniciar_estado(Yc[:, :meio], datas_c[:meio], rotulos)
+            arquivo = os.path.join(pasta, "estado.npz")
+            salvar_estado(estado, arquivo)
+            estado = carregar_estado(arquivo)
+            for j in range(meio, len(datas_c)):
+                atualizar(estado, Yc[:, j], datas_c[j])
+            obtido = [q for q, _ in quebras(estado)]
+            diverge = [i for i, (a, b) in enumerate(zip(esperado, obtido)) if a != b]
+            if diverge:
+                erros.append(u"{}: {} série(s) com quebra diferente (ex.: {} vs {})".format(
+                    nome, len(diverge), obtido[diverge[0]], esperado[diverge[0]]))
+
+            # resíduo recursivo: a atualização de Sherman-Morrison = refazer o OLS até o mês
+            X = desenho_monitor(datas_c, estado['periodo'], estado['tendencia'])
+            s = 0
+            i0 = int(estado['ini'][s])
+            Xr = X[i0:len(datas_c)]
+            b = np.linalg.lstsq(Xr, Yc[s, i0:len(datas_c)], rcond=None)[0]
+            if not np.allclose(b, estado['coef_recursivo'][s], atol=1e-6):
+                erros.append(u"{}: coeficientes recursivos diferem do OLS completo".format(nome))
+
+        try:
+            atualizar(estado, Yc[:, -1], (1990, 1))
+            erros.append(u"mês fora de ordem aceito")
+        except ValueError:
+            pass
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    for e in erros:
+        print(u"  [FALHA] {}".format(e))
+    print(u"--- Autoteste: {} ---".format("OK" if not erros else "FALHOU"))
+    return not erros
+
+
+if __name__ == "__main__":
+    if "--autoteste" in sys.argv:
+        sys.exit(0 if autoteste() else 1)
+    monitorar_csv(reiniciar="--reiniciar" in sys.argv)
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# Rótulos e cores das 5 classes de NDVI, num só lugar: simbologia dos scripts
+# PyQGIS (raster e vetor), campo Rotulo do dissolve e figuras do figuras.py.
+# Classe 1 = vermelho (Não-Vegetação/Água) ... 5 = verde escuro (Saudável e Vigoroso).
+
+# --- CONFIGURAÇÕES ---
+ROTULOS = [
+    u"Não-Vegetação/Água",
+    u"Estresse Severo/Degradação",
+    u"Estresse Moderado/Baixa Biomassa",
+    u"Saúde Razoável",
+    u"Saudável e Vigoroso"
+]
+CORES_HEX = ["#d7191c", "#fdae61", "#ffffbf", "#abdda4", "#1a9641"]
+
+# {DN: rótulo}, como gravado no campo Rotulo dos vetores dissolvidos
+ROTULOS_MAPA = dict((i + 1, rotulo) for i, rotulo in enumerate(ROTULOS))
+
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Pool de processos compartilhado pelos motores headless (vetorização, recorte...).
+# Dentro do QGIS o sys.executable é o próprio qgis(.exe); os processos filhos
+# precisam apontar para o interpretador Python que acompanha a instalação.
+
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _ajustar_executavel():
+    """Usa o python da instalação (e não o binário do QGIS) para criar os filhos."""
+    nome = os.path.basename(sys.executable).lower()
+    if nome.startswith("python"):
+        return
+    for candidato in ("python.exe", "python3.exe", os.path.join("bin", "python3")):
+        caminho = os.path.join(sys.exec_prefix, candidato)
+        if os.path.exists(caminho):
+            multiprocessing.set_executable(caminho)
+            return
+
+
+def n_processos_padrao(n_processos=None):
+    """Número de processos: o informado ou todos os núcleos disponíveis."""
+    if n_processos:
+        return max(1, int(n_processos))
+    return max(1, os.cpu_count() or 1)
+
+
+def criar_pool(n_processos=None):
+    """Cria o ProcessPoolExecutor com o interpretador correto."""
+    _ajustar_executavel()
+    return ProcessPoolExecutor(max_workers=n_processos_padrao(n_processos))
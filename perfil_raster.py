@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Perfil de gravação dos rasters produzidos pelo processamento (recortes e
+# intermediários de classes Int16). Padrão: Cloud-Optimized GeoTIFF com
+# blocos internos 512x512, compressão DEFLATE/ZSTD, preditor e overviews
+# internas -- abre e redesenha rápido no QGIS e pesa menos para sincronizar.
+#
+# Perfis:
+#   "cog"      -> driver COG (overviews internas, blocos 512, compressão)
+#   "gtiff"    -> GTiff em blocos com compressão e overviews internas
+#   "original" -> GTiff sem opções (como o 'OPTIONS': '' dos scripts)
+
+import os
+from osgeo import gdal
+
+from instrumentacao import trecho
+
+# --- CONFIGURAÇÕES ---
+PERFIL_SAIDA = "cog"
+COMPRESSAO = "DEFLATE"       # ou "ZSTD" (GDAL >= 2.3)
+NIVEL_COMPRESSAO = 6
+TAMANHO_BLOCO = 512
+
+gdal.UseExceptions()
+
+_TIPOS_FLOAT = (gdal.GDT_Float32, gdal.GDT_Float64)
+
+
+def _preditor(tipo_dado):
+    """Preditor de ponto flutuante (3) para NDVI/reflectância, horizontal (2) para inteiros."""
+    return 3 if tipo_dado in _TIPOS_FLOAT else 2
+
+
+def _reamostragem(tipo_dado):
+    """Média para contínuos; classe mais próxima para rasters de classes."""
+    return "AVERAGE" if tipo_dado in _TIPOS_FLOAT else "NEAREST"
+
+
+def opcoes_gtiff(tipo_dado, perfil=PERFIL_SAIDA):
+    """Opções de criação GTiff (também usadas no 'OPTIONS' dos algoritmos GDAL do QGIS)."""
+    if perfil == "original":
+        return []
+    opcoes = [
+        "TILED=YES",
+        "BLOCKXSIZE={}".format(TAMANHO_BLOCO),
+        "BLOCKYSIZE={}".format(TAMANHO_BLOCO),
+        "COMPRESS={}".format(COMPRESSAO),
+        "PREDICTOR={}".format(_preditor(tipo_dado)),
+        "BIGTIFF=IF_SAFER",
+    ]
+    if COMPRESSAO == "DEFLATE":
+        opcoes.append("ZLEVEL={}".format(NIVEL_COMPRESSAO))
+    elif COMPRESSAO == "ZSTD":
+        opcoes.append("ZSTD_LEVEL={}".format(NIVEL_COMPRESSAO))
+    return opcoes
+
+
+def opcoes_texto(tipo_dado=gdal.GDT_Float32, perfil=PERFIL_SAIDA):
+    """Mesmas opções no formato 'A=1|B=2' esperado pelo parâmetro OPTIONS do Processing."""
+    return "|".join(opcoes_gtiff(tipo_dado, perfil))
+
+
+def opcoes_cog(tipo_dado):
+    opcoes = [
+        "BLOCKSIZE={}".format(TAMANHO_BLOCO),
+        "COMPRESS={}".format(COMPRESSAO),
+        "PREDICTOR=YES",
+        "LEVEL={}".format(NIVEL_COMPRESSAO),
+        "OVERVIEWS=AUTO",
+        "OVERVIEW_RESAMPLING={}".format(_reamostragem(tipo_dado)),
+        "BIGTIFF=IF_SAFER",
+    ]
+    return opcoes
+
+
+def _caminho_temporario(caminho):
+    return "{}.{}.tmp.tif".format(os.path.splitext(caminho)[0], os.getpid())
+
+
+def criar_raster(caminho, xsize, ysize, n_bandas, tipo_dado, perfil=PERFIL_SAIDA):
+    """
+    Cria o dataset para escrita em blocos. O driver COG só grava por cópia,
+    então nesse perfil a escrita vai para um GTiff temporário em blocos, que
+    vira COG em finalizar_raster() (chamada depois de fechar o dataset).
+    """
+    if perfil == "cog":
+        # temporário: só blocos, sem custo de compressão
+        opcoes = ["TILED=YES", "BLOCKXSIZE={}".format(TAMANHO_BLOCO),
+                  "BLOCKYSIZE={}".format(TAMANHO_BLOCO), "BIGTIFF=IF_SAFER"]
+        return gdal.GetDriverByName('GTiff').Create(_caminho_temporario(caminho), xsize, ysize,
+                                                    n_bandas, tipo_dado, options=opcoes)
+    return gdal.GetDriverByName('GTiff').Create(caminho, xsize, ysize, n_bandas, tipo_dado,
+                                                options=opcoes_gtiff(tipo_dado, perfil))
+
+
+def _construir_overviews(caminho):
+    ds = gdal.Open(caminho, gdal.GA_Update)
+    ds.BuildOverviews(_reamostragem(ds.GetRasterBand(1).DataType), [2, 4, 8, 16, 32])
+    ds = None
+
+
+def finalizar_raster(caminho, perfil=PERFIL_SAIDA):
+    """Conclui no perfil escolhido um raster de criar_raster() já fechado (ds = None)."""
+    if perfil == "cog":
+        temporario = _caminho_temporario(caminho)
+        origem = gdal.Open(temporario)
+        tipo_dado = origem.GetRasterBand(1).DataType
+        copia = gdal.GetDriverByName('COG').CreateCopy(caminho, origem, options=opcoes_cog(tipo_dado))
+        copia = origem = None
+        gdal.GetDriverByName('GTiff').Delete(temporario)
+    elif perfil == "gtiff":
+        _construir_overviews(caminho)
+    return caminho
+
+
+def aplicar_perfil(caminho, perfil=PERFIL_SAIDA):
+    """
+    Regrava no perfil um raster já pronto (saídas dos algoritmos do QGIS,
+    que não escrevem COG nem overviews internas).
+    """
+    if perfil == "original":
+        return caminho
+    with trecho("perfil_raster", camada=os.path.basename(caminho), perfil=perfil) as t:
+        origem = gdal.Open(caminho)
+        tipo_dado = origem.GetRasterBand(1).DataType
+        t['pixels'] = origem.RasterXSize * origem.RasterYSize
+        temporario = _caminho_temporario(caminho)
+
+        if perfil == "cog":
+            copia = gdal.GetDriverByName('COG').CreateCopy(temporario, origem, options=opcoes_cog(tipo_dado))
+        else:
+            copia = gdal.GetDriverByName('GTiff').CreateCopy(temporario, origem, options=opcoes_gtiff(tipo_dado, perfil))
+        copia = origem = None
+        os.replace(temporario, caminho)
+        if perfil == "gtiff":
+            _construir_overviews(caminho)
+        t['bytes'] = os.path.getsize(caminho)
+    return caminho
+
+
+def concluir_saida_gdal(caminho, perfil=PERFIL_SAIDA):
+    """
+    Para saídas dos algoritmos GDAL do Processing gravadas com
+    'OPTIONS': opcoes_texto(): já estão em blocos e comprimidas, falta só
+    virar COG ou ganhar as overviews internas.
+    """
+    if perfil == "cog":
+        return aplicar_perfil(caminho, perfil)
+    if perfil == "gtiff":
+        with trecho("overviews", camada=os.path.basename(caminho)) as t:
+            _construir_overviews(caminho)
+            t['bytes'] = os.path.getsize(caminho)
+    return caminho
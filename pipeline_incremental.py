@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# Executor incremental do processamento PA-458:
+#   recorte -> vetorização -> dissolve   (uma tarefa por ano e lado)
+#   Sankey                               (uma tarefa por lado, todos os anos)
+# Cada tarefa declara entradas, saídas e parâmetros. Um manifesto guarda o
+# hash do conteúdo das entradas e os parâmetros da última execução; só rodam
+# as tarefas cujas entradas mudaram (ou cujas saídas sumiram). Incluir o
+# compósito de 2025 custa o trabalho de um ano, mais a transição do lado.
+
+import os
+import json
+import time
+import hashlib
+
+from transicao_raster import identificar_lado_ano
+from vetorizacao_paralela import listar_rasters_ndvi, nome_seguro
+import etapas
+import perfil_raster
+
+# --- CONFIGURAÇÕES ---
+PASTA_ENTRADA = r"G:\Meu Drive\PA458_ByPolygons"
+PADRAO_ENTRADA = "PA458_*_NDVI_*.tif"
+CAMINHO_MASCARA = r"G:\Meu Drive\PA458_ByPolygons\buffer_total.gpkg"
+PASTA_SAIDA = r"G:\Meu Drive\PA458_ByPolygons\final\sem_urb"
+PASTA_SANKEY = r"H:\Meu Drive\UFRA\PRÉ PROJETO DE TCC\PRODUTOS TCC\tabelas_sankey"
+ARQUIVO_MANIFESTO = os.path.join(PASTA_SAIDA, "manifesto_pipeline.json")
+
+# Parâmetros que entram na assinatura das tarefas (mudou -> refaz)
+PARAMETROS = {
+    'recorte': {'nodata': etapas.NODATA, 'perfil': perfil_raster.PERFIL_SAIDA},
+    'vetorizacao': {'n_classes': 5, 'metodo': 'intervalo_igual', 'perfil': perfil_raster.PERFIL_SAIDA},
+    'dissolve': {'campo': 'DN', 'area': 'geometria'},  # ou 'pixels' (contagem no raster de classes)
+    'sankey': {'formato': 'ClassAAAA,area_ha'},
+}
+
+EXTENSOES_SHAPEFILE = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+TAMANHO_LEITURA = 1 << 20
+
+
+# --- Hash de conteúdo ---
+def _arquivos_do_dado(caminho):
+    """Um shapefile é um conjunto de arquivos; os demais formatos, um só."""
+    base, ext = os.path.splitext(caminho)
+    if ext.lower() != ".shp":
+        return [caminho]
+    return [base + e for e in EXTENSOES_SHAPEFILE if os.path.exists(base + e)]
+
+
+def hash_arquivo(caminho, cache_hashes):
+    """sha256 do conteúdo; reaproveita o hash anterior se mtime e tamanho não mudaram."""
+    st = os.stat(caminho)
+    chave = os.path.normcase(os.path.abspath(caminho))
+    item = cache_hashes.get(chave)
+    if item and item['mtime_ns'] == st.st_mtime_ns and item['tamanho'] == st.st_size:
+        return item['sha256']
+
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_LEITURA), b''):
+            h.update(bloco)
+    cache_hashes[chave] = {'mtime_ns': st.st_mtime_ns, 'tamanho': st.st_size, 'sha256': h.hexdigest()}
+    return h.hexdigest()
+
+
+def assinatura_tarefa(tarefa, cache_hashes):
+    hashes = {}
+    for entrada in tarefa['entradas']:
+        for arq in _arquivos_do_dado(entrada):
+            hashes[os.path.basename(arq)] = hash_arquivo(arq, cache_hashes)
+    texto = json.dumps({'entradas': hashes, 'parametros': tarefa['parametros']}, sort_keys=True)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+# --- Manifesto ---
+def carregar_manifesto(arquivo=ARQUIVO_MANIFESTO):
+    if os.path.exists(arquivo):
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'tarefas': {}, 'hashes': {}}
+
+
+def salvar_manifesto(manifesto, arquivo=ARQUIVO_MANIFESTO):
+    pasta = os.path.dirname(arquivo)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    tmp = arquivo + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, indent=1, sort_keys=True)
+    os.replace(tmp, arquivo)
+
+
+# --- Grafo de tarefas ---
+def _tarefa(id_tarefa, funcao, argumentos, entradas, saidas, parametros, depende=()):
+    return {
+        'id': id_tarefa, 'funcao': funcao, 'argumentos': argumentos,
+        'entradas': list(entradas), 'saidas': list(saidas),
+        'parametros': parametros, 'depende': list(depende),
+    }
+
+
+def montar_tarefas(rasters, caminho_mascara=CAMINHO_MASCARA, pasta_saida=PASTA_SAIDA,
+                   pasta_sankey=PASTA_SANKEY, etapas_ativas=None, motor=etapas):
+    """
+    Monta o DAG a partir da lista de rasters NDVI (PA458_<Lado>_<AAAA>_...).
+    `motor` é o módulo com as funções das etapas (etapas ou etapas_qgis).
+    Retorna a lista de tarefas em ordem topológica.
+    """
+    ativas = set(etapas_ativas or PARAMETROS)
+    tarefas = []
+    sankey_por_lado = {'Leste': {}, 'Oeste': {}}
+    deps_sankey = {'Leste': [], 'Oeste': []}
+    parametros_motor = {'motor': motor.__name__}
+
+    for raster in sorted(rasters):
+        lado, ano = identificar_lado_ano(raster)
+        if not (lado and ano):
+            continue
+        nome = nome_seguro(raster)
+        chave = "{}:{}".format(lado, ano)
+
+        recorte = os.path.join(pasta_saida, "{}.tif".format(nome))
+        vetor = os.path.join(pasta_saida, "{}_vetor.gpkg".format(nome))
+        classes = os.path.join(pasta_saida, "{}_classes.tif".format(nome))
+        dissolvido = os.path.join(pasta_saida, "{}_dissolvido.gpkg".format(nome))
+
+        # Etapas fora de `etapas_ativas` não viram tarefa: suas saídas são
+        # lidas do disco (de uma execução anterior) pelas etapas seguintes.
+        entrada_vetor = raster
+        deps_vetor, deps_dissolve = [], []
+        if 'recorte' in ativas:
+            id_recorte = "recorte:" + chave
+            tarefas.append(_tarefa(
+                id_recorte, motor.recortar_por_mascara,
+                {'caminho_raster': raster, 'caminho_mascara': caminho_mascara, 'caminho_saida': recorte},
+                [raster, caminho_mascara], [recorte], dict(PARAMETROS['recorte'], **parametros_motor)))
+            entrada_vetor = recorte
+            deps_vetor = [id_recorte]
+
+        if 'vetorizacao' in ativas:
+            id_vetor = "vetorizacao:" + chave
+            tarefas.append(_tarefa(
+                id_vetor, motor.vetorizar,
+                {'caminho_raster': entrada_vetor, 'pasta_saida': pasta_saida},
+                [entrada_vetor], [vetor, classes], dict(PARAMETROS['vetorizacao'], **parametros_motor),
+                deps_vetor))
+            deps_dissolve = [id_vetor]
+            if motor.ENTRADA_SANKEY == "classes":
+                deps_sankey[lado].append(id_vetor)
+
+        if 'dissolve' in ativas:
+            id_dissolve = "dissolve:" + chave
+            argumentos = {'caminho_vetor': vetor, 'caminho_saida': dissolvido}
+            entradas = [vetor]
+            if PARAMETROS['dissolve']['area'] == 'pixels':
+                argumentos['caminho_classes'] = classes
+                entradas.append(classes)
+            tarefas.append(_tarefa(
+                id_dissolve, motor.dissolver_com_area, argumentos,
+                entradas, [dissolvido], dict(PARAMETROS['dissolve'], **parametros_motor), deps_dissolve))
+            if motor.ENTRADA_SANKEY == "dissolvido":
+                deps_sankey[lado].append(id_dissolve)
+
+        sankey_por_lado[lado][ano] = classes if motor.ENTRADA_SANKEY == "classes" else dissolvido
+
+    if 'sankey' in ativas:
+        for lado in ['Leste', 'Oeste']:
+            if not sankey_por_lado[lado]:
+                continue
+            anos = sorted(sankey_por_lado[lado])
+            csv_saida = os.path.join(pasta_sankey, "transicao_completa_{}.csv".format(lado))
+            tarefas.append(_tarefa(
+                "sankey:" + lado, motor.tabela_transicao,
+                {'entradas_por_ano': sankey_por_lado[lado], 'caminho_csv': csv_saida},
+                [sankey_por_lado[lado][a] for a in anos],
+                [csv_saida], dict(PARAMETROS['sankey'], anos=anos, **parametros_motor),
+                deps_sankey[lado]))
+
+    return tarefas
+
+
+def executar(tarefas, arquivo_manifesto=ARQUIVO_MANIFESTO, forcar=False):
+    """
+    Roda as tarefas em ordem, pulando as que têm a mesma assinatura da última
+    execução e saídas presentes. O manifesto é salvo após cada tarefa, então
+    uma execução interrompida retoma de onde parou.
+    """
+    manifesto = carregar_manifesto(arquivo_manifesto)
+    falhas = set()
+    resumo = {'executadas': 0, 'puladas': 0, 'falhas': 0}
+
+    for t in tarefas:
+        if any(d in falhas for d in t['depende']):
+            print(u"  [--] {} (dependência falhou)".format(t['id']))
+            falhas.add(t['id'])
+            continue
+
+        try:
+            assinatura = assinatura_tarefa(t, manifesto['hashes'])
+        except OSError as e:
+            print(u"  [ERRO] {}: entrada indisponível ({})".format(t['id'], e))
+            falhas.add(t['id'])
+            resumo['falhas'] += 1
+            continue
+
+        anterior = manifesto['tarefas'].get(t['id'])
+        em_dia = (anterior is not None and anterior['assinatura'] == assinatura and
+                  all(os.path.exists(s) for s in t['saidas']))
+        if em_dia and not forcar:
+            resumo['puladas'] += 1
+            continue
+
+        for s in t['saidas']:
+            pasta = os.path.dirname(s)
+            if pasta and not os.path.exists(pasta):
+                os.makedirs(pasta)
+
+        print(u"  > {}".format(t['id']))
+        inicio = time.time()
+        try:
+            t['funcao'](**t['argumentos'])
+        except Exception as e:
+            print(u"  [ERRO] {}: {}".format(t['id'], e))
+            falhas.add(t['id'])
+            resumo['falhas'] += 1
+            manifesto['tarefas'].pop(t['id'], None)
+            salvar_manifesto(manifesto, arquivo_manifesto)
+            continue
+
+        manifesto['tarefas'][t['id']] = {
+            'assinatura': assinatura,
+            'saidas': t['saidas'],
+            'segundos': round(time.time() - inicio, 3),
+            'concluida_em': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        salvar_manifesto(manifesto, arquivo_manifesto)
+        resumo['executadas'] += 1
+
+    print(u"--- {executadas} executada(s), {puladas} em dia, {falhas} falha(s) ---".format(**resumo))
+    return resumo
+
+
+if __name__ == "__main__":
+    rasters = listar_rasters_ndvi(PASTA_ENTRADA, PADRAO_ENTRADA)
+    print(u"--- Pipeline incremental: {} rasters de entrada ---".format(len(rasters)))
+    executar(montar_tarefas(rasters))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Modo lote (headless) do processamento PA-458, no estilo do qgis_process:
+# recebe pastas ou padrões glob de rasters e a máscara vetorial e roda
+# recorte -> vetorização -> dissolve -> Sankey sem projeto carregado,
+# sem árvore de camadas e sem renderização. Pensado para o job noturno
+# em servidor sem display.
+#
+# Exemplos:
+#   python processamento_lote.py --rasters "/dados/PA458_*_NDVI_*.tif" \
+#       --mascara /dados/buffer_total.gpkg --saida /dados/final --sankey /dados/tabelas_sankey
+#   python processamento_lote.py --rasters /dados --etapas vetorizacao,sankey --motor qgis
+
+import os
+import glob
+import argparse
+
+import pipeline_incremental
+from pipeline_incremental import montar_tarefas, executar, PARAMETROS
+from vetorizacao_paralela import PADRAO_ENTRADA
+
+ETAPAS = list(PARAMETROS)
+
+
+def _pasta_normalizada(caminho):
+    return os.path.normcase(os.path.abspath(caminho))
+
+
+def expandir_entradas(entradas, padrao=PADRAO_ENTRADA, excluir=()):
+    """
+    Pastas viram <pasta>/<padrao>; os demais argumentos são tratados como glob.
+    Arquivos dentro das pastas em `excluir` não entram como rasters (com a
+    etapa recorte ativa, a --saida: lá os recortes <nome>.tif também casam
+    com o padrão).
+    """
+    fora = set(_pasta_normalizada(p) for p in excluir)
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            arquivos.extend(glob.glob(os.path.join(entrada, padrao)))
+        else:
+            arquivos.extend(glob.glob(entrada))
+    return sorted(set(a for a in arquivos if not a.endswith("_classes.tif") and
+                      _pasta_normalizada(os.path.dirname(a)) not in fora))
+
+
+def carregar_motor(nome):
+    """'gdal' = etapas.py (GDAL/NumPy puro); 'qgis' = mesmos algoritmos dos scripts."""
+    if nome == "qgis":
+        import etapas_qgis
+        etapas_qgis.iniciar_qgis()
+        return etapas_qgis
+    import etapas
+    return etapas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u"Processamento PA-458 em lote, sem projeto QGIS.")
+    parser.add_argument("--rasters", nargs="+", required=True,
+                        help=u"Pastas ou padrões glob dos rasters NDVI (PA458_<Lado>_<AAAA>_...)")
+    parser.add_argument("--mascara", default=pipeline_incremental.CAMINHO_MASCARA,
+                        help=u"Vetor de máscara do recorte (buffer_total)")
+    parser.add_argument("--saida", default=pipeline_incremental.PASTA_SAIDA,
+                        help=u"Pasta dos recortes, vetores e dissolvidos")
+    parser.add_argument("--sankey", default=pipeline_incremental.PASTA_SANKEY,
+                        help=u"Pasta das tabelas de transição")
+    parser.add_argument("--etapas", default=",".join(ETAPAS),
+                        help=u"Etapas a executar, separadas por vírgula ({})".format(",".join(ETAPAS)))
+    parser.add_argument("--motor", choices=["gdal", "qgis"], default="gdal",
+                        help=u"gdal: GDAL/NumPy; qgis: algoritmos do Processing sem interface")
+    parser.add_argument("--manifesto", default=None,
+                        help=u"Arquivo do manifesto incremental (padrão: <saida>/manifesto_pipeline.json)")
+    parser.add_argument("--forcar", action="store_true",
+                        help=u"Refaz todas as tarefas, ignorando o manifesto")
+    args = parser.parse_args(argv)
+
+    etapas_ativas = [e.strip() for e in args.etapas.split(",") if e.strip()]
+    desconhecidas = set(etapas_ativas) - set(ETAPAS)
+    if desconhecidas:
+        parser.error(u"etapas desconhecidas: {}".format(", ".join(sorted(desconhecidas))))
+
+    # Sem o recorte, os rasters de entrada são os próprios recortes já gravados
+    # na --saida; só com ele é que essa pasta precisa ficar de fora.
+    excluir = [args.saida] if 'recorte' in etapas_ativas else []
+    rasters = expandir_entradas(args.rasters, excluir=excluir)
+    if not rasters:
+        if excluir:
+            parser.error(u"nenhum raster encontrado em {} (fora da pasta de saída {})".format(
+                args.rasters, args.saida))
+        parser.error(u"nenhum raster encontrado em {}".format(args.rasters))
+
+    motor = carregar_motor(args.motor)
+    tarefas = montar_tarefas(rasters, args.mascara, args.saida, args.sankey,
+                             etapas_ativas=etapas_ativas, motor=motor)
+    manifesto = args.manifesto or os.path.join(args.saida, "manifesto_pipeline.json")
+
+    print(u"--- Lote: {} rasters, {} tarefas, motor {} ---".format(len(rasters), len(tarefas), args.motor))
+    resumo = executar(tarefas, manifesto, forcar=args.forcar)
+    return 1 if resumo['falhas'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# Recorte pela máscara (buffer_total) com a máscara rasterizada uma única vez
+# por grade (CRS, transformação e tamanho) e guardada como bitmap compacto.
+# O recorte em si é um np.where em blocos de linhas (fora da máscara = -9999),
+# distribuído num pool de processos: os seis anos dos dois lados compartilham
+# as duas máscaras, em vez de o GDAL rasterizar o buffer de novo a cada raster.
+
+import os
+import glob
+import hashlib
+from concurrent.futures import as_completed
+
+import numpy as np
+from osgeo import gdal, ogr
+
+from paralelo import criar_pool
+from perfil_raster import criar_raster, finalizar_raster
+
+# --- CONFIGURAÇÕES ---
+PASTA_ENTRADA = r"G:\Meu Drive\PA458_ByPolygons"
+PADRAO_ENTRADA = "PA458_*_NDVI_*.tif"
+CAMINHO_MASCARA = r"G:\Meu Drive\PA458_ByPolygons\buffer_total.gpkg"
+PASTA_SAIDA = r"G:\Meu Drive\PA458_ByPolygons\final\sem_urb"
+PASTA_CACHE_MASCARAS = os.path.join(os.path.expanduser("~"), ".pa458_cache", "mascaras")
+
+NODATA = -9999
+LINHAS_POR_BLOCO = 512
+N_PROCESSOS = None  # None = todos os núcleos
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+
+def _separar_fonte(fonte):
+    """'arquivo.gpkg|layername=buffer_total' (fonte do QGIS) -> (arquivo, camada)."""
+    partes = fonte.split("|")
+    camada = None
+    for p in partes[1:]:
+        if p.startswith("layername="):
+            camada = p.split("=", 1)[1]
+    return partes[0], camada
+
+
+def chave_grade(ds, caminho_mascara):
+    """Identifica a combinação (máscara, CRS, transformação, tamanho)."""
+    arquivo, camada = _separar_fonte(caminho_mascara)
+    st = os.stat(arquivo)
+    texto = "|".join([
+        os.path.normcase(os.path.abspath(arquivo)), str(camada), str(st.st_mtime_ns), str(st.st_size),
+        ds.GetProjection(), repr(tuple(ds.GetGeoTransform())),
+        str(ds.RasterXSize), str(ds.RasterYSize),
+    ])
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def rasterizar_mascara(ds, caminho_mascara):
+    """Bitmap booleano da máscara na grade de `ds` (pixel dentro se o centro estiver dentro)."""
+    arquivo, camada = _separar_fonte(caminho_mascara)
+    vds = ogr.Open(arquivo)
+    lyr = vds.GetLayerByName(camada) if camada else vds.GetLayer(0)
+
+    mem = gdal.GetDriverByName('MEM').Create('', ds.RasterXSize, ds.RasterYSize, 1, gdal.GDT_Byte)
+    mem.SetGeoTransform(ds.GetGeoTransform())
+    mem.SetProjection(ds.GetProjection())
+    gdal.RasterizeLayer(mem, [1], lyr, burn_values=[1])
+    return mem.GetRasterBand(1).ReadAsArray().astype(bool)
+
+
+def mascara_da_grade(ds, caminho_mascara, pasta_cache=PASTA_CACHE_MASCARAS):
+    """Caminho do bitmap (np.packbits) da máscara para a grade; rasteriza só se não existir."""
+    if not os.path.exists(pasta_cache):
+        os.makedirs(pasta_cache)
+    caminho_bits = os.path.join(pasta_cache, "{}.npz".format(chave_grade(ds, caminho_mascara)))
+    if not os.path.exists(caminho_bits):
+        mascara = rasterizar_mascara(ds, caminho_mascara)
+        tmp = caminho_bits + ".{}.tmp.npz".format(os.getpid())
+        np.savez(tmp, bits=np.packbits(mascara), forma=np.array(mascara.shape))
+        os.replace(tmp, caminho_bits)
+    return caminho_bits
+
+
+def carregar_mascara(caminho_bits):
+    dados = np.load(caminho_bits)
+    forma = tuple(int(v) for v in dados['forma'])
+    return np.unpackbits(dados['bits'], count=forma[0] * forma[1]).reshape(forma).astype(bool)
+
+
+def janela_da_mascara(mascara):
+    """Menor janela (xoff, yoff, largura, altura) com pixels dentro da máscara."""
+    linhas = np.flatnonzero(mascara.any(axis=1))
+    colunas = np.flatnonzero(mascara.any(axis=0))
+    if linhas.size == 0:
+        return None
+    return (int(colunas[0]), int(linhas[0]),
+            int(colunas[-1] - colunas[0] + 1), int(linhas[-1] - linhas[0] + 1))
+
+
+def nodata_da_banda(b_in, dtype, nodata=NODATA):
+    """
+    Nodata que cabe no tipo da banda: `nodata` em bandas float ou quando está
+    na faixa do inteiro; senão o nodata da própria banda; sem ele, o maior
+    valor do tipo sem sinal (255, 65535...) ou o menor do tipo com sinal.
+    """
+    if dtype.kind == 'f':
+        return nodata
+    info = np.iinfo(dtype)
+    if info.min <= nodata <= info.max:
+        return nodata
+    origem = b_in.GetNoDataValue()
+    if origem is not None and info.min <= origem <= info.max:
+        return int(origem)
+    return int(info.max) if dtype.kind == 'u' else int(info.min)
+
+
+def recortar_com_bitmap(caminho_raster, caminho_bits, caminho_saida, nodata=NODATA,
+                        linhas_por_bloco=LINHAS_POR_BLOCO):
+    """
+    Recorta todas as bandas pelo bitmap: a saída cobre a extensão da máscara
+    (alinhada aos pixels de origem, sem reamostragem) e fora dela vale `nodata`
+    (ou, em bandas inteiras onde ele não cabe, o de nodata_da_banda).
+    """
+    mascara = carregar_mascara(caminho_bits)
+    janela = janela_da_mascara(mascara)
+    if janela is None:
+        raise RuntimeError(u"Máscara não cobre o raster {}".format(caminho_raster))
+    xoff, yoff, largura, altura = janela
+
+    origem = gdal.Open(caminho_raster)
+    gt = origem.GetGeoTransform()
+    tipo = origem.GetRasterBand(1).DataType
+
+    saida = criar_raster(caminho_saida, largura, altura, origem.RasterCount, tipo)
+    saida.SetGeoTransform((gt[0] + xoff * gt[1] + yoff * gt[2], gt[1], gt[2],
+                           gt[3] + xoff * gt[4] + yoff * gt[5], gt[4], gt[5]))
+    saida.SetProjection(origem.GetProjection())
+
+    for i in range(1, origem.RasterCount + 1):
+        b_in = origem.GetRasterBand(i)
+        b_out = saida.GetRasterBand(i)
+        if b_in.GetDescription():
+            b_out.SetDescription(b_in.GetDescription())
+        nodata_banda = None
+        for y0 in range(0, altura, linhas_por_bloco):
+            nlin = min(linhas_por_bloco, altura - y0)
+            dados = b_in.ReadAsArray(xoff, yoff + y0, largura, nlin)
+            if nodata_banda is None:
+                nodata_banda = nodata_da_banda(b_in, dados.dtype, nodata)
+                b_out.SetNoDataValue(nodata_banda)
+            dentro = mascara[yoff + y0:yoff + y0 + nlin, xoff:xoff + largura]
+            b_out.WriteArray(np.where(dentro, dados, dados.dtype.type(nodata_banda)), 0, y0)
+
+    saida = None
+    return finalizar_raster(caminho_saida)
+
+
+def recortar_raster(caminho_raster, caminho_mascara, caminho_saida, nodata=NODATA):
+    """Recorte de um raster só (usado pelas etapas do pipeline), com a máscara em cache."""
+    caminho_bits = mascara_da_grade(gdal.Open(caminho_raster), caminho_mascara)
+    return recortar_com_bitmap(caminho_raster, caminho_bits, caminho_saida, nodata)
+
+
+def recortar_lote(caminhos, caminho_mascara=CAMINHO_MASCARA, pasta_saida=PASTA_SAIDA,
+                  nodata=NODATA, n_processos=N_PROCESSOS, nomes_saida=None):
+    """
+    Recorta todos os rasters em paralelo. A máscara é rasterizada no processo
+    principal uma vez por grade distinta; os processos só leem o bitmap.
+    Retorna {raster: caminho_recortado}; a saída é <pasta_saida>/<nome>.tif, com
+    o nome do arquivo de origem ou o de `nomes_saida[raster]` (nome da camada).
+    """
+    nomes_saida = nomes_saida or {}
+    if not os.path.exists(pasta_saida):
+        os.makedirs(pasta_saida)
+
+    bitmaps = {}
+    for caminho in caminhos:
+        bitmaps[caminho] = mascara_da_grade(gdal.Open(caminho), caminho_mascara)
+    print(u"  > {} grade(s) distinta(s) para {} raster(s)".format(len(set(bitmaps.values())), len(caminhos)))
+
+    saidas = {}
+    with criar_pool(n_processos) as pool:
+        futuros = {}
+        for caminho in caminhos:
+            nome = nomes_saida.get(caminho) or os.path.splitext(os.path.basename(caminho))[0]
+            caminho_saida = os.path.join(pasta_saida, "{}.tif".format(nome))
+            futuros[pool.submit(recortar_com_bitmap, caminho, bitmaps[caminho], caminho_saida, nodata)] = caminho
+        for fut in as_completed(futuros):
+            caminho = futuros[fut]
+            try:
+                saidas[caminho] = fut.result()
+            except Exception as e:
+                print(u"Erro ao processar {}: {}".format(os.path.basename(caminho), e))
+    return saidas
+
+
+if __name__ == "__main__":
+    rasters = sorted(glob.glob(os.path.join(PASTA_ENTRADA, PADRAO_ENTRADA)))
+    print(u"--- Recortando {} rasters ---".format(len(rasters)))
+    feitos = recortar_lote(rasters)
+    print(u"--- Concluído! {} camadas recortadas em: {} ---".format(len(feitos), PASTA_SAIDA))
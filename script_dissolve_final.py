@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
-import processing
 import os
+import sys
 from qgis.core import (
     QgsProject, QgsVectorLayer, QgsField, QgsMapLayerType, 
     QgsSymbol, QgsRendererCategory, QgsCategorizedSymbolRenderer
@@ -15,15 +15,20 @@ CAMADAS_IGNORAR = [
     "PA-458", "Buffer Leste", "mapbiomas_bragança", "PA458_Oeste_12km"
 ]
 
-# Configuração da Simbologia (Igual à original)
-ROTULOS_MAPA = {
-    1: u"Não-Vegetação/Água",
-    2: u"Estresse Severo/Degradação",
-    3: u"Estresse Moderado/Baixa Biomassa",
-    4: u"Saúde Razoável",
-    5: u"Saudável e Vigoroso"
-}
-CORES_HEX = ["#d7191c", "#fdae61", "#ffffbf", "#abdda4", "#1a9641"]
+# "qgis": native:dissolve e depois edição feição a feição (Rotulo/Area_Ha)
+# "direto": dissolve_vetorial.py -- união e áreas vetorizadas, gravadas junto
+#           com Rotulo/Area_Ha numa única transação do GeoPackage
+MOTOR_DISSOLVE = "qgis"
+# (só "direto") Área pela contagem de pixels do <nome>_classes.tif, se existir
+AREA_POR_PIXELS = False
+
+# Pasta destes scripts (para importar os módulos auxiliares no console do QGIS)
+PASTA_SCRIPTS = os.path.dirname(os.path.abspath(__file__)) if "__file__" in globals() else os.getcwd()
+if PASTA_SCRIPTS not in sys.path:
+    sys.path.insert(0, PASTA_SCRIPTS)
+
+from instrumentacao import rodar, trecho, contador, contar, encerrar_contador
+from paleta import ROTULOS_MAPA, CORES_HEX  # simbologia (igual à original)
 
 def aplicar_simbologia(layer_vetor):
     """Reaplica a simbologia classificada no arquivo dissolvido."""
@@ -44,6 +49,25 @@ def aplicar_simbologia(layer_vetor):
     layer_vetor.setRenderer(renderer)
     layer_vetor.triggerRepaint()
 
+def dissolver_direto(layer, caminho_saida):
+    """Dissolve + Rotulo/Area_Ha numa única escrita (sem sessão de edição)."""
+    from dissolve_vetorial import dissolver_com_area
+
+    partes = layer.source().split("|")
+    camada = None
+    for p in partes[1:]:
+        if p.startswith("layername="):
+            camada = p.split("=", 1)[1]
+
+    caminho_classes = None
+    if AREA_POR_PIXELS and partes[0].endswith("_vetor.gpkg"):
+        caminho_classes = partes[0][:-len("_vetor.gpkg")] + "_classes.tif"
+        if not os.path.exists(caminho_classes):
+            print(u"  > Raster de classes não encontrado; área pela geometria.")
+            caminho_classes = None
+
+    dissolver_com_area(partes[0], caminho_saida, caminho_classes, camada)
+
 def dissolver_calcular_posicionar():
     root = QgsProject.instance().layerTreeRoot()
     # Pega lista de camadas (cópia da lista atual para evitar erros ao modificar a árvore)
@@ -67,11 +91,16 @@ def dissolver_calcular_posicionar():
 
         # 2. Executar DISSOLVE (Agrupa geometrias pelo DN)
         try:
-            processing.run("native:dissolve", {
-                'INPUT': layer,
-                'FIELD': ['DN'],
-                'OUTPUT': caminho_saida
-            })
+            if MOTOR_DISSOLVE == "direto":
+                with trecho("dissolve_vetorial", camada=layer.name()) as t:
+                    dissolver_direto(layer, caminho_saida)
+                    t['bytes'] = os.path.getsize(caminho_saida)
+            else:
+                rodar("native:dissolve", {
+                    'INPUT': layer,
+                    'FIELD': ['DN'],
+                    'OUTPUT': caminho_saida
+                })
             
             # 3. Carregar a camada (SEM adicionar na árvore ainda)
             vlayer = QgsVectorLayer(caminho_saida, layer.name() + "_FINAL", "ogr")
@@ -79,33 +108,37 @@ def dissolver_calcular_posicionar():
                 print(u"Erro ao carregar camada gerada.")
                 continue
 
-            # 4. Adicionar Campos e Calcular Área (Equivalente à Calculadora de Campo)
-            # Iniciamos edição para alterar a tabela
-            vlayer.startEditing()
+            # 4. (motor "qgis") Adicionar Campos e Calcular Área (Equivalente à Calculadora de Campo)
+            if MOTOR_DISSOLVE != "direto":
+                # Iniciamos edição para alterar a tabela
+                vlayer.startEditing()
             
-            # Adiciona colunas
-            pr = vlayer.dataProvider()
-            pr.addAttributes([
-                QgsField("Rotulo", QVariant.String, len=100),
-                QgsField("Area_Ha", QVariant.Double) # Campo Decimal
-            ])
-            vlayer.updateFields()
-
-            # Itera sobre as 5 feições para preencher
-            for feat in vlayer.getFeatures():
-                dn = feat['DN']
+                # Adiciona colunas
+                pr = vlayer.dataProvider()
+                pr.addAttributes([
+                    QgsField("Rotulo", QVariant.String, len=100),
+                    QgsField("Area_Ha", QVariant.Double) # Campo Decimal
+                ])
+                vlayer.updateFields()
+
+                # Itera sobre as 5 feições para preencher
+                feicoes = contador("dissolve.feicoes", camada=layer.name())
+                for feat in vlayer.getFeatures():
+                    dn = feat['DN']
                 
-                # A. Preencher Rótulo
-                feat['Rotulo'] = ROTULOS_MAPA.get(dn, "Indefinido")
+                    # A. Preencher Rótulo
+                    feat['Rotulo'] = ROTULOS_MAPA.get(dn, "Indefinido")
                 
-                # B. Calcular Área ($area / 10000)
-                # geom.area() retorna em metros quadrados (se projeção for UTM/métrica)
-                area_hectares = feat.geometry().area() / 10000.0
-                feat['Area_Ha'] = round(area_hectares, 4)
+                    # B. Calcular Área ($area / 10000)
+                    # geom.area() retorna em metros quadrados (se projeção for UTM/métrica)
+                    area_hectares = feat.geometry().area() / 10000.0
+                    feat['Area_Ha'] = round(area_hectares, 4)
                 
-                vlayer.updateFeature(feat)
+                    vlayer.updateFeature(feat)
+                    contar(feicoes)
+                encerrar_contador(feicoes)
             
-            vlayer.commitChanges()
+                vlayer.commitChanges()
 
             # 5. Adicionar ao Projeto e POSICIONAR NA ÁRVORE
             QgsProject.instance().addMapLayer(vlayer, False) # False = não põe na árvore auto
@@ -136,4 +169,5 @@ def dissolver_calcular_posicionar():
 
     print(u"\n--- FIM ---")
 
-dissolver_calcular_posicionar()
\ No newline at end of file
+with trecho("script_dissolve_final", motor=MOTOR_DISSOLVE):
+    dissolver_calcular_posicionar()
\ No newline at end of file
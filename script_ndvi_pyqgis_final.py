@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
-import processing
+import sys
 from qgis.core import (
-    QgsProject, QgsMapLayerType, QgsRasterLayer, QgsRasterBandStats,
+    QgsProject, QgsMapLayerType, QgsRasterLayer,
     QgsColorRampShader, QgsRasterShader, QgsSingleBandPseudoColorRenderer,
     QgsProcessingException
 )
@@ -13,17 +13,35 @@ CAMADA_MASCARA = "buffer_total"
 PASTA_SAIDA = r"G:\Meu Drive\PA458_ByPolygons\final\sem_urb"
 BANDA_NDVI = 3  # Mantendo a lógica do seu script anterior
 
+# Motor do recorte:
+#   "qgis"     -> gdal:cliprasterbymasklayer, um raster por vez (original)
+#   "paralelo" -> recorte_paralelo.py: máscara rasterizada uma vez por grade,
+#                 recorte em pool de processos (mesmos nomes e nodata -9999)
+MOTOR_RECORTE = "qgis"
+N_PROCESSOS = None  # None = todos os núcleos (apenas no motor "paralelo")
+
+# Limites das classes da simbologia:
+#   "por_camada" -> Intervalo Igual do min/max de cada recorte (original)
+#   "intervalo", "quantil", "jenks", "fixo" -> os mesmos limites em todos os
+#                   recortes, do histograma somado (classes_globais.py)
+LIMITES_CLASSES = "por_camada"
+
+# Pasta destes scripts (para importar os módulos auxiliares no console do QGIS)
+PASTA_SCRIPTS = os.path.dirname(os.path.abspath(__file__)) if "__file__" in globals() else os.getcwd()
+if PASTA_SCRIPTS not in sys.path:
+    sys.path.insert(0, PASTA_SCRIPTS)
+
+from estatisticas_cache import min_max_camada
+from perfil_raster import opcoes_texto, concluir_saida_gdal
+from instrumentacao import rodar, trecho
+from paleta import ROTULOS, CORES_HEX
+
 # --- (Reutilizando sua função de simbologia para consistência) ---
-def aplica_pseudocolor_ndvi_discreto(layer, banda=BANDA_NDVI):
-    rotulos = [
-        u"Não-Vegetação/Água", u"Estresse Severo/Degradação",
-        u"Estresse Moderado/Baixa Biomassa", u"Saúde Razoável", u"Saudável e Vigoroso"
-    ]
-    cores_hex = ["#d7191c", "#fdae61", "#ffffbf", "#abdda4", "#1a9641"]
+def aplica_pseudocolor_ndvi_discreto(layer, banda=BANDA_NDVI, limites=None):
+    rotulos, cores_hex = ROTULOS, CORES_HEX
     
     prov = layer.dataProvider()
-    stats = prov.bandStatistics(banda, QgsRasterBandStats.Min | QgsRasterBandStats.Max)
-    vmin, vmax = stats.minimumValue, stats.maximumValue
+    vmin, vmax = min_max_camada(layer, banda)
     
     if vmin is None or vmax is None or vmin == vmax:
         return # Evita erro em rasters vazios
@@ -34,6 +52,8 @@ def aplica_pseudocolor_ndvi_discreto(layer, banda=BANDA_NDVI):
     
     for i, (rotulo, hex_cor) in enumerate(zip(rotulos, cores_hex)):
         val_limite = vmin + step * (i + 1)
+        if limites is not None:
+            val_limite = float(limites[i + 1])
         itens.append(QgsColorRampShader.ColorRampItem(val_limite, QColor(hex_cor), rotulo))
 
     colorRampShader = QgsColorRampShader()
@@ -46,6 +66,68 @@ def aplica_pseudocolor_ndvi_discreto(layer, banda=BANDA_NDVI):
     layer.setRenderer(renderer)
     layer.triggerRepaint()
 
+def carregar_e_estilizar(layer, caminho_saida, root):
+    """Carrega o recorte logo acima do raster original e aplica a simbologia."""
+    # 5. Carregar o novo arquivo
+    novo_layer = QgsRasterLayer(caminho_saida, layer.name()) # Mantém mesmo nome
+    
+    if not novo_layer.isValid():
+        print(u"Falha ao carregar: {}".format(caminho_saida))
+        return False
+
+    # 6. Adicionar ao projeto e posicionar na árvore
+    # Adiciona sem colocar na árvore automaticamente primeiro
+    QgsProject.instance().addMapLayer(novo_layer, False)
+    
+    # Encontra o nó da camada original na árvore
+    node_original = root.findLayer(layer.id())
+    
+    if node_original:
+        # Insere o novo nó no mesmo pai, logo antes (acima) do original
+        parent = node_original.parent()
+        index = parent.children().index(node_original)
+        parent.insertLayer(index, novo_layer)
+        
+        # Opcional: Desligar a visualização da camada antiga para não confundir
+        # root.findLayer(layer.id()).setItemVisibilityChecked(False)
+    else:
+        root.addLayer(novo_layer)
+
+    # 7. Aplicar Simbologia
+    aplica_pseudocolor_ndvi_discreto(novo_layer, banda=BANDA_NDVI)
+    return True
+
+def recortar_em_paralelo(camadas, mascara, root):
+    """Motor "paralelo": todos os recortes de uma vez, com a máscara rasterizada por grade."""
+    from recorte_paralelo import recortar_lote
+
+    por_fonte = {l.source(): l for l in camadas}
+    saidas = recortar_lote(list(por_fonte), mascara.source(), PASTA_SAIDA,
+                           nodata=-9999, n_processos=N_PROCESSOS,
+                           nomes_saida={f: l.name() for f, l in por_fonte.items()})
+    processados = 0
+    for fonte, caminho_saida in saidas.items():
+        if carregar_e_estilizar(por_fonte[fonte], caminho_saida, root):
+            processados += 1
+    return processados
+
+def estilizar_com_limites_compartilhados():
+    """Reaplica a simbologia de todos os recortes da pasta de saída com os mesmos limites."""
+    if LIMITES_CLASSES == "por_camada":
+        return
+    from classes_globais import limites_globais
+
+    recortes = [l for l in QgsProject.instance().mapLayers().values()
+                if l.type() == QgsMapLayerType.RasterLayer and l.source().startswith(PASTA_SAIDA)
+                and os.path.isfile(l.source()) and not l.source().endswith("_classes.tif")]
+    if not recortes:
+        return
+    limites = limites_globais([l.source() for l in recortes], LIMITES_CLASSES, n_processos=N_PROCESSOS)
+    print(u"Limites '{}' em {} recortes: {}".format(
+        LIMITES_CLASSES, len(recortes), " ".join("{:.4f}".format(v) for v in limites)))
+    for l in recortes:
+        aplica_pseudocolor_ndvi_discreto(l, BANDA_NDVI, limites)
+
 # --- Função Principal de Processamento ---
 def processar_recorte_e_estilo():
     # 1. Verificar diretório
@@ -70,6 +152,15 @@ def processar_recorte_e_estilo():
 
     processados = 0
 
+    if MOTOR_RECORTE == "paralelo":
+        camadas = [QgsProject.instance().mapLayer(i) for i in layer_ids]
+        camadas = [l for l in camadas if l.type() == QgsMapLayerType.RasterLayer
+                   and not l.source().startswith(PASTA_SAIDA)]
+        processados = recortar_em_paralelo(camadas, mascara, root)
+        estilizar_com_limites_compartilhados()
+        print(u"--- Concluído! {} camadas recortadas e estilizadas em: {} ---".format(processados, PASTA_SAIDA))
+        return
+
     for layer_id in layer_ids:
         layer = QgsProject.instance().mapLayer(layer_id)
         
@@ -95,46 +186,24 @@ def processar_recorte_e_estilo():
                 'KEEP_RESOLUTION': True,
                 'NODATA': -9999, # Define valor nulo para a área fora da máscara
                 'ALPHA_BAND': False,
-                'OPTIONS': '',
+                'OPTIONS': opcoes_texto(), # blocos 512, compressão e preditor (perfil_raster.py)
                 'DATA_TYPE': 0, # Use Input Layer Data Type
                 'OUTPUT': caminho_saida
             }
             
-            processing.run("gdal:cliprasterbymasklayer", params)
-
-            # 5. Carregar o novo arquivo
-            novo_layer = QgsRasterLayer(caminho_saida, layer.name()) # Mantém mesmo nome
-            
-            if not novo_layer.isValid():
-                print(u"Falha ao carregar: {}".format(caminho_saida))
-                continue
+            rodar("gdal:cliprasterbymasklayer", params)
+            concluir_saida_gdal(caminho_saida) # COG / overviews internas
 
-            # 6. Adicionar ao projeto e posicionar na árvore
-            # Adiciona sem colocar na árvore automaticamente primeiro
-            QgsProject.instance().addMapLayer(novo_layer, False)
-            
-            # Encontra o nó da camada original na árvore
-            node_original = root.findLayer(layer.id())
-            
-            if node_original:
-                # Insere o novo nó no mesmo pai, logo antes (acima) do original
-                parent = node_original.parent()
-                index = parent.children().index(node_original)
-                parent.insertLayer(index, novo_layer)
-                
-                # Opcional: Desligar a visualização da camada antiga para não confundir
-                # root.findLayer(layer.id()).setItemVisibilityChecked(False)
-            else:
-                root.addLayer(novo_layer)
-
-            # 7. Aplicar Simbologia
-            aplica_pseudocolor_ndvi_discreto(novo_layer, banda=BANDA_NDVI)
-            processados += 1
+            # 5-7. Carregar, posicionar na árvore e aplicar simbologia
+            if carregar_e_estilizar(layer, caminho_saida, root):
+                processados += 1
 
         except Exception as e:
             print(u"Erro ao processar {}: {}".format(layer.name(), e))
 
+    estilizar_com_limites_compartilhados()
     print(u"--- Concluído! {} camadas recortadas e estilizadas em: {} ---".format(processados, PASTA_SAIDA))
 
 # Executar
-processar_recorte_e_estilo()
\ No newline at end of file
+with trecho("script_ndvi_pyqgis_final", motor=MOTOR_RECORTE):
+    processar_recorte_e_estilo()
\ No newline at end of file
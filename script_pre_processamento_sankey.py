@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
-import processing
 import os
-import csv
+import sys
 from qgis.core import (
     QgsProject, QgsVectorLayer, QgsMapLayerType, QgsVectorFileWriter
 )
@@ -13,6 +12,20 @@ PASTA_BASE = r"H:\Meu Drive\UFRA\PRÉ PROJETO DE TCC\PRODUTOS TCC\tabelas_sankey
 # Configurações de Filtro
 IGNORAR = ["Buffer", "mapbiomas", "dissolvido", "sankey", "transicao"]
 
+# Modo de cálculo da transição:
+#   "vetor"  -> interseção sequencial das camadas '_FINAL' do projeto (original)
+#   "raster" -> bincount dos rasters de classes (*_classes.tif), mesmo CSV
+MODO_TRANSICAO = "vetor"
+PASTA_CLASSES = r"G:\Meu Drive\PA458_ByPolygons\final\sem_urb"
+
+# Pasta destes scripts (para importar os módulos auxiliares no console do QGIS)
+PASTA_SCRIPTS = os.path.dirname(os.path.abspath(__file__)) if "__file__" in globals() else os.getcwd()
+if PASTA_SCRIPTS not in sys.path:
+    sys.path.insert(0, PASTA_SCRIPTS)
+
+from transicao_raster import escrever_csv_transicao, processar_lados_raster
+from instrumentacao import rodar, trecho, contador, contar, encerrar_contador
+
 def renomear_campo_dn(layer, ano):
     """Renomeia 'DN' para 'CLASSE_20xx'."""
     novo_nome = "Class{}".format(ano)
@@ -28,7 +41,7 @@ def renomear_campo_dn(layer, ano):
                 'type': field.type()
             })
             
-    res = processing.run("native:refactorfields", {
+    res = rodar("native:refactorfields", {
         'INPUT': layer,
         'FIELDS_MAPPING': fields_mapping,
         'OUTPUT': 'TEMPORARY_OUTPUT'
@@ -42,7 +55,7 @@ def exportar_produtos_finais(layer_final, nome_base):
     caminho_shp = os.path.join(PASTA_BASE, "{}.shp".format(nome_base))
     
     print(u"  > Salvando Shapefile para auditoria...")
-    processing.run("native:savefeatures", {
+    rodar("native:savefeatures", {
         'INPUT': layer_final,
         'OUTPUT': caminho_shp
     })
@@ -56,10 +69,11 @@ def exportar_produtos_finais(layer_final, nome_base):
     # 2. Salvar CSV (Para o R)
     caminho_csv = os.path.join(PASTA_BASE, "{}.csv".format(nome_base))
     
-    campos_classe = [f.name() for f in layer_final.fields() if f.name().startswith("CLASSE_")]
+    campos_classe = [f.name() for f in layer_final.fields() if f.name().startswith("Class")]
     campos_classe.sort() 
     
     dados_agrupados = {}
+    feicoes = contador("transicao.feicoes", camada=nome_base)
     
     for feat in layer_final.getFeatures():
         # Tupla de histórico (5, 5, 4...)
@@ -70,12 +84,10 @@ def exportar_produtos_finais(layer_final, nome_base):
             dados_agrupados[historico] += area_ha
         else:
             dados_agrupados[historico] = area_ha
+        contar(feicoes)
+    encerrar_contador(feicoes)
             
-    with open(caminho_csv, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(campos_classe + ['area_ha'])
-        for historico, area in dados_agrupados.items():
-            writer.writerow(list(historico) + [round(area, 4)])
+    escrever_csv_transicao(caminho_csv, campos_classe, dados_agrupados)
             
     print(u"    [OK] CSV salvo em: {}".format(caminho_csv))
 
@@ -83,6 +95,12 @@ def processar_tudo_com_auditoria():
     if not os.path.exists(PASTA_BASE):
         os.makedirs(PASTA_BASE)
 
+    if MODO_TRANSICAO == "raster":
+        # Sem interseção: histórico por pixel direto dos rasters de classes
+        processar_lados_raster(PASTA_CLASSES, PASTA_BASE)
+        print(u"\n--- Concluído! Verifique a pasta. ---")
+        return
+
     dados_mapa = {'Leste': {}, 'Oeste': {}}
     camadas = QgsProject.instance().mapLayers().values()
     
@@ -129,7 +147,7 @@ def processar_tudo_com_auditoria():
             print(u"  > Cruzando {} com {}...".format(ano_base, ano_prox))
             layer_prox = renomear_campo_dn(dados_mapa[lado][ano_prox], ano_prox)
             
-            res = processing.run("native:intersection", {
+            res = rodar("native:intersection", {
                 'INPUT': layer_acumulado,
                 'OVERLAY': layer_prox,
                 'OUTPUT': 'TEMPORARY_OUTPUT'
@@ -143,4 +161,5 @@ def processar_tudo_com_auditoria():
 
     print(u"\n--- Concluído! Verifique a pasta e o painel de camadas. ---")
 
-processar_tudo_com_auditoria()
\ No newline at end of file
+with trecho("script_pre_processamento_sankey", modo=MODO_TRANSICAO):
+    processar_tudo_com_auditoria()
\ No newline at end of file
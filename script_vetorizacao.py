@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
-import processing
+import sys
 from qgis.core import (
-    QgsProject, QgsMapLayerType, QgsVectorLayer, QgsRasterBandStats,
+    QgsProject, QgsMapLayerType, QgsVectorLayer,
     QgsSymbol, QgsRendererCategory, QgsCategorizedSymbolRenderer
 )
 from qgis.PyQt.QtGui import QColor
@@ -12,15 +12,31 @@ from qgis.PyQt.QtCore import Qt
 # Pasta onde os vetores resultantes (.gpkg) serão salvos
 PASTA_SAIDA = r"G:\Meu Drive\PA458_ByPolygons\final\sem_urb"
 
-# Definição das Classes (1 a 5)
-ROTULOS = [
-    u"Não-Vegetação/Água",
-    u"Estresse Severo/Degradação",
-    u"Estresse Moderado/Baixa Biomassa",
-    u"Saúde Razoável",
-    u"Saudável e Vigoroso"
-]
-CORES_HEX = ["#d7191c", "#fdae61", "#ffffbf", "#abdda4", "#1a9641"]
+# Salva o raster reclassificado (<nome>_classes.tif) ao lado do vetor,
+# usado pelo modo "raster" de script_pre_processamento_sankey.py
+SALVAR_RASTER_CLASSES = True
+
+# Motor de vetorização:
+#   "qgis"     -> reclassifybytable + gdal:polygonize, uma camada por vez (original)
+#   "paralelo" -> vetorizacao_paralela.py: blocos em pool de processos, mesmo GPKG
+MOTOR_VETORIZACAO = "qgis"
+N_PROCESSOS = None  # None = todos os núcleos (apenas no motor "paralelo")
+
+# Limites das 5 classes:
+#   "por_camada" -> Intervalo Igual do min/max de cada raster (original)
+#   "intervalo", "quantil", "jenks", "fixo" -> limites únicos para todos os
+#                   anos e lados, do histograma somado (classes_globais.py)
+LIMITES_CLASSES = "por_camada"
+
+# Pasta destes scripts (para importar os módulos auxiliares no console do QGIS)
+PASTA_SCRIPTS = os.path.dirname(os.path.abspath(__file__)) if "__file__" in globals() else os.getcwd()
+if PASTA_SCRIPTS not in sys.path:
+    sys.path.insert(0, PASTA_SCRIPTS)
+
+from estatisticas_cache import min_max_camada
+from perfil_raster import aplicar_perfil
+from instrumentacao import rodar, trecho
+from paleta import ROTULOS, CORES_HEX  # definição das classes (1 a 5)
 
 def definir_simbologia_vetor(layer_vetor):
     """Aplica a simbologia categorizada no campo 'DN'."""
@@ -41,6 +57,54 @@ def definir_simbologia_vetor(layer_vetor):
     layer_vetor.setRenderer(renderer)
     layer_vetor.triggerRepaint()
 
+def carregar_e_estilizar(layer, caminho_final, root):
+    """Carrega o vetor gerado logo acima do raster de origem e aplica a simbologia."""
+    vetor_layer = QgsVectorLayer(caminho_final, layer.name(), "ogr")
+    if not vetor_layer.isValid():
+        print(u"  > Erro ao carregar o arquivo gerado.")
+        return False
+
+    # Adiciona ao projeto sem desenhar ainda
+    QgsProject.instance().addMapLayer(vetor_layer, False)
+    
+    # Tenta colocar o vetor logo acima do raster original na árvore
+    node_raster = root.findLayer(layer.id())
+    if node_raster:
+        parent = node_raster.parent()
+        idx = parent.children().index(node_raster)
+        parent.insertLayer(idx, vetor_layer) # Insere acima
+        # Opcional: Desligar o raster original
+        # node_raster.setItemVisibilityChecked(False)
+    else:
+        root.addLayer(vetor_layer)
+
+    definir_simbologia_vetor(vetor_layer)
+    return True
+
+def limites_compartilhados(rasters_projeto):
+    """Limites únicos (classes_globais.py) para as camadas em arquivo, ou None no modo "por_camada"."""
+    if LIMITES_CLASSES == "por_camada":
+        return None
+    from classes_globais import limites_globais
+
+    fontes = [l.source() for l in rasters_projeto if os.path.isfile(l.source())]
+    limites = limites_globais(fontes, LIMITES_CLASSES, n_processos=N_PROCESSOS)
+    print(u"  > Limites '{}' para todas as camadas: {}".format(
+        LIMITES_CLASSES, " ".join("{:.4f}".format(v) for v in limites)))
+    return limites
+
+def processar_em_paralelo(rasters_projeto, root):
+    """Motor "paralelo": todos os rasters vetorizados de uma vez, fora da thread do QGIS."""
+    from vetorizacao_paralela import vetorizar_lote
+
+    por_fonte = {l.source(): l for l in rasters_projeto}
+    saidas = vetorizar_lote(list(por_fonte), PASTA_SAIDA, n_processos=N_PROCESSOS,
+                            salvar_classes=SALVAR_RASTER_CLASSES,
+                            limites=limites_compartilhados(rasters_projeto))
+    for fonte, caminho_final in saidas.items():
+        if carregar_e_estilizar(por_fonte[fonte], caminho_final, root):
+            print(u"  > Sucesso: {}".format(por_fonte[fonte].name()))
+
 def processar_camadas_carregadas():
     # 1. Validação da Pasta
     if not os.path.exists(PASTA_SAIDA):
@@ -58,6 +122,13 @@ def processar_camadas_carregadas():
 
     root = QgsProject.instance().layerTreeRoot()
 
+    if MOTOR_VETORIZACAO == "paralelo":
+        processar_em_paralelo(rasters_projeto, root)
+        print(u"\n--- Processamento finalizado! ---")
+        return
+
+    limites = limites_compartilhados(rasters_projeto)
+
     for layer in rasters_projeto:
         print(u"\nProcessando: {}".format(layer.name()))
 
@@ -72,28 +143,38 @@ def processar_camadas_carregadas():
         else:
             print(u"  > Detectado banda única: Usando Banda 1")
 
-        # 3. Estatísticas Min/Max
-        stats = prov.bandStatistics(banda_uso, QgsRasterBandStats.Min | QgsRasterBandStats.Max)
-        vmin, vmax = stats.minimumValue, stats.maximumValue
+        # 3. Estatísticas Min/Max (cache compartilhado com a simbologia)
+        vmin, vmax = min_max_camada(layer, banda_uso)
 
         if vmin is None or vmax is None or vmin == vmax:
             print(u"  > PULO: Camada vazia ou constante.")
             continue
 
-        # 4. Criar Tabela de Reclassificação (Intervalo Igual)
-        n_classes = 5
-        step = (vmax - vmin) / n_classes
-        reclass_table = []
-        for i in range(n_classes):
-            limite_inf = vmin + (step * i)
-            limite_sup = vmin + (step * (i + 1))
-            if i == n_classes - 1: limite_sup += 0.0001
-            reclass_table.extend([limite_inf, limite_sup, i + 1])
+        # 4. Criar Tabela de Reclassificação (Intervalo Igual ou limites compartilhados)
+        if limites is not None:
+            from classes_globais import tabela_reclassificacao
+            reclass_table = tabela_reclassificacao(limites)
+        else:
+            n_classes = 5
+            step = (vmax - vmin) / n_classes
+            reclass_table = []
+            for i in range(n_classes):
+                limite_inf = vmin + (step * i)
+                limite_sup = vmin + (step * (i + 1))
+                if i == n_classes - 1: limite_sup += 0.0001
+                reclass_table.extend([limite_inf, limite_sup, i + 1])
 
         try:
-            # 5. Reclassificar (Memória)
-            # Transforma valores quebrados em 1, 2, 3, 4, 5
-            res_reclass = processing.run("native:reclassifybytable", {
+            nome_seguro = layer.name().replace(" ", "_").replace("/", "-")
+
+            # 5. Reclassificar
+            # Transforma valores quebrados em 1, 2, 3, 4, 5. O raster de classes
+            # fica em disco: é a entrada do modo "raster" da tabela de transição.
+            saida_classes = 'TEMPORARY_OUTPUT'
+            if SALVAR_RASTER_CLASSES:
+                saida_classes = os.path.join(PASTA_SAIDA, "{}_classes.tif".format(nome_seguro))
+
+            res_reclass = rodar("native:reclassifybytable", {
                 'INPUT_RASTER': layer,
                 'RASTER_BAND': banda_uso,
                 'TABLE': reclass_table,
@@ -101,16 +182,17 @@ def processar_camadas_carregadas():
                 'RANGE_BOUNDARIES': 0, 
                 'NODATA_FOR_MISSING': True,
                 'DATA_TYPE': 5, # Int16
-                'OUTPUT': 'TEMPORARY_OUTPUT'
+                'OUTPUT': saida_classes
             })
+            if SALVAR_RASTER_CLASSES:
+                aplicar_perfil(res_reclass['OUTPUT']) # COG Int16 (perfil_raster.py)
             
             # 6. Poligonizar (Salvar em Disco)
-            nome_seguro = layer.name().replace(" ", "_").replace("/", "-")
             caminho_final = os.path.join(PASTA_SAIDA, "{}_vetor.gpkg".format(nome_seguro))
             
             print(u"  > Gerando vetor em: {}".format(caminho_final))
             
-            processing.run("gdal:polygonize", {
+            rodar("gdal:polygonize", {
                 'INPUT': res_reclass['OUTPUT'],
                 'BAND': 1,
                 'FIELD': 'DN',
@@ -119,26 +201,8 @@ def processar_camadas_carregadas():
             })
 
             # 7. Carregar e Estilizar
-            vetor_layer = QgsVectorLayer(caminho_final, layer.name(), "ogr")
-            if vetor_layer.isValid():
-                # Adiciona ao projeto sem desenhar ainda
-                QgsProject.instance().addMapLayer(vetor_layer, False)
-                
-                # Tenta colocar o vetor logo acima do raster original na árvore
-                node_raster = root.findLayer(layer.id())
-                if node_raster:
-                    parent = node_raster.parent()
-                    idx = parent.children().index(node_raster)
-                    parent.insertLayer(idx, vetor_layer) # Insere acima
-                    # Opcional: Desligar o raster original
-                    # node_raster.setItemVisibilityChecked(False)
-                else:
-                    root.addLayer(vetor_layer)
-
-                definir_simbologia_vetor(vetor_layer)
+            if carregar_e_estilizar(layer, caminho_final, root):
                 print(u"  > Sucesso.")
-            else:
-                print(u"  > Erro ao carregar o arquivo gerado.")
 
         except Exception as e:
             print(u"  > Falha: {}".format(e))
@@ -146,4 +210,5 @@ def processar_camadas_carregadas():
     print(u"\n--- Processamento finalizado! ---")
 
 # Executar
-processar_camadas_carregadas()
\ No newline at end of file
+with trecho("script_vetorizacao", motor=MOTOR_VETORIZACAO):
+    processar_camadas_carregadas()
\ No newline at end of file
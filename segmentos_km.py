@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+# NDVI por trecho ao longo da PA-458: cada buffer (Leste/Oeste) é dividido
+# em segmentos de N metros de estaqueamento (distância ao longo do eixo da
+# rodovia, a partir do início da estrada), em vez do polígono único por lado
+# (union(1)) do notebook. Mostra o gradiente ao longo da via.
+#
+#   - índice pixel -> segmento: o centro de cada pixel dentro do polígono do
+#     lado é projetado no eixo (ponto mais próximo da polilinha); o
+#     estaqueamento dividido por N dá o segmento. Calculado uma vez por
+#     grade (mesma chave do bitmap do recorte_paralelo.py + eixo + N) e
+#     guardado em cache no disco;
+#   - estatísticas: os valores de todos os anos de um lado são lidos nas
+#     posições do índice e somados por (ano, segmento) num único bincount
+#     (contagem, média, desvio e fração com NDVI < 0,5);
+#   - saída: tabela longa lado, segmento, km_ini, km_fim, ano, ... que vira
+#     matriz segmento x ano (matriz_segmentos) para a detecção de quebras e
+#     para o Sankey.
+
+import os
+import hashlib
+
+import numpy as np
+import pandas as pd
+from osgeo import gdal, ogr, osr
+
+from tabelas import espelhar_csv
+from recorte_paralelo import chave_grade, mascara_da_grade, carregar_mascara, janela_da_mascara
+from vetorizacao_paralela import banda_ndvi
+from zonal_lote import pares_locais
+
+# --- CONFIGURAÇÕES ---
+CAMINHO_EIXO = r"G:\Meu Drive\PA458_ByPolygons\PA458_eixo.gpkg"  # linha central da rodovia
+INICIO_EIXO = None   # (x, y) do km 0 no CRS do eixo; None = primeiro vértice da linha
+COMPRIMENTO_SEGMENTO = 1000.0  # metros
+CSV_SAIDA = os.path.join("outputs", "ndvi_segmentos_km.csv")
+PASTA_CACHE_INDICES = os.path.join(os.path.expanduser("~"), ".pa458_cache", "segmentos")
+
+LIMIAR_NDVI = 0.5          # fração de pixels abaixo (as "áreas < 0,5" dos mapas anuais)
+PONTOS_POR_BLOCO = 4096    # pixels projetados por vez (memória ~ pontos x trechos candidatos)
+MARGEM_BUSCA = 2000.0      # metros; trechos do eixo considerados em volta de cada bloco
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+
+# --- Eixo da rodovia ---
+def _encadear(partes):
+    """Junta as partes de uma linha (multilinha ou várias feições) pela ponta mais próxima."""
+    partes = [p for p in partes if len(p) >= 2]
+    if not partes:
+        raise RuntimeError(u"Eixo sem geometria de linha")
+    linha = partes.pop(0)
+    while partes:
+        melhor = None
+        for i, p in enumerate(partes):
+            for inverter_linha, inverter_parte in ((False, False), (False, True), (True, False), (True, True)):
+                a = linha[0] if inverter_linha else linha[-1]
+                b = p[-1] if inverter_parte else p[0]
+                d = np.hypot(*(a - b))
+                if melhor is None or d < melhor[0]:
+                    melhor = (d, i, inverter_linha, inverter_parte)
+        d, i, inverter_linha, inverter_parte = melhor
+        p = partes.pop(i)
+        if inverter_linha:
+            linha = linha[::-1]
+        if inverter_parte:
+            p = p[::-1]
+        linha = np.vstack([linha, p[1:] if d == 0 else p])
+    return linha
+
+
+def ler_eixo(caminho_eixo, wkt_destino, inicio=INICIO_EIXO):
+    """Vértices (N, 2) do eixo no CRS de destino, orientados a partir de `inicio`."""
+    vds = ogr.Open(caminho_eixo)
+    lyr = vds.GetLayer(0)
+    srs_destino = osr.SpatialReference()
+    srs_destino.ImportFromWkt(wkt_destino)
+    srs_destino.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    srs_eixo = lyr.GetSpatialRef()
+    transf = None
+    if srs_eixo is not None and not srs_eixo.IsSame(srs_destino):
+        srs_eixo = srs_eixo.Clone()
+        srs_eixo.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        transf = osr.CoordinateTransformation(srs_eixo, srs_destino)
+
+    partes = []
+    for feat in lyr:
+        geom = feat.GetGeometryRef()
+        if geom is None:
+            continue
+        geom = geom.Clone()
+        if ogr.GT_Flatten(geom.GetGeometryType()) == ogr.wkbLineString:
+            linhas = [geom]
+        else:
+            linhas = [geom.GetGeometryRef(i) for i in range(geom.GetGeometryCount())]
+        for g in linhas:
+            pontos = np.array(g.GetPoints(), dtype=np.float64)[:, :2]
+            if transf is not None:
+                pontos = np.array(transf.TransformPoints(pontos.tolist()), dtype=np.float64)[:, :2]
+            partes.append(pontos)
+    vds = None
+
+    vertices = _encadear(partes)
+    if inicio is not None:
+        p0 = np.array(inicio, dtype=np.float64)
+        if transf is not None:
+            p0 = np.array(transf.TransformPoint(float(p0[0]), float(p0[1]))[:2])
+        if np.hypot(*(vertices[-1] - p0)) < np.hypot(*(vertices[0] - p0)):
+            vertices = vertices[::-1]
+    return vertices
+
+
+def estaqueamento(px, py, vertices, margem=MARGEM_BUSCA, pontos_por_bloco=PONTOS_POR_BLOCO):
+    """
+    Distância ao longo do eixo (m) do ponto mais próximo de cada (px, py) e
+    a distância até o eixo. Em cada bloco de pontos só entram os trechos da
+    polilinha cuja caixa envolvente está a menos de `margem` da caixa do
+    bloco; pontos mais longe que isso são refeitos contra o eixo inteiro.
+    """
+    A, B = vertices[:-1], vertices[1:]
+    d = B - A
+    comp = np.hypot(d[:, 0], d[:, 1])
+    acum = np.concatenate([[0.0], np.cumsum(comp)])[:-1]
+    l2 = np.maximum(comp ** 2, 1e-12)
+    cx0, cx1 = np.minimum(A[:, 0], B[:, 0]), np.maximum(A[:, 0], B[:, 0])
+    cy0, cy1 = np.minimum(A[:, 1], B[:, 1]), np.maximum(A[:, 1], B[:, 1])
+
+    def projetar(x, y, trechos):
+        ax, ay, dx, dy = A[trechos, 0], A[trechos, 1], d[trechos, 0], d[trechos, 1]
+        t = np.clip(((x[:, None] - ax) * dx + (y[:, None] - ay) * dy) / l2[trechos], 0.0, 1.0)
+        dist2 = (ax + t * dx - x[:, None]) ** 2 + (ay + t * dy - y[:, None]) ** 2
+        k = np.argmin(dist2, axis=1)
+        linhas = np.arange(x.size)
+        return acum[trechos][k] + t[linhas, k] * comp[trechos][k], np.sqrt(dist2[linhas, k])
+
+    cadeia = np.empty(px.size)
+    distancia = np.empty(px.size)
+    todos = np.arange(A.shape[0])
+    for i0 in range(0, px.size, pontos_por_bloco):
+        x, y = px[i0:i0 + pontos_por_bloco], py[i0:i0 + pontos_por_bloco]
+        perto = np.flatnonzero((cx1 >= x.min() - margem) & (cx0 <= x.max() + margem) &
+                               (cy1 >= y.min() - margem) & (cy0 <= y.max() + margem))
+        c, dist = projetar(x, y, perto if perto.size else todos)
+        longe = dist > margem
+        if longe.any() and perto.size:
+            c[longe], dist[longe] = projetar(x[longe], y[longe], todos)
+        cadeia[i0:i0 + x.size], distancia[i0:i0 + x.size] = c, dist
+    return cadeia, distancia
+
+
+# --- Índice pixel -> segmento ---
+def _chave_indice(ds, caminho_mascara, caminho_eixo, comprimento, inicio):
+    st = os.stat(caminho_eixo)
+    texto = "|".join([chave_grade(ds, caminho_mascara), os.path.normcase(os.path.abspath(caminho_eixo)),
+                      str(st.st_mtime_ns), str(st.st_size), repr(float(comprimento)), repr(inicio)])
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def construir_indice(ds, caminho_mascara, caminho_eixo=CAMINHO_EIXO, comprimento=COMPRIMENTO_SEGMENTO,
+                     inicio=INICIO_EIXO):
+    """
+    Janela do polígono, posições (achatadas na janela) dos pixels dentro
+    dele, segmento de cada um e o comprimento do eixo.
+    """
+    mascara = carregar_mascara(mascara_da_grade(ds, caminho_mascara))
+    janela = janela_da_mascara(mascara)
+    if janela is None:
+        raise RuntimeError(u"Polígono {} não cobre o raster".format(os.path.basename(caminho_mascara)))
+    xoff, yoff, largura, altura = janela
+    dentro = mascara[yoff:yoff + altura, xoff:xoff + largura]
+    posicoes = np.flatnonzero(dentro)
+
+    gt = ds.GetGeoTransform()
+    lin, col = np.divmod(posicoes, largura)
+    col = col + xoff + 0.5
+    lin = lin + yoff + 0.5
+    px = gt[0] + col * gt[1] + lin * gt[2]
+    py = gt[3] + col * gt[4] + lin * gt[5]
+
+    vertices = ler_eixo(caminho_eixo, ds.GetProjection(), inicio)
+    cadeia, _ = estaqueamento(px, py, vertices)
+    comprimento_eixo = float(np.hypot(*np.diff(vertices, axis=0).T).sum())
+    # o fim exato do eixo (e o que se projeta nele) fica no último segmento
+    n_segmentos = max(int(np.ceil(comprimento_eixo / comprimento)), 1)
+    segmento = np.minimum(np.floor(cadeia / comprimento), n_segmentos - 1).astype(np.int32)
+    return {'janela': np.array(janela), 'posicoes': posicoes.astype(np.int64), 'segmento': segmento,
+            'comprimento_eixo': np.array(comprimento_eixo)}
+
+
+def indice_segmentos(ds, caminho_mascara, caminho_eixo=CAMINHO_EIXO, comprimento=COMPRIMENTO_SEGMENTO,
+                     inicio=INICIO_EIXO, pasta_cache=PASTA_CACHE_INDICES):
+    """Índice da grade de `ds` (ver construir_indice), calculado só se não estiver em cache."""
+    if not os.path.exists(pasta_cache):
+        os.makedirs(pasta_cache)
+    caminho = os.path.join(pasta_cache, "{}.npz".format(
+        _chave_indice(ds, caminho_mascara, caminho_eixo, comprimento, inicio)))
+    if not os.path.exists(caminho):
+        indice = construir_indice(ds, caminho_mascara, caminho_eixo, comprimento, inicio)
+        tmp = caminho + ".{}.tmp.npz".format(os.getpid())
+        np.savez(tmp, **indice)
+        os.replace(tmp, caminho)
+    with np.load(caminho) as z:
+        return {'janela': tuple(int(v) for v in z['janela']), 'posicoes': z['posicoes'],
+                'segmento': z['segmento'], 'comprimento_eixo': float(z['comprimento_eixo'])}
+
+
+# --- Estatísticas por segmento ---
+def valores_indexados(caminho_raster, indice, banda=None):
+    """Valores da banda NDVI nas posições do índice (NaN onde nodata)."""
+    ds = gdal.Open(caminho_raster)
+    b = ds.GetRasterBand(banda or banda_ndvi(ds))
+    valores = b.ReadAsArray(*indice['janela']).ravel()[indice['posicoes']].astype(np.float64)
+    nodata = b.GetNoDataValue()
+    if nodata is not None:
+        valores[valores == nodata] = np.nan
+    return valores
+
+
+def estatisticas_por_segmento(valores, segmento, n_segmentos, limiar=LIMIAR_NDVI):
+    """
+    valores (n_rasters, n_pixels), segmento (n_pixels,) -> dict de arrays
+    (n_rasters, n_segmentos): count, mean, std, frac_abaixo. Um bincount por
+    estatística sobre o par (raster, segmento) achatado.
+    """
+    n_rasters = valores.shape[0]
+    chave = (np.arange(n_rasters)[:, None] * n_segmentos + segmento[None, :]).ravel()
+    v = valores.ravel()
+    ok = np.isfinite(v)
+    chave, v = chave[ok], v[ok]
+    tamanho = n_rasters * n_segmentos
+    forma = (n_rasters, n_segmentos)
+
+    n = np.bincount(chave, minlength=tamanho).reshape(forma)
+    soma = np.bincount(chave, weights=v, minlength=tamanho).reshape(forma)
+    soma2 = np.bincount(chave, weights=v * v, minlength=tamanho).reshape(forma)
+    abaixo = np.bincount(chave, weights=(v < limiar).astype(np.float64), minlength=tamanho).reshape(forma)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = soma / n
+        desvio = np.sqrt(np.maximum(soma2 / n - media ** 2, 0.0) * n / np.maximum(n - 1, 1))
+        frac = abaixo / n
+    return {'count': n, 'mean': media, 'std': desvio, 'frac_abaixo': frac}
+
+
+def tabela_segmentos(pares, caminho_eixo=CAMINHO_EIXO, comprimento=COMPRIMENTO_SEGMENTO, inicio=INICIO_EIXO):
+    """
+    pares: os do zonal_lote.pares_locais ({'raster', 'mascara', 'ano', 'lado'}).
+    Tabela longa lado, segmento, km_ini, km_fim, ano, count, mean, std,
+    frac_abaixo. Os rasters de um lado compartilham a grade; se algum vier em
+    outra grade, ganha o próprio índice.
+    """
+    por_lado = {}
+    for par in pares:
+        por_lado.setdefault(par['lado'], []).append(par)
+
+    linhas = []
+    for lado, itens in sorted(por_lado.items()):
+        por_grade = {}
+        for par in itens:
+            ds = gdal.Open(par['raster'])
+            chave = (par['mascara'], ds.GetProjection(), ds.GetGeoTransform(), ds.RasterXSize, ds.RasterYSize)
+            if chave not in por_grade:
+                por_grade[chave] = (indice_segmentos(ds, par['mascara'], caminho_eixo, comprimento, inicio), [])
+            por_grade[chave][1].append((par['ano'], par['raster']))
+            ds = None
+
+        for indice, grupo in por_grade.values():
+            n_seg = max(int(np.ceil(indice['comprimento_eixo'] / comprimento)), 1)
+            valores = np.array([valores_indexados(c, indice) for _, c in grupo])
+            stats = estatisticas_por_segmento(valores, indice['segmento'], n_seg)
+            for r, (ano, _) in enumerate(grupo):
+                for s in np.flatnonzero(stats['count'][r] > 0):
+                    linhas.append({'lado': lado, 'segmento': int(s),
+                                   'km_ini': s * comprimento / 1000.0, 'km_fim': (s + 1) * comprimento / 1000.0,
+                                   'ano': ano, 'count': int(stats['count'][r, s]),
+                                   'mean': float(stats['mean'][r, s]), 'std': float(stats['std'][r, s]),
+                                   'frac_abaixo': float(stats['frac_abaixo'][r, s])})
+    colunas = ['lado', 'segmento', 'km_ini', 'km_fim', 'ano', 'count', 'mean', 'std', 'frac_abaixo']
+    return pd.DataFrame(linhas, columns=colunas).sort_values(['lado', 'segmento', 'ano']).reset_index(drop=True)
+
+
+def matriz_segmentos(tabela, lado, campo='mean'):
+    """(segmentos, anos, matriz segmento x ano) de um lado; NaN onde o segmento não tem pixel válido."""
+    largo = tabela[tabela['lado'] == lado].pivot(index='segmento', columns='ano', values=campo).sort_index()
+    return largo.index.tolist(), [int(a) for a in largo.columns], largo.to_numpy(dtype=np.float64)
+
+
+if __name__ == "__main__":
+    pares = pares_locais()
+    print(u"--- NDVI por segmento de {:.0f} m ({} pares ano x lado) ---".format(COMPRIMENTO_SEGMENTO, len(pares)))
+    tabela = tabela_segmentos(pares)
+    for lado in sorted(tabela['lado'].unique()):
+        segmentos, anos, matriz = matriz_segmentos(tabela, lado)
+        print(u"  {}: {} segmentos x {} anos".format(lado, len(segmentos), len(anos)))
+    pasta = os.path.dirname(CSV_SAIDA)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    tabela.to_csv(CSV_SAIDA, index=False)
+    espelhar_csv(CSV_SAIDA, tabela)
+    print(u"--- Salvo: {} ---".format(CSV_SAIDA))
@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+# Montagem das séries mensais (substitui o build_ts + forecast::na.interp do
+# bfast.R), a etapa de pré-processamento comum aos motores de quebra
+# (bfast_numpy.py, bfast_pixel.py) e aos gráficos:
+#   - lê o CSV exportado pelo GEE (system:index,date,<série>,ndvi,.geo) sem
+#     interpretar a coluna .geo (os MultiPoint vazios de cada linha);
+#   - completa o calendário mensal entre o primeiro e o último mês;
+#   - preenche as falhas como o na.interp (Fourier + polinômio, STL robusto e
+#     interpolação linear da série dessazonalizada), em lote: os ajustes e o
+#     STL andam com todas as séries de uma vez, o que escala para milhares
+#     de séries (trechos de km, pixels);
+#   - devolve um array float32 (séries x meses) já preenchido e a máscara
+#     das observações reais.
+#
+# `python series_mensais.py` monta as séries Leste/Oeste do CSV de 12 km e
+# grava outputs/series_ndvi_mensal.npz.
+
+import os
+import csv
+import math
+
+import numpy as np
+
+# --- CONFIGURAÇÕES ---
+PASTA_DADOS = os.path.dirname(os.path.abspath(__file__))
+CSV_NDVI = os.path.join(PASTA_DADOS, "PA458_NDVI_mensal_2017_2025_12km.csv")
+NPZ_SAIDA = os.path.join(PASTA_DADOS, "outputs", "series_ndvi_mensal.npz")
+
+CAMPO_DATA = 'date'
+CAMPO_SERIE = 'lado'
+CAMPO_REGIAO = 'region'   # tabela longa do mensal_regioes.py
+CAMPO_VALOR = 'ndvi'
+CAMPO_GEO = '.geo'
+VAZIOS = ('', 'NA', 'null', 'None')
+
+FREQUENCIA = 12
+S_WINDOW_INTERP = 11    # primeiro s.window do mstl (7 + 4 * 1)
+
+
+# =====================================================================
+# Leitura do CSV e calendário
+# =====================================================================
+def _linhas_csv(caminho):
+    """
+    Cabeçalho e campos de cada linha, sem a coluna .geo. Quando a .geo é a
+    última coluna (o padrão do Export.table do GEE), a linha é cortada antes
+    dela com split, sem passar o JSON pelo leitor de CSV.
+    """
+    with open(caminho, 'r', encoding='utf-8', newline='') as f:
+        cabecalho = next(csv.reader([f.readline()]))
+        if cabecalho and cabecalho[-1] == CAMPO_GEO:
+            n = len(cabecalho) - 1
+            yield cabecalho[:n]
+            for linha in f:
+                if linha.strip():
+                    yield linha.rstrip('\r\n').split(',', n)[:n]
+        else:
+            yield cabecalho
+            for campos in csv.reader(f):
+                if campos:
+                    yield campos
+
+
+def calendario_mensal(inicio, fim):
+    """[(ano, mes), ...] de `inicio` a `fim`, inclusive."""
+    datas = []
+    ano, mes = inicio
+    while (ano, mes) <= fim:
+        datas.append((ano, mes))
+        mes += 1
+        if mes > 12:
+            ano, mes = ano + 1, 1
+    return datas
+
+
+def tempo_decimal(datas):
+    """time() do R para uma ts mensal: ano + (mês - 1) / 12."""
+    return np.array([a + (m - 1) / 12.0 for a, m in datas], dtype=np.float64)
+
+
+def data_iso(datas, indice):
+    ano, mes = datas[indice]
+    return "{:04d}-{:02d}-01".format(ano, mes)
+
+
+def ler_csv_gee(caminho=CSV_NDVI, campo_valor=CAMPO_VALOR, campo_serie=CAMPO_SERIE):
+    """
+    Lê o CSV do GEE e completa o calendário mensal (comum a todas as séries).
+    Retorna (datas [(ano, mes)], rotulos, Y float64 séries x meses com NaN).
+    Sem a coluna `campo_serie`, as séries vêm da coluna region.
+    """
+    linhas = _linhas_csv(caminho)
+    cabecalho = next(linhas)
+    if campo_serie not in cabecalho and CAMPO_REGIAO in cabecalho:
+        campo_serie = CAMPO_REGIAO
+    i_data, i_serie, i_valor = (cabecalho.index(c) for c in (CAMPO_DATA, campo_serie, campo_valor))
+
+    valores = {}
+    for campos in linhas:
+        ano, mes = campos[i_data][:7].split('-')
+        v = campos[i_valor]
+        valores.setdefault(campos[i_serie], {})[(int(ano), int(mes))] = float(v) if v not in VAZIOS else np.nan
+
+    rotulos = sorted(valores)
+    todas = [d for por_data in valores.values() for d in por_data]
+    datas = calendario_mensal(min(todas), max(todas))
+    posicao = dict((d, t) for t, d in enumerate(datas))
+    Y = np.full((len(rotulos), len(datas)), np.nan)
+    for s, rotulo in enumerate(rotulos):
+        for d, v in valores[rotulo].items():
+            Y[s, posicao[d]] = v
+    return datas, rotulos, Y
+
+
+# =====================================================================
+# STL (Cleveland et al., 1990) -- porte do stl.f usado pelo R, em lote
+# =====================================================================
+def _proximo_impar(x):
+    x = int(round(x))
+    return x + 1 if x % 2 == 0 else x
+
+
+def _stlest(Y, n, q, grau, xs, esq, dir_, rw):
+    """Estimativa loess em `xs` (posição 1-based) com a vizinhança esq..dir_."""
+    h = max(xs - esq, dir_ - xs)
+    if q > n:
+        h += (q - n) // 2
+    j = np.arange(esq, dir_ + 1, dtype=np.float64)
+    r = np.abs(j - xs)
+    w = np.zeros_like(r)
+    perto = r <= 0.999 * h
+    w[perto] = 1.0
+    medio = perto & (r > 0.001 * h)
+    w[medio] = (1.0 - (r[medio] / h) ** 3) ** 3
+
+    W = np.broadcast_to(w, (Y.shape[0], w.size)).copy()
+    if rw is not None:
+        W *= rw[:, esq - 1:dir_]
+    a = W.sum(axis=1)
+    ok = a > 0
+    W[ok] /= a[ok, None]
+    if h > 0 and grau > 0:
+        media = (W * j).sum(axis=1)
+        c = (W * (j - media[:, None]) ** 2).sum(axis=1)
+        ajusta = ok & (np.sqrt(c) > 0.001 * (n - 1))
+        b = np.zeros_like(c)
+        b[ajusta] = (xs - media[ajusta]) / c[ajusta]
+        W = np.where(ajusta[:, None], W * (b[:, None] * (j - media[:, None]) + 1.0), W)
+    ys = (W * Y[:, esq - 1:dir_]).sum(axis=1)
+    return ys, ok
+
+
+def _stless(Y, q, grau, salto, rw=None):
+    """Suavização loess de todas as posições, avaliando a cada `salto` e interpolando."""
+    S, n = Y.shape
+    if n < 2:
+        return Y.copy()
+    novo = min(salto, n - 1)
+    ys = np.zeros_like(Y)
+    esq, dir_ = 1, min(q, n)
+
+    def estimar(i, esq, dir_):
+        v, ok = _stlest(Y, n, q, grau, float(i), esq, dir_, rw)
+        ys[:, i - 1] = np.where(ok, v, Y[:, i - 1])
+
+    if q >= n:
+        esq, dir_ = 1, n
+        for i in range(1, n + 1, novo):
+            estimar(i, esq, dir_)
+    elif novo == 1:
+        nsh = (q + 1) // 2
+        esq, dir_ = 1, q
+        for i in range(1, n + 1):
+            if i > nsh and dir_ != n:
+                esq += 1
+                dir_ += 1
+            estimar(i, esq, dir_)
+    else:
+        nsh = (q + 1) // 2
+        for i in range(1, n + 1, novo):
+            if i < nsh:
+                esq, dir_ = 1, q
+            elif i >= n - nsh + 1:
+                esq, dir_ = n - q + 1, n
+            else:
+                esq, dir_ = i - nsh + 1, q + i - nsh
+            estimar(i, esq, dir_)
+
+    if novo != 1:
+        for i in range(1, n - novo + 1, novo):
+            delta = (ys[:, i + novo - 1] - ys[:, i - 1]) / novo
+            for j in range(i + 1, i + novo):
+                ys[:, j - 1] = ys[:, i - 1] + delta * (j - i)
+        k = ((n - 1) // novo) * novo + 1
+        if k != n:
+            estimar(n, esq, dir_)
+            if k != n - 1:
+                delta = (ys[:, n - 1] - ys[:, k - 1]) / (n - k)
+                for j in range(k + 1, n):
+                    ys[:, j - 1] = ys[:, k - 1] + delta * (j - k)
+    return ys
+
+
+def _stlss(W, periodo, ns, grau, salto, rw):
+    """Suavização das subséries de ciclo, estendidas um ciclo antes e depois."""
+    S, n = W.shape
+    C = np.zeros((S, n + 2 * periodo))
+    for j in range(periodo):
+        idx = np.arange(j, n, periodo)
+        k = idx.size
+        sub = W[:, idx]
+        rws = rw[:, idx] if rw is not None else None
+        suave = _stless(sub, ns, grau, salto, rws)
+
+        v0, ok0 = _stlest(sub, k, ns, grau, 0.0, 1, min(ns, k), rws)
+        v1, ok1 = _stlest(sub, k, ns, grau, float(k + 1), max(1, k - ns + 1), k, rws)
+        C[:, j] = np.where(ok0, v0, suave[:, 0])
+        C[:, (np.arange(k) + 1) * periodo + j] = suave
+        C[:, (k + 1) * periodo + j] = np.where(ok1, v1, suave[:, -1])
+    return C
+
+
+def _media_movel(X, q):
+    c = np.cumsum(np.pad(X, ((0, 0), (1, 0))), axis=1)
+    return (c[:, q:] - c[:, :-q]) / q
+
+
+def _pesos_robustos(Y, ajuste):
+    r = np.abs(Y - ajuste)
+    cmad = 6.0 * np.median(r, axis=1, keepdims=True)
+    u = np.divide(r, cmad, out=np.full_like(r, np.inf), where=cmad > 0)
+    rw = np.where(u <= 0.001, 1.0, np.where(u <= 0.999, (1.0 - u ** 2) ** 2, 0.0))
+    return rw
+
+
+def stl_lote(Y, periodo=FREQUENCIA, s_window="periodic", robusto=False, s_grau=None, t_window=None):
+    """
+    Decomposição STL de cada linha de Y (S, n), como stats::stl do R.
+    Retorna (sazonal, tendencia). Sem robustez o STL é linear em Y, e o lote
+    inteiro anda junto; com robustez cada série recebe os seus pesos.
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    S, n = Y.shape
+    periodico = s_window == "periodic"
+    if periodico:
+        s_window, s_grau = 10 * n + 1, 0
+    elif s_grau is None:
+        s_grau = 0
+    ns = max(3, _proximo_impar(s_window))
+    nt = t_window or _proximo_impar(math.ceil(1.5 * periodo / (1 - 1.5 / s_window)))
+    nt = max(3, _proximo_impar(nt))
+    nl = max(3, _proximo_impar(periodo))
+    saltos = (int(math.ceil(s_window / 10.0)), int(math.ceil(nt / 10.0)), int(math.ceil(nl / 10.0)))
+    interno, externo = (1, 15) if robusto else (2, 0)
+
+    tendencia = np.zeros_like(Y)
+    sazonal = np.zeros_like(Y)
+    rw = None
+
+    def passo(tendencia, rw):
+        for _ in range(interno):
+            C = _stlss(Y - tendencia, periodo, ns, s_grau, saltos[0], rw)
+            baixa = _media_movel(_media_movel(_media_movel(C, periodo), periodo), 3)
+            L = _stless(baixa, nl, 1, saltos[2], None)
+            sazonal = C[:, periodo:periodo + n] - L
+            tendencia = _stless(Y - sazonal, nt, 1, saltos[1], rw)
+        return sazonal, tendencia
+
+    sazonal, tendencia = passo(tendencia, rw)
+    for _ in range(externo):
+        rw = _pesos_robustos(Y, tendencia + sazonal)
+        sazonal, tendencia = passo(tendencia, rw)
+
+    if periodico:
+        ciclo = np.arange(n) % periodo
+        medias = np.array([sazonal[:, ciclo == c].mean(axis=1) for c in range(periodo)]).T
+        sazonal = medias[:, ciclo]
+    return sazonal, tendencia
+
+
+# =====================================================================
+# Preenchimento de falhas (forecast::na.interp) em lote
+# =====================================================================
+def _fourier(n, periodo, K):
+    t = np.arange(1, n + 1, dtype=np.float64)
+    colunas = []
+    for k in range(1, K + 1):
+        if 2 * k != periodo:
+            colunas.append(np.sin(2 * np.pi * k * t / periodo))
+        colunas.append(np.cos(2 * np.pi * k * t / periodo))
+    return np.column_stack(colunas)
+
+
+def interpolar_linear_lote(Y):
+    """
+    approx(..., rule = 2) em cada linha: linear entre as observações,
+    constante nas pontas. Linhas sem nenhuma observação continuam NaN.
+    """
+    Y = np.array(Y, dtype=np.float64)
+    S, n = Y.shape
+    validos = ~np.isnan(Y)
+    t = np.arange(n)
+    # índice da última observação até t e da próxima a partir de t
+    ant = np.maximum.accumulate(np.where(validos, t, -1), axis=1)
+    prox = np.minimum.accumulate(np.where(validos, t, n)[:, ::-1], axis=1)[:, ::-1]
+    ant, prox = np.where(ant >= 0, ant, prox), np.where(prox < n, prox, ant)
+    linhas = np.arange(S)[:, None]
+    ya, yp = Y[linhas, np.clip(ant, 0, n - 1)], Y[linhas, np.clip(prox, 0, n - 1)]
+    peso = np.where(prox > ant, (t - ant) / np.maximum(prox - ant, 1).astype(np.float64), 0.0)
+    return np.where(validos, Y, ya + peso * (yp - ya))
+
+
+def _ajuste_fourier_polinomio(Y, validos, periodo):
+    """lm(x ~ fourier(x, K) + poly(tt, grau)) só com as observações válidas de cada série."""
+    S, n = Y.shape
+    tt = np.linspace(-1.0, 1.0, n)
+    grau = int(min(max(n // 10, 1), 6))
+    X = np.column_stack([np.ones(n), _fourier(n, periodo, min(periodo // 2, 5)),
+                         np.polynomial.legendre.legvander(tt, grau)[:, 1:]])
+    XtV = np.einsum('np,sn->spn', X, validos.astype(np.float64))
+    A = XtV @ X
+    b = np.einsum('spn,sn->sp', XtV, np.where(validos, Y, 0.0))
+    coef = np.einsum('spq,sq->sp', np.linalg.pinv(A), b)
+    return coef @ X.T
+
+
+def preencher_falhas_lote(Y, periodo=FREQUENCIA):
+    """
+    forecast::na.interp em cada linha de Y (séries x meses, NaN nas falhas).
+    Séries com até 2 ciclos de dados vão por interpolação linear; as demais
+    por Fourier + polinômio, STL robusto (s.window = 11, como o mstl) e
+    interpolação linear da série dessazonalizada, com a sazonalidade
+    devolvida nas falhas. Se o resultado sair de [min - 0,5 faixa, max +
+    0,5 faixa], a série volta para a interpolação linear (como no R).
+    """
+    Y = np.atleast_2d(np.array(Y, dtype=np.float64))
+    saida = Y.copy()
+    validos = ~np.isnan(Y)
+    n_validos = validos.sum(axis=1)
+    com_falha = (n_validos < Y.shape[1]) & (n_validos > 0)
+    linear = com_falha & ((periodo <= 1) | (n_validos <= 2 * periodo))
+    if linear.any():
+        saida[linear] = interpolar_linear_lote(Y[linear])
+
+    idx = np.flatnonzero(com_falha & ~linear)
+    if idx.size:
+        y, v = Y[idx], validos[idx]
+        x = np.where(v, y, _ajuste_fourier_polinomio(y, v, periodo))
+        sazonal, _ = stl_lote(x, periodo, s_window=S_WINDOW_INTERP, robusto=True)
+        sa = interpolar_linear_lote(np.where(v, x - sazonal, np.nan))
+        x = np.where(v, y, sa + sazonal)
+
+        minimo, maximo = np.nanmin(y, axis=1), np.nanmax(y, axis=1)
+        faixa = maximo - minimo
+        instavel = (x.max(axis=1) > maximo + 0.5 * faixa) | (x.min(axis=1) < minimo - 0.5 * faixa)
+        if instavel.any():
+            x[instavel] = interpolar_linear_lote(y[instavel])
+        saida[idx] = x
+    return saida
+
+
+# =====================================================================
+# Séries montadas
+# =====================================================================
+def montar_series(caminho=CSV_NDVI, campo_valor=CAMPO_VALOR, campo_serie=CAMPO_SERIE, periodo=FREQUENCIA):
+    """
+    CSV do GEE -> {'datas', 'rotulos', 'valores' (float32 séries x meses,
+    falhas preenchidas), 'validos' (bool, observações reais)}.
+    """
+    datas, rotulos, Y = ler_csv_gee(caminho, campo_valor, campo_serie)
+    return {'datas': datas, 'rotulos': rotulos,
+            'valores': preencher_falhas_lote(Y, periodo).astype(np.float32),
+            'validos': ~np.isnan(Y)}
+
+
+def por_rotulo(series):
+    """{rótulo: (valores, validos)} de uma série montada."""
+    return dict((r, (series['valores'][s], series['validos'][s])) for s, r in enumerate(series['rotulos']))
+
+
+def salvar_series(caminho, series):
+    pasta = os.path.dirname(caminho)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    np.savez_compressed(caminho, datas=np.array(series['datas'], dtype=np.int16),
+                        rotulos=np.array(series['rotulos']), valores=series['valores'],
+                        validos=series['validos'])
+    return caminho
+
+
+def carregar_series(caminho):
+    with np.load(caminho) as z:
+        return {'datas': [tuple(int(v) for v in d) for d in z['datas']],
+                'rotulos': [str(r) for r in z['rotulos']],
+                'valores': z['valores'], 'validos': z['validos']}
+
+
+if __name__ == "__main__":
+    series = montar_series(CSV_NDVI)
+    datas = series['datas']
+    print(u"--- {} série(s) de {} meses ({} a {}) ---".format(
+        len(series['rotulos']), len(datas), data_iso(datas, 0)[:7], data_iso(datas, -1)[:7]))
+    for rotulo, (valores, validos) in sorted(por_rotulo(series).items()):
+        print(u"  {:<6} {} meses observados, {} preenchidos, NaN restantes: {}".format(
+            rotulo, int(validos.sum()), int((~validos).sum()), int(np.isnan(valores).sum())))
+    salvar_series(NPZ_SAIDA, series)
+    print(u"--- Salvo: {} ---".format(NPZ_SAIDA))
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# Armazenamento colunar (Parquet) das tabelas do processamento, particionado
+# por lado e ano (pastas lado=Leste/ano=2020/, partição "hive"):
+#   - gravar_tabela: linhas (dicts), DataFrame ou dict de colunas -> dataset
+#     Parquet com tipos explícitos, substituindo o dataset inteiro (como o
+#     CSV que ele espelha);
+#   - atualizar_particoes: regrava só as partições (lado/ano) presentes nos
+#     dados novos, mantendo as demais;
+#   - abrir_tabela / ler_tabela: leitura preguiçosa com filtro empurrado
+#     para o dataset: partições fora do filtro nem são abertas e, dentro
+#     delas, os grupos de linhas são descartados pelas estatísticas;
+#   - espelhar_csv: usado pelos scripts que já gravam CSV (o Sankey e o
+#     bfast.R, no R, continuam lendo os CSV); grava a mesma tabela em
+#     <pasta do CSV>/parquet/<nome>/;
+#   - exportar_csv / importar_csv_gee: de Parquet para CSV e do CSV mensal do
+#     GEE (sem a coluna .geo) para Parquet.
+#
+# Depende do pyarrow; sem ele, espelhar_csv não faz nada (os CSV seguem
+# sendo gravados) e as leituras avisam que falta o pacote.
+#
+# `python tabelas.py` converte os CSV já existentes em outputs/ e o CSV mensal.
+
+import os
+import csv
+import shutil
+
+from series_mensais import CSV_NDVI, CAMPO_REGIAO, CAMPO_DATA, CAMPO_VALOR, VAZIOS, _linhas_csv
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pads
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+# --- CONFIGURAÇÕES ---
+PASTA_PARQUET = os.path.join("outputs", "parquet")
+PARTICOES = ('lado', 'ano')
+COMPRESSAO = 'zstd'
+
+# Tipos das colunas conhecidas (as demais ficam com o tipo inferido)
+TIPOS = {
+    'lado': 'string', 'region': 'string', 'tipo': 'string', 'date': 'string',
+    'ano': 'int16', 'mes': 'int8', 'segmento': 'int32',
+    'ndvi': 'float32', 'mean': 'float64', 'median': 'float64', 'std': 'float64',
+    'count': 'int64', 'n_valid_pixels': 'int64', 'area_ha': 'float64', 'magnitude': 'float64',
+}
+PREFIXO_CLASSE = 'Class'      # ClassAAAA das tabelas de transição: int8
+TIPO_CLASSE = 'int8'
+
+
+def disponivel():
+    return pa is not None
+
+
+def _exigir_pyarrow():
+    if pa is None:
+        raise RuntimeError(u"pyarrow não está instalado (pip install pyarrow): tabelas Parquet indisponíveis")
+
+
+def _tipo(coluna, tipos):
+    nome = tipos.get(coluna) or TIPOS.get(coluna)
+    if nome is None and coluna.startswith(PREFIXO_CLASSE) and coluna[len(PREFIXO_CLASSE):].isdigit():
+        nome = TIPO_CLASSE
+    return pa.type_for_alias(nome) if nome else None
+
+
+def para_arrow(dados, tipos=None):
+    """pyarrow.Table de linhas (lista de dicts), DataFrame ou dict de colunas, com os tipos de TIPOS."""
+    _exigir_pyarrow()
+    tipos = tipos or {}
+    if isinstance(dados, pa.Table):
+        tabela = dados
+    elif hasattr(dados, 'to_dict') and hasattr(dados, 'columns'):
+        tabela = pa.Table.from_pandas(dados, preserve_index=False)
+    elif isinstance(dados, dict):
+        tabela = pa.table(dados)
+    else:
+        tabela = pa.Table.from_pylist(list(dados))
+    campos = []
+    for campo in tabela.schema:
+        tipo = _tipo(campo.name, tipos)
+        campos.append(pa.field(campo.name, tipo if tipo is not None else campo.type))
+    return tabela.cast(pa.schema(campos))
+
+
+def _escrever_dataset(tabela, pasta, particoes, comportamento):
+    chaves = [c for c in particoes if c in tabela.column_names]
+    particionamento = None
+    if chaves:
+        particionamento = pads.partitioning(pa.schema([tabela.schema.field(c) for c in chaves]), flavor='hive')
+    pads.write_dataset(tabela, pasta, format='parquet', partitioning=particionamento,
+                       basename_template="parte-{i}.parquet", existing_data_behavior=comportamento,
+                       file_options=pads.ParquetFileFormat().make_write_options(compression=COMPRESSAO))
+
+
+def gravar_tabela(dados, pasta, particoes=PARTICOES, tipos=None):
+    """
+    Grava o dataset Parquet particionado pelas colunas de `particoes` que
+    existirem na tabela, no lugar de todo o conteúdo anterior da pasta:
+    partições ausentes dos dados novos deixam de existir. A escrita vai
+    para uma pasta temporária ao lado, que então substitui a antiga.
+    """
+    tabela = para_arrow(dados, tipos)
+    pasta = os.path.abspath(pasta)
+    temporaria = "{}.{}.tmp".format(pasta, os.getpid())
+    antiga = "{}.{}.old".format(pasta, os.getpid())
+    shutil.rmtree(temporaria, ignore_errors=True)
+    _escrever_dataset(tabela, temporaria, particoes, 'error')
+    if os.path.exists(pasta):
+        os.rename(pasta, antiga)
+    os.rename(temporaria, pasta)
+    shutil.rmtree(antiga, ignore_errors=True)
+    return pasta
+
+
+def atualizar_particoes(dados, pasta, particoes=PARTICOES, tipos=None):
+    """
+    Atualização parcial: substitui só as partições presentes nos dados novos;
+    as demais (outro lado, outros anos) ficam como estão.
+    """
+    _escrever_dataset(para_arrow(dados, tipos), pasta, particoes, 'delete_matching')
+    return pasta
+
+
+def abrir_tabela(pasta):
+    """Dataset preguiçoso (nada é lido até to_table/scanner); tipos das partições vêm dos nomes."""
+    _exigir_pyarrow()
+    return pads.dataset(pasta, format='parquet', partitioning='hive')
+
+
+def _expressao(filtro):
+    """
+    {'lado': 'Leste', 'ano': [2020, 2021]} -> lado == 'Leste' & ano in (...).
+    Também aceita tuplas (coluna, operador, valor) com ==, !=, <, <=, >, >=, in.
+    """
+    if filtro is None:
+        return None
+    condicoes = filtro.items() if isinstance(filtro, dict) else filtro
+    expr = None
+    for item in condicoes:
+        if len(item) == 2:
+            coluna, valor = item
+            op = 'in' if isinstance(valor, (list, tuple, set)) else '=='
+        else:
+            coluna, op, valor = item
+        campo = pads.field(coluna)
+        if op == 'in':
+            cond = campo.isin(list(valor))
+        else:
+            cond = {'==': campo.__eq__, '!=': campo.__ne__, '<': campo.__lt__, '<=': campo.__le__,
+                    '>': campo.__gt__, '>=': campo.__ge__}[op](valor)
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def ler_tabela(pasta, filtro=None, colunas=None, como='pandas'):
+    """
+    Lê só as partições e colunas pedidas. filtro: ver _expressao.
+    como: 'pandas' (DataFrame), 'arrow' (pyarrow.Table) ou 'linhas' (dicts).
+    """
+    tabela = abrir_tabela(pasta).to_table(columns=colunas, filter=_expressao(filtro))
+    if como == 'arrow':
+        return tabela
+    if como == 'linhas':
+        return tabela.to_pylist()
+    return tabela.to_pandas()
+
+
+def exportar_csv(pasta, caminho_csv, filtro=None, colunas=None):
+    """CSV (para o R) a partir do dataset Parquet."""
+    tabela = abrir_tabela(pasta).to_table(columns=colunas, filter=_expressao(filtro))
+    pasta_csv = os.path.dirname(caminho_csv)
+    if pasta_csv and not os.path.exists(pasta_csv):
+        os.makedirs(pasta_csv)
+    pacsv.write_csv(tabela, caminho_csv)
+    return caminho_csv
+
+
+_AVISOU = []
+
+
+def espelhar_csv(caminho_csv, dados, nome=None, particoes=PARTICOES, tipos=None):
+    """
+    Grava em <pasta do CSV>/parquet/<nome> a mesma tabela do CSV
+    (nome padrão: o do CSV sem extensão), substituindo o espelho anterior
+    inteiro. Sem pyarrow, só avisa uma vez.
+    """
+    if pa is None:
+        if not _AVISOU:
+            print(u"    [aviso] pyarrow não instalado: tabelas gravadas só em CSV")
+            _AVISOU.append(True)
+        return None
+    nome = nome or os.path.splitext(os.path.basename(caminho_csv))[0]
+    return gravar_tabela(dados, os.path.join(os.path.dirname(os.path.abspath(caminho_csv)), "parquet", nome),
+                         particoes, tipos)
+
+
+# --- Conversões dos CSV existentes ---
+def linhas_csv_gee(caminho=CSV_NDVI):
+    """
+    Linhas do CSV mensal do GEE (sem a coluna .geo e a system:index), com ano
+    e mes inteiros e a série na coluna lado (coluna lado ou region do CSV).
+    """
+    linhas = _linhas_csv(caminho)
+    cabecalho = next(linhas)
+    campo_serie = 'lado' if 'lado' in cabecalho else CAMPO_REGIAO
+    indices = dict((c, i) for i, c in enumerate(cabecalho))
+    saida = []
+    for campos in linhas:
+        data = campos[indices[CAMPO_DATA]][:7]
+        v = campos[indices[CAMPO_VALOR]]
+        linha = {'lado': campos[indices[campo_serie]], 'ano': int(data[:4]), 'mes': int(data[5:7]),
+                 'date': data, 'ndvi': float(v) if v not in VAZIOS else None}
+        if 'n_valid_pixels' in indices:
+            linha['n_valid_pixels'] = int(campos[indices['n_valid_pixels']] or 0)
+        saida.append(linha)
+    return saida
+
+
+def importar_csv_gee(caminho=CSV_NDVI, pasta=os.path.join(PASTA_PARQUET, "ndvi_mensal")):
+    return gravar_tabela(linhas_csv_gee(caminho), pasta)
+
+
+def linhas_csv(caminho):
+    """Linhas de um CSV qualquer, com números convertidos pelo tipo de TIPOS (demais: texto)."""
+    saida = []
+    with open(caminho, 'r', encoding='utf-8', newline='') as f:
+        for linha in csv.DictReader(f):
+            convertida = {}
+            for c, v in linha.items():
+                nome = TIPOS.get(c) or (TIPO_CLASSE if c.startswith(PREFIXO_CLASSE) and c[len(PREFIXO_CLASSE):].isdigit() else None)
+                if nome and nome.startswith(('int', 'float')):
+                    v = None if v in VAZIOS else (float(v) if nome.startswith('float') else int(float(v)))
+                convertida[c] = v
+            saida.append(convertida)
+    return saida
+
+
+if __name__ == "__main__":
+    _exigir_pyarrow()
+    if os.path.exists(CSV_NDVI):
+        print(u"--- {} -> {} ---".format(os.path.basename(CSV_NDVI), importar_csv_gee()))
+    pasta_csv = os.path.dirname(PASTA_PARQUET) or "."
+    for nome in sorted(os.listdir(pasta_csv)) if os.path.isdir(pasta_csv) else []:
+        if nome.endswith(".csv"):
+            destino = os.path.join(PASTA_PARQUET, os.path.splitext(nome)[0])
+            gravar_tabela(linhas_csv(os.path.join(pasta_csv, nome)), destino)
+            print(u"--- {} -> {} ---".format(nome, destino))
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# Tabela de transição (Sankey) calculada direto dos rasters reclassificados.
+# Empilha as bandas de classe de cada ano, codifica o histórico de cada pixel
+# como um único inteiro e soma as áreas com numpy.bincount, bloco a bloco.
+# Gera o mesmo CSV (ClassAAAA..., area_ha) da interseção vetorial sequencial.
+
+import os
+import re
+import csv
+import glob
+import numpy as np
+from osgeo import gdal, osr
+
+from instrumentacao import trecho
+from tabelas import espelhar_csv
+
+# --- CONFIGURAÇÕES ---
+# Pasta com os rasters de classes (1 a 5, Int16, nodata -9999) por lado/ano
+PASTA_CLASSES = r"G:\Meu Drive\PA458_ByPolygons\final\sem_urb"
+PADRAO_CLASSES = "*_classes.tif"
+
+# Pasta onde as tabelas de transição são salvas (a mesma do script vetorial)
+PASTA_BASE = r"H:\Meu Drive\UFRA\PRÉ PROJETO DE TCC\PRODUTOS TCC\tabelas_sankey"
+
+N_CLASSES = 5
+NODATA = -9999
+LINHAS_POR_BLOCO = 512
+
+# Acima deste número de históricos possíveis o bincount denso ocuparia
+# memória demais; nesse caso as contagens são acumuladas por np.unique.
+LIMITE_BINCOUNT = 1 << 24
+
+gdal.UseExceptions()
+
+
+def identificar_lado_ano(nome):
+    """Extrai (lado, ano) de um nome no padrão PA458_<Lado>_<AAAA>_..."""
+    partes = os.path.splitext(os.path.basename(nome))[0].split('_')
+    lado = "Leste" if "Leste" in partes else "Oeste" if "Oeste" in partes else None
+
+    ano = None
+    for p in partes:
+        if p.isdigit() and len(p) == 4:
+            ano = int(p)
+            break
+    return lado, ano
+
+
+def localizar_rasters_classes(pasta=PASTA_CLASSES, padrao=PADRAO_CLASSES):
+    """Agrupa os rasters de classe encontrados na pasta por lado e ano."""
+    rasters = {'Leste': {}, 'Oeste': {}}
+    for caminho in sorted(glob.glob(os.path.join(pasta, padrao))):
+        lado, ano = identificar_lado_ano(caminho)
+        if lado and ano:
+            rasters[lado][ano] = caminho
+    return rasters
+
+
+def _conferir_grade(datasets):
+    """Garante que todos os rasters compartilham CRS, transformação e tamanho."""
+    ref = datasets[0]
+    srs_ref = osr.SpatialReference(wkt=ref.GetProjection())
+    for ds in datasets[1:]:
+        mesma_grade = (
+            ds.RasterXSize == ref.RasterXSize and
+            ds.RasterYSize == ref.RasterYSize and
+            np.allclose(ds.GetGeoTransform(), ref.GetGeoTransform())
+        )
+        srs = osr.SpatialReference(wkt=ds.GetProjection())
+        if not mesma_grade or not srs.IsSame(srs_ref):
+            raise RuntimeError(u"Grade diferente entre '{}' e '{}'; reamostre antes da transição."
+                               .format(ref.GetDescription(), ds.GetDescription()))
+
+
+def contar_historicos(caminhos, banda=1, n_classes=N_CLASSES, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """
+    Conta, para cada histórico de classes (um valor por ano), quantos pixels
+    o seguem. Pixels com nodata (ou fora de 1..n_classes) em qualquer ano são
+    descartados, como acontece na interseção dos polígonos.
+
+    Retorna (codigos, contagens, area_pixel_m2), com os códigos em ordem crescente.
+    """
+    datasets = [gdal.Open(c) for c in caminhos]
+    _conferir_grade(datasets)
+
+    gt = datasets[0].GetGeoTransform()
+    area_pixel = abs(gt[1] * gt[5])
+    xsize, ysize = datasets[0].RasterXSize, datasets[0].RasterYSize
+    bandas = [ds.GetRasterBand(banda) for ds in datasets]
+
+    # Histórico codificado em base (n_classes + 1): o primeiro ano é o dígito
+    # mais significativo, então a ordem dos códigos é a ordem dos históricos.
+    base = n_classes + 1
+    n_anos = len(caminhos)
+    pesos = base ** np.arange(n_anos - 1, -1, -1, dtype=np.int64)
+    n_codigos = int(base ** n_anos)
+    denso = n_codigos <= LIMITE_BINCOUNT
+
+    contagens = np.zeros(n_codigos, dtype=np.int64) if denso else {}
+
+    for y0 in range(0, ysize, linhas_por_bloco):
+        nlin = min(linhas_por_bloco, ysize - y0)
+        codigo = np.zeros((nlin, xsize), dtype=np.int64)
+        valido = np.ones((nlin, xsize), dtype=bool)
+
+        for peso, b in zip(pesos, bandas):
+            cls = b.ReadAsArray(0, y0, xsize, nlin)
+            valido &= (cls >= 1) & (cls <= n_classes)
+            codigo += cls.astype(np.int64) * peso
+
+        codigo = codigo[valido]
+        if codigo.size == 0:
+            continue
+
+        if denso:
+            contagens += np.bincount(codigo, minlength=n_codigos)
+        else:
+            cods, cnts = np.unique(codigo, return_counts=True)
+            for c, n in zip(cods.tolist(), cnts.tolist()):
+                contagens[c] = contagens.get(c, 0) + n
+
+    if denso:
+        codigos = np.flatnonzero(contagens)
+        return codigos, contagens[codigos], area_pixel
+
+    codigos = np.array(sorted(contagens), dtype=np.int64)
+    return codigos, np.array([contagens[c] for c in codigos.tolist()], dtype=np.int64), area_pixel
+
+
+def decodificar_historicos(codigos, n_anos, n_classes=N_CLASSES):
+    """Converte os códigos inteiros de volta em matriz (n_historicos, n_anos) de classes."""
+    base = n_classes + 1
+    pesos = base ** np.arange(n_anos - 1, -1, -1, dtype=np.int64)
+    return (codigos[:, None] // pesos[None, :]) % base
+
+
+def escrever_csv_transicao(caminho_csv, campos_classe, dados_agrupados):
+    """
+    Grava o CSV lido pelo Sankey no R: ClassAAAA..., area_ha (4 casas). Se o
+    nome for transicao_completa_<Lado>.csv, a tabela também vai para o
+    Parquet parquet/transicao_completa/lado=<Lado>/ (tabelas.py).
+    """
+    with trecho("escrever_csv", camada=os.path.basename(caminho_csv), linhas=len(dados_agrupados)) as t:
+        with open(caminho_csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(campos_classe + ['area_ha'])
+            for historico, area in dados_agrupados.items():
+                writer.writerow(list(historico) + [round(area, 4)])
+        t['bytes'] = os.path.getsize(caminho_csv)
+
+    m = re.match(r"transicao_completa_([A-Za-z]+)\.csv$", os.path.basename(caminho_csv))
+    if m:
+        linhas = [dict(zip(campos_classe, historico), area_ha=round(area, 4), lado=m.group(1))
+                  for historico, area in dados_agrupados.items()]
+        espelhar_csv(caminho_csv, linhas, nome="transicao_completa")
+
+
+def tabela_transicao_raster(rasters_por_ano, caminho_csv, banda=1):
+    """Calcula e salva a tabela de transição de um lado a partir de {ano: raster_classes}."""
+    anos = sorted(rasters_por_ano)
+    caminhos = [rasters_por_ano[a] for a in anos]
+
+    with trecho("contar_historicos", camada=os.path.basename(caminho_csv), anos=len(anos)) as t:
+        codigos, contagens, area_pixel = contar_historicos(caminhos, banda=banda)
+        t['historicos'] = len(codigos)
+    historicos = decodificar_historicos(codigos, len(anos))
+    areas_ha = contagens * (area_pixel / 10000.0)
+
+    dados_agrupados = {}
+    for hist, area in zip(historicos.tolist(), areas_ha.tolist()):
+        dados_agrupados[tuple(hist)] = area
+
+    campos_classe = ["Class{}".format(a) for a in anos]
+    escrever_csv_transicao(caminho_csv, campos_classe, dados_agrupados)
+    return dados_agrupados
+
+
+def processar_lados_raster(pasta_classes=PASTA_CLASSES, pasta_base=PASTA_BASE):
+    """Gera transicao_completa_{lado}.csv para Leste e Oeste a partir dos rasters."""
+    if not os.path.exists(pasta_base):
+        os.makedirs(pasta_base)
+
+    rasters = localizar_rasters_classes(pasta_classes)
+    gerados = []
+
+    for lado in ['Leste', 'Oeste']:
+        if not rasters[lado]:
+            continue
+        print(u"\n--- Processando Setor (raster): {} | anos {} ---"
+              .format(lado, sorted(rasters[lado])))
+
+        caminho_csv = os.path.join(pasta_base, "transicao_completa_{}.csv".format(lado))
+        dados = tabela_transicao_raster(rasters[lado], caminho_csv)
+        print(u"    [OK] {} históricos. CSV salvo em: {}".format(len(dados), caminho_csv))
+        gerados.append(caminho_csv)
+
+    if not gerados:
+        print(u"ERRO: Nenhum raster '{}' encontrado em {}.".format(PADRAO_CLASSES, pasta_classes))
+    return gerados
+
+
+if __name__ == "__main__":
+    processar_lados_raster()
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# Reclassificação (5 classes, Intervalo Igual) e poligonização em blocos,
+# distribuídas num pool de processos. Substitui o par
+# native:reclassifybytable + gdal:polygonize de script_vetorizacao.py sem
+# precisar do QGIS aberto: gera o mesmo <nome>_vetor.gpkg (campo DN) e,
+# opcionalmente, o <nome>_classes.tif usado pela transição em modo raster.
+
+import os
+import glob
+from concurrent.futures import as_completed
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from paralelo import criar_pool
+from perfil_raster import criar_raster, finalizar_raster
+from estatisticas_cache import consultar_cache, calcular_estatisticas, registrar_estatisticas
+
+# --- CONFIGURAÇÕES ---
+PASTA_ENTRADA = r"G:\Meu Drive\PA458_ByPolygons\final\sem_urb"
+PADRAO_ENTRADA = "PA458_*_NDVI_*.tif"
+PASTA_SAIDA = r"G:\Meu Drive\PA458_ByPolygons\final\sem_urb"
+
+N_CLASSES = 5
+NODATA = -9999
+TAMANHO_BLOCO = 1024   # pixels por lado de cada bloco
+N_PROCESSOS = None     # None = todos os núcleos
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+
+def banda_ndvi(ds):
+    """Mesma regra do script: multibanda usa a 3 (NDVI), banda única usa a 1."""
+    return 3 if ds.RasterCount >= 3 else 1
+
+
+def limites_intervalo_igual(vmin, vmax, n_classes=N_CLASSES):
+    """
+    Limites equivalentes à tabela de native:reclassifybytable do script
+    (RANGE_BOUNDARIES = 0, ou seja min < valor <= max; último limite + 0.0001).
+    """
+    step = (vmax - vmin) / n_classes
+    limites = [vmin + step * i for i in range(n_classes + 1)]
+    limites[-1] += 0.0001
+    return np.array(limites, dtype=np.float64)
+
+
+def classificar_intervalos(dados, limites, nodata_entrada=None):
+    """Aplica a tabela com numpy.digitize; fora das faixas ou nodata vira NODATA."""
+    dados = dados.astype(np.float64, copy=False)
+    classes = np.digitize(dados, limites, right=True)
+    invalido = (classes < 1) | (classes > len(limites) - 1) | np.isnan(dados)
+    if nodata_entrada is not None:
+        invalido |= dados == nodata_entrada
+    classes = classes.astype(np.int16)
+    classes[invalido] = NODATA
+    return classes
+
+
+def listar_rasters_ndvi(pasta=PASTA_ENTRADA, padrao=PADRAO_ENTRADA):
+    """Rasters NDVI da pasta, ignorando os _classes.tif gerados na mesma pasta."""
+    return [c for c in sorted(glob.glob(os.path.join(pasta, padrao)))
+            if not c.endswith("_classes.tif")]
+
+
+def gerar_blocos(xsize, ysize, tamanho=TAMANHO_BLOCO):
+    """Janelas (xoff, yoff, largura, altura) que cobrem o raster."""
+    for yoff in range(0, ysize, tamanho):
+        for xoff in range(0, xsize, tamanho):
+            yield xoff, yoff, min(tamanho, xsize - xoff), min(tamanho, ysize - yoff)
+
+
+def _driver_memoria():
+    return ogr.GetDriverByName('Memory') or ogr.GetDriverByName('MEM')
+
+
+def _ler_estatisticas(caminho):
+    """Estatísticas da banda NDVI: do cache ou de uma passada (gravada depois pelo pai)."""
+    banda = banda_ndvi(gdal.Open(caminho))
+    stats = consultar_cache(caminho, banda)
+    if stats is not None:
+        return banda, stats, False
+    return banda, calcular_estatisticas(caminho, banda), True
+
+
+def _processar_bloco(caminho, banda, limites, janela):
+    """Trabalho de um processo: lê a janela, reclassifica e poligoniza."""
+    xoff, yoff, xsize, ysize = janela
+    ds = gdal.Open(caminho)
+    b = ds.GetRasterBand(banda)
+    classes = classificar_intervalos(b.ReadAsArray(xoff, yoff, xsize, ysize), limites, b.GetNoDataValue())
+
+    gt = ds.GetGeoTransform()
+    gt_bloco = (gt[0] + xoff * gt[1] + yoff * gt[2], gt[1], gt[2],
+                gt[3] + xoff * gt[4] + yoff * gt[5], gt[4], gt[5])
+
+    mem = gdal.GetDriverByName('MEM').Create('', xsize, ysize, 1, gdal.GDT_Int16)
+    mem.SetGeoTransform(gt_bloco)
+    mb = mem.GetRasterBand(1)
+    mb.SetNoDataValue(NODATA)
+    mb.WriteArray(classes)
+
+    vds = _driver_memoria().CreateDataSource('bloco')
+    lyr = vds.CreateLayer('bloco', geom_type=ogr.wkbPolygon)
+    lyr.CreateField(ogr.FieldDefn('DN', ogr.OFTInteger))
+    gdal.Polygonize(mb, mb.GetMaskBand(), lyr, 0, [], callback=None)
+
+    # Polígonos que encostam numa borda interna (vizinha de outro bloco)
+    # precisam ser costurados na junção; os demais já estão completos.
+    xmin = gt_bloco[0]
+    xmax = gt_bloco[0] + xsize * gt[1]
+    ymax = gt_bloco[3]
+    ymin = gt_bloco[3] + ysize * gt[5]
+    tol = abs(gt[1]) * 0.5
+    bordas = (
+        (xoff > 0, lambda e: abs(e[0] - xmin) < tol),
+        (xoff + xsize < ds.RasterXSize, lambda e: abs(e[1] - xmax) < tol),
+        (yoff + ysize < ds.RasterYSize, lambda e: abs(e[2] - ymin) < tol),
+        (yoff > 0, lambda e: abs(e[3] - ymax) < tol),
+    )
+
+    poligonos = []
+    for feat in lyr:
+        geom = feat.GetGeometryRef()
+        env = geom.GetEnvelope()
+        na_costura = any(interna and toca(env) for interna, toca in bordas)
+        poligonos.append((feat.GetField(0), bytes(geom.ExportToWkb()), na_costura))
+
+    return janela, classes, poligonos
+
+
+def _partes(geom):
+    """Explode um (Multi)Polygon em polígonos simples."""
+    if ogr.GT_Flatten(geom.GetGeometryType()) == ogr.wkbPolygon:
+        return [geom]
+    return [geom.GetGeometryRef(i).Clone() for i in range(geom.GetGeometryCount())]
+
+
+def costurar_poligonos(costura):
+    """Une, por DN, os polígonos cortados pelas bordas dos blocos."""
+    for dn in sorted(costura):
+        multi = ogr.Geometry(ogr.wkbMultiPolygon)
+        for wkb in costura[dn]:
+            multi.AddGeometry(ogr.CreateGeometryFromWkb(wkb))
+        for parte in _partes(multi.UnionCascaded()):
+            yield dn, parte
+
+
+def _criar_saida_vetor(caminho_gpkg, projecao):
+    """GeoPackage no mesmo layout do gdal:polygonize (camada = nome do arquivo, campo DN)."""
+    drv = ogr.GetDriverByName('GPKG')
+    if os.path.exists(caminho_gpkg):
+        drv.DeleteDataSource(caminho_gpkg)
+    ds = drv.CreateDataSource(caminho_gpkg)
+    srs = osr.SpatialReference(wkt=projecao) if projecao else None
+    nome_camada = os.path.splitext(os.path.basename(caminho_gpkg))[0]
+    lyr = ds.CreateLayer(nome_camada, srs=srs, geom_type=ogr.wkbPolygon)
+    lyr.CreateField(ogr.FieldDefn('DN', ogr.OFTInteger))
+    lyr.StartTransaction()
+    return ds, lyr
+
+
+def _gravar_feicao(lyr, dn, geom):
+    feat = ogr.Feature(lyr.GetLayerDefn())
+    feat.SetField(0, int(dn))
+    feat.SetGeometry(geom)
+    lyr.CreateFeature(feat)
+
+
+def _criar_saida_classes(caminho_tif, ds_origem):
+    ds = criar_raster(caminho_tif, ds_origem.RasterXSize, ds_origem.RasterYSize, 1, gdal.GDT_Int16)
+    ds.SetGeoTransform(ds_origem.GetGeoTransform())
+    ds.SetProjection(ds_origem.GetProjection())
+    ds.GetRasterBand(1).SetNoDataValue(NODATA)
+    return ds
+
+
+def nome_seguro(caminho):
+    """Nome da camada como o QGIS mostraria, com os mesmos substitutos do script."""
+    nome = os.path.splitext(os.path.basename(caminho))[0]
+    return nome.replace(" ", "_").replace("/", "-")
+
+
+def vetorizar_lote(caminhos, pasta_saida=PASTA_SAIDA, n_processos=N_PROCESSOS,
+                   tamanho_bloco=TAMANHO_BLOCO, salvar_classes=True, limites=None):
+    """
+    Reclassifica e poligoniza todos os rasters de uma vez: os blocos de todos
+    os anos/lados entram no mesmo pool. `limites` (classes_globais.py) vale
+    para todos os rasters; sem ele, Intervalo Igual do min/max de cada um.
+    Retorna {raster: caminho_gpkg}.
+    """
+    if not os.path.exists(pasta_saida):
+        os.makedirs(pasta_saida)
+
+    saidas = {}
+    with criar_pool(n_processos) as pool:
+        # 1. Min/max de cada raster (definem o Intervalo Igual), via cache
+        infos = {}
+        for caminho, (banda, stats, novo) in zip(caminhos, pool.map(_ler_estatisticas, caminhos)):
+            if novo:
+                registrar_estatisticas(caminho, banda, stats)
+            infos[caminho] = (banda, stats['min'], stats['max'])
+
+        # 2. Blocos de todos os rasters no mesmo pool
+        estado = {}
+        futuros = {}
+        for caminho in caminhos:
+            banda, vmin, vmax = infos[caminho]
+            if vmin is None or vmax is None or vmin == vmax:
+                print(u"  > PULO: {} vazia ou constante.".format(os.path.basename(caminho)))
+                continue
+
+            ds = gdal.Open(caminho)
+            nome = nome_seguro(caminho)
+            caminho_gpkg = os.path.join(pasta_saida, "{}_vetor.gpkg".format(nome))
+            vds, lyr = _criar_saida_vetor(caminho_gpkg, ds.GetProjection())
+            cds = None
+            caminho_classes = os.path.join(pasta_saida, "{}_classes.tif".format(nome))
+            if salvar_classes:
+                cds = _criar_saida_classes(caminho_classes, ds)
+            estado[caminho] = {'gpkg': caminho_gpkg, 'vds': vds, 'lyr': lyr, 'cds': cds,
+                               'classes': caminho_classes, 'costura': {}}
+
+            limites_raster = limites if limites is not None else limites_intervalo_igual(vmin, vmax)
+            for janela in gerar_blocos(ds.RasterXSize, ds.RasterYSize, tamanho_bloco):
+                fut = pool.submit(_processar_bloco, caminho, banda, limites_raster, janela)
+                futuros[fut] = caminho
+
+        # 3. Polígonos internos gravados à medida que os blocos terminam
+        for fut in as_completed(futuros):
+            e = estado[futuros[fut]]
+            (xoff, yoff, _, _), classes, poligonos = fut.result()
+            if e['cds'] is not None:
+                e['cds'].GetRasterBand(1).WriteArray(classes, xoff, yoff)
+            for dn, wkb, na_costura in poligonos:
+                if na_costura:
+                    e['costura'].setdefault(dn, []).append(wkb)
+                else:
+                    _gravar_feicao(e['lyr'], dn, ogr.CreateGeometryFromWkb(wkb))
+
+    # 4. Costura das bordas e fechamento das saídas
+    for caminho, e in estado.items():
+        for dn, geom in costurar_poligonos(e['costura']):
+            _gravar_feicao(e['lyr'], dn, geom)
+        e['lyr'].CommitTransaction()
+        e['lyr'] = e['vds'] = None
+        if e['cds'] is not None:
+            e['cds'] = None
+            finalizar_raster(e['classes'])
+        saidas[caminho] = e['gpkg']
+        print(u"  > Vetor gerado: {}".format(e['gpkg']))
+
+    return saidas
+
+
+if __name__ == "__main__":
+    rasters = listar_rasters_ndvi()
+    print(u"--- Vetorizando {} rasters em paralelo ---".format(len(rasters)))
+    vetorizar_lote(rasters)
+    print(u"\n--- Processamento finalizado! ---")
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Estatísticas zonais em lote para vários pares (imagem, geometria) de uma
+# vez, em vez de um reduceRegion(...).getInfo() por ano e lado como no
+# zonal_mean do notebook. O resultado é um DataFrame "tidy": uma linha por
+# par, com as chaves do par (ano, lado...) e mean, median, count, pNN.
+#
+# Dois backends com a mesma saída:
+#   - estatisticas_ee: monta uma FeatureCollection com um reduceRegion por
+#     par no servidor e traz tudo num único getInfo (por lote), que passa
+#     pelo cache em disco do cache_ee.py;
+#   - estatisticas_locais: GeoTIFFs exportados + polígono, com o índice
+#     polígono -> pixels pré-calculado (bitmap em cache por grade, o mesmo
+#     do recorte_paralelo.py), sem depender do serviço.
+
+import os
+import glob
+
+import numpy as np
+import pandas as pd
+from osgeo import gdal
+
+from cache_ee import get_info
+from tabelas import espelhar_csv
+from recorte_paralelo import mascara_da_grade, carregar_mascara, janela_da_mascara
+from transicao_raster import identificar_lado_ano
+from vetorizacao_paralela import banda_ndvi
+
+# --- CONFIGURAÇÕES ---
+PASTA_ENTRADA = r"G:\Meu Drive\PA458_ByPolygons"
+PADRAO_ENTRADA = "PA458_*_NDVI_*.tif"
+MASCARAS_LADO = {
+    'Leste': r"G:\Meu Drive\PA458_ByPolygons\PA458_Leste.gpkg",
+    'Oeste': r"G:\Meu Drive\PA458_ByPolygons\PA458_Oeste.gpkg",
+}
+CSV_SAIDA = os.path.join("outputs", "zonal_ndvi_pa458.csv")
+
+BANDA = 'NDVI'
+PERCENTIS = (10, 25, 75, 90)
+ESCALA = 10
+TAMANHO_LOTE = 100  # pares por requisição ao EE
+
+# Chaves reservadas do par (as demais viram colunas do DataFrame)
+CHAVES_DADOS = ('imagem', 'geometria', 'raster', 'mascara')
+
+gdal.UseExceptions()
+
+
+def colunas_estatisticas(percentis=PERCENTIS):
+    return ['mean', 'median', 'count'] + ['p{}'.format(p) for p in percentis]
+
+
+def _metadados(par):
+    return dict((k, v) for k, v in par.items() if k not in CHAVES_DADOS)
+
+
+def _tabela(linhas, percentis):
+    df = pd.DataFrame(linhas)
+    for c in colunas_estatisticas(percentis):
+        if c not in df.columns:
+            df[c] = np.nan
+    return df
+
+
+# --- Backend Earth Engine ---
+def _redutor_ee(ee, percentis):
+    r = ee.Reducer.mean().combine(ee.Reducer.median(), sharedInputs=True)
+    r = r.combine(ee.Reducer.count(), sharedInputs=True)
+    return r.combine(ee.Reducer.percentile(list(percentis)), sharedInputs=True)
+
+
+def estatisticas_ee(pares, banda=BANDA, escala=ESCALA, percentis=PERCENTIS, tamanho_lote=TAMANHO_LOTE,
+                    usar_cache=True):
+    """
+    pares: [{'imagem': ee.Image, 'geometria': ee.Geometry, 'ano': ..., 'lado': ...}, ...]
+    Um getInfo por lote de `tamanho_lote` pares (os 12 pares ano x lado cabem num só).
+    Com `usar_cache`, lotes já avaliados não vão ao servidor.
+    """
+    import ee
+
+    redutor = _redutor_ee(ee, percentis)
+    # nomes de saída do reduceRegion com redutor combinado: <banda>_<saida>
+    nomes = dict(('{}_{}'.format(banda, c), c) for c in colunas_estatisticas(percentis))
+
+    linhas = []
+    for inicio in range(0, len(pares), tamanho_lote):
+        lote = pares[inicio:inicio + tamanho_lote]
+        feicoes = []
+        for i, par in enumerate(lote):
+            stats = ee.Image(par['imagem']).select([banda]).reduceRegion(
+                reducer=redutor, geometry=par['geometria'], scale=escala,
+                maxPixels=1e13, tileScale=4, bestEffort=True)
+            feicoes.append(ee.Feature(None, stats).set('_indice', i))
+
+        colecao = ee.FeatureCollection(feicoes)
+        resultado = get_info(colecao) if usar_cache else colecao.getInfo()
+        por_indice = dict((f['properties'].get('_indice'), f['properties']) for f in resultado['features'])
+        for i, par in enumerate(lote):
+            props = por_indice.get(i, {})
+            linha = _metadados(par)
+            for nome_ee, coluna in nomes.items():
+                linha[coluna] = props.get(nome_ee)
+            linhas.append(linha)
+    return _tabela(linhas, percentis)
+
+
+# --- Backend local (GeoTIFF) ---
+_INDICES = {}
+
+
+def indice_poligono(ds, caminho_mascara):
+    """
+    (janela, posicoes): janela (xoff, yoff, largura, altura) envolvendo o
+    polígono e posições (achatadas) dos pixels dentro dele. O bitmap fica em
+    cache por grade no disco; o índice, em memória durante a sessão.
+    """
+    caminho_bits = mascara_da_grade(ds, caminho_mascara)
+    if caminho_bits not in _INDICES:
+        mascara = carregar_mascara(caminho_bits)
+        janela = janela_da_mascara(mascara)
+        if janela is None:
+            _INDICES[caminho_bits] = (None, None)
+        else:
+            xoff, yoff, largura, altura = janela
+            recorte = mascara[yoff:yoff + altura, xoff:xoff + largura]
+            _INDICES[caminho_bits] = (janela, np.flatnonzero(recorte))
+    return _INDICES[caminho_bits]
+
+
+def resumir(valores, percentis=PERCENTIS):
+    """mean, median, count e percentis de um vetor de valores válidos."""
+    linha = {'count': int(valores.size)}
+    if valores.size == 0:
+        linha.update(dict((c, None) for c in colunas_estatisticas(percentis) if c != 'count'))
+        return linha
+    valores = valores.astype(np.float64)
+    qs = np.percentile(valores, [50] + list(percentis))
+    linha['mean'] = float(valores.mean())
+    linha['median'] = float(qs[0])
+    for p, q in zip(percentis, qs[1:]):
+        linha['p{}'.format(p)] = float(q)
+    return linha
+
+
+def valores_no_poligono(caminho_raster, caminho_mascara, banda=None):
+    """Valores válidos (sem nodata/NaN) da banda dentro do polígono."""
+    ds = gdal.Open(caminho_raster)
+    banda = banda or banda_ndvi(ds)
+    janela, posicoes = indice_poligono(ds, caminho_mascara)
+    if janela is None:
+        return np.empty(0, dtype=np.float32)
+    b = ds.GetRasterBand(banda)
+    valores = b.ReadAsArray(*janela).ravel()[posicoes]
+    nodata = b.GetNoDataValue()
+    validos = ~np.isnan(valores) if valores.dtype.kind == 'f' else np.ones(valores.size, dtype=bool)
+    if nodata is not None:
+        validos &= valores != nodata
+    return valores[validos]
+
+
+def estatisticas_locais(pares, banda=None, percentis=PERCENTIS):
+    """
+    pares: [{'raster': caminho.tif, 'mascara': caminho.gpkg, 'ano': ..., 'lado': ...}, ...]
+    Mesma tabela do backend EE. `banda` None = banda NDVI (3 se houver 3 bandas).
+    """
+    linhas = []
+    for par in pares:
+        linha = _metadados(par)
+        linha.update(resumir(valores_no_poligono(par['raster'], par['mascara'], banda), percentis))
+        linhas.append(linha)
+    return _tabela(linhas, percentis)
+
+
+def pares_locais(pasta=PASTA_ENTRADA, padrao=PADRAO_ENTRADA, mascaras=MASCARAS_LADO):
+    """Pares (raster, polígono do lado) dos compósitos PA458_<Lado>_<AAAA>_... da pasta."""
+    pares = []
+    for caminho in sorted(glob.glob(os.path.join(pasta, padrao))):
+        if caminho.endswith("_classes.tif"):
+            continue
+        lado, ano = identificar_lado_ano(caminho)
+        if lado in mascaras and ano:
+            pares.append({'ano': int(ano), 'lado': lado, 'raster': caminho, 'mascara': mascaras[lado]})
+    return pares
+
+
+if __name__ == "__main__":
+    pares = pares_locais()
+    print(u"--- Estatísticas zonais de {} pares (ano x lado) ---".format(len(pares)))
+    tabela = estatisticas_locais(pares).sort_values(['ano', 'lado'])
+    print(tabela.to_string(index=False))
+    pasta = os.path.dirname(CSV_SAIDA)
+    if pasta and not os.path.exists(pasta):
+        os.makedirs(pasta)
+    tabela.to_csv(CSV_SAIDA, index=False)
+    espelhar_csv(CSV_SAIDA, tabela)
+    print(u"--- Salvo: {} ---".format(CSV_SAIDA))